@@ -0,0 +1,94 @@
+# coding=utf-8
+"""
+Incremental refresh of the materialised Campaign queues (see CampaignQueueEntry).
+
+Whether a contact is in the queue of a campaign depends on its statuses in every campaign, the priority and state of
+those campaigns and its pending activities. The signals in core.signals report the contacts whose ContactCampaignStatus
+or Activity objects changed, and only those contacts are refreshed in the campaigns they are in. When the priority or
+the state of a campaign changes, the queues of every campaign are rebuilt. Inside a deferred_refresh() block the
+contacts are collected and refreshed once when the block ends, which is what views that save many rows (like the
+assignment of contacts to sellers) should use.
+
+Updates that don't send signals (queryset update() and bulk writes) must call refresh_contacts() themselves.
+"""
+import threading
+from contextlib import contextmanager
+
+from .models import Campaign
+
+
+_state = threading.local()
+
+
+def refresh_contacts(contact_ids):
+    """
+    Refreshes the given contacts in the queues of the campaigns they are in.
+    """
+    contact_ids = list(contact_ids)
+    if not contact_ids:
+        return
+    for campaign in Campaign.objects.filter(contactcampaignstatus__contact_id__in=contact_ids).distinct():
+        campaign.refresh_queue(contact_ids)
+
+
+def rebuild_queues(campaigns=None):
+    """
+    Rebuilds the queues of the campaigns, of all of them by default.
+    """
+    for campaign in campaigns if campaigns is not None else Campaign.objects.all():
+        campaign.refresh_queue()
+
+
+def contacts_changed(contact_ids):
+    """
+    Called by the signals with the contacts that changed. The refresh is done right away, or when the current
+    deferred_refresh() block ends.
+    """
+    pending = getattr(_state, "pending", None)
+    if pending is None:
+        refresh_contacts(contact_ids)
+    else:
+        pending.update(contact_ids)
+
+
+def campaign_deleting(campaign):
+    """
+    Called before a campaign is deleted: the contacts of its statuses and activities deleted in cascade are collected
+    and refreshed once by campaign_deleted(), instead of one by one.
+    """
+    if getattr(_state, "deleted_campaigns", None) is None:
+        _state.deleted_campaigns = {}
+    _state.deleted_campaigns[campaign.pk] = set()
+
+
+def campaign_row_deleted(campaign_id, contact_id):
+    """
+    Called when a ContactCampaignStatus or an Activity of a campaign is deleted.
+    """
+    deleted_campaigns = getattr(_state, "deleted_campaigns", None) or {}
+    if campaign_id in deleted_campaigns:
+        deleted_campaigns[campaign_id].add(contact_id)
+    else:
+        contacts_changed([contact_id])
+
+
+def campaign_deleted(campaign):
+    deleted_campaigns = getattr(_state, "deleted_campaigns", None) or {}
+    contacts_changed(deleted_campaigns.pop(campaign.pk, set()))
+
+
+@contextmanager
+def deferred_refresh():
+    """
+    Collects the contacts changed inside the block and refreshes them once when it ends. Blocks can be nested, the
+    outermost one does the refresh.
+    """
+    if getattr(_state, "pending", None) is not None:
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+    finally:
+        pending, _state.pending = _state.pending, None
+    refresh_contacts(pending)
@@ -0,0 +1,206 @@
+# coding=utf-8
+"""
+Detection of duplicated contacts.
+
+Comparing every contact with every other one is quadratic, so find_candidates() only compares the contacts that share
+a blocking key:
+
+- the normalised email: lowercased, without the +tag and, for Gmail, without the dots of the local part;
+- the phone or the mobile, in E.164 format (a phone can match a mobile);
+- the id document, uppercased and without punctuation;
+- the name: name and last name without accents or punctuation, with its words sorted.
+
+The keys shared by more than max_block contacts (a generic email, the phone of an institution, a common name) aren't
+used, since they don't tell the contacts apart. Each pair found is scored with the WEIGHTS of its matching keys and the
+trigram similarity of the names, computed for all the pairs at once over pandas columns, and the pairs with at least
+min_score are returned ranked.
+
+store_candidates() replaces the DuplicateContactCandidate table with them, keeping the pairs that were dismissed. The
+candidates are reviewed and merged in the duplicate contacts view of support.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import phonenumbers
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Cast
+from unidecode import unidecode
+
+from .contact_merge import DELETE_TAG
+from .models import Contact, DuplicateContactCandidate
+
+
+WEIGHTS = {"email": 0.45, "id_document": 0.45, "phone": 0.3, "name": 0.5}
+# The name is a reason of the pair when its similarity is at least this one
+NAME_SIMILARITY = 0.5
+# Above the weight of the name, so the same name alone doesn't make two contacts a candidate pair
+MIN_SCORE = 0.6
+MAX_BLOCK = 50
+GMAIL_DOMAINS = ("gmail.com", "googlemail.com")
+
+
+def normalize_emails(emails):
+    parts = emails.str.lower().str.strip().str.extract(r"^([^@+]+)(?:\+[^@]*)?@(.+)$")
+    local, domain = parts[0], parts[1].replace(GMAIL_DOMAINS[1], GMAIL_DOMAINS[0])
+    local = local.where(domain != GMAIL_DOMAINS[0], local.str.replace(".", "", regex=False))
+    return local + "@" + domain
+
+
+def normalize_phones(phones):
+    """
+    Returns the phones in E.164 format, None for the ones that aren't valid. Each distinct phone is parsed once.
+    """
+    region = getattr(settings, "PHONENUMBER_DEFAULT_REGION", None)
+
+    def e164(phone):
+        try:
+            number = phonenumbers.parse(phone, region)
+        except phonenumbers.NumberParseException:
+            return None
+        if not phonenumbers.is_possible_number(number):
+            return None
+        return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+    return phones.map({phone: e164(phone) for phone in phones.dropna().unique() if phone})
+
+
+def normalize_id_documents(id_documents):
+    id_documents = id_documents.str.upper().str.replace(r"[^0-9A-Z]", "", regex=True)
+    return id_documents.where(id_documents.str.len() >= 4)
+
+
+def name_key(name):
+    return " ".join(sorted(re.findall(r"[a-z0-9]+", unidecode(name).lower())))
+
+
+def trigrams(key):
+    """
+    Returns the trigrams of the words of a name key, padded like the ones of pg_trgm.
+    """
+    return frozenset(
+        padded[i:i + 3] for padded in ("  {} ".format(word) for word in key.split()) for i in range(len(padded) - 2)
+    )
+
+
+def load_contacts(queryset=None):
+    """
+    Returns a DataFrame with the id and the normalised keys of the contacts. By default the contacts that were merged
+    into another one (tagged for deletion) are left out.
+    """
+    if queryset is None:
+        queryset = Contact.objects.exclude(tags__name=DELETE_TAG)
+    # cast, to read the phones as they are stored instead of as PhoneNumber objects
+    rows = queryset.annotate(
+        stored_phone=Cast("phone", models.CharField()), stored_mobile=Cast("mobile", models.CharField())
+    ).values_list("id", "name", "last_name", "email", "stored_phone", "stored_mobile", "id_document")
+    frame = pd.DataFrame.from_records(
+        rows.iterator(chunk_size=10000),
+        columns=["id", "name", "last_name", "email", "phone", "mobile", "id_document"],
+    )
+    full_names = (frame["name"].fillna("") + " " + frame["last_name"].fillna("")).str.strip()
+    return pd.DataFrame(
+        {
+            "id": frame["id"],
+            "email": normalize_emails(frame["email"].astype("object")),
+            "phone": normalize_phones(frame["phone"]),
+            "mobile": normalize_phones(frame["mobile"]),
+            "id_document": normalize_id_documents(frame["id_document"].astype("object")),
+            "name": full_names.map(name_key).where(lambda names: names != ""),
+        }
+    )
+
+
+def block_pairs(keys, key, max_block=MAX_BLOCK):
+    """
+    Returns the (id_x, id_y) pairs of contacts, with id_x < id_y, that share a value of key, leaving out the values
+    shared by more than max_block contacts. keys has the columns id and key, and can have several rows for the same
+    contact.
+    """
+    keys = keys[["id", key]].dropna().drop_duplicates()
+    sizes = keys.groupby(key)["id"].transform("size")
+    keys = keys[(sizes > 1) & (sizes <= max_block)]
+    pairs = keys.merge(keys, on=key)
+    return pairs.loc[pairs["id_x"] < pairs["id_y"], ["id_x", "id_y"]]
+
+
+def score_pairs(contacts, pairs):
+    """
+    Returns a DataFrame with the contact_id, other_id, score and reasons of each pair.
+    """
+    indexed = contacts.set_index("id")
+    left = indexed.loc[pairs["id_x"].to_numpy()].reset_index(drop=True)
+    right = indexed.loc[pairs["id_y"].to_numpy()].reset_index(drop=True)
+
+    matches = {
+        "email": (left["email"] == right["email"]).to_numpy(),
+        "id_document": (left["id_document"] == right["id_document"]).to_numpy(),
+        "phone": (
+            (left["phone"] == right["phone"])
+            | (left["phone"] == right["mobile"])
+            | (left["mobile"] == right["phone"])
+            | (left["mobile"] == right["mobile"])
+        ).to_numpy(),
+    }
+    left_trigrams = left["name"].fillna("").map(trigrams)
+    right_trigrams = right["name"].fillna("").map(trigrams)
+    name_similarity = np.fromiter(
+        (len(a & b) / len(a | b) if a and b else 0.0 for a, b in zip(left_trigrams, right_trigrams)),
+        dtype=float,
+        count=len(pairs),
+    )
+
+    score = name_similarity * WEIGHTS["name"]
+    reasons = np.full(len(pairs), "", dtype=object)
+    for reason, matched in matches.items():
+        score = score + matched * WEIGHTS[reason]
+        reasons = reasons + np.where(matched, reason + ",", "")
+    reasons = reasons + np.where(name_similarity >= NAME_SIMILARITY, "name", "")
+    return pd.DataFrame(
+        {
+            "contact_id": pairs["id_x"].to_numpy(),
+            "other_id": pairs["id_y"].to_numpy(),
+            "score": np.minimum(score, 1.0).round(3),
+            "reasons": pd.Series(reasons).str.rstrip(","),
+        }
+    )
+
+
+def find_candidates(queryset=None, min_score=MIN_SCORE, max_block=MAX_BLOCK):
+    """
+    Returns the pairs of probably duplicated contacts, ranked by score (see the module docstring).
+    """
+    contacts = load_contacts(queryset)
+    phones = pd.concat(
+        [contacts[["id", "phone"]], contacts[["id", "mobile"]].rename(columns={"mobile": "phone"})],
+        ignore_index=True,
+    )
+    blocks = [
+        block_pairs(keys, key, max_block)
+        for keys, key in ((contacts, "email"), (phones, "phone"), (contacts, "id_document"), (contacts, "name"))
+    ]
+    pairs = pd.concat(blocks, ignore_index=True).drop_duplicates(ignore_index=True)
+
+    candidates = score_pairs(contacts, pairs)
+    candidates = candidates[candidates["score"] >= min_score]
+    return candidates.sort_values(["score", "contact_id"], ascending=[False, True], ignore_index=True)
+
+
+def store_candidates(candidates, batch_size=5000):
+    """
+    Replaces the DuplicateContactCandidate objects that weren't dismissed with the candidates (a DataFrame returned
+    by find_candidates). Returns the number of candidates stored.
+    """
+    with transaction.atomic():
+        DuplicateContactCandidate.objects.filter(dismissed=False).delete()
+        # the dismissed pairs found again are left as they are
+        DuplicateContactCandidate.objects.bulk_create(
+            [
+                DuplicateContactCandidate(contact_id=contact_id, other_id=other_id, score=score, reasons=reasons)
+                for contact_id, other_id, score, reasons in candidates.itertuples(index=False)
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+    return DuplicateContactCandidate.objects.filter(dismissed=False).count()
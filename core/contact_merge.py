@@ -0,0 +1,254 @@
+# coding=utf-8
+"""
+Merge of duplicated contacts.
+
+merge_contacts() merges each source contact into its target contact, for any number of pairs, in one transaction:
+
+- Every foreign key to Contact is found through the models meta (the many to many tables included, the history tables
+  excluded), so the relations added later are merged too. Each one is re-pointed with a single UPDATE for all the
+  pairs. The rows of a source that would break a unique constraint along with a row of its target are deleted first:
+  the target's rows are kept.
+- The tags of the sources are added to their targets, and the sources are tagged "eliminar". The sources are kept.
+- The duplicate candidates of the sources (see core.contact_duplicates) are deleted.
+- Each target is saved once with the merged data, without the CMS sync of the contact signals, and is synced with the
+  CMS once when the transaction is committed. The email validations of Contact.clean() (bounces and the CMS
+  validation and dedupe) run for the targets that get a new email, and a ValidationError rolls back the merge. The
+  dynamic contact filters and the campaign queues are refreshed once for all the contacts.
+
+merge_pairs() merges a list of (target id, source id) pairs, like the ones of the merge_contacts command, in chunks.
+"""
+import traceback
+from datetime import date
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+from taggit.models import Tag, TaggedItem
+
+from . import campaign_queue, dcf_members
+from .models import Activity, Contact, DuplicateContactCandidate, update_web_user, update_web_user_newsletters
+from .utils import mail_managers_on_errors
+
+
+DELETE_TAG = "eliminar"
+# Moved from the source to the target when the target doesn't have one (or has the same one)
+MOVED_FIELDS = ("email", "id_document")
+# Copied from the source to the target when the target doesn't have one
+FILLED_FIELDS = (
+    "last_name",
+    "phone",
+    "mobile",
+    "work_phone",
+    "gender",
+    "birthdate",
+    "education",
+    "ocupation_id",
+    "subtype_id",
+    "id_document_type_id",
+)
+
+
+def unique_sets(model, field):
+    """
+    Returns the other fields of each unique constraint of the model that includes field.
+    """
+    sets = [set(fields) for fields in model._meta.unique_together]
+    sets += [
+        set(constraint.fields)
+        for constraint in model._meta.constraints
+        if isinstance(constraint, models.UniqueConstraint) and constraint.fields and constraint.condition is None
+    ]
+    if field.unique:
+        sets.append({field.name})
+    return [tuple(sorted(fields - {field.name})) for fields in sets if field.name in fields]
+
+
+@lru_cache(maxsize=None)
+def contact_relations():
+    """
+    Returns (model, foreign key, unique sets) for every foreign key to Contact.
+    """
+    relations = []
+    for model in apps.get_models(include_auto_created=True):
+        if hasattr(model, "instance_type") or not model._meta.managed:
+            # history tables (django-simple-history) and database views
+            continue
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.ForeignKey) and field.remote_field.model is Contact:
+                relations.append((model, field, unique_sets(model, field)))
+    return relations
+
+
+def target_of(attname, mapping):
+    return Case(
+        *[When(**{attname: source_id}, then=Value(target_id)) for source_id, target_id in mapping.items()],
+        output_field=models.IntegerField(),
+    )
+
+
+def repoint(model, field, unique_fields, mapping):
+    """
+    Points the rows of the model that reference the sources of mapping ({source id: target id}) to their targets.
+    """
+    rows = model._base_manager.filter(**{field.attname + "__in": list(mapping)})
+    for others in unique_fields:
+        conflicts = rows.annotate(merge_target=target_of(field.attname, mapping)).filter(
+            Exists(
+                model._base_manager.filter(
+                    **{field.attname: OuterRef("merge_target")}, **{name: OuterRef(name) for name in others}
+                )
+            )
+        )
+        conflicting_ids = list(conflicts.values_list("pk", flat=True))
+        if conflicting_ids:
+            model._base_manager.filter(pk__in=conflicting_ids).delete()
+    return rows.update(**{field.name: target_of(field.attname, mapping)})
+
+
+def merge_data(target, source):
+    """
+    Merges the data of the source into the target, in memory.
+    """
+    for field in MOVED_FIELDS:
+        value = getattr(source, field)
+        if value and getattr(target, field) in (None, "", value):
+            setattr(target, field, value)
+            setattr(source, field, None)
+    if not source.email:
+        source.no_email = True
+    if target.email:
+        target.no_email = False
+    for field in FILLED_FIELDS:
+        if not getattr(target, field) and getattr(source, field):
+            setattr(target, field, getattr(source, field))
+    target.notes = (
+        f"Combined from {source.id} - {source.get_full_name()} at {date.today()}" + f"\n{target.notes or ''}"
+    )
+    if source.notes:
+        target.notes += f"\n\nNotes imported from {source.id} - {source.get_full_name()}\n\n"
+        target.notes += source.notes
+
+
+def merge_tags(mapping):
+    content_type = ContentType.objects.get_for_model(Contact)
+    delete_tag = Tag.objects.filter(name=DELETE_TAG).first() or Tag.objects.create(name=DELETE_TAG)
+    items = TaggedItem.objects.filter(content_type=content_type, object_id__in=list(mapping))
+    TaggedItem.objects.bulk_create(
+        [
+            TaggedItem(content_type=content_type, object_id=mapping[source_id], tag_id=tag_id)
+            for source_id, tag_id in items.values_list("object_id", "tag_id")
+        ]
+        + [TaggedItem(content_type=content_type, object_id=source_id, tag=delete_tag) for source_id in mapping],
+        ignore_conflicts=True,
+    )
+
+
+def sync_with_cms(contact, old_email):
+    try:
+        update_web_user(contact, old_email)
+        update_web_user_newsletters(contact)
+    except ValidationError as ex:
+        mail_managers_on_errors("CMS sync of merged contact {}".format(contact.id), str(ex), traceback.format_exc())
+
+
+def merge_contacts(pairs):
+    """
+    Merges each source into its target, for a list of (target, source) Contact pairs. A contact can be in only one
+    pair. Raises ValueError for the pairs that can't be merged, and rolls back everything on any error.
+    """
+    contact_ids = [contact.id for pair in pairs for contact in pair]
+    if len(set(contact_ids)) != len(contact_ids):
+        raise ValueError("A contact can't be merged with itself or be in more than one pair")
+    mapping = {source.id: target.id for target, source in pairs}
+
+    with transaction.atomic(), dcf_members.deferred_refresh(), campaign_queue.deferred_refresh():
+        emails = {target.id: target.email for target, source in pairs}
+        for target, source in pairs:
+            merge_data(target, source)
+        # first, since the moved emails are unique
+        Contact.objects.bulk_update([source for target, source in pairs], ["email", "no_email", "id_document"])
+        for target, source in pairs:
+            # updatefromweb skips the CMS sync of the signals, but also the validations of clean() in save()
+            if target.email != emails[target.id]:
+                target.clean(debug=settings.DEBUG_CONTACT_CLEAN)
+            target.updatefromweb = True
+            target.save()
+            target.updatefromweb = False
+
+        # The pending activities of the sources in campaigns would call their targets again
+        Activity.objects.filter(contact_id__in=list(mapping), campaign__isnull=False, status__in=["A", "P"]).delete()
+        # The duplicate candidates of the sources are solved (see core.contact_duplicates)
+        DuplicateContactCandidate.objects.filter(
+            Q(contact_id__in=list(mapping)) | Q(other_id__in=list(mapping))
+        ).delete()
+        for model, field, unique_fields in contact_relations():
+            repoint(model, field, unique_fields, mapping)
+            if model is Contact:
+                # a target that referenced its source
+                Contact.objects.filter(pk__in=list(mapping.values()), **{field.attname: F("pk")}).update(
+                    **{field.name: None}
+                )
+        merge_tags(mapping)
+
+        dcf_members.contacts_changed(contact_ids)
+        campaign_queue.contacts_changed(contact_ids)
+        for target, source in pairs:
+            transaction.on_commit(
+                lambda target=target: sync_with_cms(target, getattr(target, "old_email", None))
+            )
+    return [target for target, source in pairs]
+
+
+def merge_pairs(id_pairs, chunk_size=500):
+    """
+    Merges a list of (target id, source id) pairs, chunk_size pairs in each transaction. A target can receive several
+    sources. When a chunk fails its pairs are merged one by one, so only the failing pairs are left unmerged. Returns
+    the number of pairs merged and a list of (target id, source id, error) for the rest.
+    """
+    errors, valid_pairs, sources, targets = [], [], set(), set()
+    existing = set(
+        Contact.objects.filter(pk__in={contact_id for pair in id_pairs for contact_id in pair}).values_list(
+            "pk", flat=True
+        )
+    )
+    for target_id, source_id in id_pairs:
+        if target_id not in existing or source_id not in existing:
+            errors.append((target_id, source_id, "Contact not found"))
+        elif target_id == source_id or source_id in sources or source_id in targets or target_id in sources:
+            errors.append((target_id, source_id, "The source is already merged or is a target in another pair"))
+        else:
+            valid_pairs.append((target_id, source_id))
+            sources.add(source_id)
+            targets.add(target_id)
+
+    # a target is in only one pair of each chunk
+    chunks = []
+    for target_id, source_id in valid_pairs:
+        for chunk in chunks:
+            if len(chunk) < chunk_size and target_id not in chunk:
+                chunk[target_id] = source_id
+                break
+        else:
+            chunks.append({target_id: source_id})
+
+    merged = 0
+    with dcf_members.deferred_refresh(), campaign_queue.deferred_refresh():
+        for chunk in chunks:
+            try:
+                contacts = Contact.objects.in_bulk(list(chunk) + list(chunk.values()))
+                merge_contacts([(contacts[target_id], contacts[source_id]) for target_id, source_id in chunk.items()])
+                merged += len(chunk)
+            except Exception:
+                # the contacts changed in memory are read again
+                for target_id, source_id in chunk.items():
+                    try:
+                        contacts = Contact.objects.in_bulk([target_id, source_id])
+                        merge_contacts([(contacts[target_id], contacts[source_id])])
+                        merged += 1
+                    except Exception as ex:
+                        errors.append((target_id, source_id, str(ex)))
+    return merged, errors
@@ -0,0 +1,141 @@
+# coding=utf-8
+"""
+Incremental refresh of the materialised DynamicContactFilter membership (see DynamicContactFilterMember).
+
+The signals in core.signals and invoicing.signals report the contacts whose data read by the filters changed, with the
+criteria that changed (see CRITERIA): only those contacts are refreshed, and only in the filters that read those
+criteria. A save that doesn't change any field read by the filters (like the next billing date of a subscription)
+doesn't refresh anything. The contacts are collected and refreshed once when the transaction is committed, so a process
+that saves many rows in one transaction refreshes each filter once. Inside a deferred_refresh() block they're also
+collected in autocommit mode, which is what processes that save many rows outside a transaction should use.
+
+Whether a contact is a debtor also depends on the date (an invoice expires without being saved), so the filters with
+debtor contacts must be rebuilt every day with the rebuild_dcf_members command.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .models import Contact, DynamicContactFilter, Subscription, SubscriptionNewsletter, SubscriptionProduct
+
+
+# Every filter reads the email of its contacts, the other criteria are read only by some of them
+ALL, PROMOTIONS, POLLS, PRODUCTS, NEWSLETTERS, DEBTORS = (
+    "all", "allow_promotions", "allow_polls", "products", "newsletters", "debtors"
+)
+# The fields read by the filters, for each model whose signals refresh them, and their criterion
+TRACKED_FIELDS = {
+    Contact: {"email": ALL, "allow_promotions": PROMOTIONS, "allow_polls": POLLS},
+    Subscription: {"contact": PRODUCTS, "active": PRODUCTS},
+    SubscriptionProduct: {"subscription": PRODUCTS, "product": PRODUCTS},
+    SubscriptionNewsletter: {"contact": NEWSLETTERS, "product": NEWSLETTERS},
+}
+
+_state = threading.local()
+
+
+def reads(dcf, criterion):
+    """
+    Whether the members of the filter depend on the criterion.
+    """
+    if criterion == PROMOTIONS:
+        return dcf.allow_promotions
+    if criterion == POLLS:
+        return dcf.allow_polls
+    if criterion == PRODUCTS:
+        return dcf.mode in (1, 2)
+    if criterion == NEWSLETTERS:
+        return dcf.mode == 3
+    if criterion == DEBTORS:
+        return dcf.debtor_contacts is not None
+    return True
+
+
+def saving(instance, update_fields=None):
+    """
+    Called before an instance of one of the TRACKED_FIELDS models is saved. Reads the saved row once and keeps in the
+    instance the criteria of the fields that change (all of them for a new row) as dcf_criteria, and the saved values
+    of those fields as dcf_previous.
+    """
+    tracked = TRACKED_FIELDS[instance._meta.concrete_model]
+    instance.dcf_criteria, instance.dcf_previous = set(), {}
+    attnames = {instance._meta.get_field(name).attname: name for name in tracked}
+    if update_fields is not None:
+        attnames = {
+            attname: name for attname, name in attnames.items() if attname in update_fields or name in update_fields
+        }
+    if not attnames:
+        return
+    previous = None
+    if instance.pk is not None:
+        previous = instance._meta.concrete_model.objects.filter(pk=instance.pk).values(*attnames).first()
+    if previous is None:
+        instance.dcf_criteria = {tracked[name] for name in attnames.values()}
+        return
+    instance.dcf_previous = previous
+    instance.dcf_criteria = {
+        tracked[name] for attname, name in attnames.items() if previous[attname] != getattr(instance, attname)
+    }
+
+
+def refresh_contacts(changes):
+    """
+    Refreshes the membership of the contacts that changed, given as {criterion: contact ids}, in the filters that read
+    each criterion. Each filter is refreshed once, for all its contacts.
+    """
+    changes = {criterion: set(contact_ids) for criterion, contact_ids in changes.items() if contact_ids}
+    if not changes:
+        return
+    for dcf in DynamicContactFilter.objects.prefetch_related("products", "newsletters"):
+        contact_ids = set().union(
+            *(contact_ids for criterion, contact_ids in changes.items() if reads(dcf, criterion))
+        )
+        if contact_ids:
+            dcf.refresh_members(contact_ids)
+
+
+def refresh_pending():
+    pending, _state.on_commit = getattr(_state, "on_commit", None), None
+    if pending:
+        refresh_contacts(pending)
+
+
+def contacts_changed(contact_ids, criteria=(ALL,)):
+    """
+    Called by the signals with the contacts that changed and the criteria that changed for them. The contacts are
+    refreshed when the current transaction is committed (right away in autocommit mode), or when the current
+    deferred_refresh() block ends.
+    """
+    contact_ids = set(contact_ids)
+    if not contact_ids or not criteria:
+        return
+    pending = getattr(_state, "deferred", None)
+    if pending is None:
+        pending = getattr(_state, "on_commit", None)
+        if pending is None:
+            pending = _state.on_commit = defaultdict(set)
+        # registered on every call, since the callbacks of a savepoint that is rolled back are discarded. The first one
+        # that runs refreshes everything pending, the rest find nothing to do.
+        transaction.on_commit(refresh_pending)
+    for criterion in criteria:
+        pending[criterion].update(contact_ids)
+
+
+@contextmanager
+def deferred_refresh():
+    """
+    Collects the contacts changed inside the block and reports them once when it ends, to be refreshed when the
+    transaction is committed. Blocks can be nested, the outermost one reports them.
+    """
+    if getattr(_state, "deferred", None) is not None:
+        yield
+        return
+    _state.deferred = defaultdict(set)
+    try:
+        yield
+    finally:
+        pending, _state.deferred = _state.deferred, None
+    for criterion, contact_ids in pending.items():
+        contacts_changed(contact_ids, [criterion])
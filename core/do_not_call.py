@@ -0,0 +1,167 @@
+# coding=utf-8
+"""
+Do not call numbers (the national registry of numbers that can't be called, uploaded in support).
+
+The numbers are matched by their national significant number (without the country code or the trunk prefix), stored
+in the indexed DoNotCallNumber.national_number column, instead of with a LIKE '%number%' scan of the registry:
+
+- normalize_number() returns that key, for a registry number or a contact phone.
+- prefetch_do_not_call() checks the phones of a list of contacts (a page of a list, the contacts of the seller console)
+  with one query, and leaves the result on each contact, where Contact.do_not_call() reads it. flag_contacts() does the
+  same for a whole queryset (like the contacts of a campaign), one query per chunk.
+- sync_numbers() applies a new registry as a diff: only the numbers added and removed are written.
+
+With the DO_NOT_CALL_IN_MEMORY_FILTER setting, the checks look up the keys in a sorted array of the whole registry,
+loaded once per process and loaded again when the registry changes, instead of querying it.
+"""
+import re
+from uuid import uuid4
+
+import numpy as np
+import phonenumbers
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from phonenumber_field.phonenumber import PhoneNumber
+
+from .models import Contact, DoNotCallNumber
+
+
+PHONE_FIELDS = ("phone", "mobile", "work_phone")
+VERSION_KEY = "do_not_call:version"
+
+
+def normalize_number(number):
+    """
+    Returns the national significant number of a phone (a PhoneNumber or a string), or None if it has no digits.
+    """
+    if not number:
+        return None
+    if isinstance(number, PhoneNumber):
+        if number.national_number is None:
+            return None
+        return phonenumbers.national_significant_number(number)
+    try:
+        parsed = phonenumbers.parse(str(number), getattr(settings, "PHONENUMBER_DEFAULT_REGION", None))
+    except phonenumbers.NumberParseException:
+        parsed = None
+    if parsed is not None and parsed.national_number:
+        return phonenumbers.national_significant_number(parsed)
+    return re.sub(r"\D", "", str(number)).lstrip("0") or None
+
+
+class DoNotCallFilter:
+    """
+    The keys of the registry in a sorted array, looked up with a binary search.
+    """
+
+    def __init__(self, keys):
+        self.keys = np.unique(np.array([key for key in keys if key], dtype=str))
+
+    def matching(self, keys):
+        """
+        Returns the keys that are in the registry.
+        """
+        keys = np.array(list(keys), dtype=str)
+        if not len(keys) or not len(self.keys):
+            return set()
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return set(keys[self.keys[positions] == keys].tolist())
+
+
+_filter = {"version": None, "filter": None}
+
+
+def registry_changed():
+    """
+    Makes every process load the in-memory filter again.
+    """
+    cache.set(VERSION_KEY, uuid4().hex, None)
+
+
+def get_filter():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    # without a version (no cache available) the filter is loaded every time
+    if _filter["filter"] is None or version is None or _filter["version"] != version:
+        _filter["filter"] = DoNotCallFilter(
+            DoNotCallNumber.objects.values_list("national_number", flat=True).iterator(chunk_size=10000)
+        )
+        _filter["version"] = version
+    return _filter["filter"]
+
+
+def matching_keys(keys):
+    """
+    Returns the keys that are in the registry, with one query or with the in-memory filter.
+    """
+    keys = {key for key in keys if key}
+    if not keys:
+        return set()
+    if getattr(settings, "DO_NOT_CALL_IN_MEMORY_FILTER", False):
+        return get_filter().matching(keys)
+    return set(DoNotCallNumber.objects.filter(national_number__in=keys).values_list("national_number", flat=True))
+
+
+def prefetch_do_not_call(contacts):
+    """
+    Checks the phones of the contacts against the registry, with one query, and sets on each contact the
+    do_not_call_checked dict ({key: bool}) that Contact.do_not_call() reads. Returns the contacts.
+    """
+    contacts = list(contacts)
+    contact_keys = [
+        {normalize_number(getattr(contact, field)) for field in PHONE_FIELDS} - {None} for contact in contacts
+    ]
+    matches = matching_keys(key for keys in contact_keys for key in keys)
+    for contact, keys in zip(contacts, contact_keys):
+        contact.do_not_call_checked = {key: key in matches for key in keys}
+    return contacts
+
+
+def flag_contacts(queryset=None, chunk_size=5000):
+    """
+    Returns {contact id: [phone fields in the registry]} for the contacts of the queryset that have any, checking
+    chunk_size contacts per query.
+    """
+    if queryset is None:
+        queryset = Contact.objects.all()
+    contacts = queryset.only("id", *PHONE_FIELDS).order_by().iterator(chunk_size=chunk_size)
+    flagged, chunk = {}, []
+    for contact in contacts:
+        chunk.append(contact)
+        if len(chunk) == chunk_size:
+            flagged.update(flagged_fields(chunk))
+            chunk = []
+    flagged.update(flagged_fields(chunk))
+    return flagged
+
+
+def flagged_fields(contacts):
+    flagged = {}
+    for contact in prefetch_do_not_call(contacts):
+        fields = [field for field in PHONE_FIELDS if contact.do_not_call(field)]
+        if fields:
+            flagged[contact.id] = fields
+    return flagged
+
+
+def sync_numbers(numbers, batch_size=5000):
+    """
+    Makes the registry have exactly the numbers given, deleting the ones that aren't there anymore and creating the
+    new ones, in one transaction. Returns the number of numbers added and removed.
+    """
+    numbers = {number.strip() for number in numbers if number and number.strip()}
+    existing = set(DoNotCallNumber.objects.values_list("number", flat=True).iterator(chunk_size=10000))
+    added, removed = sorted(numbers - existing), sorted(existing - numbers)
+    with transaction.atomic():
+        for start in range(0, len(removed), batch_size):
+            DoNotCallNumber.objects.filter(number__in=removed[start:start + batch_size]).delete()
+        DoNotCallNumber.objects.bulk_create(
+            [DoNotCallNumber(number=number, national_number=normalize_number(number) or "") for number in added],
+            batch_size=batch_size,
+        )
+        if added or removed:
+            transaction.on_commit(registry_changed)
+    return len(added), len(removed)
@@ -0,0 +1,237 @@
+# coding=utf-8
+"""
+Synchronisation of the Dynamic Contact Filters with their Mailtrain lists.
+
+The emails of a filter and of its list are compared as sets, so only the differences are sent to Mailtrain. Mailtrain
+subscribes and deletes one email per request, so those requests are made by a bounded pool of threads, each one with its
+own pooled HTTP session that retries with exponential backoff on connection errors and on 429/5xx responses. A single
+MailtrainClient (and its rate limit) can be shared by the syncs of several filters running at the same time.
+
+Every run produces a SyncReport with the emails added and removed and the ones that failed, which can be written to a
+CSV file.
+"""
+import csv
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class MailtrainError(Exception):
+    pass
+
+
+class RateLimiter:
+    """
+    Allows at most `rate` calls to acquire() per second, shared by every thread that uses it.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(self.next_slot, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class MailtrainClient:
+    """
+    Mailtrain API client safe to use from several threads. By default it's configured with the MAILTRAIN_API_URL and
+    MAILTRAIN_API_KEY settings, and MAILTRAIN_API_RATE (requests per second, no limit if it's not set).
+    """
+
+    page_size = 10000
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_url=None, api_key=None, rate=None, retries=4, backoff=0.5, timeout=30, pool_size=16):
+        self.api_url = api_url or getattr(settings, "MAILTRAIN_API_URL", None)
+        self.api_key = api_key or getattr(settings, "MAILTRAIN_API_KEY", None)
+        if not (self.api_url and self.api_key):
+            raise MailtrainError("Mailtrain API URL or API Key is not configured properly.")
+        rate = rate or settings.MAILTRAIN_API_RATE
+        self.rate_limiter = RateLimiter(rate) if rate else None
+        self.retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=self.retry_statuses,
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=self.retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.local.session = session
+        return session
+
+    def call(self, endpoint, method="get", params=None, data=None):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        response = self.session.request(
+            method,
+            f"{self.api_url}{endpoint}",
+            params=dict(params or {}, access_token=self.api_key),
+            data=data,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response
+
+    def list_emails(self, list_id):
+        """
+        Returns every email of the list, whatever its status, reading it in pages.
+        """
+        emails, start = [], 0
+        while True:
+            data = self.call(f"subscriptions/{list_id}", params={"start": start, "limit": self.page_size}).json()
+            subscriptions = data["data"]["subscriptions"]
+            emails.extend(subscription["email"] for subscription in subscriptions)
+            start += len(subscriptions)
+            if len(subscriptions) < self.page_size or start >= data["data"].get("total", start):
+                return emails
+
+    def subscribe(self, email, list_id):
+        return self.call(f"subscribe/{list_id}", method="post", data={"EMAIL": email})
+
+    def delete(self, email, list_id):
+        return self.call(f"delete/{list_id}", method="post", data={"EMAIL": email})
+
+
+class SyncReport:
+    """
+    Result of the synchronisation of a filter with its list.
+    """
+
+    def __init__(self, dcf, list_id):
+        self.dcf, self.list_id = dcf, list_id
+        self.in_filter = self.in_list = 0
+        self.added, self.removed = [], []
+        # (email, action, error)
+        self.errors = []
+        self.seconds = 0.0
+        self.finished = None
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def as_dict(self):
+        return {
+            "dcf_id": self.dcf.id,
+            "list_id": self.list_id,
+            "in_filter": self.in_filter,
+            "in_list": self.in_list,
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "errors": len(self.errors),
+            "seconds": round(self.seconds, 1),
+        }
+
+    def __str__(self):
+        return "Filter {dcf_id} -> list {list_id}: {in_filter} in filter, {in_list} in list, {added} added, " \
+            "{removed} removed, {errors} errors in {seconds}s".format(**self.as_dict())
+
+    def write_csv(self, directory=None):
+        """
+        Writes the diff (email, action, result) to a CSV file under the directory, by default
+        MEDIA_ROOT/MAILTRAIN_SYNC_REPORTS_PATH, and returns its path.
+        """
+        directory = directory or os.path.join(settings.MEDIA_ROOT, settings.MAILTRAIN_SYNC_REPORTS_PATH)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory, "dcf-{}-{}.csv".format(self.dcf.id, (self.finished or timezone.now()).strftime("%Y%m%d%H%M%S"))
+        )
+        with open(path, "w", newline="") as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(["email", "action", "result"])
+            writer.writerows((email, "add", "ok") for email in self.added)
+            writer.writerows((email, "remove", "ok") for email in self.removed)
+            writer.writerows((email, action, error) for email, action, error in self.errors)
+        return path
+
+
+def sync_emails(report, emails_in_filter, client, workers=8, dry_run=False):
+    """
+    Makes the list of the report have exactly the emails of the filter. Emails are compared ignoring case.
+    """
+    start = time.monotonic()
+    try:
+        emails_in_list = client.list_emails(report.list_id)
+    except requests.RequestException as e:
+        # without the current list nothing can be compared, and nothing must be removed
+        report.errors.append(("", "list", str(e)))
+        report.seconds = time.monotonic() - start
+        return report
+    in_filter = {email.lower(): email for email in emails_in_filter}
+    in_list = {email.lower(): email for email in emails_in_list}
+    report.in_filter, report.in_list = len(in_filter), len(in_list)
+    to_remove = [in_list[email] for email in sorted(in_list.keys() - in_filter.keys())]
+    to_add = [in_filter[email] for email in sorted(in_filter.keys() - in_list.keys())]
+
+    if dry_run:
+        report.added, report.removed = to_add, to_remove
+    else:
+
+        def apply(action, email):
+            try:
+                (client.delete if action == "remove" else client.subscribe)(email, report.list_id)
+            except requests.RequestException as e:
+                return action, email, str(e)
+            return action, email, None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            tasks = [("remove", email) for email in to_remove] + [("add", email) for email in to_add]
+            for action, email, error in pool.map(lambda task: apply(*task), tasks):
+                if error:
+                    report.errors.append((email, action, error))
+                else:
+                    (report.removed if action == "remove" else report.added).append(email)
+    report.seconds = time.monotonic() - start
+    report.finished = timezone.now()
+    return report
+
+
+def sync_filters(filters, client=None, concurrency=1, workers=None, dry_run=False):
+    """
+    Synchronises the filters with their Mailtrain lists, `concurrency` filters at the same time, sharing the client
+    (and its rate limit). The emails of the filters are read here, so the threads only talk to Mailtrain. Returns the
+    reports in the same order as the filters; last_time_synced is updated for the filters synced without errors.
+    """
+    client = client or MailtrainClient()
+    workers = workers or settings.MAILTRAIN_SYNC_WORKERS
+    plans = []
+    for dcf in filters:
+        if dcf.debtor_contacts:
+            # the debtors also change when an invoice expires, which doesn't refresh the members
+            dcf.refresh_members()
+        plans.append((SyncReport(dcf, dcf.mailtrain_id), dcf.get_emails()))
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        reports = list(pool.map(lambda plan: sync_emails(plan[0], plan[1], client, workers, dry_run), plans))
+
+    for report in reports:
+        if report.ok and not dry_run:
+            report.dcf.last_time_synced = report.finished
+            report.dcf.save(update_fields=["last_time_synced"])
+    return reports
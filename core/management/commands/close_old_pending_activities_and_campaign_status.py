@@ -2,6 +2,7 @@ from datetime import datetime
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db import transaction
+from core.campaign_queue import deferred_refresh
 from core.models import Activity, ContactCampaignStatus
 from core.choices import ACTIVITY_STATUS
 from support.models import SellerConsoleAction
@@ -74,7 +75,7 @@ class Command(BaseCommand):
             campaign_statuses_updated = 0
 
             # Process each activity
-            with transaction.atomic():
+            with transaction.atomic(), deferred_refresh():
                 for activity in activities:
                     # Update the activity
                     activity.status = ACTIVITY_STATUS.COMPLETED  # Completed
@@ -0,0 +1,37 @@
+# coding=utf-8
+import time
+
+from django.core.management import BaseCommand
+
+from core.contact_duplicates import MAX_BLOCK, MIN_SCORE, find_candidates, store_candidates
+
+
+class Command(BaseCommand):
+    help = """Finds the pairs of contacts that are probably duplicated and replaces the candidates shown in the
+    duplicate contacts view with them (see core.contact_duplicates). The dismissed pairs are kept."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-score",
+            type=float,
+            default=MIN_SCORE,
+            help="Minimum score of a pair, from 0 to 1 (default %(default)s)",
+        )
+        parser.add_argument(
+            "--max-block",
+            type=int,
+            default=MAX_BLOCK,
+            help="Values of a key (email, phone, id document, name) shared by more contacts are ignored "
+            "(default %(default)s)",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Show the best candidates without storing them")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        candidates = find_candidates(min_score=options["min_score"], max_block=options["max_block"])
+        self.stdout.write("{} candidates found in {:.1f}s".format(len(candidates), time.time() - start))
+        if options["dry_run"]:
+            self.stdout.write(candidates.head(50).to_string(index=False))
+        else:
+            stored = store_candidates(candidates)
+            self.stdout.write(self.style.SUCCESS("{} candidates pending review".format(stored)))
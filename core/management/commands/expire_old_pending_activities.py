@@ -2,6 +2,7 @@ from datetime import datetime
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db import transaction
+from core.campaign_queue import deferred_refresh
 from core.models import Activity
 from core.choices import ACTIVITY_STATUS
 
@@ -78,7 +79,7 @@ class Command(BaseCommand):
         # Update activities to expired status
         expired_count = 0
         
-        with transaction.atomic():
+        with transaction.atomic(), deferred_refresh():
             for activity in pending_activities:
                 activity.status = ACTIVITY_STATUS.EXPIRED
                 activity.save()
@@ -0,0 +1,33 @@
+# coding=utf-8
+import csv
+
+from django.core.management import BaseCommand, CommandError
+
+from core.contact_merge import merge_pairs
+
+
+class Command(BaseCommand):
+    help = """Merges duplicated contacts from a CSV file with a (target contact id, source contact id) pair per row: the
+    subscriptions, invoices, issues, activities and every other row of the source are moved to the target, and the
+    source is tagged "eliminar" (see core.contact_merge). A first row that isn't numeric is taken as a header."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_file", help="CSV file with the target and source ids")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Pairs merged in each transaction")
+        parser.add_argument("--delimiter", default=",")
+
+    def handle(self, *args, **options):
+        pairs = []
+        with open(options["csv_file"], newline="") as csv_file:
+            for line, row in enumerate(csv.reader(csv_file, delimiter=options["delimiter"]), 1):
+                if not row:
+                    continue
+                try:
+                    pairs.append((int(row[0]), int(row[1])))
+                except (ValueError, IndexError):
+                    if line > 1:
+                        raise CommandError("Line {}: expected a target id and a source id".format(line))
+        merged, errors = merge_pairs(pairs, options["chunk_size"])
+        for target_id, source_id, error in errors:
+            self.stderr.write("{} <- {}: {}".format(target_id, source_id, error))
+        self.stdout.write("{} contacts merged, {} pairs with errors".format(merged, len(errors)))
@@ -0,0 +1,30 @@
+# coding=utf-8
+import time
+
+from django.core.management import BaseCommand
+
+from core.models import Campaign
+
+
+class Command(BaseCommand):
+    help = """Rebuilds the materialised queues of the campaigns (the contacts each seller has to call). Run it after
+    changes made without signals, like bulk updates of ContactCampaignStatus or Activity objects."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("campaign_ids", nargs="*", type=int, help="Campaigns to rebuild, by default all of them")
+        parser.add_argument("--active-only", action="store_true", help="Rebuild only the active campaigns")
+
+    def handle(self, *args, **options):
+        campaigns = Campaign.objects.all()
+        if options["campaign_ids"]:
+            campaigns = campaigns.filter(pk__in=options["campaign_ids"])
+        if options["active_only"]:
+            campaigns = campaigns.filter(active=True)
+        for campaign in campaigns:
+            start = time.time()
+            campaign.refresh_queue()
+            self.stdout.write(
+                "Campaign {} ({}): {} contacts queued in {:.1f}s".format(
+                    campaign.id, campaign.name, campaign.queue_entries.count(), time.time() - start
+                )
+            )
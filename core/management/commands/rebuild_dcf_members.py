@@ -0,0 +1,32 @@
+# coding=utf-8
+import time
+
+from django.core.management import BaseCommand
+
+from core.models import DynamicContactFilter
+
+
+class Command(BaseCommand):
+    help = """Rebuilds the materialised membership of the Dynamic Contact Filters. Run it every day for the filters with
+    debtor contacts (an invoice can expire without being saved) and after changes made without signals."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("dcf_ids", nargs="*", type=int, help="Filters to rebuild, by default all of them")
+        parser.add_argument(
+            "--debtors-only", action="store_true", help="Rebuild only the filters that use the debtor contacts option"
+        )
+
+    def handle(self, *args, **options):
+        filters = DynamicContactFilter.objects.prefetch_related("products", "newsletters")
+        if options["dcf_ids"]:
+            filters = filters.filter(pk__in=options["dcf_ids"])
+        if options["debtors_only"]:
+            filters = filters.filter(debtor_contacts__isnull=False)
+        for dcf in filters:
+            start = time.time()
+            dcf.refresh_members()
+            self.stdout.write(
+                "Filter {} ({}): {} members in {:.1f}s".format(
+                    dcf.id, dcf.description, dcf.members.count(), time.time() - start
+                )
+            )
@@ -0,0 +1,108 @@
+"""
+Management command to simulate the revenue impact of a price change over every active subscription.
+
+Usage examples
+--------------
+    # New price for two products (by slug or id)
+    python manage.py simulate_prices --price newspaper=650 --price 12=300
+
+    # Also change the discount for annual subscriptions and write every subscription to a CSV
+    python manage.py simulate_prices --price newspaper=650 --discount 12=15 --csv-path /tmp/simulation.csv
+"""
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core.models import Product
+from core.price_simulation import PriceSimulation
+
+
+class Command(BaseCommand):
+    help = "Compares the current totals of every active subscription with the totals obtained with new prices"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--price",
+            action="append",
+            default=[],
+            metavar="PRODUCT=PRICE",
+            help="Proposed price for a product, given by slug or id (can be repeated)",
+        )
+        parser.add_argument(
+            "--discount",
+            action="append",
+            default=[],
+            metavar="FREQUENCY=PERCENTAGE",
+            help="Proposed discount for a frequency in months, instead of the DISCOUNT_{n}_MONTHS setting",
+        )
+        parser.add_argument("--top", type=int, default=20, help="Amount of top movers to show (default 20)")
+        parser.add_argument("--bins", type=int, default=10, help="Amount of histogram bins (default 10)")
+        parser.add_argument("--csv-path", help="Write the current and proposed total of every subscription here")
+
+    def parse_pairs(self, values, option):
+        pairs = []
+        for value in values:
+            key, sep, number = value.partition("=")
+            try:
+                assert sep
+                pairs.append((key.strip(), float(number)))
+            except (AssertionError, ValueError):
+                raise CommandError("Invalid --{} value: {}".format(option, value))
+        return pairs
+
+    def handle(self, *args, **options):
+        price_table = {}
+        for key, price in self.parse_pairs(options["price"], "price"):
+            lookup = Q(slug=key) | Q(id=key) if key.isdigit() else Q(slug=key)
+            product = Product.objects.filter(lookup).first()
+            if not product:
+                raise CommandError("Product not found: {}".format(key))
+            price_table[product.id] = price
+        frequency_discounts = {
+            int(frequency): percentage for frequency, percentage in self.parse_pairs(options["discount"], "discount")
+        }
+
+        start = time.monotonic()
+        simulation = PriceSimulation()
+        loaded = time.monotonic()
+        report = simulation.run(price_table, frequency_discounts, options["top"], options["bins"])
+        self.stdout.write(
+            "{} subscriptions in {} combinations, loaded in {:.2f}s, simulated in {:.2f}s".format(
+                report["subscriptions"], report["combinations"], loaded - start, time.monotonic() - loaded
+            )
+        )
+        self.stdout.write(
+            "Total per billing period: {:.2f} -> {:.2f} ({:+.2f}, {:+.2f}%)".format(
+                report["old_total"], report["new_total"], report["delta"], report["delta_pct"]
+            )
+        )
+        self.stdout.write("Monthly revenue: {:.2f} -> {:.2f}".format(report["old_monthly"], report["new_monthly"]))
+
+        self.stdout.write("\nDifference per subscription")
+        for bucket in report["histogram"]:
+            self.stdout.write("{:>10.2f} {:>10.2f}\t{}".format(bucket["from"], bucket["to"], bucket["count"]))
+
+        self.stdout.write("\nTop movers\nsubscription\tcontact\tfrequency\tcurrent\tproposed\tdifference")
+        for mover in report["top_movers"]:
+            self.stdout.write(
+                "{subscription_id}\t{contact_id}\t{frequency}\t{old:.2f}\t{new:.2f}\t{delta:+.2f}".format(**mover)
+            )
+
+        if options["csv_path"]:
+            old, new = simulation.compare(price_table, frequency_discounts)
+            with open(options["csv_path"], "w", newline="") as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(["subscription_id", "contact_id", "frequency", "current", "proposed"])
+                for i, subscription_id in enumerate(simulation.subscription_ids.tolist()):
+                    writer.writerow(
+                        [
+                            subscription_id,
+                            simulation.contact_ids[i],
+                            int(simulation.subscription_frequencies[i]),
+                            old[i],
+                            new[i],
+                        ]
+                    )
+            self.stdout.write(self.style.SUCCESS("CSV written to {}".format(options["csv_path"])))
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-17 11:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0118_subscription_added_products"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dynamiccontactfilter",
+            name="members_refreshed",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Last full refresh of the members"
+            ),
+        ),
+        migrations.CreateModel(
+            name="DynamicContactFilterMember",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("email", models.EmailField(max_length=254, verbose_name="Email")),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dynamic_contact_filter_memberships",
+                        to="core.contact",
+                    ),
+                ),
+                (
+                    "dcf",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="members",
+                        to="core.dynamiccontactfilter",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Dynamic Contact Filter member",
+                "verbose_name_plural": "Dynamic Contact Filter members",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dynamiccontactfiltermember",
+            constraint=models.UniqueConstraint(fields=("dcf", "contact"), name="unique_dcf_member"),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("support", "0040_absencereason_attendancerecord_shift_and_more"),
+        ("core", "0119_dynamiccontactfilter_members_refreshed_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="campaign",
+            name="queue_refreshed",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Last full refresh of the queue"
+            ),
+        ),
+        migrations.CreateModel(
+            name="CampaignQueueEntry",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date_assigned", models.DateField(blank=True, null=True)),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="queue_entries", to="core.campaign"
+                    ),
+                ),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="campaign_queue_entries",
+                        to="core.contact",
+                    ),
+                ),
+                (
+                    "contact_campaign_status",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="queue_entry",
+                        to="core.contactcampaignstatus",
+                    ),
+                ),
+                (
+                    "seller",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="campaign_queue_entries",
+                        to="support.seller",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Campaign queue entry",
+                "verbose_name_plural": "Campaign queue entries",
+                "indexes": [
+                    models.Index(
+                        fields=["campaign", "seller", "date_assigned", "contact"], name="campaign_queue_order"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0120_campaign_queue_refreshed_campaignqueueentry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="contactcampaignstatus",
+            index=models.Index(fields=["last_action_date"], name="ccs_last_action_date"),
+        ),
+    ]
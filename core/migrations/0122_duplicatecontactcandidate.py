@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0121_contactcampaignstatus_ccs_last_action_date"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="contact",
+            options={
+                "ordering": ("-id",),
+                "permissions": [("can_merge_contacts", "Can merge contacts")],
+                "verbose_name": "contact",
+                "verbose_name_plural": "contacts",
+            },
+        ),
+        migrations.CreateModel(
+            name="DuplicateContactCandidate",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("score", models.FloatField(verbose_name="Score")),
+                ("reasons", models.CharField(max_length=64, verbose_name="Reasons")),
+                ("detected", models.DateTimeField(auto_now_add=True, verbose_name="Detected")),
+                ("dismissed", models.BooleanField(default=False, verbose_name="Dismissed")),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="duplicate_candidates",
+                        to="core.contact",
+                    ),
+                ),
+                (
+                    "other",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="core.contact"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Duplicate contact candidate",
+                "verbose_name_plural": "Duplicate contact candidates",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="duplicatecontactcandidate",
+            constraint=models.UniqueConstraint(fields=("contact", "other"), name="unique_duplicate_candidate"),
+        ),
+        migrations.AddIndex(
+            model_name="duplicatecontactcandidate",
+            index=models.Index(fields=["dismissed", "-score"], name="duplicate_candidate_score"),
+        ),
+    ]
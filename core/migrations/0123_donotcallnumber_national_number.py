@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+def fill_national_numbers(apps, schema_editor):
+    from core.do_not_call import normalize_number
+
+    DoNotCallNumber = apps.get_model("core", "DoNotCallNumber")
+    numbers = []
+    for number in DoNotCallNumber.objects.all().iterator(chunk_size=10000):
+        number.national_number = normalize_number(number.number) or ""
+        numbers.append(number)
+    DoNotCallNumber.objects.bulk_update(numbers, ["national_number"], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0122_duplicatecontactcandidate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="donotcallnumber",
+            name="national_number",
+            field=models.CharField(db_index=True, default="", editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_national_numbers, migrations.RunPython.noop),
+    ]
@@ -10,7 +10,7 @@ from django.contrib.gis.db import models as gismodels
 from django.contrib.gis.geos import Point
 from django.conf import settings
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import F, Q, Sum, Count, Max, Prefetch
 from django.db.utils import IntegrityError
 from django.forms import ValidationError
@@ -61,10 +61,8 @@ from .choices import (
     FreeSubscriptionRequestedBy,
     get_activity_types,
 )
+from .mailtrain_sync import sync_filters
 from .utils import (
-    delete_email_from_mailtrain_list,
-    subscribe_email_to_mailtrain_list,
-    get_emails_from_mailtrain_list,
     validateEmailOnWeb,
     updatewebuser,
 )
@@ -957,16 +955,18 @@ class Contact(models.Model):
         return self.activity_set.count()
 
     def do_not_call(self, phone_att="phone"):
-        number = getattr(self, phone_att)
-        if phone_att == "work_phone":
-            return DoNotCallNumber.objects.filter(number__iexact=number).exists()
-        elif not number:
-            return False
-        elif isinstance(number, str):
-            return DoNotCallNumber.objects.filter(number__contains=number).exists()
-        elif number.national_number is None:
+        """
+        Whether the phone in phone_att is in the do not call registry. The phones of the contact are checked with one
+        query the first time, unless prefetch_do_not_call already checked them.
+        """
+        from .do_not_call import normalize_number, prefetch_do_not_call
+
+        key = normalize_number(getattr(self, phone_att))
+        if key is None:
             return False
-        return DoNotCallNumber.objects.filter(number__contains=number.national_number).exists()
+        if key not in getattr(self, "do_not_call_checked", {}):
+            prefetch_do_not_call([self])
+        return self.do_not_call_checked[key]
 
     def do_not_call_phone(self):
         return self.do_not_call("phone")
@@ -1004,7 +1004,8 @@ class Contact(models.Model):
         ocupation_id: str = None,
         birthdate: str = None,
     ) -> list:
-        """Takes a source contact and merges it within this one. It allows the manual overriding of data.
+        """Takes a source contact and merges it within this one (see core.contact_merge). It allows the manual
+        overriding of data.
 
         Args:
             source (Contact): The contact whose data is going to be deleted and merged into this one.
@@ -1021,34 +1022,22 @@ class Contact(models.Model):
             ocupation_id (str, optional): Override ocupation_id. Defaults to None.
             birthdate (str, optional): Override birthdate. Defaults to None.
         """
+        from .contact_merge import merge_contacts
+
         errors = []
         try:
             if email:
-                source.email = None
-                source.no_email = True
-                source.save()
-            if not email or email == "":
-                self.email = None
-                self.not_email = True
-            else:
                 self.email = email.strip()
-                self.not_email = False
-            self.save()  # check for the try
             if name:
                 self.name = name.strip()
             if last_name:
                 self.last_name = last_name.strip()
             if id_document:
-                if source.id_document == id_document.strip():
-                    source.id_document = None
-                    source.save()
-                self.id_document = id_document.strip()
-            if self.id_document == "":
-                self.id_document = None
+                self.id_document = id_document.strip() or None
             if phone:
                 self.phone = phone.strip()
             if work_phone:
-                self.work_phone = phone.strip()
+                self.work_phone = work_phone.strip()
             if mobile:
                 self.mobile = mobile.strip()
             if gender:
@@ -1061,30 +1050,8 @@ class Contact(models.Model):
                 self.ocupation_id = int(ocupation_id.strip())
             if birthdate:
                 self.birthdate = birthdate.strip()
-            self.notes = (
-                f"Combined from {source.id} - {source.get_full_name()} at {date.today()}" + f"\n{self.notes or ''}"
-            )
-            if source.notes:
-                self.notes += f"\n\nNotes imported from {source.id} - {source.get_full_name()}\n\n"
-                self.notes += source.notes
-            for tag in source.tags.all():
-                self.tags.add(tag.name)
-            self.save()
-            source.addresses.update(contact=self)
-            source.subscriptions.update(contact=self)
-            source.invoice_set.update(contact=self)
-            # We need to delete the activities that have a campaign and are yet to be resolved
-            source.activity_set.filter(campaign__isnull=False, status__in=["A", "P"]).delete()
-            # Then we update the contact of the remaining activities
-            source.activity_set.update(contact=self)
-            source.issue_set.update(contact=self)
-            # ContactCampaignStatus have a unique constraint on (contact, campaign)
-            # so we need to delete the source's ContactCampaignStatus and keep the ones from the target if they exist.
-            if self.contactcampaignstatus_set.exists():
-                source.contactcampaignstatus_set.all().delete()
-            source.contactproducthistory_set.update(contact=self)
-            source.tags.add("eliminar")
-
+            # the email and id document given are taken from the source if it has them (see core.contact_merge)
+            merge_contacts([(self, source)])
         except Exception as e:
             errors.append(e)
 
@@ -1172,6 +1139,9 @@ class Contact(models.Model):
         verbose_name = _("contact")
         verbose_name_plural = _("contacts")
         ordering = ("-id",)
+        permissions = [
+            ("can_merge_contacts", _("Can merge contacts")),
+        ]
 
 
 class Country(models.Model):
@@ -1802,6 +1772,8 @@ class Subscription(models.Model):
         """
         Returns the amount of products in this subscription
         """
+        if "subscriptionproduct_set" in getattr(self, "_prefetched_objects_cache", {}):
+            return len([sp for sp in self._prefetched_objects_cache["subscriptionproduct_set"] if sp.product_id])
         return self.products.count() if self.pk else 0
 
     def get_used_affiliate_slots(self):
@@ -1901,6 +1873,8 @@ class Subscription(models.Model):
             pass
         else:
             self.contact.add_product_history(self, product, "D")
+        # a prefetched subscriptionproduct_set (e.g. from a BillingContext) is stale from now on
+        getattr(self, "_prefetched_objects_cache", {}).pop("subscriptionproduct_set", None)
 
         if not self.subscriptionproduct_set.exists():
             self.active = False
@@ -2009,6 +1983,16 @@ class Subscription(models.Model):
         """
         Returns the first product by priority
         """
+        if "subscriptionproduct_set" in getattr(self, "_prefetched_objects_cache", {}):
+            products = [
+                sp.product
+                for sp in self._prefetched_objects_cache["subscriptionproduct_set"]
+                if sp.product
+                and sp.product.type in (Product.ProductTypeChoices.SUBSCRIPTION, Product.ProductTypeChoices.OTHER)
+            ]
+            # nulls last, as the database does with ascending order
+            products.sort(key=lambda p: (p.billing_priority is None, p.billing_priority or 0, p.id))
+            return products[0] if products else None
         products = self.products.filter(
             type__in=[Product.ProductTypeChoices.SUBSCRIPTION, Product.ProductTypeChoices.OTHER]
         ).order_by("billing_priority")
@@ -2029,7 +2013,13 @@ class Subscription(models.Model):
         product = self.get_first_product_by_priority()
         if product:
             result.update({"name": self.get_billing_name()})
-            sp = self.subscriptionproduct_set.filter(product=product).first()
+            if "subscriptionproduct_set" in getattr(self, "_prefetched_objects_cache", {}):
+                sp = min(
+                    (sp for sp in self._prefetched_objects_cache["subscriptionproduct_set"] if sp.product == product),
+                    key=lambda sp: sp.id,
+                )
+            else:
+                sp = self.subscriptionproduct_set.filter(product=product).first()
             # TODO: Remove or at least explain why a hardcoded frequency of "4" has an special treatment on next line
             # TODO: "56" route should be turned into a feature and its id should not be used in a hardcoded way
             default_state = getattr(settings, "DEFAULT_STATE", None)
@@ -2126,9 +2116,11 @@ class Subscription(models.Model):
 
         return invoiceitem_list
 
-    def product_summary(self, with_pauses=False):
+    def product_summary(self, with_pauses=False, context=None):
         """
         Takes each product for this subscription and returns a list with the copies for each.
+        A BillingContext (see invoicing.billing_context) can be given to use its already loaded products and price
+        rules.
         """
         # products = self.products.filter(type='S')  # TODO: explain the usage of this commented line or remove it
         from .utils import process_products
@@ -2143,6 +2135,8 @@ class Subscription(models.Model):
                 subscription_products = subscription_products.filter(active=True)
 
         dict_all_products = {str(sp.product.id): str(sp.copies) for sp in subscription_products if sp.product}
+        if context is not None:
+            return process_products(dict_all_products, catalog=context.products, price_rules=context.price_rules)
         return process_products(dict_all_products)
 
     def product_summary_list(self, with_pauses=False) -> list:
@@ -2617,13 +2611,18 @@ class Campaign(models.Model):
         default=3, blank=True, null=True, verbose_name=_("Priority"), choices=Priorities.choices
     )
     days = models.PositiveSmallIntegerField(default=5, blank=True, null=True)
+    queue_refreshed = models.DateTimeField(
+        null=True, blank=True, editable=False, verbose_name=_("Last full refresh of the queue")
+    )
 
     def __str__(self):
         return self.name
 
-    def get_not_contacted(self, seller_id):
+    def get_queue_statuses(self):
         """
-        Returns the ContactCampaignStatus objects for all Contacts that have not been called yet (status=1)
+        Returns the ContactCampaignStatus objects of all the sellers for the Contacts that have not been called yet
+        (status=1) or that have to be called again (status=3). This is the definition of the queue of the campaign,
+        which is materialised in CampaignQueueEntry (see refresh_queue).
 
         lower_priority_contacts are those that have a campaign with a priority lower than the current one
 
@@ -2640,14 +2639,16 @@ class Campaign(models.Model):
 
         All of those are excluded from the final queryset
         """
+        # a campaign without priority is queued like one with the default priority
+        priority = self.priority or self.Priorities.MID
         lower_priority_contacts = Contact.objects.filter(
-            contactcampaignstatus__campaign__priority__lt=self.priority,
+            contactcampaignstatus__campaign__priority__lt=priority,
             contactcampaignstatus__campaign__active=True,
             contactcampaignstatus__status=1,
         )
         same_priority_contacts = Contact.objects.filter(
             contactcampaignstatus__campaign__pk__lt=self.pk,
-            contactcampaignstatus__campaign__priority=self.priority,
+            contactcampaignstatus__campaign__priority=priority,
             contactcampaignstatus__campaign__active=True,
             contactcampaignstatus__status=1,
         ).exclude(contactcampaignstatus__campaign__pk=self.pk)
@@ -2671,21 +2672,83 @@ class Campaign(models.Model):
         """
 
         return (
-            self.contactcampaignstatus_set.filter(seller_id=seller_id, status__in=[1, 3])
+            self.contactcampaignstatus_set.filter(status__in=[1, 3])
             .exclude(contact__id__in=lower_priority_contacts.values('pk'))
             .exclude(contact__id__in=same_priority_contacts.values('pk'))
             .exclude(contact__id__in=contacts_with_current_activities.values('pk'))
             # TODO: @ prev TODO
             # .exclude(contact__id__in=contacts_with_lower_priority_activities.values('pk'))
             # .exclude(contact__id__in=contacts_with_same_priority_activities.values('pk'))
-            .order_by(F('date_assigned').asc(nulls_last=True), 'contact__id')
         )
 
+    def refresh_queue(self, contact_ids=None):
+        """
+        Updates the materialised queue (see CampaignQueueEntry) from get_queue_statuses(). Pass a list of contact ids
+        to refresh only those contacts, without it the whole queue is rebuilt.
+        """
+        statuses = self.get_queue_statuses()
+        stored_entries = self.queue_entries.all()
+        if contact_ids is not None:
+            statuses = statuses.filter(contact_id__in=contact_ids)
+            stored_entries = stored_entries.filter(contact_id__in=contact_ids)
+        fields = ("seller_id", "contact_id", "date_assigned")
+        current = {row[0]: row[1:] for row in statuses.order_by().values_list("id", *fields)}
+        stored = {row[0]: row[1:] for row in stored_entries.values_list("contact_campaign_status_id", *fields)}
+
+        removed = stored.keys() - current.keys()
+        if removed:
+            self.queue_entries.filter(contact_campaign_status_id__in=removed).delete()
+        changed = [
+            CampaignQueueEntry(
+                campaign=self,
+                contact_campaign_status_id=ccs_id,
+                seller_id=seller_id,
+                contact_id=contact_id,
+                date_assigned=date_assigned,
+            )
+            for ccs_id, (seller_id, contact_id, date_assigned) in current.items()
+            if stored.get(ccs_id) != (seller_id, contact_id, date_assigned)
+        ]
+        if changed:
+            CampaignQueueEntry.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=["contact_campaign_status"],
+                update_fields=["seller", "contact", "date_assigned"],
+            )
+        if contact_ids is None:
+            # update() doesn't send post_save, which would refresh the queues again
+            self.queue_refreshed = timezone.now()
+            Campaign.objects.filter(pk=self.pk).update(queue_refreshed=self.queue_refreshed)
+
+    def get_queue(self, seller_id):
+        """
+        Returns the entries of the queue of the seller in the order they have to be called, building the queue of the
+        campaign on first use.
+        """
+        if self.queue_refreshed is None:
+            self.refresh_queue()
+        return self.queue_entries.filter(seller_id=seller_id).order_by(
+            F("date_assigned").asc(nulls_last=True), "contact_id"
+        )
+
+    def get_not_contacted(self, seller_id):
+        """
+        Returns the ContactCampaignStatus objects of the seller for all Contacts that have not been called yet, in the
+        order they have to be called. They are read from the materialised queue, see get_queue_statuses() for which
+        ones are included.
+        """
+        if self.queue_refreshed is None:
+            self.refresh_queue()
+        return ContactCampaignStatus.objects.filter(
+            queue_entry__campaign=self, queue_entry__seller_id=seller_id
+        ).order_by(F("queue_entry__date_assigned").asc(nulls_last=True), "queue_entry__contact_id")
+
     def get_not_contacted_count(self, seller_id):
         """
         Returns the count of ContactCampaignStatus objects for all Contacts that have not been called yet (status=1)
         """
-        return self.get_not_contacted(seller_id).count()
+        return self.get_queue(seller_id).count()
 
     def get_successful_count(self, seller_id):
         return self.contactcampaignstatus_set.filter(seller_id=seller_id, campaign_resolution__in=["S1", "S2"]).count()
@@ -2914,6 +2977,7 @@ class ContactCampaignStatus(models.Model):
 
     class Meta:
         unique_together = ["contact", "campaign"]
+        indexes = [models.Index(fields=["last_action_date"], name="ccs_last_action_date")]
         verbose_name = _("Contact Campaign Status")
         verbose_name_plural = _("Contact Campaign Statuses")
         ordering = ["id"]
@@ -2968,6 +3032,35 @@ class ContactCampaignStatus(models.Model):
             subscription.save()
 
 
+class CampaignQueueEntry(models.Model):
+    """
+    Materialised queue of a Campaign: the ContactCampaignStatus objects that the sellers have to call, with what's
+    needed to order them. Kept up to date for the changed contacts by the signals in core.signals (see
+    core.campaign_queue), and rebuilt with the rebuild_campaign_queues command.
+    """
+
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="queue_entries")
+    contact_campaign_status = models.OneToOneField(
+        ContactCampaignStatus, on_delete=models.CASCADE, related_name="queue_entry"
+    )
+    seller = models.ForeignKey(
+        "support.Seller", on_delete=models.CASCADE, null=True, blank=True, related_name="campaign_queue_entries"
+    )
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name="campaign_queue_entries")
+    date_assigned = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return "{} - {}".format(self.campaign_id, self.contact_id)
+
+    class Meta:
+        verbose_name = _("Campaign queue entry")
+        verbose_name_plural = _("Campaign queue entries")
+        indexes = [
+            # the order of the queue of a seller, also used to count it
+            models.Index(fields=["campaign", "seller", "date_assigned", "contact"], name="campaign_queue_order"),
+        ]
+
+
 class PriceRule(models.Model):
     """
     Controls the price rules for bundled products and for different combinations of products, transforming one or more
@@ -3078,6 +3171,9 @@ class DynamicContactFilter(models.Model):
     mailtrain_id = models.CharField(max_length=9, blank=True)
     last_time_synced = models.DateTimeField(null=True, blank=True)
     debtor_contacts = models.PositiveSmallIntegerField(null=True, blank=True, choices=DEBTOR_CONCACTS_CHOICES)
+    members_refreshed = models.DateTimeField(
+        null=True, blank=True, editable=False, verbose_name=_("Last full refresh of the members")
+    )
 
     def __str__(self):
         return self.description
@@ -3120,43 +3216,67 @@ class DynamicContactFilter(models.Model):
 
         return subscriptions
 
+    def refresh_members(self, contact_ids=None):
+        """
+        Updates the materialised membership (see DynamicContactFilterMember) from get_subscriptions(). Pass a list of
+        contact ids to refresh only those contacts, without it the whole membership is rebuilt.
+        """
+        subscriptions = self.get_subscriptions()
+        if contact_ids is not None:
+            subscriptions = subscriptions.filter(contact_id__in=contact_ids)
+        current = dict(
+            Contact.objects.filter(pk__in=subscriptions.order_by().values("contact_id"))
+            .exclude(email__isnull=True)
+            .exclude(email="")
+            .values_list("id", "email")
+        )
+        stored_members = self.members.all()
+        if contact_ids is not None:
+            stored_members = stored_members.filter(contact_id__in=contact_ids)
+        stored = dict(stored_members.values_list("contact_id", "email"))
+
+        removed = stored.keys() - current.keys()
+        if removed:
+            self.members.filter(contact_id__in=removed).delete()
+        changed = [
+            DynamicContactFilterMember(dcf=self, contact_id=contact_id, email=email)
+            for contact_id, email in current.items()
+            if stored.get(contact_id) != email
+        ]
+        if changed:
+            DynamicContactFilterMember.objects.bulk_create(
+                changed, update_conflicts=True, unique_fields=["dcf", "contact"], update_fields=["email"]
+            )
+        if contact_ids is None:
+            # update() doesn't send post_save, which would refresh the filter again
+            self.members_refreshed = timezone.now()
+            DynamicContactFilter.objects.filter(pk=self.pk).update(members_refreshed=self.members_refreshed)
+
+    def get_members(self):
+        """
+        Returns the membership of the filter, built on first use.
+        """
+        if self.members_refreshed is None:
+            self.refresh_members()
+        return self.members.all()
+
     def get_email_count(self):
-        return self.get_subscriptions().count()
+        return self.get_members().count()
 
     def get_contacts(self):
-        if self.mode == 1:
-            return Contact.objects.filter(subscriptions__in=self.get_subscriptions()).distinct()
-        else:
-            return Contact.objects.filter(subscriptions__in=self.get_subscriptions())
+        return Contact.objects.filter(pk__in=self.get_members().values("contact_id"))
 
     def get_emails(self):
-        emails = []
-        for subscription in self.get_subscriptions():
-            if subscription.contact.email:
-                emails.append(subscription.contact.email)
-        return emails
-
-    def sync_with_mailtrain_list(self):
-        # We get all the lists first
-        emails_in_filter = self.get_emails()
-        emails_in_mailtrain = get_emails_from_mailtrain_list(self.mailtrain_id)
+        return list(self.get_members().values_list("email", flat=True))
 
+    def sync_with_mailtrain_list(self, client=None, dry_run=False):
+        """
+        Makes the Mailtrain list of the filter have exactly the emails of the filter, sending only the differences (see
+        core.mailtrain_sync). Returns the SyncReport of the run.
+        """
         if settings.DEBUG:
             print(f"DEBUG: synchronizing DCF {self.id} with list {self.mailtrain_id}")
-
-        # First we're going to delete the ones that don't belong to the list
-        for email_in_mailtrain in emails_in_mailtrain:
-            if email_in_mailtrain not in emails_in_filter:
-                delete_email_from_mailtrain_list(email_in_mailtrain, self.mailtrain_id)
-
-        # Then we're going to add the ones that aren't in the list
-        for email_in_filter in emails_in_filter:
-            if email_in_filter not in emails_in_mailtrain:
-                subscribe_email_to_mailtrain_list(email_in_filter, self.mailtrain_id)
-
-        # Finally we'll add "now" as last time synced
-        self.last_time_synced = datetime.now()
-        self.save()
+        return sync_filters([self], client, dry_run=dry_run)[0]
 
     def get_mode(self):
         modes = dict(DYNAMIC_CONTACT_FILTER_MODES)
@@ -3177,6 +3297,53 @@ class DynamicContactFilter(models.Model):
         ordering = ["id"]
 
 
+class DynamicContactFilterMember(models.Model):
+    """
+    Materialised membership of a DynamicContactFilter: the contacts (with their email) that match it. Kept up to date
+    for the changed contacts by the signals in core.signals and invoicing.signals (see core.dcf_members), and rebuilt
+    with the rebuild_dcf_members command.
+    """
+
+    dcf = models.ForeignKey(DynamicContactFilter, on_delete=models.CASCADE, related_name="members")
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name="dynamic_contact_filter_memberships")
+    email = models.EmailField(verbose_name=_("Email"))
+
+    def __str__(self):
+        return "{} - {}".format(self.dcf_id, self.email)
+
+    class Meta:
+        verbose_name = _("Dynamic Contact Filter member")
+        verbose_name_plural = _("Dynamic Contact Filter members")
+        constraints = [models.UniqueConstraint(fields=["dcf", "contact"], name="unique_dcf_member")]
+
+
+class DuplicateContactCandidate(models.Model):
+    """
+    A pair of contacts that are probably the same person, found by the detect_duplicate_contacts command (see
+    core.contact_duplicates). contact is the one with the lower id. The dismissed pairs are kept, so they aren't
+    proposed again.
+    """
+
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name="duplicate_candidates")
+    other = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField(verbose_name=_("Score"))
+    reasons = models.CharField(max_length=64, verbose_name=_("Reasons"))
+    detected = models.DateTimeField(auto_now_add=True, verbose_name=_("Detected"))
+    dismissed = models.BooleanField(default=False, verbose_name=_("Dismissed"))
+
+    def __str__(self):
+        return "{} - {}".format(self.contact_id, self.other_id)
+
+    def get_reasons(self):
+        return self.reasons.split(",") if self.reasons else []
+
+    class Meta:
+        verbose_name = _("Duplicate contact candidate")
+        verbose_name_plural = _("Duplicate contact candidates")
+        constraints = [models.UniqueConstraint(fields=["contact", "other"], name="unique_duplicate_candidate")]
+        indexes = [models.Index(fields=["dismissed", "-score"], name="duplicate_candidate_score")]
+
+
 class ProductBundle(models.Model):
     products = models.ManyToManyField(Product)
 
@@ -3217,17 +3384,21 @@ class AdvancedDiscount(models.Model):
 
 class DoNotCallNumber(models.Model):
     number = models.CharField(max_length=20, primary_key=True)
+    # see core.do_not_call
+    national_number = models.CharField(max_length=20, db_index=True, editable=False, default="")
 
-    @staticmethod
-    def delete_all_numbers():
-        DoNotCallNumber.objects.all().delete()
+    def save(self, *args, **kwargs):
+        from .do_not_call import normalize_number, registry_changed
 
-    @staticmethod
-    def upload_new_numbers(numbers_list):
-        objs = []
-        for number in numbers_list:
-            objs.append(DoNotCallNumber(number=number[0]))
-        DoNotCallNumber.objects.bulk_create(objs)
+        self.national_number = normalize_number(self.number) or ""
+        super().save(*args, **kwargs)
+        transaction.on_commit(registry_changed)
+
+    def delete(self, *args, **kwargs):
+        from .do_not_call import registry_changed
+
+        transaction.on_commit(registry_changed)
+        return super().delete(*args, **kwargs)
 
     def __str__(self):
         return self.number
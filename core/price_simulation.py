@@ -0,0 +1,207 @@
+# coding=utf-8
+"""
+"What if" price simulation over every active subscription.
+
+Subscriptions are grouped by their (products with copies, frequency) combination, which are a few hundreds even for a
+large subscriber base. Every combination is passed through the price rules (process_products) and compiled once into
+rows of coefficient matrices (combinations x products) that describe how each product price adds up to the total,
+following the same steps as calc_price_from_products (see core.pricing): subscription products matched with their
+targeted discounts, affectable and non-affectable amounts, discounts left, the last percentage discount, the frequency
+discount, the "other" products and the rounding. A price table is then applied to every combination at once with
+NumPy, and the totals are spread back to the subscriptions.
+
+Amounts are calculated with floats, so a total that falls exactly on .5 may be rounded differently than the Decimal
+based calculation.
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from django.conf import settings
+
+from core.models import Product, Subscription, SubscriptionProduct
+from core.pricing import pricing_engine
+from core.utils import process_products
+
+
+class PriceSimulation:
+    """
+    Loads the products with copies and the frequency of every active normal subscription and compiles them. Call run()
+    with a proposed price table to compare the current totals with the proposed ones.
+    """
+
+    def __init__(self):
+        self.products = pricing_engine.snapshot().products
+        self.columns = {product_id: column for column, product_id in enumerate(sorted(self.products))}
+        self.current_prices = np.array([float(self.products[p].price) for p in sorted(self.products)], dtype=float)
+
+        self.subscription_ids, self.contact_ids, frequencies = [], [], []
+        subscription_rows = (
+            Subscription.objects.filter(active=True, type="N")
+            .order_by("id")
+            .values_list("id", "contact_id", "frequency")
+        )
+        products_by_subscription = defaultdict(list)
+        subscription_products = SubscriptionProduct.objects.filter(
+            subscription__active=True, subscription__type="N", active=True, product__isnull=False
+        ).values_list("subscription_id", "product_id", "copies")
+        for subscription_id, product_id, copies in subscription_products:
+            products_by_subscription[subscription_id].append((product_id, copies))
+
+        combinations, subscription_combinations = {}, []
+        for subscription_id, contact_id, frequency in subscription_rows:
+            key = (tuple(sorted(products_by_subscription[subscription_id])), frequency)
+            subscription_combinations.append(combinations.setdefault(key, len(combinations)))
+            self.subscription_ids.append(subscription_id)
+            self.contact_ids.append(contact_id)
+            frequencies.append(frequency)
+        self.subscription_ids = np.array(self.subscription_ids, dtype=np.int64)
+        self.subscription_frequencies = np.array(frequencies, dtype=float)
+        self.subscription_combinations = np.array(subscription_combinations, dtype=np.int64)
+        self.compile(list(combinations))
+
+    def compile(self, combinations):
+        """
+        Builds the coefficient matrices of the given (products with copies, frequency) combinations.
+        """
+        rows, columns = len(combinations), len(self.columns)
+        self.affectable = np.zeros((rows, columns))
+        self.non_affectable = np.zeros((rows, columns))
+        self.other = np.zeros((rows, columns))
+        # column of the percentage discount applied to each subscription product, -1 if there's none
+        self.percentage_matches = np.full((rows, columns), -1, dtype=np.int64)
+        # column of the percentage discount applied to the non-affectable amount, -1 if there's none
+        self.last_percentage = np.full(rows, -1, dtype=np.int64)
+        self.frequencies = np.array([frequency for products_with_copies, frequency in combinations], dtype=np.int64)
+
+        for row, (products_with_copies, frequency) in enumerate(combinations):
+            summary = process_products({str(product_id): str(copies) for product_id, copies in products_with_copies})
+            self.compile_row(row, summary, frequency)
+
+    def compile_row(self, row, products_with_copies, frequency):
+        per_frequency = Product.BillingModeChoices.PER_FREQUENCY
+        copies_by_product = {
+            product_id: int(copies)
+            for product_id, copies in products_with_copies.items()
+            if product_id in self.products
+        }
+        products = [self.products[product_id] for product_id in copies_by_product]
+        discounts = [product for product in products if product.type in ("D", "P", "A")]
+        discounts_by_target, used_discounts = defaultdict(list), set()
+        for discount in discounts:
+            if discount.target_product_id:
+                discounts_by_target[discount.target_product_id].append(discount)
+
+        for product in products:
+            column, copies = self.columns[product.id], copies_by_product[product.id]
+            if product.type == "O":
+                self.other[row, column] += copies
+            if product.type != "S":
+                continue
+            coefficient = copies * (frequency if product.billing_mode == per_frequency else 1)
+            if discounts_by_target.get(product.id):
+                discount = discounts_by_target[product.id].pop(0)
+                used_discounts.add(discount.id)
+                self.affectable[row, column] += coefficient
+                if discount.type == "D":
+                    discount_coefficient = copies_by_product[discount.id]
+                    if discount.billing_mode == per_frequency:
+                        discount_coefficient *= frequency
+                    self.affectable[row, self.columns[discount.id]] -= discount_coefficient
+                elif discount.type == "P":
+                    self.percentage_matches[row, column] = self.columns[discount.id]
+            elif product.has_implicit_discount:
+                self.affectable[row, column] += coefficient
+            else:
+                self.non_affectable[row, column] += coefficient
+
+        for discount in discounts:
+            if discount.id in used_discounts:
+                continue
+            if discount.type == "D":
+                discount_coefficient = copies_by_product[discount.id]
+                if discount.billing_mode == per_frequency:
+                    discount_coefficient *= frequency
+                self.non_affectable[row, self.columns[discount.id]] -= discount_coefficient
+            elif discount.type == "P":
+                self.last_percentage[row] = self.columns[discount.id]
+
+    def prices(self, price_table=None):
+        """
+        Returns the price vector with the prices of the given {product id: price} table applied to the current ones.
+        """
+        prices = self.current_prices.copy()
+        for product_id, price in (price_table or {}).items():
+            prices[self.columns[product_id]] = float(price)
+        return prices
+
+    def totals(self, prices, frequency_discounts=None):
+        """
+        Returns the total of every combination for the given price vector. frequency_discounts is a
+        {frequency: percentage} table, the DISCOUNT_{n}_MONTHS settings are used for the frequencies not in it.
+        """
+        frequency_discounts = frequency_discounts or {}
+        # the -1 columns (no percentage discount) pick this extra 0% at the end
+        percentages = np.append(prices, 0) / 100
+        affectable = (self.affectable * prices * (1 - percentages[self.percentage_matches])).sum(axis=1)
+        non_affectable = (self.non_affectable * prices).sum(axis=1)
+        non_affectable -= non_affectable * percentages[self.last_percentage]
+        total = affectable + non_affectable
+
+        discount_pct = np.array(
+            [
+                frequency_discounts.get(frequency, getattr(settings, f"DISCOUNT_{frequency}_MONTHS", 0))
+                for frequency in self.frequencies.tolist()
+            ],
+            dtype=float,
+        )
+        total -= total * discount_pct / 100
+        total += self.other @ prices
+        return np.round(total)
+
+    def compare(self, price_table=None, frequency_discounts=None):
+        """
+        Returns two arrays with the current and the proposed total of every subscription (see subscription_ids).
+        """
+        old = self.totals(self.current_prices)[self.subscription_combinations]
+        new = self.totals(self.prices(price_table), frequency_discounts)[self.subscription_combinations]
+        return old, new
+
+    def run(self, price_table=None, frequency_discounts=None, top=20, bins=10):
+        """
+        Compares the current totals with the ones obtained with the given price table and frequency discounts.
+        Returns a dict with the totals per billing period and per month, a histogram of the difference per subscription
+        and the subscriptions with the biggest differences.
+        """
+        old, new = self.compare(price_table, frequency_discounts)
+        delta = new - old
+        old_total, new_total = float(old.sum()), float(new.sum())
+        old_monthly = float((old / self.subscription_frequencies).sum()) if len(old) else 0.0
+        new_monthly = float((new / self.subscription_frequencies).sum()) if len(new) else 0.0
+        counts, edges = np.histogram(delta, bins=bins) if len(delta) else (np.array([]), np.array([]))
+        movers = np.argsort(-np.abs(delta), kind="stable")[:top]
+        return {
+            "subscriptions": len(old),
+            "combinations": len(self.frequencies),
+            "old_total": old_total,
+            "new_total": new_total,
+            "delta": new_total - old_total,
+            "delta_pct": (new_total - old_total) * 100 / old_total if old_total else 0.0,
+            "old_monthly": old_monthly,
+            "new_monthly": new_monthly,
+            "histogram": [
+                {"from": float(edges[i]), "to": float(edges[i + 1]), "count": int(counts[i])}
+                for i in range(len(counts))
+            ],
+            "top_movers": [
+                {
+                    "subscription_id": int(self.subscription_ids[i]),
+                    "contact_id": self.contact_ids[i],
+                    "frequency": int(self.subscription_frequencies[i]),
+                    "old": float(old[i]),
+                    "new": float(new[i]),
+                    "delta": float(delta[i]),
+                }
+                for i in movers
+            ],
+        }
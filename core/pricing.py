@@ -0,0 +1,419 @@
+# coding=utf-8
+"""
+Pricing engine used by calc_price_from_products.
+
+Pricing a set of products only depends on the products, their copies, the frequency and some settings, but it's
+computed on every price shown in the subscription forms, on every dynamic price request and for every subscription
+billed. The engine keeps an in-process snapshot of the product catalog (with the discounts linked to their target
+products) and of the active price rules, and memoises the price of every (products with copies, frequency) combination
+in a LRU cache, as a "plan" that references products by id so the invoice items can be built again on every call.
+
+The snapshot and the memoised plans are dropped when a Product, PriceRule, ProductBundle or AdvancedDiscount is saved
+or deleted in this process (see core.signals). Other processes reload their snapshot when it's older than
+PRICING_ENGINE_TTL seconds.
+"""
+import time
+from collections import defaultdict, namedtuple
+from functools import lru_cache, partial
+from threading import RLock
+
+from django.conf import settings
+from django.utils.text import format_lazy
+from django.utils.translation import get_language, gettext as _
+
+
+PricingSnapshot = namedtuple("PricingSnapshot", ["products", "price_rules", "loaded_at"])
+
+# An invoice item to be built: the product id (or None), if it's linked to the subscription and the other attributes.
+ItemPlan = namedtuple("ItemPlan", ["product_id", "with_subscription", "attrs"])
+
+
+class PricingEngine:
+
+    def __init__(self):
+        self._lock = RLock()
+        self._snapshot = None
+        self._plan = None
+
+    def snapshot(self):
+        """
+        Returns the current snapshot of the catalog and the active price rules, loading it if needed.
+        """
+        return self._current()[0]
+
+    def _current(self):
+        """
+        Returns the snapshot and the memoised plan function bound to it, loading them if needed.
+        """
+        with self._lock:
+            ttl = getattr(settings, "PRICING_ENGINE_TTL", 300)
+            if self._snapshot and ttl and time.monotonic() - self._snapshot.loaded_at > ttl:
+                self.invalidate()
+            if self._snapshot is None:
+                self._snapshot = self._load_snapshot()
+                self._plan = lru_cache(maxsize=getattr(settings, "PRICING_ENGINE_CACHE_SIZE", 1024))(
+                    partial(self._compute_plan, self._snapshot.products)
+                )
+            return self._snapshot, self._plan
+
+    def invalidate(self, **kwargs):
+        """
+        Drops the snapshot and the memoised plans, they're loaded again on the next call. Accepts (and ignores) any
+        keyword argument so it can be connected to signals.
+        """
+        with self._lock:
+            self._snapshot, self._plan = None, None
+
+    def cache_info(self):
+        """
+        Returns the hits, misses, maxsize and currsize of the plans cache (all of them 0 before the first call).
+        """
+        plan = self._plan
+        if plan is None:
+            return {"hits": 0, "misses": 0, "maxsize": 0, "currsize": 0}
+        return plan.cache_info()._asdict()
+
+    def _load_snapshot(self):
+        from core.models import PriceRule, Product
+
+        products = Product.objects.in_bulk()
+        for product in products.values():
+            product.target_product = products.get(product.target_product_id)
+        price_rules = list(
+            PriceRule.objects.filter(active=True)
+            .order_by("priority")
+            .select_related("resulting_product", "choose_one_product")
+            .prefetch_related(
+                "products_pool", "products_not_pool", "ignore_product_bundle", "ignore_product_bundle__products"
+            )
+        )
+        return PricingSnapshot(products, price_rules, time.monotonic())
+
+    def calc_price(
+        self, products_with_copies, frequency, debug_id="", create_items=None, subscription=None, catalog=None
+    ):
+        """
+        Same arguments and result as core.utils.calc_price_from_products. The invoice items (if requested) take their
+        products from the catalog when given, or from the snapshot.
+        """
+        frequency = int(frequency)
+        debug = getattr(settings, "DEBUG_PRODUCTS", False)
+        snapshot, plan = self._current()
+        products = catalog if catalog is not None else snapshot.products
+        # ids that are not products (or not loaded in the caller's catalog) are ignored, as they always were
+        key = tuple(
+            (product_id, int(copies))
+            for product_id, copies in products_with_copies.items()
+            if product_id in products and product_id in snapshot.products
+        )
+        if debug:
+            # not memoised, so every calculation is printed
+            total_price, item_plans = self._compute_plan(
+                snapshot.products, key, frequency, get_language(), debug, debug_id
+            )
+        else:
+            total_price, item_plans = plan(key, frequency, get_language())
+        if not create_items:
+            return total_price
+        return total_price, self.build_items(item_plans, subscription, products)
+
+    @staticmethod
+    def build_items(item_plans, subscription, products):
+        from invoicing.models import InvoiceItem
+
+        invoice_items = []
+        for item_plan in item_plans:
+            attrs = dict(item_plan.attrs)
+            if item_plan.product_id:
+                attrs["product"] = products[item_plan.product_id]
+            if item_plan.with_subscription:
+                attrs["subscription"] = subscription
+            invoice_items.append(InvoiceItem(**attrs))
+        return invoice_items
+
+    @staticmethod
+    def _compute_plan(products, products_with_copies, frequency, language, debug=False, debug_id=""):
+        """
+        Calculates the price of the given (product id, copies) pairs and the invoice items to create, taking the
+        products from the given catalog. The language is only part of the arguments because the item descriptions are
+        translated, so plans are memoised per language.
+        """
+        from core.models import Product
+
+        copies_by_product = dict(products_with_copies)
+        item_plans = []
+        percentage_discount = None
+        # the description suffix of the last subscription product or targeted discount, reused by the other discounts
+        frequency_extra = ''
+        if debug and debug_id:
+            debug_id += ": "
+
+        subscription_product_list, discount_product_list, other_product_list, advanced_discount_list = [], [], [], []
+
+        # 1. partition the input by discount products / non discount products
+        for product_id, copies in products_with_copies:
+            product = products[product_id]
+            if product.type in ('D', 'P', 'A'):  # Discount, Percentage and Advanced discounts
+                discount_product_list.append(product)
+            elif product.type == "S":  # Subscription products
+                subscription_product_list.append(product)
+            elif product.type == "O":  # Other products
+                other_product_list.append(product)
+
+        if debug:
+            print("Discount products:", discount_product_list)
+            print("Subscription products:", subscription_product_list)
+            print("Other products:", other_product_list)
+            print("Advanced discount products:", advanced_discount_list)
+
+        # discounts by their target product, in input order. Every discount can be used only once.
+        discounts_by_target, used_discounts = defaultdict(list), set()
+        for discount_product in discount_product_list:
+            if discount_product.target_product_id:
+                discounts_by_target[discount_product.target_product_id].append(discount_product)
+
+        # 2. obtain 2 total cost amounts: affectable/non-affectable by discounts
+        total_affectable, total_non_affectable = 0, 0
+        for product in subscription_product_list:
+            copies = copies_by_product[product.id]
+            per_frequency = product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY
+
+            frequency_extra = (
+                _(' {frequency} months'.format(frequency=frequency))
+                if frequency > 1 and product.edition_frequency != 4 and per_frequency
+                else ''
+            )
+            price = product.price * frequency if per_frequency else product.price
+            item_plans.append(
+                ItemPlan(
+                    product.id,
+                    True,
+                    {
+                        "invoice": None,  # They will be added to the invoice later
+                        "copies": copies,
+                        "price": price,
+                        "description": format_lazy(
+                            '{product_name} {frequency_extra}',
+                            product_name=product.name,
+                            frequency_extra=frequency_extra,
+                        ),
+                        "type": 'I',
+                        "amount": price * copies,
+                    },
+                )
+            )
+
+            if debug:
+                print(
+                    f"{debug_id}{product.name} {copies}x{'-' if product.type == 'D' else ''}"
+                    f"{product.price} = {'-' if product.type == 'D' else ''}{product.price * copies}"
+                )
+
+            # Check if this product is affected to any of the discounts first. This also needs to create the item.
+            if discounts_by_target.get(product.id):
+                discount_product = discounts_by_target[product.id].pop(0)
+                used_discounts.add(discount_product.id)
+                affectable_delta = product.price * copies
+                if per_frequency:
+                    affectable_delta *= frequency
+                discount_copies = copies_by_product[discount_product.id]
+                if discount_product.type == "D":
+                    discount_amount = discount_product.price * discount_copies
+                    if discount_product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY:
+                        discount_amount *= frequency
+                    affectable_delta -= discount_amount
+                elif discount_product.type == "P":
+                    affectable_delta_discount = (affectable_delta * discount_product.price) / 100
+                    affectable_delta -= affectable_delta_discount
+                total_affectable += affectable_delta
+                # We also need to create a product item for the discount
+                frequency_extra = (
+                    _(' {frequency} months'.format(frequency=frequency))
+                    if frequency > 1
+                    and discount_product.edition_frequency != 4
+                    and discount_product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY
+                    else ''
+                )
+                item_plans.append(
+                    ItemPlan(
+                        discount_product.id,
+                        False,
+                        {
+                            "description": format_lazy('{} {}', discount_product.name, frequency_extra),
+                            "price": discount_product.price * frequency,
+                            "copies": discount_copies,
+                            "type": 'D',
+                            "amount": discount_product.price * discount_copies,
+                        },
+                    )
+                )
+            else:
+                # Not affected by discounts but the product price can be also "affectable" if has_implicit_discount
+                product_delta = product.price * copies
+                if per_frequency:
+                    product_delta *= frequency
+                if product.has_implicit_discount:
+                    total_affectable += product_delta
+                else:
+                    total_non_affectable += product_delta
+        if debug:
+            print(
+                f"{debug_id}Before iteration over discounts "
+                f"affectable={total_affectable}, non-affectable={total_non_affectable}"
+            )
+
+        # 3. iterate over discounts left
+        for product in discount_product_list:
+            if product.id in used_discounts:
+                continue
+            if debug:
+                print(f"{debug_id}Discount Product: {product} {product.type}")
+            if product.type == 'D':
+                copies = copies_by_product[product.id]
+                item_plans.append(
+                    ItemPlan(
+                        product.id,
+                        True,
+                        {
+                            "invoice": None,
+                            "copies": copies,
+                            "price": product.price * frequency,
+                            "description": format_lazy('{} {}', product.name, frequency_extra),
+                            "type": 'D',
+                            "amount": product.price * copies,
+                        },
+                    )
+                )
+                discount_amount = product.price * copies
+                if product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY:
+                    discount_amount *= frequency
+                total_non_affectable -= discount_amount
+            elif product.type == 'P':
+                percentage_discount = product  # only one percentage discount product (the last one found in the list).
+            elif product.type == 'A':
+                advanced_discount_list.append(product)
+
+        if debug:
+            print(
+                f"{debug_id}After iteration over discounts "
+                f"affectable={total_affectable}, non-affectable={total_non_affectable}"
+            )
+
+        # Handle percentage discount
+        if percentage_discount:
+            discount_amount = (total_non_affectable * percentage_discount.price) / 100
+            if debug:
+                print(f"{debug_id}Percentage Discount: {percentage_discount} {discount_amount}")
+            item_plans.append(
+                ItemPlan(
+                    percentage_discount.id,
+                    True,
+                    {
+                        "invoice": None,
+                        "copies": 1,
+                        "price": discount_amount,
+                        "description": format_lazy('{} {}', percentage_discount.name, frequency_extra),
+                        "type": 'D',
+                        "amount": discount_amount,
+                    },
+                )
+            )
+            total_non_affectable -= discount_amount
+
+        if debug:
+            print(
+                debug_id
+                + f"After percentage discount affectable={total_affectable}, non-affectable={total_non_affectable}"
+            )
+
+        # Every billing mode (per frequency, fixed or not supported) adds both totals up, the frequency is already
+        # applied in the amounts above.
+        total_price = float(total_affectable + total_non_affectable)
+
+        if debug:
+            print(debug_id + f"Before frequency discount total_price={total_price}")
+
+        # Handle frequency discount
+        discount_pct = getattr(settings, f'DISCOUNT_{frequency}_MONTHS', 0)
+        if discount_pct:
+            discount_amount = (total_price * discount_pct) / 100
+            total_price -= discount_amount
+            item_plans.append(
+                ItemPlan(
+                    None,
+                    True,
+                    {
+                        "invoice": None,
+                        "copies": 1,
+                        "description": _(
+                            '{frequency} months discount ({discount_pct}% discount)'.format(
+                                frequency=frequency, discount_pct=discount_pct
+                            )
+                        ),
+                        "amount": discount_amount,
+                        "type": 'D',  # This means the item is a discount
+                        "type_dr": 1,  # 1 means it's a plain value
+                    },
+                )
+            )
+
+            if debug:
+                print(
+                    debug_id
+                    + f"After frequency discount total_price={total_price} "
+                    f"(Discount: {discount_pct}% - {discount_amount})"
+                )
+
+        # Finally we add the price of the one-shot products. O stands for "Other". They can be affected by copies but
+        # they are not billed per frequency.
+        for product in other_product_list:
+            copies = copies_by_product[product.id]
+            product_price = float(product.price) * copies
+            total_price += product_price
+            item_plans.append(
+                ItemPlan(
+                    product.id,
+                    True,
+                    {
+                        "invoice": None,
+                        "copies": copies,
+                        "price": product.price,
+                        "description": product.name,
+                        "type": 'I',
+                        "amount": product_price,
+                    },
+                )
+            )
+
+        if debug:
+            print(debug_id + f"Before rounding total_price={total_price}")
+
+        # We need to add a rounding item if the total price is not an integer
+        if total_price % 1 != 0:
+            rounding_price = total_price % 1
+            item_plans.append(
+                ItemPlan(
+                    None,
+                    True,
+                    {
+                        "invoice": None,
+                        "copies": 1,
+                        "description": _("Rounding"),
+                        "amount": rounding_price,
+                        "price": rounding_price,
+                        "type": 'R' if total_price > 0 else 'D',  # "R" for surcharge, "D" for discount
+                        "type_dr": 1,
+                    },
+                )
+            )
+            if debug:
+                print(f"{debug_id}Rounding: {rounding_price}")
+            total_price = round(total_price)
+
+        if debug:
+            print(debug_id + f"Total {total_price}")
+
+        return total_price, tuple(item_plans)
+
+
+pricing_engine = PricingEngine()
@@ -4,20 +4,36 @@ import traceback
 import json
 
 from django.conf import settings
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.forms import ValidationError
+from django.test.signals import setting_changed
+
+from util.email_typosquash import replacements as email_replacements
 
 from .models import (
+    Activity,
     Address,
+    AdvancedDiscount,
+    Campaign,
     Contact,
+    ContactCampaignStatus,
+    DynamicContactFilter,
+    EmailReplacement,
+    PriceRule,
+    Product,
+    ProductBundle,
     Subscription,
+    SubscriptionNewsletter,
+    SubscriptionProduct,
     regex_alphanumeric,
     regex_alphanumeric_msg,
     update_web_user,
     update_web_user_newsletters,
 )
+from . import campaign_queue, dcf_members
 from .forms import no_email_validation_msg
+from .pricing import pricing_engine
 from .utils import cms_rest_api_request, mail_managers_on_errors
 
 
@@ -227,3 +243,142 @@ def contact_post_delete(sender, instance, **kwargs):
                 print(f"ERROR: (contact_post_delete) sending delete request: {ex} trace: {tb}")
     elif settings.DEBUG and getattr(settings, "DEBUG_NOOP_SIGNALS", True):
         print("DEBUG: (contact_post_delete) signal called - noop")
+
+
+# Pricing engine signals: any change in the products, price rules or discounts drops the engine snapshot and the
+# memoised prices (see core.pricing).
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=PriceRule)
+@receiver([post_save, post_delete], sender=ProductBundle)
+@receiver([post_save, post_delete], sender=AdvancedDiscount)
+@receiver(m2m_changed, sender=PriceRule.products_pool.through)
+@receiver(m2m_changed, sender=PriceRule.products_not_pool.through)
+@receiver(m2m_changed, sender=PriceRule.ignore_product_bundle.through)
+@receiver(m2m_changed, sender=ProductBundle.products.through)
+@receiver(m2m_changed, sender=AdvancedDiscount.find_products.through)
+def pricing_catalog_changed(sender, **kwargs):
+    pricing_engine.invalidate()
+
+
+@receiver(setting_changed)
+def pricing_setting_changed(sender, setting, **kwargs):
+    if setting.startswith(("DISCOUNT_", "PRICING_ENGINE_")):
+        pricing_engine.invalidate()
+
+
+@receiver([post_save, post_delete], sender=EmailReplacement)
+def email_replacements_changed(sender, **kwargs):
+    # the replacements kept in memory by util.email_typosquash
+    email_replacements.invalidate()
+
+
+# Dynamic contact filter membership signals: the contacts whose data read by the filters changed are refreshed in the
+# filters that read it, and the filters whose definition changed are rebuilt (see core.dcf_members).
+
+
+@receiver(pre_save, sender=Contact)
+@receiver(pre_save, sender=Subscription)
+@receiver(pre_save, sender=SubscriptionNewsletter)
+@receiver(pre_save, sender=SubscriptionProduct)
+def dcf_saving(sender, instance, update_fields=None, **kwargs):
+    dcf_members.saving(instance, update_fields)
+
+
+@receiver(post_save, sender=Contact)
+def dcf_contact_changed(sender, instance, **kwargs):
+    # the memberships of a deleted contact are deleted in cascade
+    dcf_members.contacts_changed([instance.id], getattr(instance, "dcf_criteria", ()))
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+@receiver([post_save, post_delete], sender=SubscriptionNewsletter)
+def dcf_subscription_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        criteria = set(dcf_members.TRACKED_FIELDS[sender].values())
+    else:
+        criteria = getattr(instance, "dcf_criteria", ())
+    # the previous contact too, if it changed
+    contact_ids = {instance.contact_id, getattr(instance, "dcf_previous", {}).get("contact_id")} - {None}
+    dcf_members.contacts_changed(contact_ids, criteria)
+
+
+@receiver([post_save, post_delete], sender=SubscriptionProduct)
+def dcf_subscription_product_changed(sender, instance, signal, **kwargs):
+    criteria = [dcf_members.PRODUCTS] if signal is post_delete else getattr(instance, "dcf_criteria", ())
+    if not criteria:
+        return
+    subscription_ids = {instance.subscription_id, getattr(instance, "dcf_previous", {}).get("subscription_id")}
+    # the subscription may have been deleted already when its products are deleted in cascade
+    dcf_members.contacts_changed(
+        Subscription.objects.filter(pk__in=subscription_ids - {None}).values_list("contact_id", flat=True), criteria
+    )
+
+
+@receiver(post_save, sender=DynamicContactFilter)
+def dcf_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {"last_time_synced"}:
+        # saved by the mailtrain sync, the membership didn't change
+        return
+    instance.refresh_members()
+
+
+@receiver(m2m_changed, sender=DynamicContactFilter.products.through)
+@receiver(m2m_changed, sender=DynamicContactFilter.newsletters.through)
+def dcf_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        instance.refresh_members()
+    else:
+        for dcf in DynamicContactFilter.objects.filter(pk__in=pk_set or []):
+            dcf.refresh_members()
+
+
+# Campaign queue signals: the contacts whose campaign statuses or activities changed are refreshed in the queues of
+# their campaigns, and every queue is rebuilt when the priority or the state of a campaign changes (see
+# core.campaign_queue).
+
+
+@receiver([post_save, post_delete], sender=ContactCampaignStatus)
+def campaign_queue_status_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        campaign_queue.campaign_row_deleted(instance.campaign_id, instance.contact_id)
+    else:
+        campaign_queue.contacts_changed([instance.contact_id])
+
+
+@receiver([post_save, post_delete], sender=Activity)
+def campaign_queue_activity_changed(sender, instance, signal, **kwargs):
+    if not instance.campaign_id or not instance.contact_id:
+        return
+    if signal is post_delete:
+        campaign_queue.campaign_row_deleted(instance.campaign_id, instance.contact_id)
+    else:
+        campaign_queue.contacts_changed([instance.contact_id])
+
+
+@receiver(pre_save, sender=Campaign)
+def campaign_queue_pre_save(sender, instance, **kwargs):
+    instance.old_queue_settings = (
+        Campaign.objects.filter(pk=instance.pk).values_list("priority", "active").first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Campaign)
+def campaign_queue_campaign_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) <= {"queue_refreshed"}:
+        return
+    if getattr(instance, "old_queue_settings", None) != (instance.priority, instance.active):
+        campaign_queue.rebuild_queues()
+
+
+@receiver(pre_delete, sender=Campaign)
+def campaign_queue_campaign_deleting(sender, instance, **kwargs):
+    campaign_queue.campaign_deleting(instance)
+
+
+@receiver(post_delete, sender=Campaign)
+def campaign_queue_campaign_deleted(sender, instance, **kwargs):
+    campaign_queue.campaign_deleted(instance)
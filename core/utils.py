@@ -19,7 +19,6 @@ from django.core.exceptions import ValidationError
 from django.core.mail import mail_managers
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
-from django.utils.text import format_lazy
 from rest_framework.decorators import authentication_classes
 
 
@@ -114,7 +113,9 @@ def addMonth(d, n=1):
     return eom.replace(day=d.day)
 
 
-def calc_price_from_products(products_with_copies, frequency, debug_id="", create_items=None, subscription=None):
+def calc_price_from_products(
+    products_with_copies, frequency, debug_id="", create_items=None, subscription=None, catalog=None
+):
     """
     Returns the prices and optionally creates invoice items if invoice is provided.
     Args:
@@ -123,6 +124,8 @@ def calc_price_from_products(products_with_copies, frequency, debug_id="", creat
         debug_id: Debug identifier. If provided, debug messages will be printed when prices are calculated.
         invoice: Optional Invoice object to create items for
         subscription: Optional Subscription object (required if invoice is provided)
+        catalog: Optional dictionary of already loaded Product instances by id (see invoicing.billing_context), used
+            for the products of the invoice items.
     Returns:
         If invoice is None: returns calculated total price
         If invoice is provided: returns (total_price, invoice_items)
@@ -133,299 +136,11 @@ def calc_price_from_products(products_with_copies, frequency, debug_id="", creat
         - One-shot products: products that are not affected by discounts and are not part of a subscription. They're
         usually represented by products of the type "Other" and have an edition frequency of 4 (one-shot products).
         They're affected by copies but not by frequency.
+        - The calculation is done and memoised by the pricing engine, see core.pricing.
     """
-    from core.models import Product
-    from invoicing.models import InvoiceItem
+    from .pricing import pricing_engine
 
-    invoice_items = [] if create_items else None
-    total_price, discount_pct, frequency = 0, 0, int(frequency)
-
-    percentage_discount, debug = None, getattr(settings, 'DEBUG_PRODUCTS', False)
-    if debug and debug_id:
-        debug_id += ": "
-    # Fetch all Product instances needed in a single query using in_bulk
-    products = Product.objects.in_bulk(products_with_copies.keys())
-    if debug:
-        print(f"DEBUG: calc_price_from_products: products={products}")
-
-    # Create the dictionary with product_id as key and (Product instance, copies) as value
-    product_data = {
-        product_id: (products[product_id], int(copies))
-        for product_id, copies in products_with_copies.items()
-        if product_id in products
-    }
-
-    subscription_product_list, discount_product_list, other_product_list, advanced_discount_list = [], [], [], []
-
-    # 1. partition the input by discount products / non discount products
-    for product, copies in product_data.values():
-        if product.type in ('D', 'P', 'A'):  # Discount, Percentage and Advanced discounts
-            discount_product_list.append(product)
-        elif product.type == "S":  # Subscription products
-            subscription_product_list.append(product)
-        elif product.type == "O":  # Other products
-            other_product_list.append(product)
-
-    if debug:
-        print("Discount products:", discount_product_list)
-        print("Subscription products:", subscription_product_list)
-        print("Other products:", other_product_list)
-        print("Advanced discount products:", advanced_discount_list)
-    # 2. obtain 2 total cost amounts: affectable/non-affectable by discounts
-    total_affectable, total_non_affectable = 0, 0
-    for product in subscription_product_list:
-        copies = int(products_with_copies[product.id])
-
-        # Create invoice item if needed
-        if create_items:
-            frequency_extra = (
-                _(' {frequency} months'.format(frequency=frequency))
-                if frequency > 1
-                and product.edition_frequency != 4
-                and product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY
-                else ''
-            )
-            price = (
-                product.price * frequency
-                if product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY
-                else product.price
-            )
-            item = InvoiceItem(
-                subscription=subscription,
-                invoice=None,  # They will be added to the invoice later
-                copies=copies,
-                price=price,
-                product=product,
-                description=format_lazy(
-                    '{product_name} {frequency_extra}', product_name=product.name, frequency_extra=frequency_extra
-                ),
-                type='I',
-                amount=price * copies,
-            )
-            invoice_items.append(item)
-
-        if debug:
-            print(
-                f"{debug_id}{product.name} {copies}x{'-' if product.type == 'D' else ''}"
-                f"{product.price} = {'-' if product.type == 'D' else ''}{product.price * copies}"
-            )
-
-        # Check if this product is affected to any of the discounts first. This also needs to create the invoice item.
-        affectable = False
-        for discount_product in [d for d in discount_product_list if d.target_product == product]:
-            affectable_delta = product.price * copies
-            if product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY:
-                affectable_delta *= frequency
-            discount_copies = int(products_with_copies[discount_product.id])
-            if discount_product.type == "D":
-                discount_amount = discount_product.price * discount_copies
-                if discount_product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY:
-                    discount_amount *= frequency
-                affectable_delta -= discount_amount
-            elif discount_product.type == "P":
-                affectable_delta_discount = (affectable_delta * discount_product.price) / 100
-                affectable_delta -= affectable_delta_discount
-            total_affectable += affectable_delta
-            # We also need to create a product item for the discount
-            if create_items:
-                frequency_extra = (
-                    _(' {frequency} months'.format(frequency=frequency))
-                    if frequency > 1
-                    and discount_product.edition_frequency != 4
-                    and discount_product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY
-                    else ''
-                )
-                item_discount = InvoiceItem(
-                    description=format_lazy('{} {}', discount_product.name, frequency_extra),
-                    price=discount_product.price * frequency,
-                    product=discount_product,
-                    copies=discount_copies,
-                    type='D',
-                    amount=discount_product.price * discount_copies,
-                )
-                invoice_items.append(item_discount)
-            discount_product_list.remove(discount_product)
-            affectable = True
-            break
-        if not affectable:
-            # Not affected by discounts but the product price can be also "affectable" if has_implicit_discount
-            product_delta = product.price * copies
-            if product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY:
-                product_delta *= frequency
-            if product.has_implicit_discount:
-                total_affectable += product_delta
-            else:
-                total_non_affectable += product_delta
-    if debug:
-        print(
-            debug_id
-            + f"Before iteration over discounts affectable={total_affectable}, non-affectable={total_non_affectable}"
-        )
-
-    # 3. iterate over discounts left
-    for product in discount_product_list:
-        if debug:
-            print(f"{debug_id}Discount Product: {product} {product.type}")
-        if product.type == 'D':
-            if create_items:
-                item = InvoiceItem(
-                    subscription=subscription,
-                    invoice=None,
-                    copies=int(products_with_copies[product.id]),
-                    price=product.price * frequency,
-                    product=product,
-                    description=format_lazy('{} {}', product.name, frequency_extra),
-                    type='D',
-                    amount=product.price * int(products_with_copies[product.id]),
-                )
-                if debug:
-                    print(f"{debug_id}Item: {item}")
-                invoice_items.append(item)
-            discount_amount = product.price * int(products_with_copies[product.id])
-            if product.billing_mode == Product.BillingModeChoices.PER_FREQUENCY:
-                discount_amount *= frequency
-            total_non_affectable -= discount_amount
-        elif product.type == 'P':
-            percentage_discount = product  # only one percentage discount product (the last one found in the list).
-        elif product.type == 'A':
-            advanced_discount_list.append(product)
-
-    if debug:
-        print(
-            debug_id
-            + f"After iteration over discounts affectable={total_affectable}, non-affectable={total_non_affectable}"
-        )
-
-    # Handle percentage discount
-    if percentage_discount:
-        discount_amount = (total_non_affectable * percentage_discount.price) / 100
-        if debug:
-            print(f"{debug_id}Percentage Discount: {percentage_discount} {discount_amount}")
-        if create_items:
-            item = InvoiceItem(
-                subscription=subscription,
-                invoice=None,
-                copies=1,
-                price=discount_amount,
-                product=percentage_discount,
-                description=format_lazy('{} {}', percentage_discount.name, frequency_extra),
-                type='D',
-                amount=discount_amount,
-            )
-            if debug:
-                print(f"{debug_id}Item added: {item}")
-            invoice_items.append(item)
-        total_non_affectable -= discount_amount
-
-    if debug:
-        print(
-            debug_id
-            + f"After percentage discount affectable={total_affectable}, non-affectable={total_non_affectable}"
-        )
-
-    # Let's decide what ing mode we're using for the subscription and calculate the total price accordingly
-    billing_modes = {product.billing_mode for product in subscription_product_list}
-
-    # Calculate total price based on aggregated billing modes
-    if Product.BillingModeChoices.PER_FREQUENCY in billing_modes:
-        # Frequency-based logic
-        if debug:
-            print(f"Frequency operation: {total_affectable + total_non_affectable}. (frequency={frequency})")
-        # The frequency is already applied in the invoice item calculations, so we don't multiply again
-        total_price = float(total_affectable + total_non_affectable)
-    elif Product.BillingModeChoices.FIXED in billing_modes:
-        # Fixed-price logic
-        if debug:
-            print(f"Fixed price operation: {total_affectable + total_non_affectable}.")
-        total_price = float(total_affectable + total_non_affectable)
-    else:
-        # Default to fixed price for now
-        if debug:
-            print(
-                "Defaulting to fixed price because billing mode is not supported",
-                f"total_affectable={total_affectable}, total_non_affectable={total_non_affectable}",
-            )
-        total_price = float(total_affectable + total_non_affectable)
-
-    if debug:
-        print(debug_id + f"Before frequency discount total_price={total_price}")
-
-    # Handle frequency discount
-    discount_pct = getattr(settings, f'DISCOUNT_{frequency}_MONTHS', 0)
-    if discount_pct:
-        discount_amount = (total_price * discount_pct) / 100
-        total_price -= discount_amount
-
-        if create_items:
-            frequency_discount_item = InvoiceItem(
-                subscription=subscription,
-                invoice=None,
-                copies=1,
-                description=_(
-                    '{frequency} months discount ({discount_pct}% discount)'.format(
-                        frequency=frequency, discount_pct=discount_pct
-                    )
-                ),
-                amount=discount_amount,
-                type='D',  # This means the item is a discount
-                type_dr=1,  # 1 means it's a plain value
-            )
-            invoice_items.append(frequency_discount_item)
-
-        if debug:
-            print(
-                debug_id
-                + f"After frequency discount total_price={total_price} (Discount: {discount_pct}% - {discount_amount})"
-            )
-
-    # Finally we add the price of the one-shot products. O stands for "Other". They can be affected by copies but
-    # they are not billed per frequency.
-    for product in other_product_list:
-        copies = int(products_with_copies[product.id])
-        product_price = float(product.price) * copies
-        total_price += product_price
-
-        if create_items:
-            item = InvoiceItem(
-                subscription=subscription,
-                invoice=None,
-                copies=copies,
-                price=product.price,
-                product=product,
-                description=product.name,
-                type='I',
-                amount=product_price,
-            )
-            invoice_items.append(item)
-
-    if debug:
-        print(debug_id + f"Before rounding total_price={total_price}")
-
-    # We need to add a rounding item if the total price is not an integer
-    if total_price % 1 != 0:
-        rounding_price = total_price % 1
-        if create_items:
-            rounding_item = InvoiceItem(
-                subscription=subscription,
-                invoice=None,
-                copies=1,
-                description=_("Rounding"),
-                amount=rounding_price,
-                price=rounding_price,
-                type='R' if total_price > 0 else 'D',  # "R" for surcharge, "D" for discount
-                type_dr=1,
-            )
-            invoice_items.append(rounding_item)
-        if debug:
-            print(f"{debug_id}Rounding: {rounding_price}")
-        total_price = round(total_price)
-
-    if debug:
-        print(debug_id + f"Total {total_price}")
-
-    if create_items:
-        return total_price, invoice_items
-    return total_price
+    return pricing_engine.calc_price(products_with_copies, frequency, debug_id, create_items, subscription, catalog)
 
 
 def create_invoiceitem_for_corporate_subscription(subscription):
@@ -458,23 +173,38 @@ def create_invoiceitem_for_corporate_subscription(subscription):
     return [item]
 
 
-def process_products(input_product_dict: dict) -> dict:
+def process_products(input_product_dict: dict, catalog=None, price_rules=None) -> dict:
     """
     Takes products from a product list (for example from a subscription products list) and turns them into new products
     that are already bundled. These will be executed in order of priority, from smallest to greatest.
 
     Each of the products must be a tuple with product and copies.
+
+    The products and the active price rules can be given already loaded (see invoicing.billing_context), by default
+    they're taken from the pricing engine snapshot (see core.pricing).
     """
     from core.models import Product, PriceRule
+    from .pricing import pricing_engine
+
+    if catalog is None and price_rules is None:
+        snapshot = pricing_engine.snapshot()
+        catalog, price_rules = snapshot.products, snapshot.price_rules
     input_product_ids = list(input_product_dict.keys())
-    input_products_list = list(Product.objects.filter(id__in=input_product_ids))
+    if catalog is not None:
+        input_products_list = sorted(
+            (catalog[int(product_id)] for product_id in input_product_ids if int(product_id) in catalog),
+            key=lambda product: product.id,
+        )
+    else:
+        input_products_list = list(Product.objects.filter(id__in=input_product_ids))
     input_products_count, output_dict, non_discount_added = len(input_products_list), {}, 0
 
-    price_rules = (
-        PriceRule.objects.filter(active=True)
-        .order_by('priority')
-        .prefetch_related('products_pool', 'products_not_pool', 'ignore_product_bundle')
-    )
+    if price_rules is None:
+        price_rules = (
+            PriceRule.objects.filter(active=True)
+            .order_by('priority')
+            .prefetch_related('products_pool', 'products_not_pool', 'ignore_product_bundle')
+        )
 
     for pricerule in price_rules:
         exit_loop = False
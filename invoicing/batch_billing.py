@@ -0,0 +1,240 @@
+# coding=utf-8
+"""
+Batch billing engine.
+
+The subscriptions due for a Billing are split into chunks of consecutive ids (see BillingChunk). Every chunk is
+billed inside its own transaction, with a savepoint per subscription so a single failure doesn't roll back the rest
+of the chunk. Chunks can be processed by a pool of worker processes, each one using its own database connection.
+
+Since a subscription stops being due as soon as its invoice is committed (its next_billing moves forward in the same
+transaction), re-running a chunk never bills a subscription twice. This is what makes an interrupted run resumable:
+only the chunks that were not completed are processed again.
+
+By default a chunk is billed in bulk: every invoice and item is built in memory and then written with a few bulk
+queries (see bulk_bill_subscriptions). If writing in bulk fails, the chunk is billed again row by row, so the
+subscription that causes the failure can be isolated and reported.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from core.dcf_members import deferred_refresh
+from core.models import Subscription
+from core.signals import subscription_post_save_signal
+from invoicing.billing_context import BillingContext
+from invoicing.models import Billing, BillingChunk, Invoice, InvoiceItem
+from invoicing.signals import invoice_dcf_signal, invoice_pre_save_signal
+from invoicing.utils import (
+    ZeroAmountError, advance_subscription, apply_invoice_side_effects, bill_subscription, build_subscription_invoice
+)
+
+
+def plan_chunks(billing, chunk_size=200):
+    """
+    Splits the subscriptions due for this billing into id-range chunks and stores them. Returns the created chunks.
+    This is done only once per billing, resumed runs reuse the chunks already planned.
+    """
+    subscription_ids = list(billing.subscriptions_to_bill().order_by("id").values_list("id", flat=True))
+    chunks = []
+    for number, start in enumerate(range(0, len(subscription_ids), chunk_size), start=1):
+        block = subscription_ids[start:start + chunk_size]
+        chunks.append(
+            BillingChunk(
+                billing=billing,
+                number=number,
+                first_subscription_id=block[0],
+                last_subscription_id=block[-1],
+                size=len(block),
+            )
+        )
+    BillingChunk.objects.bulk_create(chunks)
+    billing.subscriber_amount = len(subscription_ids)
+    billing.save(update_fields=["subscriber_amount"])
+    return chunks
+
+
+def bulk_bill_subscriptions(context, billing_date=None, dpp=10, billing=None):
+    """
+    Bills every subscription of a BillingContext writing the invoices, their items and the subscription updates in bulk.
+    Returns the number of subscriptions billed and a list of (subscription, exception) with the ones that couldn't be
+    billed, which are left untouched, except the ones whose amount is not greater than 0: like bill_subscription does,
+    their next billing date and balance are advanced without an invoice, and they're reported with a ZeroAmountError.
+
+    The hooks that run when these objects are saved one by one are replayed explicitly: Invoice.set_payment_names and
+    the invoice pre_save receiver before the invoices are created, the invoice_dcf_signal receiver after they're
+    created (an invoice that is already expired makes its contact a debtor), the history records are written in bulk
+    and subscription_post_save_signal runs after the subscriptions are updated. One-shot products and expired
+    temporary discounts are still removed one by one, as they're rare.
+
+    The other Subscription receivers are skipped on purpose, since only next_billing and balance are updated and none
+    of them depends on these fields: dcf_subscription_changed (core.signals, the dynamic contact filters don't use
+    them) and rollups_subscription_changing and rollups_subscription_changed (support.signals, the sales and
+    unsubscriptions roll-ups don't use them either).
+    """
+    billing_date = billing_date or date.today()
+    to_write, zero_amount, not_billed = [], [], []
+    for subscription in context:
+        try:
+            invoice, invoice_items, balance_item, amount = build_subscription_invoice(
+                subscription, billing_date, dpp, billing=billing, context=context
+            )
+        except Exception as e:
+            not_billed.append((subscription, e))
+        else:
+            if amount > 0:
+                to_write.append((subscription, invoice, invoice_items, balance_item))
+            else:
+                advance_subscription(subscription, balance_item)
+                zero_amount.append(subscription)
+                not_billed.append((subscription, ZeroAmountError()))
+    if not to_write:
+        update_subscriptions(zero_amount)
+        return 0, not_billed
+
+    invoices = [invoice for subscription, invoice, invoice_items, balance_item in to_write]
+    for invoice in invoices:
+        invoice.set_payment_names()
+        invoice_pre_save_signal(Invoice, invoice)
+    bulk_create_with_history(invoices, Invoice)
+    for invoice in invoices:
+        invoice_dcf_signal(Invoice, invoice, created=True)
+
+    items = []
+    for subscription, invoice, invoice_items, balance_item in to_write:
+        for item in invoice_items:
+            item.invoice = invoice
+            items.append(item)
+    InvoiceItem.objects.bulk_create(items)
+
+    for subscription, invoice, invoice_items, balance_item in to_write:
+        apply_invoice_side_effects(invoice, invoice_items, billing_date, context)
+        advance_subscription(subscription, balance_item)
+    billed = [subscription for subscription, invoice, invoice_items, balance_item in to_write]
+    update_subscriptions(billed + zero_amount)
+    return len(to_write), not_billed
+
+
+def update_subscriptions(subscriptions):
+    """
+    Saves the next billing date and balance of the billed subscriptions in bulk.
+    """
+    if not subscriptions:
+        return
+    bulk_update_with_history(subscriptions, Subscription, ["next_billing", "balance"])
+    for subscription in subscriptions:
+        subscription_post_save_signal(Subscription, subscription, created=False)
+
+
+def bill_one_by_one(context, billing):
+    """
+    Bills every subscription of a BillingContext with bill_subscription, each one in its own savepoint. Returns the
+    same as bulk_bill_subscriptions.
+    """
+    billed, not_billed = 0, []
+    for subscription in context:
+        try:
+            with transaction.atomic():
+                try:
+                    bill_subscription(
+                        subscription, billing.billing_date, billing.dpp, billing=billing, context=context
+                    )
+                except ZeroAmountError as e:
+                    # caught inside the savepoint, the subscription keeps its advanced next billing date
+                    not_billed.append((subscription, e))
+                    continue
+        except Exception as e:
+            not_billed.append((subscription, e))
+        else:
+            billed += 1
+    return billed, not_billed
+
+
+def bill_chunk(chunk_id, bulk=True):
+    """
+    Bills every subscription still due in the chunk's id range, in a single transaction. Returns the chunk report.
+
+    The chunk row is locked while it's being billed, so two runs over the same billing can't process it at the same
+    time. Subscriptions that fail to bill are reported and left untouched, the chunk is then marked as completed with
+    errors and will be retried if the billing is resumed.
+    """
+    start = time.monotonic()
+    with transaction.atomic():
+        chunk = BillingChunk.objects.select_for_update().select_related("billing").get(pk=chunk_id)
+        if chunk.status == "C":
+            return chunk.as_report()
+        billing = chunk.billing
+        subscriptions = billing.subscriptions_to_bill().filter(
+            id__range=(chunk.first_subscription_id, chunk.last_subscription_id)
+        )
+        billed = None
+        if bulk:
+            try:
+                with transaction.atomic():
+                    billed, not_billed = bulk_bill_subscriptions(
+                        BillingContext(subscriptions), billing.billing_date, billing.dpp, billing
+                    )
+            except Exception:
+                # the objects built for the bulk write are not reliable anymore, start over with a new context
+                billed = None
+        if billed is None:
+            # the filter memberships of the billed contacts are refreshed once for the whole chunk
+            with deferred_refresh():
+                billed, not_billed = bill_one_by_one(BillingContext(subscriptions), billing)
+
+        skipped, failed, errors = 0, 0, []
+        for subscription, e in not_billed:
+            if isinstance(e, AssertionError):
+                # the subscription doesn't meet the billing requirements (no payment type, amount not positive, etc.)
+                skipped += 1
+            else:
+                failed += 1
+            errors.append("Contact {}, Subscription {}: {}".format(subscription.contact_id, subscription.id, e))
+        # subscriptions that were planned but are not due anymore (already billed by a previous run) are skipped too
+        skipped += max(chunk.size - (billed + skipped + failed), 0)
+        # a resumed chunk (completed with errors) already added its previous counts to the billing's progress
+        processed = billed + skipped + failed - (chunk.billed + chunk.skipped + chunk.failed)
+        chunk.billed, chunk.skipped, chunk.failed = billed, skipped, failed
+        chunk.errors = "\n".join(errors) or None
+        chunk.status = "E" if failed else "C"
+        chunk.elapsed = time.monotonic() - start
+        chunk.save()
+        Billing.objects.filter(pk=billing.pk).update(processed_contacts=F("processed_contacts") + processed)
+    return chunk.as_report()
+
+
+def run_batch_billing(billing, workers=1, bulk=True):
+    """
+    Bills every chunk of the billing that is not completed yet, yielding each chunk report as it's finished.
+    With more than one worker the chunks are distributed across a process pool. With bulk=False the chunks are billed
+    row by row.
+    """
+    chunk_ids = list(billing.chunks.exclude(status="C").values_list("id", flat=True))
+    billing.status = "S"
+    billing.save(update_fields=["status"])
+
+    if workers > 1 and len(chunk_ids) > 1:
+        # Connections must not be shared with the forked workers, each of them opens its own one when needed.
+        connections.close_all()
+        mp_context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+            for report in executor.map(partial(bill_chunk, bulk=bulk), chunk_ids):
+                yield report
+    else:
+        for chunk_id in chunk_ids:
+            yield bill_chunk(chunk_id, bulk)
+
+    billing.refresh_from_db()
+    chunk_errors = billing.chunks.exclude(errors=None).values_list("errors", flat=True)
+    billing.errors = "\n".join(chunk_errors) or None
+    billing.status = "E" if billing.chunks.filter(status="E").exists() else "C"
+    billing.completed = True
+    billing.end = timezone.now()
+    billing.save()
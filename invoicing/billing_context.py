@@ -0,0 +1,81 @@
+# coding=utf-8
+from collections import defaultdict
+
+from django.db.models import Prefetch, QuerySet
+
+from core.models import Subscription, SubscriptionProduct
+from core.pricing import pricing_engine
+from invoicing.models import Invoice
+from util.dates import diff_month
+
+
+class BillingContext:
+    """
+    Loads, in a fixed number of queries, everything that bill_subscription needs to read for a batch of
+    subscriptions: the subscriptions with their contacts and billing address, their subscription products with
+    products, addresses and routes and the months already invoiced for every temporary discount product. The product
+    catalog and the active price rules are taken from the pricing engine (see core.pricing).
+
+    Subscription helpers (get_billing_data_by_priority, product_summary, etc.) use the prefetched subscription products
+    when they're available, so billing a subscription loaded here only queries the database to write.
+    """
+
+    def __init__(self, subscriptions):
+        if isinstance(subscriptions, Subscription):
+            subscriptions = [subscriptions]
+        if not isinstance(subscriptions, QuerySet):
+            # a list of subscriptions or of subscription ids
+            subscriptions = [getattr(s, "pk", s) for s in subscriptions]
+
+        # the catalog and the price rules are the ones of the pricing engine snapshot, shared by every context
+        snapshot = pricing_engine.snapshot()
+        self.products, self.price_rules = snapshot.products, snapshot.price_rules
+
+        self.subscriptions = list(
+            Subscription.objects.filter(pk__in=subscriptions)
+            .select_related(
+                "contact", "billing_contact", "billing_address__state", "payment_type_fk", "payment_method_fk"
+            )
+            .prefetch_related(
+                Prefetch(
+                    "subscriptionproduct_set",
+                    queryset=SubscriptionProduct.objects.select_related("address__state").order_by("id"),
+                )
+            )
+            .order_by("id")
+        )
+        for subscription in self.subscriptions:
+            for sp in subscription._prefetched_objects_cache["subscriptionproduct_set"]:
+                if sp.product_id:
+                    sp.product = self.products[sp.product_id]
+
+        # Months invoiced by (subscription, product) for temporary discounts, counting once per invoice item just like
+        # Subscription.months_in_invoices_with_product does.
+        self.invoiced_months = defaultdict(int)
+        invoice_rows = Invoice.objects.filter(
+            subscription_id__in=[s.id for s in self.subscriptions],
+            invoiceitem__product__temporary_discount_months__gte=1,
+        ).values_list("subscription_id", "invoiceitem__product_id", "service_from", "service_to")
+        for subscription_id, product_id, service_from, service_to in invoice_rows:
+            self.invoiced_months[(subscription_id, product_id)] += diff_month(service_to, service_from)
+
+    def __iter__(self):
+        return iter(self.subscriptions)
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def months_in_invoices_with_product(self, subscription, product):
+        """
+        Same as Subscription.months_in_invoices_with_product but taken from the preloaded invoices.
+        """
+        return self.invoiced_months[(subscription.id, product.id)]
+
+    def add_invoice(self, invoice, invoice_items):
+        """
+        Registers the months of a just created invoice, so the temporary discounts of its items keep being counted.
+        """
+        months = diff_month(invoice.service_to, invoice.service_from)
+        for item in invoice_items:
+            if item.product_id and item.product.temporary_discount_months:
+                self.invoiced_months[(invoice.subscription_id, item.product_id)] += months
@@ -2,16 +2,42 @@
 
 from datetime import date
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.db.models import Q
 
 from core.models import Subscription
+from invoicing.models import Billing
+from invoicing.batch_billing import plan_chunks, run_batch_billing
 
 
 class Command(BaseCommand):
     help = """Bills all customers that have not been billed as for today."""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help='Bill in id-range chunks, one transaction per chunk, registering the run in a Billing',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1, help='Number of worker processes used in batch mode (default 1)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=200, help='Subscriptions per chunk in batch mode (default 200)'
+        )
+        parser.add_argument(
+            '--resume', type=int, metavar='BILLING_ID', help='Resume an interrupted batch run, implies --batch'
+        )
+        parser.add_argument(
+            '--row-by-row',
+            action='store_true',
+            help='In batch mode, save every invoice one by one instead of writing each chunk in bulk',
+        )
+        parser.add_argument('--dpp', type=int, default=10, help='Days to pay for the generated invoices (default 10)')
+
     def handle(self, *args, **options):
+        if options['batch'] or options['resume']:
+            return self.handle_batch(**options)
         errors = ''
         count = 0
         billing_date = date.today()
@@ -22,7 +48,7 @@ class Command(BaseCommand):
             try:
                 c = subscription.contact
                 print(('Billing contact {}\'s subscription {}'.format(c.id, subscription.id)))
-                invoice = subscription.bill(billing_date, 10)
+                invoice = subscription.bill(billing_date, options['dpp'])
                 print(('Generated invoice {} for ${}. Contact: {}'.format(invoice.id, invoice.amount, c.id)))
                 # invoice.save()
             except Exception as e:
@@ -32,3 +58,42 @@ class Command(BaseCommand):
         print(('List of errors: \n{}'.format(errors)))
 
         # TODO: Mail someone with the print
+
+    def handle_batch(self, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--workers and --chunk-size must be positive")
+        if options['resume']:
+            try:
+                billing = Billing.objects.get(pk=options['resume'])
+            except Billing.DoesNotExist:
+                raise CommandError("Billing {} does not exist".format(options['resume']))
+            if billing.status == "C":
+                raise CommandError("Billing {} is already completed".format(billing.id))
+            self.stdout.write("Resuming billing {} for {}".format(billing.id, billing.billing_date))
+        else:
+            billing = Billing.objects.create(billing_date=date.today(), dpp=options['dpp'], status="R")
+            chunks = plan_chunks(billing, options['chunk_size'])
+            self.stdout.write(
+                "Started billing {}: {} subscriptions due on {} in {} chunks".format(
+                    billing.id, billing.subscriber_amount, billing.billing_date, len(chunks)
+                )
+            )
+
+        totals = {"billed": 0, "skipped": 0, "failed": 0, "elapsed": 0}
+        self.stdout.write("chunk\tids\tstatus\tbilled\tskipped\tfailed\telapsed")
+        for report in run_batch_billing(billing, options['workers'], not options['row_by_row']):
+            for key in totals:
+                totals[key] += report[key]
+            self.stdout.write(
+                "{number}\t{first_subscription_id}-{last_subscription_id}\t{status}\t{billed}\t{skipped}\t"
+                "{failed}\t{elapsed:.2f}s".format(**report)
+            )
+            if report["errors"] and options['verbosity'] > 1:
+                self.stdout.write(report["errors"])
+        self.stdout.write(
+            "Ended billing {}: {billed} billed, {skipped} skipped, {failed} failed in {elapsed:.2f}s of work".format(
+                billing.id, **totals
+            )
+        )
+        if totals["failed"]:
+            self.stdout.write("Resume it with --resume {} to retry the failed subscriptions".format(billing.id))
@@ -0,0 +1,78 @@
+# Generated by Django 4.2 on 2026-10-17 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("invoicing", "0030_historicalinvoice_created_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BillingChunk",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField(verbose_name="Number")),
+                (
+                    "first_subscription_id",
+                    models.PositiveIntegerField(verbose_name="First subscription id"),
+                ),
+                (
+                    "last_subscription_id",
+                    models.PositiveIntegerField(verbose_name="Last subscription id"),
+                ),
+                (
+                    "size",
+                    models.PositiveIntegerField(default=0, verbose_name="Planned subscriptions"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("P", "Pending"),
+                            ("R", "Starting"),
+                            ("S", "Started"),
+                            ("A", "Aborted"),
+                            ("C", "Completed"),
+                            ("E", "Completed with errors"),
+                        ],
+                        default="P",
+                        max_length=1,
+                        verbose_name="Status",
+                    ),
+                ),
+                ("billed", models.PositiveIntegerField(default=0, verbose_name="Billed")),
+                ("skipped", models.PositiveIntegerField(default=0, verbose_name="Skipped")),
+                ("failed", models.PositiveIntegerField(default=0, verbose_name="Failed")),
+                (
+                    "elapsed",
+                    models.FloatField(blank=True, null=True, verbose_name="Elapsed seconds"),
+                ),
+                ("errors", models.TextField(blank=True, null=True, verbose_name="Errors")),
+                (
+                    "billing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="invoicing.billing",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "billing chunk",
+                "verbose_name_plural": "billing chunks",
+                "ordering": ["billing", "number"],
+                "unique_together": {("billing", "number")},
+            },
+        ),
+    ]
@@ -115,13 +115,18 @@ class Invoice(models.Model):
     old_pk = models.PositiveIntegerField(blank=True, null=True)
 
     def save(self, *args, **kwargs):
-        # Save the payment method and type in case they are deleted from the database to preserve the integrity
-        # of the invoice data.
+        self.set_payment_names()
+        super().save(*args, **kwargs)
+
+    def set_payment_names(self):
+        """
+        Save the payment method and type in case they are deleted from the database to preserve the integrity of the
+        invoice data. Called on save, bulk creations must call it by hand.
+        """
         if self.payment_method_fk:
             self.payment_method_name = self.payment_method_fk.name
         if self.payment_type_fk:
             self.payment_type_name = self.payment_type_fk.name
-        super().save(*args, **kwargs)
 
     def __str__(self):
         return '%s %d' % (_('Invoice'), self.id)
@@ -393,6 +398,50 @@ class Billing(models.Model):
         get_latest_by = "start"
 
 
+class BillingChunk(models.Model):
+    """
+    A range of subscription ids billed as a single unit (one transaction) by the batch billing engine. Chunks are
+    planned once per Billing, so an interrupted run can be resumed by processing only the chunks not completed yet.
+    """
+
+    billing = models.ForeignKey(Billing, on_delete=models.CASCADE, related_name="chunks")
+    number = models.PositiveIntegerField(verbose_name=_("Number"))
+    first_subscription_id = models.PositiveIntegerField(verbose_name=_("First subscription id"))
+    last_subscription_id = models.PositiveIntegerField(verbose_name=_("Last subscription id"))
+    size = models.PositiveIntegerField(default=0, verbose_name=_("Planned subscriptions"))
+    status = models.CharField(max_length=1, default="P", choices=BILLING_STATUS, verbose_name=_("Status"))
+    billed = models.PositiveIntegerField(default=0, verbose_name=_("Billed"))
+    skipped = models.PositiveIntegerField(default=0, verbose_name=_("Skipped"))
+    failed = models.PositiveIntegerField(default=0, verbose_name=_("Failed"))
+    elapsed = models.FloatField(blank=True, null=True, verbose_name=_("Elapsed seconds"))
+    errors = models.TextField(blank=True, null=True, verbose_name=_("Errors"))
+
+    def __str__(self):
+        return "%s %d (%d-%d)" % (_("Chunk"), self.number, self.first_subscription_id, self.last_subscription_id)
+
+    def as_report(self):
+        """
+        Returns a plain dict with the results of this chunk, suitable to be sent back from a worker process.
+        """
+        return {
+            "number": self.number,
+            "first_subscription_id": self.first_subscription_id,
+            "last_subscription_id": self.last_subscription_id,
+            "status": self.status,
+            "billed": self.billed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "elapsed": self.elapsed or 0,
+            "errors": self.errors or "",
+        }
+
+    class Meta:
+        verbose_name = _("billing chunk")
+        verbose_name_plural = _("billing chunks")
+        ordering = ["billing", "number"]
+        unique_together = ["billing", "number"]
+
+
 class CreditNote(models.Model):
     """
     Esto modela las notas de crédito necesarias para la factura electrónica.
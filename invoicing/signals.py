@@ -1,8 +1,11 @@
 # coding=utf-8
+from datetime import date
+
 from django.utils.translation import gettext_lazy as _
 
 from django.dispatch import receiver
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
+from core.dcf_members import DEBTORS, contacts_changed
 from .models import Invoice
 
 
@@ -14,3 +17,12 @@ def invoice_pre_save_signal(sender, instance, **kwargs):
             (instance.paid or instance.debited) and instance.payment_date) or \
             (not instance.paid and not instance.debited and
                 not instance.payment_date), _('A paid invoice must have a payment date and vice versa')
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+def invoice_dcf_signal(sender, instance, **kwargs):
+    # Only the filters with debtor contacts depend on the invoices. A new invoice that isn't expired yet can't make its
+    # contact a debtor.
+    if kwargs.get("created") and not (instance.expiration_date and instance.expiration_date < date.today()):
+        return
+    contacts_changed([instance.contact_id], [DEBTORS])
@@ -320,17 +320,13 @@ def contact_update_mp_wrapper(
     return result
 
 
-def bill_subscription(
-    subscription,
-    billing_date=None,
-    dpp=10,
-    force_by_date=False,
-    billing_date_override=None,
-    payment_reference=None,
+def build_subscription_invoice(
+    subscription, billing_date=None, dpp=10, force_by_date=False, payment_reference=None, billing=None, context=None
 ):
     """
-    Bills a single subscription into an only invoice. Returns the created invoice.
-    # TODO: Products have a field "active" which may not be used here. check and make fixes if any.
+    Runs every check and calculation needed to bill a subscription, without writing anything to the database.
+    Returns the invoice (not saved, None if the amount is not greater than 0), its items (not saved either), the balance
+    item if the subscription has a balance and the amount of the invoice.
     """
     # Safely get settings with default values
     billing_extra_days = getattr(settings, 'BILLING_EXTRA_DAYS', 0)
@@ -339,7 +335,7 @@ def bill_subscription(
     envelope_price = getattr(settings, 'ENVELOPE_PRICE', 0)
 
     billing_date = billing_date or date.today()
-    invoice = None
+    invoice, balance_item = None, None
 
     # Check that the subscription is normal
     assert subscription.type in ('N', 'C'), _('This subscription is not normal or corporate and should not be billed.')
@@ -379,7 +375,7 @@ def bill_subscription(
         elif billing_data["route"] in exclude_routes_from_billing_list:
             raise Exception(f"{err_msg}, can't be billed since it's on route {billing_data['route']}.")
 
-    product_summary = subscription.product_summary(with_pauses=True)
+    product_summary = subscription.product_summary(with_pauses=True, context=context)
 
     # Calculate price and get invoice items
     if subscription.type == "C" and subscription.override_price:
@@ -392,13 +388,19 @@ def bill_subscription(
             debug_id=f"subscription_{subscription.id}",
             create_items=True,
             subscription=subscription,
+            catalog=context.products if context else None,
         )
 
     # Handle envelope price if needed
-    if envelope_price and SubscriptionProduct.objects.filter(subscription=subscription, has_envelope=1).exists():
+    if envelope_price and context:
+        products_with_envelope_count = len(
+            [sp for sp in subscription.subscriptionproduct_set.all() if sp.has_envelope == 1]
+        )
+    elif envelope_price:
         products_with_envelope_count = SubscriptionProduct.objects.filter(
             subscription=subscription, has_envelope=1
         ).count()
+    if envelope_price and products_with_envelope_count:
         envelope_amount = products_with_envelope_count * envelope_price * subscription.frequency
         envelope_item = InvoiceItem(description=_('Envelope'), amount=envelope_amount, subscription=subscription)
         invoice_items.append(envelope_item)
@@ -418,75 +420,142 @@ def bill_subscription(
         amount += (-1 if subscription.balance > 0 else 1) * float(balance_item.amount)
         invoice_items.append(balance_item)
 
+    if amount > 0:
+        invoice = Invoice(
+            contact=subscription.get_billing_contact(),
+            payment_type=subscription.payment_type,
+            creation_date=billing_date,
+            service_from=service_from,
+            service_to=service_from + relativedelta(months=subscription.frequency),
+            billing_name=billing_data['name'],
+            billing_address=billing_data['address'],
+            billing_state=billing_data['state'],
+            billing_city=billing_data['city'],
+            route=billing_data['route'],
+            order=billing_data['order'],
+            expiration_date=overdue_date,
+            billing_document=subscription.get_billing_document(),
+            subscription=subscription,
+            amount=amount,
+            payment_type_fk=subscription.payment_type_fk,
+            payment_method_fk=subscription.payment_method_fk,
+            payment_reference=payment_reference,
+            billing=billing,
+        )
+
+    return invoice, invoice_items, balance_item, amount
+
+
+def apply_invoice_side_effects(invoice, invoice_items, billing_date, context=None):
+    """
+    Updates the subscription of a just saved invoice according to its items: one-shot products are removed (ending the
+    subscription if it has no products left) and so are the temporary discounts that were already fully invoiced.
+    """
+    for item in invoice_items:
+        # TODO: We need a better way to identify one-shot products than checking the edition frequency
+        if item.product and item.product.edition_frequency == 4:
+            invoice.subscription.remove_product(item.product)
+            # After this if the subscription has no products left, we should end it
+            if not invoice.subscription.products.exists():
+                invoice.subscription.end_date = billing_date
+                invoice.subscription.active = False
+                invoice.subscription.save()
+
+    # Remove temporary discounts if applicable
+    if context:
+        context.add_invoice(invoice, invoice_items)
+        invoiceitems_with_temporary_discount = [
+            item for item in invoice_items if item.product and item.product.temporary_discount_months
+        ]
+    else:
+        invoiceitems_with_temporary_discount = invoice.invoiceitem_set.filter(
+            product__temporary_discount_months__gte=1
+        )
+    for invoiceitem in invoiceitems_with_temporary_discount:
+        temporary_discount = invoiceitem.product
+        months = temporary_discount.temporary_discount_months
+        if context:
+            months_invoiced = context.months_in_invoices_with_product(invoice.subscription, temporary_discount)
+        else:
+            months_invoiced = invoice.subscription.months_in_invoices_with_product(temporary_discount.slug)
+        if months_invoiced >= months:
+            invoice.subscription.remove_product(temporary_discount)
+
+
+def advance_subscription(subscription, balance_item=None, force_by_date=False, billing_date_override=None):
+    """
+    Updates (in memory) the balance and the next billing date of a just billed subscription.
+    """
+    # Subscription balance needs to be updated if there's a balance item
+    if subscription.balance:
+        if subscription.balance > 0 and balance_item:
+            subscription.balance = Decimal(subscription.balance) - Decimal(balance_item.amount)
+        if subscription.balance <= 0:
+            subscription.balance = None
+
+    # Update subscription billing date. If force_by_date is True, we will use the billing_date_override.
+    if force_by_date and billing_date_override:
+        subscription.next_billing = billing_date_override
+    else:
+        # For corporate subscriptions with end_date, set next_billing to end_date after first bill
+        # This ensures they are only billed once
+        if subscription.type == "C" and subscription.end_date:
+            subscription.next_billing = subscription.end_date
+        else:
+            subscription.next_billing = (subscription.next_billing or subscription.start_date) + relativedelta(
+                months=subscription.frequency
+            )
+
+
+class ZeroAmountError(AssertionError):
+    """
+    Raised by bill_subscription when the amount to bill isn't greater than 0. No invoice is created, but the next
+    billing date and the balance of the subscription were already advanced and saved.
+    """
+
+    def __init__(self, message=_("This subscription wasn't billed since amount is not greater than 0")):
+        super().__init__(message)
+
+
+def bill_subscription(
+    subscription,
+    billing_date=None,
+    dpp=10,
+    force_by_date=False,
+    billing_date_override=None,
+    payment_reference=None,
+    billing=None,
+    context=None,
+):
+    """
+    Bills a single subscription into an only invoice. Returns the created invoice.
+    When a Billing is given, the created invoice is linked to it.
+    When a BillingContext (see invoicing.billing_context) that includes the subscription is given, the data needed to
+    bill it is read from there instead of being queried.
+    # TODO: Products have a field "active" which may not be used here. check and make fixes if any.
+    """
+    billing_date = billing_date or date.today()
+    invoice, invoice_items, balance_item, amount = build_subscription_invoice(
+        subscription, billing_date, dpp, force_by_date, payment_reference, billing, context
+    )
+
     try:
         # Create invoice if amount is greater than 0
-        if amount > 0:
-            invoice = Invoice.objects.create(
-                contact=subscription.get_billing_contact(),
-                payment_type=subscription.payment_type,
-                creation_date=billing_date,
-                service_from=service_from,
-                service_to=service_from + relativedelta(months=subscription.frequency),
-                billing_name=billing_data['name'],
-                billing_address=billing_data['address'],
-                billing_state=billing_data['state'],
-                billing_city=billing_data['city'],
-                route=billing_data['route'],
-                order=billing_data['order'],
-                expiration_date=overdue_date,
-                billing_document=subscription.get_billing_document(),
-                subscription=subscription,
-                amount=amount,
-                payment_type_fk=subscription.payment_type_fk,
-                payment_method_fk=subscription.payment_method_fk,
-                payment_reference=payment_reference,
-            )
+        if invoice:
+            invoice.save()
 
             # Add all invoice items to the invoice
             for item in invoice_items:
+                item.invoice = invoice
                 item.save()
-                invoice.invoiceitem_set.add(item)
-                # TODO: We need a better way to identify one-shot products than checking the edition frequency
-                if item.product and item.product.edition_frequency == 4:
-                    invoice.subscription.remove_product(item.product)
-                    # After this if the subscription has no products left, we should end it
-                    if not invoice.subscription.products.exists():
-                        invoice.subscription.end_date = billing_date
-                        invoice.subscription.active = False
-                        invoice.subscription.save()
-
-            # Remove temporary discounts if applicable
-            invoiceitems_with_temporary_discount = invoice.invoiceitem_set.filter(
-                product__temporary_discount_months__gte=1
-            )
-            for invoiceitem in invoiceitems_with_temporary_discount:
-                temporary_discount = invoiceitem.product
-                months = temporary_discount.temporary_discount_months
-                if invoice.subscription.months_in_invoices_with_product(temporary_discount.slug) >= months:
-                    invoice.subscription.remove_product(temporary_discount)
-
-        # Subscription balance needs to be updated if there's a balance item
-        if subscription.balance:
-            if subscription.balance > 0 and balance_item:
-                subscription.balance = Decimal(subscription.balance) - Decimal(balance_item.amount)
-            if subscription.balance <= 0:
-                subscription.balance = None
-
-        # Update subscription billing date. If force_by_date is True, we will use the billing_date_override.
-        if force_by_date and billing_date_override:
-            subscription.next_billing = billing_date_override
-        else:
-            # For corporate subscriptions with end_date, set next_billing to end_date after first bill
-            # This ensures they are only billed once
-            if subscription.type == "C" and subscription.end_date:
-                subscription.next_billing = subscription.end_date
-            else:
-                subscription.next_billing = (subscription.next_billing or subscription.start_date) + relativedelta(
-                    months=subscription.frequency
-                )
+
+            apply_invoice_side_effects(invoice, invoice_items, billing_date, context)
+
+        advance_subscription(subscription, balance_item, force_by_date, billing_date_override)
         subscription.save()
 
-        assert amount > 0, _("This subscription wasn't billed since amount is not greater than 0")
+        if amount <= 0:
+            raise ZeroAmountError()
 
     except Exception as e:
         raise
@@ -25,8 +25,10 @@ from reportlab.platypus import Table, TableStyle
 from .filters import InvoiceFilter
 from .forms import InvoiceForm, InvoiceItemFormSet
 from invoicing.models import Invoice, InvoiceItem, Billing, CreditNote
+from core.choices import FREQUENCY_CHOICES
 from core.models import Contact, Product
 from core.mixins import BreadcrumbsMixin
+from core.price_simulation import PriceSimulation
 
 
 @staff_member_required
@@ -576,3 +578,61 @@ class CanceledInvoicesReportView(BreadcrumbsMixin, UserPassesTestMixin, Template
                 ]
             )
         return response
+
+
+class PriceSimulationReportView(BreadcrumbsMixin, UserPassesTestMixin, TemplateView):
+    """
+    "What if" report: compares the current totals of every active subscription with the ones obtained with the
+    proposed product prices and frequency discounts (see core.price_simulation).
+
+    Access: Admins group, Finances group, and superusers only.
+    """
+
+    template_name = "price_simulation_report.html"
+
+    def test_func(self):
+        user = self.request.user
+        if user.is_superuser:
+            return True
+        return user.groups.filter(name__in=["Admins", "Finances"]).exists()
+
+    def breadcrumbs(self):
+        return [
+            {"label": _("Home"), "url": reverse("home")},
+            {"label": _("Price simulation"), "url": ""},
+        ]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["products"] = list(Product.objects.filter(active=True).order_by("type", "name"))
+        context["frequencies"] = [
+            {
+                "months": months,
+                "name": name,
+                "discount": getattr(settings, "DISCOUNT_{}_MONTHS".format(months), 0),
+            }
+            for months, name in FREQUENCY_CHOICES
+        ]
+        return context
+
+    def post(self, request, *args, **kwargs):
+        context = self.get_context_data(**kwargs)
+        price_table, frequency_discounts = {}, {}
+        try:
+            for product in context["products"]:
+                value = request.POST.get("price_{}".format(product.id), "").strip()
+                if value:
+                    product.proposed_price = price_table[product.id] = float(value)
+            for frequency in context["frequencies"]:
+                value = request.POST.get("discount_{}".format(frequency["months"]), "").strip()
+                if value:
+                    frequency["proposed"] = frequency_discounts[frequency["months"]] = float(value)
+        except ValueError:
+            messages.error(request, _("Prices and discounts must be numbers"))
+            return self.render_to_response(context)
+        report = PriceSimulation().run(price_table, frequency_discounts)
+        top_bucket = max([bucket["count"] for bucket in report["histogram"]] or [0])
+        for bucket in report["histogram"]:
+            bucket["percent"] = bucket["count"] * 100 / top_bucket if top_bucket else 0
+        context["report"] = report
+        return self.render_to_response(context)
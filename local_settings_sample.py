@@ -32,6 +32,11 @@ SECRET_KEY = ""
 # DISCOUNT_6_MONTHS = 7.3
 # DISCOUNT_12_MONTHS = 11.91
 
+# Pricing engine (core.pricing): seconds before a process reloads its products and price rules (0 = never, they're
+# still reloaded when changed in the same process) and max amount of memoised prices.
+# PRICING_ENGINE_TTL = 300
+# PRICING_ENGINE_CACHE_SIZE = 1024
+
 # Price of an envelope (default=not set)
 # ENVELOPE_PRICE = 4
 
@@ -90,7 +90,7 @@ class RouteChangeAdmin(admin.ModelAdmin):
 
 @admin.register(Delivery)
 class DeliveryAdmin(admin.ModelAdmin):
-    list_display = ('date', 'route', 'copies')
+    list_display = ('date', 'route', 'product', 'copies')
 
 
 @admin.register(Resort)
@@ -0,0 +1,159 @@
+# coding=utf-8
+"""
+Snapshot of the delivery manifest of an edition: what was sent to each route on a day, for a product.
+
+snapshot_edition() runs once per edition (the snapshot_editions command, scheduled before the labels of the day are
+printed). It aggregates the subscription products of the product on each route with one grouped query, and stores the
+result in the EditionRoute rows of the Edition (copies, subscription products, contacts, new, closing, promotions,
+envelopes and special instructions), the totals of the Edition and the Delivery rows of the day. Once taken, the
+snapshot is not changed again unless it's forced, so it's also the record of what was actually sent each day.
+
+The logistics pages and create_deliveries read route_manifests() when the editions have a snapshot, instead of adding
+up the subscription products again on every request, and fall back to the live aggregates when they have not. The
+snapshot only has the paper products of the subscriptions that had started by the day, which isn't what the live
+columns of the route lists count, so the pages label the columns read from it as the ones of the edition.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Product, SubscriptionProduct
+
+from .models import Delivery, Edition, EditionRoute
+
+
+# Days before the date of the edition that a subscription is new for
+NEW_DAYS = 7
+# Days before the date of the edition that an ending subscription counts as closing, like in route_details
+CLOSING_DAYS = 3
+MANIFEST_FIELDS = (
+    "copies",
+    "subscription_products",
+    "contacts",
+    "new",
+    "closing",
+    "promotions",
+    "envelopes",
+    "special_instructions",
+)
+
+
+def manifest(product, day):
+    """
+    Returns the manifest of every route for the product on the day, as a list of dictionaries with the route_id and
+    the MANIFEST_FIELDS, from the active subscription products (of paper products) of the active subscriptions that
+    already started.
+    """
+    aggregates = {
+        "copies": Coalesce(Sum("copies"), 0),
+        "subscription_products": Count("id"),
+        "contacts": Count("subscription__contact", distinct=True),
+        "new": Coalesce(Sum("copies", filter=Q(subscription__start_date__gte=day - timedelta(NEW_DAYS))), 0),
+        "closing": Count(
+            "subscription", distinct=True, filter=Q(subscription__end_date__gte=day - timedelta(CLOSING_DAYS))
+        ),
+        "promotions": Coalesce(Sum("copies", filter=Q(subscription__type="P")), 0),
+        "envelopes": Count("id", filter=Q(has_envelope__isnull=False)),
+        "special_instructions": Count(
+            "id", filter=Q(special_instructions__isnull=False) & ~Q(special_instructions="")
+        ),
+    }
+    rows = (
+        SubscriptionProduct.objects.filter(
+            product=product,
+            active=True,
+            subscription__active=True,
+            subscription__start_date__lte=day,
+            route__isnull=False,
+        )
+        .exclude(product__digital=True)
+        .values("route_id")
+        # the annotations can't be named like the fields of the model
+        .annotate(**{"total_" + field: aggregate for field, aggregate in aggregates.items()})
+        .order_by("route_id")
+    )
+    return [{"route_id": row["route_id"], **{field: row["total_" + field] for field in aggregates}} for row in rows]
+
+
+def snapshot_edition(product, day, force=False):
+    """
+    Stores the manifest of the product on the day in the EditionRoute rows of its Edition (created if it doesn't
+    exist) and in the Delivery rows of the day, in one transaction. An edition that already has a snapshot is left as
+    it is unless force is True. Returns the edition.
+    """
+    edition, created = Edition.objects.get_or_create(product=product, date=day)
+    if edition.snapshot_at and not force:
+        return edition
+    rows = manifest(product, day)
+    with transaction.atomic():
+        EditionRoute.objects.filter(edition=edition).delete()
+        EditionRoute.objects.bulk_create([EditionRoute(edition=edition, **row) for row in rows])
+        edition.total = sum(row["copies"] for row in rows)
+        edition.promotions = sum(row["promotions"] for row in rows)
+        edition.standard = edition.total - edition.promotions
+        edition.snapshot_at = timezone.now()
+        edition.save(update_fields=["total", "promotions", "standard", "snapshot_at"])
+        Delivery.objects.filter(date=day, product=product).exclude(
+            route__in=[row["route_id"] for row in rows]
+        ).delete()
+        Delivery.objects.bulk_create(
+            [Delivery(date=day, route=row["route_id"], product=product, copies=row["copies"]) for row in rows],
+            update_conflicts=True,
+            unique_fields=["date", "route", "product"],
+            update_fields=["copies"],
+        )
+    return edition
+
+
+def snapshot_editions(day, force=False):
+    """
+    Takes the snapshot of the editions of every paper product delivered on the weekday of the day. Returns the
+    editions.
+    """
+    products = Product.objects.filter(weekday=day.isoweekday()).exclude(digital=True).order_by("id")
+    return [snapshot_edition(product, day, force) for product in products]
+
+
+def route_manifests(day, product=None):
+    """
+    Returns the snapshot of the day (only for the product, if one is given) as {route number: {field: value}} with the
+    MANIFEST_FIELDS added up over the products. Returns None unless the editions of every paper product delivered on
+    the weekday of the day (or the edition of the product) have a snapshot, so the totals are never partial.
+    """
+    if product is not None:
+        product_ids = [product.id]
+    else:
+        product_ids = list(
+            Product.objects.filter(weekday=day.isoweekday()).exclude(digital=True).values_list("id", flat=True)
+        )
+    editions = Edition.objects.filter(date=day, product__in=product_ids, snapshot_at__isnull=False)
+    if not product_ids or editions.values("product").distinct().count() < len(product_ids):
+        return None
+    rows = (
+        EditionRoute.objects.filter(edition__in=editions)
+        .values("route_id")
+        .annotate(**{"total_" + field: Sum(field) for field in MANIFEST_FIELDS})
+        .order_by()
+    )
+    return {row["route_id"]: {field: row["total_" + field] for field in MANIFEST_FIELDS} for row in rows}
+
+
+def snapshot_copies(dates):
+    """
+    Returns the copies of the editions of the dates that have a snapshot, as {(date, product id): {route number:
+    copies}}. The editions without any route are included, with no copies.
+    """
+    copies = {
+        (day, product_id): {}
+        for day, product_id in Edition.objects.filter(date__in=dates, snapshot_at__isnull=False).values_list(
+            "date", "product_id"
+        )
+    }
+    for day, product_id, route_id, route_copies in EditionRoute.objects.filter(
+        edition__date__in=dates, edition__snapshot_at__isnull=False
+    ).values_list("edition__date", "edition__product_id", "route_id", "copies"):
+        copies[(day, product_id)][route_id] = route_copies
+    return copies
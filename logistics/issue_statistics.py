@@ -0,0 +1,175 @@
+# coding=utf-8
+"""
+Issue statistics of the logistics pages (logistics_issues_statistics and issues_route_list).
+
+The issues of any window are counted with one grouped query by period (TruncDay, TruncWeek or TruncMonth) or by route,
+instead of a count per day, week, month or route. In the roll-ups mode they're read by day from the issues roll-up (see
+support.daily_rollups) and grouped by period in Python.
+
+The denominators of the percentages (the active subscription products of each weekday, the active subscriptions and
+the active subscriptions of each route) are counted with three queries and cached for
+ISSUE_STATISTICS_CACHE_TIMEOUT seconds (300 by default), since they change slowly and every page uses them.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from core.models import Subscription, SubscriptionProduct
+from support.daily_rollups import ISSUES
+from support.models import Issue
+
+
+DAY, WEEK, MONTH = "day", "week", "month"
+TRUNCATES = {DAY: TruncDay, WEEK: TruncWeek, MONTH: TruncMonth}
+# The weekly and monthly percentages are over the active subscriptions times these editions
+EDITIONS = {WEEK: 6, MONTH: 24}
+CACHE_KEY = "logistics_issue_statistics:denominators"
+
+
+def period_start(day, period):
+    """
+    The first day of the period (the day, its week starting on monday or its month) of the day.
+    """
+    if period == WEEK:
+        return day - timedelta(day.isoweekday() - 1)
+    if period == MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def periods(period, date_from, date_to):
+    """
+    Returns the (first day, last day) of every period from the one of date_from to the one of date_to.
+    """
+    step = {DAY: timedelta(1), WEEK: timedelta(7), MONTH: relativedelta(months=1)}[period]
+    start, result = period_start(date_from, period), []
+    while start <= date_to:
+        result.append((start, start + step - timedelta(1)))
+        start += step
+    return result
+
+
+def issues_by_period(period, date_from, date_to, category="L", rollups=False):
+    """
+    Returns {first day of the period: issues} for the issues of the category from date_from to date_to.
+    """
+    if rollups:
+        counts = defaultdict(int)
+        for day, measures in ISSUES.read(["date"], date_from, date_to, category=category).items():
+            counts[period_start(day, period)] += measures["issues"]
+        return dict(counts)
+    return dict(
+        Issue.objects.filter(category=category, date__gte=date_from, date__lte=date_to)
+        .annotate(period=TRUNCATES[period]("date"))
+        .values_list("period")
+        .annotate(Count("id"))
+        .order_by()
+    )
+
+
+def issues_by_route(date_from, date_to, category="L", rollups=False):
+    """
+    Returns {route number: issues} for the issues of the category from date_from to date_to.
+    """
+    if rollups:
+        rows = ISSUES.read(["route_id"], date_from, date_to, category=category)
+        return {route_id: measures["issues"] for route_id, measures in rows.items() if route_id}
+    return dict(
+        Issue.objects.filter(
+            category=category, date__gte=date_from, date__lte=date_to, subscription_product__route__isnull=False
+        )
+        .values_list("subscription_product__route")
+        .annotate(Count("id"))
+        .order_by()
+    )
+
+
+def compute_denominators():
+    weekdays = dict(
+        SubscriptionProduct.objects.filter(subscription__active=True)
+        .exclude(product__digital=True)
+        .values_list("product__weekday")
+        .annotate(Count("id"))
+        .order_by()
+    )
+    subscriptions = Subscription.objects.filter(active=True).exclude(products__digital=True)
+    routes = dict(
+        subscriptions.filter(subscriptionproduct__route__isnull=False)
+        .values_list("subscriptionproduct__route")
+        .annotate(Count("id"))
+        .order_by()
+    )
+    return {"weekdays": weekdays, "subscriptions": subscriptions.count(), "routes": routes}
+
+
+def get_denominators():
+    """
+    Returns the active subscription products by weekday, the active subscriptions and the active subscriptions by
+    route, without digital products, from the cache when they're there.
+    """
+    denominators = cache.get(CACHE_KEY)
+    if denominators is None:
+        denominators = compute_denominators()
+        cache.set(CACHE_KEY, denominators, getattr(settings, "ISSUE_STATISTICS_CACHE_TIMEOUT", 300))
+    return denominators
+
+
+def percentage(issues, total):
+    """
+    The issues as a percentage of total, None when total is 0.
+    """
+    return float(issues) * 100 / total if total else None
+
+
+def issue_statistics(period, date_from, date_to, category="L", rollups=False):
+    """
+    Returns a dict with the start, end, issues and percentage of each period from the one of date_from to the one of
+    date_to. The daily percentage is over the active subscription products of the weekday, the weekly and monthly ones
+    over the active subscriptions times the editions of the period. The percentage is None without issues or
+    denominator.
+    """
+    windows = periods(period, date_from, date_to)
+    counts = issues_by_period(period, windows[0][0], windows[-1][1], category, rollups) if windows else {}
+    denominators = get_denominators() if counts else None
+    statistics = []
+    for start, end in windows:
+        issues = counts.get(start, 0)
+        pct = None
+        if issues:
+            if period == DAY:
+                pct = percentage(issues, denominators["weekdays"].get(start.isoweekday(), 0))
+            else:
+                pct = percentage(issues, denominators["subscriptions"] * EDITIONS[period])
+        statistics.append({"start": start, "end": end, "issues": issues, "pct": pct})
+    return statistics
+
+
+def weekdays_count(date_from, date_to):
+    """
+    The days from monday to friday from date_from to date_to.
+    """
+    return sum(1 for start, end in periods(DAY, date_from, date_to) if start.isoweekday() <= 5)
+
+
+def route_statistics(routes, date_from, date_to, category="L", rollups=False):
+    """
+    Returns a dict with the route number, issues, active subscriptions and percentage of each route, the percentage
+    over the active subscriptions of the route times the weekdays from date_from to date_to.
+    """
+    days = weekdays_count(date_from, date_to)
+    issues = issues_by_route(date_from, date_to, category, rollups)
+    subscriptions = get_denominators()["routes"]
+    return [
+        {
+            "route_number": route.number,
+            "issues_count": issues.get(route.number, 0),
+            "subscriptions_count": subscriptions.get(route.number, 0),
+            "pct": percentage(issues.get(route.number, 0), subscriptions.get(route.number, 0) * days),
+        }
+        for route in routes
+    ]
@@ -0,0 +1,125 @@
+# coding=utf-8
+"""
+File cache of the labels PDF of every route.
+
+A label run (the labels of a weekday, or of a product on a date, in a page layout) is split by route and the PDF of
+every route is kept under MEDIA_ROOT/LOGISTICS_LABELS_PATH/cache/<run>/ with the hash of its LabelSpecs in the file
+name.
+The specs hold the exact contents of the labels, so a route is drawn again only when one of its labels changed, and the
+labels of the whole run are the cached route PDFs put together. The render_label_cache command keeps the cache of the
+next edition up to date in the background.
+
+The old versions of a route are removed only once they weren't used for OLD_VERSION_SECONDS, since a request rendered
+at the same time from older specs may still be putting them together.
+"""
+import hashlib
+import os
+import shutil
+import time
+from itertools import groupby
+from operator import attrgetter
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from django.conf import settings
+
+from .label_printing import draw_labels, write_atomically
+
+
+# Seconds since it was last used after which an old version of a route is removed
+OLD_VERSION_SECONDS = 600
+
+
+def specs_digest(specs, page):
+    """
+    Returns the hash of the labels drawn from the specs in the page layout.
+    """
+    digest = hashlib.sha256(page.encode())
+    for spec in specs:
+        digest.update(repr(tuple(spec)).encode())
+    return digest.hexdigest()[:16]
+
+
+class LabelCache:
+    """
+    Draws the labels of every route into its own PDF when they change and puts the route PDFs of a run together.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(settings.MEDIA_ROOT, settings.LOGISTICS_LABELS_PATH, "cache")
+
+    def route_filename(self, route, digest):
+        return "route-{}-{}.pdf".format(route if route is not None else "none", digest)
+
+    def render(self, run, specs, page="Roll"):
+        """
+        Draws the routes of the specs (ordered by route) whose labels aren't cached yet and removes the old versions of
+        those routes not used for OLD_VERSION_SECONDS. Returns the paths of the route PDFs in order and how many routes
+        were drawn.
+        """
+        run_directory = os.path.join(self.directory, run)
+        os.makedirs(run_directory, exist_ok=True)
+        paths, drawn = [], 0
+        for route, route_specs in groupby(specs, key=attrgetter("route")):
+            route_specs = list(route_specs)
+            path = os.path.join(run_directory, self.route_filename(route, specs_digest(route_specs, page)))
+            try:
+                # the modification time is when the version was last used, see below
+                os.utime(path)
+            except FileNotFoundError:
+                write_atomically(path, lambda output: draw_labels(output, route_specs, page))
+                drawn += 1
+            paths.append(path)
+        current = {os.path.basename(path) for path in paths}
+        routes = tuple(filename.rsplit("-", 1)[0] + "-" for filename in current)
+        for filename in os.listdir(run_directory):
+            if routes and filename.startswith(routes) and filename not in current:
+                old_path = os.path.join(run_directory, filename)
+                try:
+                    if os.path.getmtime(old_path) < time.time() - OLD_VERSION_SECONDS:
+                        os.unlink(old_path)
+                except FileNotFoundError:
+                    # removed by a run rendered at the same time
+                    pass
+        return paths, drawn
+
+    def concatenate(self, paths, output):
+        """
+        Writes the pages of the route PDFs into the output file.
+        """
+        writer = PdfWriter()
+        for path in paths:
+            for page in PdfReader(path).pages:
+                writer.add_page(page)
+        writer.write(output)
+
+    def prune(self, days=7):
+        """
+        Removes the runs that weren't rendered in the last days. Returns how many were removed.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        for run in os.listdir(self.directory):
+            run_directory = os.path.join(self.directory, run)
+            if os.path.isdir(run_directory) and os.path.getmtime(run_directory) < time.time() - days * 86400:
+                shutil.rmtree(run_directory, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def labels(self, run, specs, output, page="Roll"):
+        """
+        Writes the labels of the specs into the output file, drawing only the routes that changed. Returns the paths of
+        the route PDFs and how many routes were drawn.
+        """
+        paths, drawn = self.render(run, specs, page)
+        self.concatenate(paths, output)
+        return paths, drawn
+
+
+def weekday_run(isoweekday, page):
+    return "weekday-{}-{}".format(isoweekday, page)
+
+
+def product_date_run(product, day, page):
+    return "product-{}-{}-{}".format(product.id, day.strftime("%Y%m%d"), page)
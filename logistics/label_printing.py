@@ -0,0 +1,284 @@
+# coding=utf-8
+"""
+Individual delivery labels, read with a single pre-joined query and drawn into a temporary file.
+
+The subscription products are read in chunks with every object the label needs joined (subscription, contact, route,
+address, label contact, seller and product) and three annotations replace the queries the old loops ran for every
+subscription product: whether the contact was invoiced in the last days and the id and weekday of the first product of
+the subscription by billing priority. Every subscription product becomes a LabelSpec with the exact contents of its
+labels, which is what gets drawn and what the label cache (see logistics.label_cache) hashes.
+
+ReportLab writes the document when the canvas is saved, so it's written to a temporary file that is then streamed to
+the client (or moved to its final path by the print_labels command) instead of being kept in memory as the response
+body.
+"""
+import os
+import tempfile
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from reportlab.pdfgen.canvas import Canvas
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.http import FileResponse
+from django.utils.translation import gettext_lazy as _
+
+from core.models import Product, SubscriptionProduct
+from invoicing.models import Invoice
+from util.dates import next_business_day
+
+from .labels import LogisticsLabel, LogisticsLabel96x30, Roll, Roll96x30, SheetA4
+
+
+# page name: (sheet layout, label type)
+LABEL_SHEETS = {
+    "Roll": (Roll, LogisticsLabel),
+    "Roll96x30": (Roll96x30, LogisticsLabel96x30),
+    "SheetA4": (SheetA4, LogisticsLabel),
+}
+ROUTE_SUFFIXES = {1: _("MONDAY"), 2: _("TUESDAY"), 3: _("WEDNESDAY"), 4: _("THURSDAY"), 5: _("FRIDAY")}
+# subscription products read from the database at once
+LABELS_CHUNK_SIZE = 2000
+
+LabelSpec = namedtuple(
+    "LabelSpec",
+    [
+        "route",
+        "route_order",
+        "route_suffix",
+        "name",
+        "address",
+        "message_for_contact",
+        "envelope",
+        "new",
+        "has_invoice",
+        "special_instructions",
+        "partial",
+        "copies",
+    ],
+)
+
+
+def label_dates(date_string=None):
+    """
+    Returns the day whose products are delivered and the last start date of the subscriptions that get a label. With
+    no date given, the labels are for the next business day (or for today, from midnight to 2:59).
+    """
+    if date_string:
+        next_day = datetime.strptime(date_string, "%Y-%m-%d").date()
+        return next_day, next_day
+    if datetime.now().hour in range(0, 3):
+        next_day = date.today()
+    else:
+        next_day = next_business_day()
+    return next_day, date.today() + timedelta(1)
+
+
+def with_label_data(subscription_products, invoiced_days=6):
+    """
+    Joins and annotates what the labels need to the subscription products, ordered by route and order.
+    """
+    first_product = SubscriptionProduct.objects.filter(
+        subscription=OuterRef("subscription"),
+        product__type__in=[Product.ProductTypeChoices.SUBSCRIPTION, Product.ProductTypeChoices.OTHER],
+    ).order_by("product__billing_priority", "product_id")
+    return (
+        subscription_products.filter(address__isnull=False)
+        .select_related("subscription__contact", "route", "address", "label_contact", "seller", "product")
+        .annotate(
+            recently_invoiced=Exists(
+                Invoice.objects.filter(
+                    contact=OuterRef("subscription__contact"),
+                    print_date__gte=date.today() - timedelta(invoiced_days),
+                )
+            ),
+            first_product_id=Subquery(first_product.values("product_id")[:1]),
+            first_product_weekday=Subquery(first_product.values("product__weekday")[:1]),
+        )
+        .order_by("route", F("order").asc(nulls_first=True), "address__address_1")
+    )
+
+
+def label_subscription_products(isoweekday, started_by, route_numbers=None, exclude_contacts=None):
+    """
+    Returns the subscription products of the products delivered on a weekday that get a label, for the active
+    subscriptions started by the given date. Pass a list of route numbers to get only the labels of those routes.
+    """
+    subscription_products = SubscriptionProduct.objects.filter(
+        active=True,
+        product__weekday=isoweekday,
+        subscription__active=True,
+        subscription__start_date__lte=started_by,
+        route__isnull=False,
+    ).exclude(route__print_labels=False)
+    if route_numbers is not None:
+        subscription_products = subscription_products.filter(route__number__in=route_numbers)
+    if exclude_contacts:
+        subscription_products = subscription_products.exclude(subscription__contact_id__in=exclude_contacts)
+    return with_label_data(subscription_products)
+
+
+def product_date_subscription_products(product, day):
+    """
+    Returns the subscription products of a product that get a label on a date, from the subscriptions in good standing
+    on that date, with or without route.
+    """
+    return with_label_data(
+        SubscriptionProduct.objects.filter(
+            Q(subscription__end_date__gte=day) | Q(subscription__end_date__isnull=True),
+            active=True,
+            product=product,
+            subscription__status="OK",
+            subscription__start_date__lte=day,
+        ),
+        invoiced_days=30,
+    )
+
+
+def label_specs(subscription_products, route_suffix="", invoice_weekday=None, invoice_product=None, mark_contacts=()):
+    """
+    Yields a LabelSpec for every subscription product. The invoice icon is shown to the contacts with one of the payment
+    types in settings.LOGISTICS_LABEL_INVOICE_PAYMENT_TYPES invoiced recently, when the first product of their
+    subscription is delivered on invoice_weekday or is invoice_product.
+    """
+    mark_contacts = set(mark_contacts)
+    new_start_date = next_business_day()
+    for sp in subscription_products.iterator(chunk_size=LABELS_CHUNK_SIZE):
+        subscription, contact = sp.subscription, sp.subscription.contact
+
+        # Here we'll show an icon if the contact has one of the payment types marked on settings.
+        if invoice_product is not None:
+            first_product_matches = sp.first_product_id == invoice_product.id
+        else:
+            first_product_matches = bool(sp.first_product_weekday) and sp.first_product_weekday == invoice_weekday
+        has_invoice = bool(
+            subscription.payment_type
+            and subscription.payment_type in settings.LOGISTICS_LABEL_INVOICE_PAYMENT_TYPES
+            and not subscription.billing_address_id
+            and sp.recently_invoiced
+            and first_product_matches
+        )
+        if sp.label_message and sp.label_message.strip():
+            message_for_contact = sp.label_message
+        elif subscription.type == "P":
+            ref = sp.seller.name if sp.seller else "un amigo"  # TODO: i18n
+            message_for_contact = "Recomendado por {}".format(ref)  # TODO: i18n
+        else:
+            message_for_contact = ""
+
+        yield LabelSpec(
+            route=sp.route_id,
+            route_order=sp.order if sp.route_id else None,
+            route_suffix=str(route_suffix),
+            name=(sp.label_contact or contact).get_full_name().upper(),
+            address=(sp.address.address_1 or "") + "\n" + (sp.address.address_2 or ""),
+            message_for_contact=message_for_contact,
+            envelope=bool(sp.has_envelope),
+            new=subscription.start_date == new_start_date,
+            has_invoice=has_invoice,
+            special_instructions=bool(sp.special_instructions),
+            partial=contact.id in mark_contacts,
+            copies=sp.copies,
+        )
+
+
+def draw_labels(output, specs, page="Roll"):
+    """
+    Draws a label for every copy of the specs, with a separator label before every route, into the output file. Returns
+    the number of labels drawn, separators not included.
+    """
+    Page, Label = LABEL_SHEETS[page]
+    canvas = Canvas(output, pagesize=(Page.width, Page.height))
+    sheet = Page(Label, canvas)
+    iterator = sheet.iterator()
+    old_route, started, count = None, False, 0
+
+    for spec in specs:
+        # Separator label
+        if spec.route and old_route != spec.route:
+            label = next(iterator)
+            label.separador()
+            old_route, started = spec.route, True
+
+        for copy in range(spec.copies):
+            label = next(iterator)
+            label.route_suffix = spec.route_suffix
+            label.has_invoice = spec.has_invoice
+            label.envelope = spec.envelope
+            label.new = spec.new
+            label.special_instructions = spec.special_instructions
+            label.message_for_contact = spec.message_for_contact
+            label.name = spec.name
+            label.partial = spec.partial
+            label.address = spec.address
+            label.route = spec.route
+            label.route_order = spec.route_order
+            label.draw()
+            started, count = True, count + 1
+    if started:
+        sheet.flush()
+    else:
+        canvas.showPage()
+    canvas.save()
+    return count
+
+
+def write_labels(output, subscription_products, tomorrow, page="Roll", mark_contacts=()):
+    """
+    Draws the labels of the subscription products delivered on the weekday of tomorrow into the output file. Returns
+    the number of labels drawn, separators not included.
+    """
+    isoweekday = tomorrow.isoweekday()
+    route_suffix = ROUTE_SUFFIXES.get(isoweekday, "")
+    specs = label_specs(subscription_products, route_suffix, invoice_weekday=isoweekday, mark_contacts=mark_contacts)
+    return draw_labels(output, specs, page)
+
+
+def pdf_response(write, filename):
+    """
+    Returns a response that streams the PDF written by write(output) from a temporary file, which is removed once it's
+    sent.
+    """
+    output = tempfile.TemporaryFile()
+    write(output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type="application/pdf")
+
+
+def labels_response(subscription_products, tomorrow, filename, page="Roll", mark_contacts=()):
+    """
+    Returns a response that streams the labels PDF of the subscription products.
+    """
+    return pdf_response(
+        lambda output: write_labels(output, subscription_products, tomorrow, page, mark_contacts), filename
+    )
+
+
+def write_atomically(path, write):
+    """
+    Writes a file with write(output) next to the path and moves it there when done, so a partial file is never read.
+    Returns what write() returns.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, partial_path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as partial:
+            result = write(partial)
+        os.replace(partial_path, path)
+    except BaseException:
+        os.unlink(partial_path)
+        raise
+    return result
+
+
+def labels_filename(next_day):
+    return "individual-labels-{}.pdf".format(next_day.strftime("%Y%m%d"))
+
+
+def labels_path(next_day):
+    """
+    Returns where the print_labels command leaves the labels of the day, under settings.LOGISTICS_LABELS_PATH.
+    """
+    return os.path.join(settings.MEDIA_ROOT, settings.LOGISTICS_LABELS_PATH, labels_filename(next_day))
@@ -0,0 +1,69 @@
+# coding=utf-8
+"""
+Suggests a route for the subscription products of paper products without one, from the polygons of the active routes
+and the location of their addresses, and optionally assigns them. Without --apply it's a dry run that only reports the
+suggestions.
+
+Usage examples
+--------------
+    # Report of the suggestions for the active subscriptions, with the detail in a CSV
+    python manage.py assign_routes_by_location --csv /tmp/suggestions.csv
+
+    # Assign the routes of the subscriptions that start in the future, for one product
+    python manage.py assign_routes_by_location --future --product 1 --apply
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from logistics.route_assignment import (
+    apply_suggestions,
+    load_route_index,
+    suggest_routes,
+    summary,
+    unrouted_subscription_products,
+)
+
+
+class Command(BaseCommand):
+    help = "Suggests (and with --apply assigns) the route of the subscription products without one, by location"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--future",
+            action="store_true",
+            help="The subscriptions that start in the future instead of the active ones",
+        )
+        parser.add_argument("--product", type=int, action="append", help="Only this product id, can be repeated")
+        parser.add_argument("--apply", action="store_true", help="Assign the suggested routes")
+        parser.add_argument(
+            "--include-ambiguous",
+            action="store_true",
+            help="Also assign the addresses inside more than one route (to the smallest one)",
+        )
+        parser.add_argument("--csv", help="Write the suggestion of every subscription product to this file")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        index = load_route_index()
+        subscription_products = unrouted_subscription_products(future=options["future"])
+        if options["product"]:
+            subscription_products = subscription_products.filter(product_id__in=options["product"])
+        suggestions = suggest_routes(subscription_products, index)
+        statuses, by_route = summary(suggestions)
+        self.stdout.write(
+            "{} subscription products without route, {} routes with polygon, located in {:.1f}s".format(
+                len(suggestions), len(index), time.time() - start
+            )
+        )
+        for status, count in sorted(statuses.items()):
+            self.stdout.write("  {}: {}".format(status, count))
+        for route, count in by_route.items():
+            self.stdout.write("  route {}: {}".format(route, count))
+        if options["csv"]:
+            suggestions.to_csv(options["csv"], index=False)
+        if options["apply"]:
+            assigned = apply_suggestions(suggestions, include_ambiguous=options["include_ambiguous"])
+            self.stdout.write(self.style.SUCCESS("{} subscription products assigned".format(assigned)))
+        else:
+            self.stdout.write("Dry run, use --apply to assign the routes")
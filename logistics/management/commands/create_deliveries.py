@@ -2,39 +2,32 @@
 
 from datetime import date
 
-from django.core.management import BaseCommand
-from django.db.models import Sum
+from django.core.management import BaseCommand, CommandError
 
-from core.models import SubscriptionProduct
-from logistics.models import Delivery
+from logistics.utils import create_deliveries
 
 
 class Command(BaseCommand):
     help = """Creates deliveries based on product per weekday."""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-range',
+            nargs=2,
+            metavar=('START', 'END'),
+            type=date.fromisoformat,
+            help='Create the deliveries of every day from START to END (YYYY-MM-DD, both included) instead of today',
+        )
+
     def handle(self, *args, **options):
-        today = date.today()
-        isoweekday = today.isoweekday()
-        sp_queryset = SubscriptionProduct.objects.filter(
-            product__weekday=isoweekday, subscription__active=True, subscription__start_date__lte=today)
-
-        print(("Creating deliveries for the day {}".format(today)))
-        for route in sp_queryset.values('route_id').distinct():
-            route_id = route['route_id']
-            if route_id is None:
-                continue
-            copies = sp_queryset.filter(route_id=route_id).aggregate(sum_copies=Sum('copies'))['sum_copies'] or 0
-            nd, created = Delivery.objects.get_or_create(
-                date=today,
-                route=route['route_id'],
-            )
-            if nd.copies:
-                nd.copies = nd.copies + copies
-            else:
-                nd.copies = copies
-            nd.save()
-            if created:
-                print(("New delivery for route {}: {} copies".format(route_id, copies)))
-            else:
-                print(("Added {} copies to delivery for route {}".format(copies, route_id)))
-        print("Ended process")
+        start, end = options['date_range'] or (date.today(), date.today())
+        if start > end:
+            raise CommandError("The start of the date range must not be after its end")
+
+        print(("Creating deliveries for the days {} to {}".format(start, end)))
+        deliveries = create_deliveries(start, end)
+        for delivery in deliveries:
+            print(("Delivery for {} route {} product {}: {} copies".format(
+                delivery.date, delivery.route, delivery.product_id, delivery.copies
+            )))
+        print("Ended process, {} deliveries written".format(len(deliveries)))
@@ -0,0 +1,55 @@
+# coding=utf-8
+"""
+Writes the labels PDF of the day to a file, to be run in the background (from a crontab) for the full daily run.
+
+Usage examples
+--------------
+    # Labels for the next business day, left under MEDIA_ROOT/LOGISTICS_LABELS_PATH
+    python manage.py print_labels
+
+    # Labels of two routes for a given day, to another file
+    python manage.py print_labels --date 2026-10-19 --routes 12,14 --output /tmp/labels.pdf
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logistics.label_printing import (
+    LABEL_SHEETS,
+    label_dates,
+    label_subscription_products,
+    labels_path,
+    write_atomically,
+    write_labels,
+)
+
+
+class Command(BaseCommand):
+    help = "Writes the labels PDF of the day to a file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Day of the labels (YYYY-MM-DD), by default the next business day")
+        parser.add_argument("--routes", help="Comma separated route numbers, by default every route")
+        parser.add_argument("--page", default="Roll", choices=sorted(LABEL_SHEETS), help="Page layout (default Roll)")
+        parser.add_argument("--output", help="Path of the PDF, by default under MEDIA_ROOT/LOGISTICS_LABELS_PATH")
+
+    def handle(self, *args, **options):
+        try:
+            next_day, tomorrow = label_dates(options["date"])
+        except ValueError:
+            raise CommandError("Invalid date: {}".format(options["date"]))
+        route_numbers = None
+        if options["routes"]:
+            route_numbers = [route_number for route_number in options["routes"].split(",") if route_number != ""]
+        output = options["output"] or labels_path(next_day)
+
+        start = time.time()
+        subscription_products = label_subscription_products(next_day.isoweekday(), tomorrow, route_numbers)
+        count = write_atomically(
+            output, lambda partial: write_labels(partial, subscription_products, tomorrow, options["page"])
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{} labels for {} written to {} in {:.1f}s".format(count, next_day, output, time.time() - start)
+            )
+        )
@@ -0,0 +1,57 @@
+# coding=utf-8
+"""
+Draws the labels of the routes that changed for the next edition into the label cache, to be run in the background
+(from a crontab) during the night so printing the labels of one or every route only puts the cached PDFs together.
+
+Usage examples
+--------------
+    # Labels of the next business day
+    python manage.py render_label_cache
+
+    # Labels of the mondays, in both roll sizes
+    python manage.py render_label_cache --weekday 1 --page Roll --page Roll96x30
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from logistics.label_cache import LabelCache, weekday_run
+from logistics.label_printing import LABEL_SHEETS, ROUTE_SUFFIXES, label_specs, label_subscription_products
+from util.dates import next_business_day
+
+
+class Command(BaseCommand):
+    help = "Draws the labels of the routes that changed for the next edition into the label cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--weekday", type=int, choices=range(1, 8), help="ISO weekday, by default the one of the next business day"
+        )
+        parser.add_argument(
+            "--page",
+            action="append",
+            choices=sorted(LABEL_SHEETS),
+            help="Page layout, can be repeated (default Roll)",
+        )
+        parser.add_argument(
+            "--prune-days", type=int, default=7, help="Remove the cached runs not rendered in these days (default 7)"
+        )
+
+    def handle(self, *args, **options):
+        isoweekday = options["weekday"] or next_business_day().isoweekday()
+        cache = LabelCache()
+        for page in options["page"] or ["Roll"]:
+            start = time.time()
+            specs = label_specs(
+                label_subscription_products(isoweekday, date.today()),
+                ROUTE_SUFFIXES.get(isoweekday, ""),
+                invoice_weekday=isoweekday,
+            )
+            paths, drawn = cache.render(weekday_run(isoweekday, page), specs, page)
+            self.stdout.write(
+                "{}: {} routes drawn, {} unchanged in {:.1f}s".format(
+                    weekday_run(isoweekday, page), drawn, len(paths) - drawn, time.time() - start
+                )
+            )
+        self.stdout.write(self.style.SUCCESS("{} old runs removed".format(cache.prune(options["prune_days"]))))
@@ -0,0 +1,45 @@
+# coding=utf-8
+"""
+Stores the delivery manifest of every route for the editions of a day (see logistics.edition_snapshot). Scheduled
+once a day, before the labels are printed. An edition that already has a snapshot is kept as it is, unless --force is
+given.
+
+Usage examples
+--------------
+    # Snapshot of the editions of the next business day
+    python manage.py snapshot_editions
+
+    # Take the snapshot of a past day again
+    python manage.py snapshot_editions --date 2026-10-16 --force
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from logistics.edition_snapshot import snapshot_editions
+from util.dates import next_business_day
+
+
+class Command(BaseCommand):
+    help = "Stores the delivery manifest of every route for the editions of a day"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            type=date.fromisoformat,
+            help="The day of the editions (YYYY-MM-DD), the next business day by default",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Take the snapshot again for the editions that already have one"
+        )
+
+    def handle(self, *args, **options):
+        day = options["date"] or next_business_day()
+        editions = snapshot_editions(day, force=options["force"])
+        for edition in editions:
+            self.stdout.write(
+                "{}: {} copies, {} promotions, snapshot of {:%Y-%m-%d %H:%M}".format(
+                    edition, edition.total, edition.promotions, edition.snapshot_at
+                )
+            )
+        self.stdout.write(self.style.SUCCESS("{} editions of {}".format(len(editions), day)))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-17 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0118_subscription_added_products"),
+        ("logistics", "0015_distributor_alter_route_distributor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="delivery",
+            name="product",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="core.product",
+                verbose_name="Product",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="delivery",
+            constraint=models.UniqueConstraint(
+                fields=("date", "route", "product"), name="unique_delivery_date_route_product"
+            ),
+        ),
+    ]
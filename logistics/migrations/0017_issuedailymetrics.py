@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-17 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("logistics", "0016_delivery_product_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IssueDailyMetrics",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField(db_index=True)),
+                ("category", models.CharField(max_length=1, null=True)),
+                ("issues", models.PositiveIntegerField(default=0)),
+                (
+                    "route",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="issue_daily_metrics",
+                        to="logistics.route",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "issue daily metrics",
+                "verbose_name_plural": "issue daily metrics",
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("logistics", "0017_issuedailymetrics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="edition",
+            name="snapshot_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the delivery manifest of every route was stored (see logistics.edition_snapshot)",
+                null=True,
+                verbose_name="Snapshot date and time",
+            ),
+        ),
+        migrations.AddField(
+            model_name="editionroute",
+            name="copies",
+            field=models.PositiveIntegerField(default=0, verbose_name="Copies"),
+        ),
+        migrations.AddField(
+            model_name="editionroute",
+            name="subscription_products",
+            field=models.PositiveIntegerField(default=0, verbose_name="Subscription products"),
+        ),
+        migrations.AddField(
+            model_name="editionroute",
+            name="contacts",
+            field=models.PositiveIntegerField(default=0, verbose_name="Contacts"),
+        ),
+        migrations.AddField(
+            model_name="editionroute",
+            name="new",
+            field=models.PositiveIntegerField(default=0, verbose_name="New"),
+        ),
+        migrations.AddField(
+            model_name="editionroute",
+            name="closing",
+            field=models.PositiveIntegerField(default=0, verbose_name="Closing"),
+        ),
+        migrations.AddField(
+            model_name="editionroute",
+            name="envelopes",
+            field=models.PositiveIntegerField(default=0, verbose_name="Envelopes"),
+        ),
+        migrations.AddField(
+            model_name="editionroute",
+            name="special_instructions",
+            field=models.PositiveIntegerField(default=0, verbose_name="Special instructions"),
+        ),
+    ]
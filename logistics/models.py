@@ -266,11 +266,17 @@ class Delivery(models.Model):
 
     date = models.DateField(verbose_name=_('Date'))
     route = models.IntegerField(verbose_name=_('Route'))
+    product = models.ForeignKey(
+        'core.Product', on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_('Product')
+    )
     copies = models.IntegerField(verbose_name=_('Copies'), null=True, blank=True)
 
     class Meta:
         verbose_name = _('delivery')
         verbose_name_plural = _('deliveries')
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'route', 'product'], name='unique_delivery_date_route_product'),
+        ]
 
 
 class RouteChange(models.Model):
@@ -317,6 +323,12 @@ class Edition(models.Model):
     total = models.IntegerField(blank=True, null=True, verbose_name=_('Total'))
     extras = models.IntegerField(blank=True, null=True, verbose_name='Extras')
     rounding = models.IntegerField(blank=True, null=True)
+    snapshot_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Snapshot date and time'),
+        help_text=_('When the delivery manifest of every route was stored (see logistics.edition_snapshot)'),
+    )
 
     old_pk = models.PositiveIntegerField(blank=True, null=True)
 
@@ -337,12 +349,20 @@ class Edition(models.Model):
 
 class EditionRoute(models.Model):
     """
-    Stores data for every edition on each route
+    Stores data for every edition on each route: the delivery manifest of the route, as it was when the edition was
+    sent (see logistics.edition_snapshot).
     """
 
     edition = models.ForeignKey(Edition, on_delete=models.CASCADE, verbose_name=_('Edition'))
     route = models.ForeignKey(Route, on_delete=models.CASCADE, verbose_name=_('Route'))
     promotions = models.IntegerField(blank=True, null=True, verbose_name=_('Promotions'))
+    copies = models.PositiveIntegerField(default=0, verbose_name=_('Copies'))
+    subscription_products = models.PositiveIntegerField(default=0, verbose_name=_('Subscription products'))
+    contacts = models.PositiveIntegerField(default=0, verbose_name=_('Contacts'))
+    new = models.PositiveIntegerField(default=0, verbose_name=_('New'))
+    closing = models.PositiveIntegerField(default=0, verbose_name=_('Closing'))
+    envelopes = models.PositiveIntegerField(default=0, verbose_name=_('Envelopes'))
+    special_instructions = models.PositiveIntegerField(default=0, verbose_name=_('Special instructions'))
 
     class Meta:
         verbose_name = _('edition route')
@@ -353,3 +373,18 @@ class EditionProduct(models.Model):
     product = models.ForeignKey('core.Product', on_delete=models.CASCADE, verbose_name=_('Product'))
     route = models.ForeignKey(Route, on_delete=models.CASCADE, verbose_name=_('Route'))
     additional_copies = models.PositiveSmallIntegerField(default=3, verbose_name=_('Additional copies'))
+
+
+class IssueDailyMetrics(models.Model):
+    """
+    Issues by day, category and route of their subscription product (see support.daily_rollups).
+    """
+
+    date = models.DateField(db_index=True)
+    category = models.CharField(max_length=1, null=True)
+    route = models.ForeignKey(Route, on_delete=models.SET_NULL, null=True, related_name='issue_daily_metrics')
+    issues = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('issue daily metrics')
+        verbose_name_plural = _('issue daily metrics')
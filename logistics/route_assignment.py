@@ -0,0 +1,239 @@
+# coding=utf-8
+"""
+Automatic assignment of routes to the subscription products that have none, from the polygon of each route
+(Route.the_geom) and the location of the address of each subscription product.
+
+RouteIndex keeps the polygons in memory, indexed by a uniform grid: each cell of the grid lists the polygons whose
+bounding box overlaps it, so a point is only tested against the few polygons of its cell. The points of each cell are
+tested together, with NumPy, so thousands of addresses are located in one pass. When a point is inside more than one
+polygon (a route drawn inside another one) the smallest polygon wins, and the suggestion is marked as ambiguous.
+
+get_route_index() loads the polygons of the active routes once per process, transformed by PostGIS to the coordinates
+of the addresses (WGS84). It's loaded again when a route is saved or deleted in this process (see logistics.signals),
+and in the other processes when it's older than ROUTE_INDEX_TTL seconds.
+
+suggest_routes() returns the suggested route of each subscription product, and apply_suggestions() assigns them with
+one UPDATE per route. Used by the assign_routes_by_location command and by the assign routes pages.
+"""
+import time
+from collections import defaultdict
+from datetime import date
+from threading import RLock
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from core.models import SubscriptionProduct
+
+from .models import Route
+
+
+WGS84 = 4326
+# Cells of the grid along its longest side
+GRID_CELLS = 64
+
+SUGGESTED, AMBIGUOUS, OUTSIDE, NO_LOCATION = "suggested", "ambiguous", "outside", "no_location"
+
+
+def ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+
+def points_in_rings(xs, ys, rings):
+    """
+    Returns which of the points are inside the polygon given by its rings (the exterior one and its holes), with the
+    even-odd rule: a point is inside when a ray from it crosses the rings an odd number of times.
+    """
+    inside = np.zeros(len(xs), dtype=bool)
+    xs, ys = xs[:, None], ys[:, None]
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        crossing = (y1 > ys) != (y2 > ys)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_crossed = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= (np.count_nonzero(crossing & (xs < x_crossed), axis=1) % 2).astype(bool)
+    return inside
+
+
+class RouteIndex:
+    """
+    The polygons of the routes, indexed by a grid. polygons is a list of (route number, rings), where rings are the
+    exterior ring and the holes of the polygon, each one a sequence of (x, y) points.
+    """
+
+    def __init__(self, polygons, grid_cells=GRID_CELLS):
+        self.routes, self.rings = [], []
+        for number, rings in polygons:
+            rings = [np.asarray(ring, dtype=float) for ring in rings if len(ring) >= 3]
+            if rings:
+                self.routes.append(number)
+                self.rings.append(rings)
+        self.routes = np.array(self.routes, dtype=int)
+        self.areas = np.array([ring_area(rings[0]) - sum(map(ring_area, rings[1:])) for rings in self.rings])
+        self.bboxes = np.array(
+            [[*rings[0].min(axis=0), *rings[0].max(axis=0)] for rings in self.rings], dtype=float
+        ).reshape(-1, 4)
+        self.cells = defaultdict(list)
+        if not len(self.routes):
+            self.origin, self.cell_size = np.zeros(2), 1.0
+            return
+        self.origin = self.bboxes[:, :2].min(axis=0)
+        extent = (self.bboxes[:, 2:].max(axis=0) - self.origin).max()
+        self.cell_size = extent / grid_cells or 1.0
+        for position, bbox in enumerate(self.bboxes):
+            (first_x, first_y), (last_x, last_y) = self.cell(bbox[:2]), self.cell(bbox[2:])
+            for cell_x in range(first_x, last_x + 1):
+                for cell_y in range(first_y, last_y + 1):
+                    self.cells[(cell_x, cell_y)].append(position)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def cell(self, point):
+        return tuple(int(value) for value in np.floor((np.asarray(point) - self.origin) / self.cell_size))
+
+    def locate(self, xs, ys):
+        """
+        Returns the route number of each point (0 for the points outside every route) and the number of routes that
+        contain it. The points without coordinates (NaN) are outside.
+        """
+        xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        routes = np.zeros(len(xs), dtype=int)
+        matches = np.zeros(len(xs), dtype=int)
+        located = np.flatnonzero(~np.isnan(xs) & ~np.isnan(ys))
+        if not len(self.routes) or not len(located):
+            return routes, matches
+        cells = np.floor((np.column_stack([xs[located], ys[located]]) - self.origin) / self.cell_size).astype(int)
+        keys, cell_of_point = np.unique(cells, axis=0, return_inverse=True)
+        cell_of_point = cell_of_point.ravel()
+        order = np.argsort(cell_of_point, kind="stable")
+        bounds = np.searchsorted(cell_of_point[order], np.arange(len(keys) + 1))
+        for key, start, end in zip(map(tuple, keys), bounds[:-1], bounds[1:]):
+            candidates = self.cells.get(key)
+            if not candidates:
+                continue
+            points = located[order[start:end]]
+            best_area = np.full(len(points), np.inf)
+            for position in candidates:
+                min_x, min_y, max_x, max_y = self.bboxes[position]
+                in_bbox = (xs[points] >= min_x) & (xs[points] <= max_x) & (ys[points] >= min_y) & (ys[points] <= max_y)
+                if not in_bbox.any():
+                    continue
+                inside = np.zeros(len(points), dtype=bool)
+                inside[in_bbox] = points_in_rings(xs[points[in_bbox]], ys[points[in_bbox]], self.rings[position])
+                matches[points[inside]] += 1
+                smaller = inside & (self.areas[position] < best_area)
+                routes[points[smaller]] = self.routes[position]
+                best_area[smaller] = self.areas[position]
+        return routes, matches
+
+
+def load_route_index(routes=None):
+    """
+    Returns a RouteIndex with the polygons of the routes (by default the active ones), in WGS84.
+    """
+    from django.contrib.gis.db.models.functions import Transform
+
+    if routes is None:
+        routes = Route.objects.filter(active=True)
+    routes = routes.filter(the_geom__isnull=False).annotate(wgs84=Transform("the_geom", WGS84)).only("number")
+    return RouteIndex([(route.number, route.wgs84.coords) for route in routes.iterator()])
+
+
+_index = {"index": None, "loaded_at": 0}
+_lock = RLock()
+
+
+def get_route_index():
+    """
+    Returns the index of the active routes, loading it if needed.
+    """
+    with _lock:
+        ttl = getattr(settings, "ROUTE_INDEX_TTL", 300)
+        if _index["index"] is None or (ttl and time.monotonic() - _index["loaded_at"] > ttl):
+            _index["index"], _index["loaded_at"] = load_route_index(), time.monotonic()
+        return _index["index"]
+
+
+def routes_changed(**kwargs):
+    """
+    Drops the index, it's loaded again when it's used. Accepts (and ignores) any keyword argument so it can be
+    connected to signals.
+    """
+    with _lock:
+        _index["index"] = None
+
+
+def unrouted_subscription_products(future=False):
+    """
+    Returns the subscription products of paper products without a route: the ones of the active subscriptions, or
+    with future=True the ones of the subscriptions that start from today on.
+    """
+    subscription_products = SubscriptionProduct.objects.filter(
+        route__isnull=True, product__type="S", product__offerable=True
+    ).exclude(product__digital=True)
+    if future:
+        return subscription_products.filter(subscription__active=False, subscription__start_date__gte=date.today())
+    return subscription_products.filter(subscription__active=True)
+
+
+def suggest_routes(subscription_products, index=None):
+    """
+    Returns a DataFrame with the id, latitude, longitude, suggested route (0 for none), number of routes that contain
+    the address and status of each subscription product.
+    """
+    if index is None:
+        index = get_route_index()
+    frame = pd.DataFrame.from_records(
+        subscription_products.values_list("id", "address__latitude", "address__longitude").iterator(chunk_size=10000),
+        columns=["id", "latitude", "longitude"],
+    )
+    latitudes = pd.to_numeric(frame["latitude"], errors="coerce").to_numpy(dtype=float)
+    longitudes = pd.to_numeric(frame["longitude"], errors="coerce").to_numpy(dtype=float)
+    routes, matches = index.locate(longitudes, latitudes)
+    frame["route"], frame["matches"] = routes, matches
+    frame["status"] = np.select(
+        [np.isnan(latitudes) | np.isnan(longitudes), matches == 0, matches > 1],
+        [NO_LOCATION, OUTSIDE, AMBIGUOUS],
+        default=SUGGESTED,
+    )
+    return frame
+
+
+def apply_suggestions(suggestions, include_ambiguous=False):
+    """
+    Assigns the suggested routes (a DataFrame returned by suggest_routes) to the subscription products that still
+    don't have a route, one UPDATE per route, and clears their order. The ambiguous suggestions are left out unless
+    include_ambiguous is set. Returns the number of subscription products assigned.
+    """
+    statuses = [SUGGESTED, AMBIGUOUS] if include_ambiguous else [SUGGESTED]
+    chosen = suggestions[suggestions["status"].isin(statuses)]
+    assigned = 0
+    # update() doesn't send the post_save signals of the subscription products, but the dynamic contact filters don't
+    # read their route or order (see core.dcf_members)
+    with transaction.atomic():
+        for route, ids in chosen.groupby("route")["id"]:
+            subscription_products = SubscriptionProduct.objects.filter(pk__in=ids.tolist(), route__isnull=True)
+            assigned += subscription_products.update(route_id=int(route), order=None)
+    return assigned
+
+
+def suggestions_by_id(subscription_products):
+    """
+    Returns {subscription product id: suggested route} for the ones that have a suggestion, for the assign routes pages.
+    """
+    suggestions = suggest_routes(subscription_products)
+    suggestions = suggestions[suggestions["status"].isin([SUGGESTED, AMBIGUOUS])]
+    return dict(zip(suggestions["id"].tolist(), suggestions["route"].tolist()))
+
+
+def summary(suggestions):
+    """
+    Returns the number of subscription products of each status, and of each suggested route.
+    """
+    by_route = suggestions[suggestions["status"] == SUGGESTED]["route"].value_counts().sort_index()
+    return suggestions["status"].value_counts().to_dict(), by_route.to_dict()
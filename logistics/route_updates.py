@@ -0,0 +1,137 @@
+# coding=utf-8
+"""
+Bulk changes of the route, order and label fields of subscription products, used by the forms of the logistics views
+(assign routes, order route and change route) and by convert_orders_to_tens.
+
+form_updates() reads the rows of a submitted form, validate_updates() checks the whole submission in memory, with one
+query for the subscription products and one for the routes, and apply_updates() saves the rows that changed with
+bulk_update, in one transaction. The post_save signals of the subscription products aren't sent, which the dynamic
+contact filters don't need since they don't read these fields (see core.dcf_members), and apply_updates() logs the
+subscription products moved from a route to another one as RouteChange rows, created in bulk.
+"""
+from django.db import transaction
+from django.utils.translation import gettext as _
+
+from core.models import SubscriptionProduct
+
+from .models import Route, RouteChange
+
+
+FIELDS = ("route", "order", "label_message", "special_instructions")
+LABEL_MESSAGE_LENGTH = SubscriptionProduct._meta.get_field("label_message").max_length
+MAX_ORDER = 32767
+
+
+def parse_number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def form_updates(post, prefix, field, with_labels=True):
+    """
+    Returns {subscription product id: {field: value, "label_message": ..., "special_instructions": ...}} for the rows
+    of a form with a value in their <prefix><id> input, taking the label fields from their message-<id> and
+    instructions-<id> inputs (unless with_labels is False, for the forms without them).
+    """
+    updates = {}
+    for name, value in post.items():
+        sp_id = name[len(prefix):]
+        if name.startswith(prefix) and sp_id.isdigit() and value:
+            updates[int(sp_id)] = {field: value.strip()}
+            if with_labels:
+                updates[int(sp_id)]["label_message"] = post.get("message-{}".format(sp_id), None)
+                updates[int(sp_id)]["special_instructions"] = post.get("instructions-{}".format(sp_id), None)
+    return updates
+
+
+def row_name(subscription_product):
+    return _("Contact {} - Product {}").format(
+        subscription_product.subscription.contact.get_full_name(),
+        subscription_product.product.name if subscription_product.product else "-",
+    )
+
+
+def validate_updates(updates):
+    """
+    Checks a submission ({subscription product id: {field: value}}, with the route and the order as numbers or strings)
+    in memory. Returns the subscription products that changed, with their new values set but not saved, and the errors
+    of the rows left out. The previous route of each one is kept in its previous_route_id attribute.
+    """
+    subscription_products = SubscriptionProduct.objects.select_related(
+        "subscription__contact", "product", "address"
+    ).in_bulk(list(updates))
+    route_numbers = {parse_number(values["route"]) for values in updates.values() if values.get("route") is not None}
+    existing_routes = set(Route.objects.filter(number__in=route_numbers - {None}).values_list("number", flat=True))
+
+    changed, errors = [], []
+    for sp_id, values in updates.items():
+        sp = subscription_products.get(sp_id)
+        if sp is None:
+            errors.append(_("Subscription product {} does not exist").format(sp_id))
+            continue
+        values = {"route_id" if field == "route" else field: value for field, value in values.items()}
+        if values.get("route_id") is not None:
+            route_number = parse_number(values["route_id"])
+            if route_number not in existing_routes:
+                errors.append(_("{}: Route {} does not exist").format(row_name(sp), values["route_id"]))
+                continue
+            values["route_id"] = route_number
+        if values.get("order") is not None:
+            order = parse_number(values["order"])
+            if order is None or not 0 <= order <= MAX_ORDER:
+                errors.append(_("{}: Order {} is not valid").format(row_name(sp), values["order"]))
+                continue
+            values["order"] = order
+        if len(values.get("label_message") or "") > LABEL_MESSAGE_LENGTH:
+            errors.append(
+                _("{}: The message can't be longer than {} characters").format(row_name(sp), LABEL_MESSAGE_LENGTH)
+            )
+            continue
+        if any(getattr(sp, field) != value for field, value in values.items()):
+            sp.previous_route_id = sp.route_id
+            for field, value in values.items():
+                setattr(sp, field, value)
+            changed.append(sp)
+    return changed, errors
+
+
+def apply_updates(subscription_products, fields=FIELDS, batch_size=1000):
+    """
+    Saves the fields of the subscription products with bulk_update and logs their route changes, in one transaction.
+    Returns the number of subscription products saved.
+    """
+    subscription_products = list(subscription_products)
+    if not subscription_products:
+        return 0
+    route_changes = [
+        RouteChange(
+            contact_id=sp.subscription.contact_id,
+            product_id=sp.product_id,
+            old_route_id=sp.previous_route_id,
+            old_address=sp.address.address_1 if sp.address else None,
+            old_city=sp.address.city if sp.address else None,
+        )
+        for sp in subscription_products
+        if "route" in fields and getattr(sp, "previous_route_id", None) not in (None, sp.route_id)
+    ]
+    with transaction.atomic():
+        SubscriptionProduct.objects.bulk_update(subscription_products, list(fields), batch_size=batch_size)
+        RouteChange.objects.bulk_create(route_changes, batch_size=batch_size)
+    return len(subscription_products)
+
+
+def orders_in_tens(subscription_products):
+    """
+    Renumbers the orders of the subscription products (ordered by their product and order) as 10, 20, 30... within
+    each product. Returns the ones whose order changed, with the new order set but not saved.
+    """
+    changed, product_id, order = [], None, 0
+    for sp in subscription_products:
+        order = order + 10 if sp.product_id == product_id else 10
+        product_id = sp.product_id
+        if sp.order != order:
+            sp.order = order
+            changed.append(sp)
+    return changed
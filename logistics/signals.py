@@ -0,0 +1,12 @@
+# coding=utf-8
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Route
+from .route_assignment import routes_changed
+
+
+@receiver([post_save, post_delete], sender=Route)
+def route_changed(sender, **kwargs):
+    # the route polygons kept in memory by logistics.route_assignment
+    routes_changed()
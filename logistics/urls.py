@@ -19,6 +19,7 @@ from logistics.views import (
     print_routes_simple,
     list_routes_detailed,
     convert_orders_to_tens,
+    sequence_route_orders,
     print_unordered_subscriptions,
     print_labels_for_day,
     assign_routes_future,
@@ -44,6 +45,7 @@ urlpatterns = [
     re_path(
         r'^convert_orders_to_tens/(\d+)/(\d+)/$', convert_orders_to_tens, name='convert_orders_to_tens_by_product'
     ),
+    re_path(r'^sequence_route/(\d+)/$', sequence_route_orders, name='sequence_route'),
     path('routes/', list_routes, name='list_routes'),
     path('routes_detailed/', list_routes_detailed, name='list_routes_detailed'),
     re_path(r'^routes/(?P<route_list>\d+(,\d+)*)/$', route_details, name='route_details'),
@@ -1,6 +1,14 @@
 # coding=utf-8
+from datetime import timedelta
+
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
 from django.utils.translation import gettext_lazy as _
+
+from core.models import SubscriptionProduct
+from logistics.edition_snapshot import snapshot_copies
+from logistics.models import Delivery
 from support.models import Issue, IssueSubcategory, IssueStatus
 
 
@@ -77,3 +85,69 @@ def create_issue_for_special_route(subscription, route_number=None, user=None, c
     )
 
     return issue
+
+
+def create_deliveries(start, end=None):
+    """
+    Writes the Delivery rows (copies by route and product) for every day from start to end (both included, end
+    defaults to start), for the products delivered on each weekday to the active subscriptions already started.
+    Returns the written deliveries.
+
+    The copies are read with a single grouped query and written with a bulk upsert, so running it again for the same
+    days updates the rows instead of adding the copies twice. Rows of those days whose route and product have no
+    copies anymore are removed. The days and products whose edition already has a snapshot (see
+    logistics.edition_snapshot) take the copies of the snapshot, what was actually sent, instead of the live ones.
+    """
+    end = end or start
+    dates = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    # every subscription started on or before the first day counts for all of them, only later starts are grouped by
+    # their own start date
+    rows = (
+        SubscriptionProduct.objects.filter(
+            product__weekday__in={day.isoweekday() for day in dates},
+            subscription__active=True,
+            subscription__start_date__lte=end,
+            route__isnull=False,
+        )
+        .annotate(
+            started=Case(
+                When(subscription__start_date__lte=start, then=Value(start)),
+                default=F("subscription__start_date"),
+            )
+        )
+        .values_list("route_id", "product_id", "product__weekday", "started")
+        .annotate(sum_copies=Sum("copies"))
+        .order_by()
+    )
+
+    copies = {}
+    for route_id, product_id, weekday, started, sum_copies in rows:
+        for day in dates:
+            if day.isoweekday() == weekday and started <= day:
+                key = (day, route_id, product_id)
+                copies[key] = copies.get(key, 0) + (sum_copies or 0)
+    snapshots = snapshot_copies(dates)
+    copies = {key: value for key, value in copies.items() if (key[0], key[2]) not in snapshots}
+    for (day, product_id), route_copies in snapshots.items():
+        copies.update({(day, route_id, product_id): value for route_id, value in route_copies.items()})
+
+    deliveries = [
+        Delivery(date=day, route=route_id, product_id=product_id, copies=sum_copies)
+        for (day, route_id, product_id), sum_copies in sorted(copies.items())
+    ]
+    with transaction.atomic():
+        stale = [
+            pk
+            for pk, day, route_id, product_id in Delivery.objects.filter(
+                date__range=(start, end), product__isnull=False
+            ).values_list("pk", "date", "route", "product_id")
+            if (day, route_id, product_id) not in copies
+        ]
+        Delivery.objects.filter(pk__in=stale).delete()
+        Delivery.objects.bulk_create(
+            deliveries,
+            update_conflicts=True,
+            unique_fields=["date", "route", "product"],
+            update_fields=["copies"],
+        )
+    return deliveries
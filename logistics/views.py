@@ -1,12 +1,13 @@
 # -*- encoding: utf-8 -*-
 
 import csv
+import os
 from datetime import date, timedelta, datetime
 from collections import defaultdict
 from dateutil.relativedelta import relativedelta
 
 from django.shortcuts import render, reverse, get_object_or_404
-from django.http import HttpResponseRedirect, HttpResponse, HttpResponseNotFound
+from django.http import FileResponse, HttpResponseRedirect, HttpResponse, HttpResponseNotFound
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Sum, Exists, OuterRef
@@ -26,14 +27,45 @@ from core.models import SubscriptionProduct, Subscription, Product, Address
 from core.choices import PRODUCT_WEEKDAYS
 from core.mixins import BreadcrumbsMixin
 from logistics.models import Route, RouteChange, Edition
+from support.daily_rollups import use_rollups
 from support.models import Issue
 
 from util.dates import next_business_day, format_date
 from .labels import LogisticsLabel, LogisticsLabel96x30, Roll, Roll96x30
+from .edition_snapshot import route_manifests
 from .filters import OrderRouteFilter, AddressGeorefFilter
+from .issue_statistics import DAY, MONTH, WEEK, issue_statistics, route_statistics, weekdays_count
+from .label_cache import LabelCache, product_date_run, weekday_run
+from .label_printing import (
+    ROUTE_SUFFIXES,
+    draw_labels,
+    label_dates,
+    label_specs,
+    label_subscription_products,
+    labels_filename,
+    labels_path,
+    labels_response,
+    pdf_response,
+    product_date_subscription_products,
+)
+from .route_assignment import suggestions_by_id, unrouted_subscription_products
+from .route_sequencing import propose_orders
+from .route_updates import FIELDS, apply_updates, form_updates, orders_in_tens, parse_number, validate_updates
 from .utils import create_issue_for_special_route
 
 
+def save_route_updates(request, updates, fields=FIELDS):
+    """
+    Validates and saves the updates of a logistics form (see logistics.route_updates), showing an error for each row
+    that couldn't be saved. Returns the subscription products saved.
+    """
+    subscription_products, errors = validate_updates(updates)
+    apply_updates(subscription_products, fields)
+    for error in errors:
+        messages.error(request, error)
+    return subscription_products
+
+
 @login_required
 def assign_routes(request):
     """
@@ -42,36 +74,14 @@ def assign_routes(request):
     product_list = Product.objects.filter(type="S", offerable=True)
     product_id, product = "all", None
     if request.POST:
-        for name, value in list(request.POST.items()):
-            if name.startswith("sp") and value:
-                try:
-                    # We get the id of the subscription id here, removing the prefix 'sp-' from the name of the item
-                    sp_id = name.replace("sp-", "")
-                    # Next we get the SubscriptionProject object from the DB
-                    sp = SubscriptionProduct.objects.get(pk=sp_id)
-                    # Finally we set the value of whatever route we set, and then save the sp
-                    route = Route.objects.get(number=int(value))
-                    sp.route = route
-                    sp.order = None
-                    sp.special_instructions = request.POST.get("instructions-{}".format(sp_id), None)
-                    sp.label_message = request.POST.get("message-{}".format(sp_id), None)
-                    sp.save()
-                except Route.DoesNotExist:
-                    messages.error(
-                        request,
-                        _(
-                            "Contact {} - Product {}: Route {} does not exist".format(
-                                sp.subscription.contact.get_full_name(), sp.product.name, value
-                            )
-                        ),
-                    )
+        updates = form_updates(request.POST, "sp-", "route")
+        for values in updates.values():
+            values["order"] = None
+        save_route_updates(request, updates)
         return HttpResponseRedirect(reverse("assign_routes"))
 
     subscription_products = (
-        SubscriptionProduct.objects.filter(
-            subscription__active=True, route__isnull=True, product__type="S", product__offerable=True
-        )
-        .exclude(product__digital=True)
+        unrouted_subscription_products()
         .select_related("subscription__contact", "address")
         .order_by("subscription__contact")
     )
@@ -88,6 +98,7 @@ def assign_routes(request):
         "assign_routes.html",
         {
             "subscription_products": subscription_products,
+            "suggested_routes": suggestions_by_id(subscription_products),
             "product_list": product_list,
             "product": product,
         },
@@ -102,40 +113,14 @@ def assign_routes_future(request):
     product_list = Product.objects.filter(type="S", offerable=True)
     product_id, product = "all", None
     if request.POST:
-        for name, value in list(request.POST.items()):
-            if name.startswith("sp") and value:
-                try:
-                    # We get the id of the subscription id here, removing the prefix 'sp-' from the name of the item
-                    sp_id = name.replace("sp-", "")
-                    # Next we get the SubscriptionProject object from the DB
-                    sp = SubscriptionProduct.objects.get(pk=sp_id)
-                    # Finally we set the value of whatever route we set, and then save the sp
-                    route = Route.objects.get(number=int(value))
-                    sp.route = route
-                    sp.order = None
-                    sp.special_instructions = request.POST.get("instructions-{}".format(sp_id), None)
-                    sp.label_message = request.POST.get("message-{}".format(sp_id), None)
-                    sp.save()
-                except Route.DoesNotExist:
-                    messages.error(
-                        request,
-                        _(
-                            "Contact {} - Product {}: Route {} does not exist".format(
-                                sp.subscription.contact.get_full_name(), sp.product.name, value
-                            )
-                        ),
-                    )
+        updates = form_updates(request.POST, "sp-", "route")
+        for values in updates.values():
+            values["order"] = None
+        save_route_updates(request, updates)
         return HttpResponseRedirect(reverse("assign_routes"))
 
     subscription_products = (
-        SubscriptionProduct.objects.filter(
-            subscription__active=False,
-            route__isnull=True,
-            product__type="S",
-            product__offerable=True,
-            subscription__start_date__gte=date.today(),
-        )
-        .exclude(product__digital=True)
+        unrouted_subscription_products(future=True)
         .select_related("subscription__contact", "address")
         .order_by("subscription__contact")
     )
@@ -152,6 +137,7 @@ def assign_routes_future(request):
         "assign_routes.html",
         {
             "subscription_products": subscription_products,
+            "suggested_routes": suggestions_by_id(subscription_products),
             "product_list": product_list,
             "product": product,
         },
@@ -194,18 +180,7 @@ def order_route(request, route_id=1):
     else:
         product = None
     if request.POST:
-        for name, value in list(request.POST.items()):
-            if name.startswith("sp-order") and value:
-                # We get the id of the subscription id here, removing the prefix 'sp-' from the name of the item
-                sp_id = name.replace("sp-order-", "")
-                # Next we get the SubscriptionProject object from the DB
-                sp = SubscriptionProduct.objects.get(pk=sp_id)
-                # Finally we set the value of whatever route we set, and then save the sp
-                if sp.order != int(value):
-                    sp.order = int(value)
-                    sp.special_instructions = request.POST.get("instructions-{}".format(sp_id), None)
-                    sp.label_message = request.POST.get("message-{}".format(sp_id), None)
-                    sp.save()
+        save_route_updates(request, form_updates(request.POST, "sp-order-", "order"))
         return HttpResponseRedirect(reverse("order_route", args=[route_id]))
 
     subscription_products = (
@@ -306,36 +281,19 @@ def change_route(request, route_id=1):
     special_routes_list = getattr(settings, "SPECIAL_ROUTES_FOR_SELLERS_LIST", [])
     if request.POST:
         issues_created = []
-        for name, value in list(request.POST.items()):
-            if name.startswith("sp-") and value and int(value) != route_object.number:
-                try:
-                    # We get the id of the subscription id here, removing the prefix 'sp-' from the name of the item
-                    sp_id = name.replace("sp-", "")
-                    # Next we get the SubscriptionProject object from the DB
-                    sp = SubscriptionProduct.objects.get(pk=sp_id)
-                    # Finally we set the value of whatever route we set, and then save the sp
-                    route = Route.objects.get(number=value)
-                    sp.route = route
-                    sp.order = None
-                    sp.special_instructions = request.POST.get("instructions-{}".format(sp_id), None)
-                    sp.label_message = request.POST.get("message-{}".format(sp_id), None)
-                    sp.save()
-
-                    # Create issue if it's a special route (50-55)
-                    custom_notes = request.POST.get("issue-notes-{}".format(sp_id), None)
-                    issue = create_issue_for_special_route(sp.subscription, route.number, request.user, custom_notes)
-                    if issue:
-                        issues_created.append(route.number)
-
-                except Route.DoesNotExist:
-                    messages.error(
-                        request,
-                        _(
-                            "Contact {} - Product {}: Route {} does not exist".format(
-                                sp.subscription.contact.get_full_name(), sp.product.name, value
-                            )
-                        ),
-                    )
+        updates = form_updates(request.POST, "sp-", "route")
+        for sp_id, values in list(updates.items()):
+            if parse_number(values["route"]) == route_object.number:
+                del updates[sp_id]
+            else:
+                values["order"] = None
+        for sp in save_route_updates(request, updates):
+            if sp.route_id != sp.previous_route_id:
+                # Create issue if it's a special route (50-55)
+                custom_notes = request.POST.get("issue-notes-{}".format(sp.id), None)
+                issue = create_issue_for_special_route(sp.subscription, sp.route_id, request.user, custom_notes)
+                if issue:
+                    issues_created.append(sp.route_id)
 
         # Show success message if issues were created
         if issues_created:
@@ -391,11 +349,22 @@ def list_routes(request):
     TODO: Allow changing
     """
     route_list = Route.objects.all()
+    # the editions already sent are read from their snapshot, which doesn't count the same as the live columns (only
+    # paper products of the subscriptions started by the day), so the template labels them as the editions of the day
+    today_manifests = route_manifests(date.today())
+    tomorrow_manifests = route_manifests(date.today() + timedelta(1))
+    for route in route_list:
+        if today_manifests is not None:
+            route.today_count = today_manifests.get(route.number, {}).get("subscription_products", 0)
+        if tomorrow_manifests is not None:
+            route.tomorrow_count = tomorrow_manifests.get(route.number, {}).get("subscription_products", 0)
     return render(
         request,
         "list_routes.html",
         {
             "route_list": route_list,
+            "today_snapshot": today_manifests is not None,
+            "tomorrow_snapshot": tomorrow_manifests is not None,
         },
     )
 
@@ -411,21 +380,38 @@ def list_routes_detailed(request):
     routes = Route.objects.all()
     weekdays = dict(PRODUCT_WEEKDAYS)
     if datetime.now().hour in range(0, 3):
-        show_day = date.today().isoweekday()
+        show_date = date.today()
     else:
-        show_day = next_business_day().isoweekday()
+        show_date = next_business_day()
+    show_day = show_date.isoweekday()
     tomorrow_product = Product.objects.get(weekday=show_day)
+    # the manifest stored when the edition was sent, if it was already, instead of adding up every route again. It
+    # doesn't count the same as the live columns, so the template labels them as the ones of the edition.
+    manifests = route_manifests(show_date, tomorrow_product)
     for route in routes:
-        route.copies = route.sum_copies_per_product(tomorrow_product)
+        if manifests is not None:
+            route_manifest = manifests.get(route.number, {})
+            route.copies = route_manifest.get("copies")
+            route.promotions = route_manifest.get("promotions")
+            route.new = route_manifest.get("new")
+        else:
+            route.copies = route.sum_copies_per_product(tomorrow_product)
+            route.promotions = route.sum_promos_per_product(tomorrow_product)
+            route.new = route.sum_copies_per_product(tomorrow_product, new=True)
+        # the contacts of the route aren't a quantity of the edition
         route.contacts = route.contacts_in_route_count()
-        route.promotions = route.sum_promos_per_product(tomorrow_product)
-        route.new = route.sum_copies_per_product(tomorrow_product, new=True)
         route.invoices = route.invoices_in_route()
         route_list.append(route)
     return render(
         request,
         "list_routes_detailed.html",
-        {"route_list": route_list, "day": weekdays[show_day], "tomorrow_product": tomorrow_product},
+        {
+            "route_list": route_list,
+            "day": weekdays[show_day],
+            "tomorrow_product": tomorrow_product,
+            "show_date": show_date,
+            "snapshot": manifests is not None,
+        },
     )
 
 
@@ -442,273 +428,51 @@ def print_labels(request, page="Roll", list_type="", route_list="", product_id=N
             mark_contacts_list = []
         if settings.DEBUG:
             print(f"DEBUG: print_labels: mark_contacts_list={mark_contacts_list}")
-        if request.GET.get("date", None):
-            date_string = request.GET.get("date")
-            next_day = datetime.strptime(date_string, "%Y-%m-%d")
-            tomorrow = next_day
-        else:
-            tomorrow = date.today() + timedelta(1)
-            if datetime.now().hour in range(0, 3):
-                next_day = date.today()
-            else:
-                next_day = next_business_day()
-        isoweekday = next_day.isoweekday()
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = "attachment; filename=individual-labels-{}.pdf".format(
-            next_day.strftime("%Y%m%d")
-        )
-        Page = globals()[page]
-        canvas = Canvas(response, pagesize=(Page.width, Page.height))
-        sheet = Page(LogisticsLabel, canvas)
-        iterator = sheet.iterator()
+        next_day, tomorrow = label_dates(request.GET.get("date", None))
         if list_type and list_type.startswith("route"):
-            # First we initialize the queryset making it empty
-            subscription_products = SubscriptionProduct.objects.none()
-            for route_number in route_list.split(","):
-                if route_number != "":
-                    # Then for each route, we add to that empty queryset all those values
-                    subscription_products = subscription_products | SubscriptionProduct.objects.filter(
-                        active=True,
-                        product__weekday=isoweekday,
-                        subscription__active=True,
-                        route__number=route_number,
-                        subscription__start_date__lte=tomorrow,
-                    ).exclude(route__print_labels=False).order_by(
-                        "route", F("order").asc(nulls_first=True), "address__address_1"
-                    )
+            route_numbers = [route_number for route_number in route_list.split(",") if route_number != ""]
         else:
             # If not, all the queryset gets rendered into the labels
-            subscription_products = (
-                SubscriptionProduct.objects.filter(
-                    active=True,
-                    product__weekday=isoweekday,
-                    subscription__active=True,
-                    subscription__start_date__lte=tomorrow,
-                )
-                .exclude(route__print_labels=False)
-                .order_by("route", F("order").asc(nulls_first=True), "address__address_1")
-            )
-
-        old_route = 0
-
-        for sp in subscription_products:
-
-            # If the subscription_product has no route, then we'll skip it.
-            if sp.route is None:
-                continue
-
-            # If the subscription_product has no address, continue. TODO: precond validation to prevent this situation
-            if sp.address is None:
-                continue
-
-            # Separator label
-            if old_route != sp.route:
-                label = next(iterator)
-                label.separador()
-                old_route = sp.route
-
-            # Here we'll show an icon if the contact has one of the payment types marked on settings.
-            has_invoice = (
-                sp.subscription.payment_type
-                and sp.subscription.payment_type in settings.LOGISTICS_LABEL_INVOICE_PAYMENT_TYPES
-                and not sp.subscription.billing_address
-                and sp.subscription.contact.invoice_set.filter(print_date__gte=date.today() - timedelta(6)).exists()
-            )
-
-            for copy in range(sp.copies):
-
-                label, route_suffix = next(iterator), ""
-
-                # TODO: take in account also here the time of execution from 0:00 to 2:59 (after midnight)
-                #       maybe next_day.isoweekday() instead of tomorrow.isoweekday() is the solution, make tests cases.
-                #       Another improvement (for performance) is to make the route_suffix assignment before first loop.
-                #       And yet another: it's also possible to obtain locale and get the day name localized,
-                #                        google this: "django get locale", "python get day name localized".
-                tomorrow_isoweekday = tomorrow.isoweekday()
-
-                if sp.product:
-                    if tomorrow_isoweekday == 1:
-                        route_suffix = _("MONDAY")
-                    elif tomorrow_isoweekday == 2:
-                        route_suffix = _("TUESDAY")
-                    elif tomorrow_isoweekday == 3:
-                        route_suffix = _("WEDNESDAY")
-                    elif tomorrow_isoweekday == 4:
-                        route_suffix = _("THURSDAY")
-                    elif tomorrow_isoweekday == 5:
-                        route_suffix = _("FRIDAY")
-                    label.route_suffix = route_suffix
-
-                    label.has_invoice = (
-                        has_invoice
-                        and sp.subscription.get_first_product_by_priority().weekday
-                        and sp.subscription.get_first_product_by_priority().weekday == tomorrow_isoweekday
-                    )
-
-                # Here we determine if the subscription needs an envelope.
-                if sp.has_envelope:
-                    label.envelope = True
-
-                if sp.subscription.start_date == next_business_day():
-                    label.new = True
-
-                if sp.special_instructions:
-                    label.special_instructions = True
-
-                if sp.label_message and sp.label_message.strip():
-                    label.message_for_contact = sp.label_message
-                else:
-                    if sp.subscription.type == "P":
-                        # TODO: the seller name can be obtained here to use it instead of "a friend"
-                        #       (also check the use case of this label, isn't the "referer" a better option?)
-                        if sp.seller:
-                            ref = sp.seller.name
-                        else:
-                            ref = "un amigo"  # TODO: i18n
-                        label.message_for_contact = "Recomendado por {}".format(ref)  # TODO: i18n
-                    # When we have a 2x1 plan we should put it here
-                    # elif getattr(sp.subscription.product, 'id', None) == 6:
-                    #     label.message_for_contact = "2x1"
-
-                if sp.label_contact:
-                    label.name = sp.label_contact.get_full_name().upper()
-                else:
-                    label.name = sp.subscription.contact.get_full_name().upper()
-
-                if mark_contacts_list and sp.subscription.contact.id in mark_contacts_list:
-                    label.partial = True
-
-                label.address = (sp.address.address_1 or "") + "\n" + (sp.address.address_2 or "")
-                label.route = sp.route.number
-                label.route_order = sp.order
-                label.draw()
-        sheet.flush()
-        canvas.save()
-        return response
+            route_numbers = None
+        subscription_products = label_subscription_products(next_day.isoweekday(), tomorrow, route_numbers)
+        return labels_response(
+            subscription_products, tomorrow, labels_filename(next_day), page, mark_contacts=mark_contacts_list
+        )
     else:
-        return render(request, "print_labels.html", {})
+        # labels of the full daily run already written by the print_labels command
+        next_day = label_dates(request.GET.get("date", None))[0]
+        pregenerated = os.path.exists(labels_path(next_day)) and not list_type
+        if pregenerated and request.GET.get("pregenerated"):
+            return FileResponse(
+                open(labels_path(next_day), "rb"), as_attachment=True, filename=labels_filename(next_day)
+            )
+        return render(request, "print_labels.html", {"pregenerated": pregenerated, "next_day": next_day})
 
 
 @login_required
 def print_labels_for_day(request):
-    page = "Roll"
     if request.POST:
         if request.FILES:
             decoded_file = request.FILES.get("exclude_contacts").read().decode("utf-8").splitlines()
-            exclude_contacts = csv.reader(decoded_file)
-            exclude_contacts_list = list(exclude_contacts)
-        else:
-            exclude_contacts = None
-        isoweekday = request.POST.get("isoweekday")
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = "attachment; filename=individual-labels-{}.pdf".format(isoweekday)
-        Page = globals()[page]
-        if request.POST.get("96x30"):
-            canvas = Canvas(response, pagesize=(Roll96x30.width, Roll96x30.height))
-            sheet = Roll96x30(LogisticsLabel96x30, canvas)
+            exclude_contacts_list = [int(item) for row in csv.reader(decoded_file) for item in row if item.strip()]
         else:
-            canvas = Canvas(response, pagesize=(Page.width, Page.height))
-            sheet = Page(LogisticsLabel, canvas)
-        iterator = sheet.iterator()
-
-        subscription_products = (
-            SubscriptionProduct.objects.filter(
-                active=True,
-                product__weekday=isoweekday,
-                subscription__active=True,
-                subscription__start_date__lte=date.today(),
-            )
-            .exclude(route__print_labels=False)
-            .order_by("route", F("order").asc(nulls_first=True), "address__address_1")
+            exclude_contacts_list = []
+        isoweekday = int(request.POST.get("isoweekday"))
+        page = "Roll96x30" if request.POST.get("96x30") else "Roll"
+        route_numbers = [
+            route_number.strip() for route_number in request.POST.get("routes", "").split(",") if route_number.strip()
+        ] or None
+        subscription_products = label_subscription_products(
+            isoweekday, date.today(), route_numbers, exclude_contacts_list
+        )
+        specs = label_specs(subscription_products, ROUTE_SUFFIXES.get(isoweekday, ""), invoice_weekday=isoweekday)
+        filename = "individual-labels-{}.pdf".format(isoweekday)
+        if exclude_contacts_list:
+            return pdf_response(lambda output: draw_labels(output, specs, page), filename)
+        # the routes that didn't change since the last time (or since render_label_cache ran) aren't drawn again
+        return pdf_response(
+            lambda output: LabelCache().labels(weekday_run(isoweekday, page), specs, output, page), filename
         )
-
-        if exclude_contacts:
-            subscription_products = subscription_products.exclude(subscription__contact_id__in=exclude_contacts_list)
-        old_route = 0
-
-        for sp in subscription_products:
-
-            # If the subscription_product has no route, then we'll skip it.
-            if sp.route is None:
-                continue
-
-            # If the subscription_product has no address, continue. TODO: precond validation to prevent this situation
-            if sp.address is None:
-                continue
-
-            # Separator label
-            if old_route != sp.route:
-                label = next(iterator)
-                label.separador()
-                old_route = sp.route
-
-            # Here we'll show an icon if the contact has one of the payment types marked on settings.
-            has_invoice = (
-                sp.subscription.payment_type
-                and sp.subscription.payment_type in settings.LOGISTICS_LABEL_INVOICE_PAYMENT_TYPES
-                and not sp.subscription.billing_address
-                and sp.subscription.contact.invoice_set.filter(print_date__gte=date.today() - timedelta(6)).exists()
-            )
-
-            for copy in range(sp.copies):
-
-                label, route_suffix = next(iterator), ""
-
-                if sp.product:
-                    if isoweekday == "1":
-                        route_suffix = _("MONDAY")
-                    elif isoweekday == "2":
-                        route_suffix = _("TUESDAY")
-                    elif isoweekday == "3":
-                        route_suffix = _("WEDNESDAY")
-                    elif isoweekday == "4":
-                        route_suffix = _("THURSDAY")
-                    elif isoweekday == "5":
-                        route_suffix = _("FRIDAY")
-                    label.route_suffix = route_suffix
-
-                    label.has_invoice = (
-                        has_invoice
-                        and sp.subscription.get_first_product_by_priority().weekday
-                        and sp.subscription.get_first_product_by_priority().weekday == isoweekday
-                    )
-
-                # Here we determine if the subscription needs an envelope.
-                if sp.has_envelope:
-                    label.envelope = True
-
-                if sp.subscription.start_date == next_business_day():
-                    label.new = True
-
-                if sp.special_instructions:
-                    label.special_instructions = True
-
-                if sp.label_message and sp.label_message.strip():
-                    label.message_for_contact = sp.label_message
-                else:
-                    if sp.subscription.type == "P":
-                        # TODO: the seller name can be obtained here to use it instead of "a friend"
-                        #       (also check the use case of this label, isn't the "referer" a better option?)
-                        if sp.seller:
-                            ref = sp.seller.name
-                        else:
-                            ref = "un amigo"  # TODO: i18n
-                        label.message_for_contact = "Recomendado por {}".format(ref)  # TODO: i18n
-                    # When we have a 2x1 plan we should put it here
-                    # elif getattr(sp.subscription.product, 'id', None) == 6:
-                    #     label.message_for_contact = "2x1"
-
-                if sp.label_contact:
-                    label.name = sp.label_contact.get_full_name().upper()
-                else:
-                    label.name = sp.subscription.contact.get_full_name().upper()
-                label.address = (sp.address.address_1 or "") + "\n" + (sp.address.address_2 or "")
-                label.route = sp.route.number
-                label.route_order = sp.order
-                label.draw()
-        sheet.flush()
-        canvas.save()
-        return response
     else:
         return render(request, "print_labels_for_day.html", {})
 
@@ -990,13 +754,21 @@ def route_details(request, route_list, extra_context=None):
     )
     base_sp_exclude = dict(product__digital=True)
 
-    routes_with_copies = (
-        SubscriptionProduct.objects.filter(route__in=routes, **base_sp_filter)
-        .exclude(**base_sp_exclude)
-        .values("route__number")
-        .annotate(sum_copies=Sum("copies"))
-    )
-    copies_by_route = {str(row["route__number"]): row["sum_copies"] or 0 for row in routes_with_copies}
+    manifests = route_manifests(day.date() if isinstance(day, datetime) else day, product)
+    if manifests is not None:
+        copies_by_route = {
+            str(number): route_manifest["copies"]
+            for number, route_manifest in manifests.items()
+            if number in {int(n) for n in route_list}
+        }
+    else:
+        routes_with_copies = (
+            SubscriptionProduct.objects.filter(route__in=routes, **base_sp_filter)
+            .exclude(**base_sp_exclude)
+            .values("route__number")
+            .annotate(sum_copies=Sum("copies"))
+        )
+        copies_by_route = {str(row["route__number"]): row["sum_copies"] or 0 for row in routes_with_copies}
 
     routes = routes.filter(number__in=[int(n) for n in copies_by_route.keys()])
 
@@ -1145,87 +917,31 @@ def edition_time(request, direction):
 @login_required
 def logistics_issues_statistics(request, category="L"):
     # TODO: Maybe we need to switch subscriptionproduct for subscriptions
-    days = []
-    weeks = []
-    months = []
-
-    start_date = date.today() - timedelta(7)
-    end_date = date.today()
-
-    control_date = start_date
-
-    while control_date <= end_date:
-        day = {}
-        isoweekday = control_date.isoweekday()
-        day["date"] = format_date(control_date)
-        day["issues"] = Issue.objects.filter(date=control_date, category=category).count()
-        day["start"] = control_date.strftime("%Y-%m-%d")
-        if day["issues"]:
-            count = (
-                SubscriptionProduct.objects.filter(subscription__active=True, product__weekday=isoweekday)
-                .exclude(product__digital=True)
-                .count()
-            )
-            if count > 0:
-                day["pct"] = float(day["issues"]) * 100 / count
-                day["pct"] = "%.2f" % day["pct"]
-            else:
-                day["pct"] = "N/A"
-        days.append(day)
-
-        control_date += timedelta(1)
-
-    start_date = date.today() - timedelta(7 * 4)
-    end_date = date.today() - timedelta(date.today().isoweekday() - 1)
-
-    control_date = start_date
-
-    while control_date <= end_date:
-        week = {}
-        week["date"] = format_date(control_date)
-
-        week["issues"] = Issue.objects.filter(
-            category=category, date__gte=control_date, date__lte=control_date + timedelta(6)
-        ).count()
-
-        if week["issues"]:
-            count = Subscription.objects.filter(active=True).exclude(products__digital=True).count()
-            if count > 0:
-                week["pct"] = float(week["issues"]) * 100 / (count * 6)
-                week["pct"] = "%.2f" % week["pct"]
-            else:
-                week["pct"] = "N/A"
-
-        week["start"] = control_date.strftime("%Y-%m-%d")
-        week["end"] = (control_date + timedelta(6)).strftime("%Y-%m-%d")
-        weeks.append(week)
-        control_date += timedelta(7)
-
-    start_date = date.today() + relativedelta(months=-4)
-    end_date = date(date.today().year, date.today().month, 1)
-
-    control_date = start_date
-
-    while control_date <= end_date:
-        month = {}
-        month["date"] = str(control_date.month)
-
-        month["issues"] = Issue.objects.filter(
-            category=category, date__gte=control_date, date__lte=control_date + relativedelta(months=+1) - timedelta(1)
-        ).count()
+    # The issues of each table are counted in one grouped query, from the issues roll-up in the roll-ups mode (see
+    # logistics.issue_statistics)
+    rollups = use_rollups(request)
+    today = date.today()
 
-        if month["issues"]:
-            count = Subscription.objects.filter(active=True).exclude(products__digital=True).count()
-            if count > 0:
-                month["pct"] = float(month["issues"]) * 100 / (count * 24)
-                month["pct"] = "%.2f" % month["pct"]
-            else:
-                month["pct"] = "N/A"
+    def formatted(statistics, label):
+        rows = []
+        for row in statistics:
+            rows.append(
+                {
+                    "date": label(row["start"]),
+                    "issues": row["issues"],
+                    "pct": "N/A" if row["pct"] is None else "%.2f" % row["pct"],
+                    "start": row["start"].strftime("%Y-%m-%d"),
+                    "end": row["end"].strftime("%Y-%m-%d"),
+                }
+            )
+        return rows
 
-        month["start"] = control_date.strftime("%Y-%m-%d")
-        month["end"] = (control_date + relativedelta(months=+1) - timedelta(1)).strftime("%Y-%m-%d")
-        months.append(month)
-        control_date = control_date + relativedelta(months=+1)
+    days = formatted(issue_statistics(DAY, today - timedelta(7), today, category, rollups), format_date)
+    weeks = formatted(issue_statistics(WEEK, today - timedelta(7 * 4), today, category, rollups), format_date)
+    months = formatted(
+        issue_statistics(MONTH, today + relativedelta(months=-4), today, category, rollups),
+        lambda start: str(start.month),
+    )
 
     return render(
         request, "issues_statistics.html", {"days": days, "weeks": weeks, "months": months, "category": category}
@@ -1249,34 +965,16 @@ def issues_per_route(request, route, start_date, end_date, category="L"):
 @login_required
 def issues_route_list(request, start_date, end_date):
     routes = Route.objects.filter(print_labels=True)
-    routes_list = []
-    days = 0
-    control_date = datetime.strptime(start_date, "%Y-%m-%d")
-    while control_date <= datetime.strptime(end_date, "%Y-%m-%d"):
-        if control_date.isoweekday() <= 5:
-            days += 1
-        control_date += timedelta(1)
-
-    for r in routes:
-        route_dict = {}
-        route_dict["route_number"] = r.number
-        route_dict["issues_count"] = Issue.objects.filter(
-            subscription_product__route=r, date__gte=start_date, date__lte=end_date, category="L"
-        ).count()
-        route_dict["subscriptions_count"] = (
-            Subscription.objects.filter(
-                active=True,
-                subscriptionproduct__route=r,
-            )
-            .exclude(products__digital=True)
-            .count()
-        )
-        if route_dict["issues_count"] > 0:
-            route_dict["pct"] = float(route_dict["issues_count"]) * 100 / (route_dict["subscriptions_count"] * days)
+    date_from = datetime.strptime(start_date, "%Y-%m-%d").date()
+    date_to = datetime.strptime(end_date, "%Y-%m-%d").date()
+    days = weekdays_count(date_from, date_to)
+
+    routes_list = route_statistics(routes, date_from, date_to, rollups=use_rollups(request))
+    for route_dict in routes_list:
+        if route_dict["issues_count"] > 0 and route_dict["pct"] is not None:
             route_dict["pct"] = "%.2f%%" % route_dict["pct"]
         else:
             route_dict["pct"] = "N/A"
-        routes_list.append(route_dict)
     return render(
         request,
         "issues_route_list.html",
@@ -1337,28 +1035,45 @@ def print_routes_simple(request, route_list):
 @permission_required("logistics.change_route")
 def convert_orders_to_tens(request, route_id, product_id=None):
     route = get_object_or_404(Route, pk=route_id)
+    subscription_products = SubscriptionProduct.objects.filter(route=route, order__isnull=False)
     if product_id:
-        product = get_object_or_404(Product, pk=product_id)
-        order_i = 10
-        for sp in SubscriptionProduct.objects.filter(product=product, route=route, order__isnull=False).order_by(
-            "order"
-        ):
-            sp.order = order_i
-            sp.save()
-            order_i += 10
+        subscription_products = subscription_products.filter(product=get_object_or_404(Product, pk=product_id))
     else:
-        for product in Product.objects.filter(offerable=True, type="S"):
-            order_i = 10
-            for sp in SubscriptionProduct.objects.filter(product=product, route=route, order__isnull=False).order_by(
-                "order"
-            ):
-                sp.order = order_i
-                sp.save()
-                order_i += 10
+        subscription_products = subscription_products.filter(product__offerable=True, product__type="S")
+    apply_updates(
+        orders_in_tens(subscription_products.select_related("subscription").order_by("product_id", "order", "id")),
+        ["order"],
+    )
     messages.success(request, _("All orders have been converted to tens."))
     return HttpResponseRedirect(reverse("order_route", args=[route.number]))
 
 
+@permission_required("logistics.change_route")
+def sequence_route_orders(request, route_id):
+    """
+    Shows the delivery order proposed for a route and its child routes from the location of the addresses (see
+    logistics.route_sequencing), as a diff against the current order, and saves it when it's accepted.
+    """
+    route = get_object_or_404(Route, pk=route_id)
+    if request.POST:
+        updates = form_updates(request.POST, "sp-order-", "order", with_labels=False)
+        saved = save_route_updates(request, updates, ["order"])
+        messages.success(request, _("The proposed order was saved for {} subscription products").format(len(saved)))
+        return HttpResponseRedirect(reverse("order_route", args=[route.number]))
+
+    proposal, summaries = propose_orders(route)
+    return render(
+        request,
+        "sequence_route.html",
+        {
+            "route": route,
+            "summaries": summaries,
+            "changes": proposal[proposal["changed"]].astype(object).where(proposal.notna(), None).to_dict("records"),
+            "total": len(proposal),
+        },
+    )
+
+
 @login_required
 def print_labels_for_product_date(request):
     """
@@ -1368,13 +1083,6 @@ def print_labels_for_product_date(request):
         product = get_object_or_404(Product, pk=request.POST.get("product_id", None))
         date_str = request.POST.get("date", None)
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = "attachment; filename=labels-{}-{}.pdf".format(product.name, date_str)
-        Page = globals()["Roll"]  # It's always a roll for now. TODO: Change
-        canvas = Canvas(response, pagesize=(Page.width, Page.height))
-        sheet = Page(LogisticsLabel, canvas)
-        iterator = sheet.iterator()
-        # If not, all the queryset gets rendered into the labels
         subscription_products = SubscriptionProduct.objects.filter(
             Q(subscription__end_date__gte=date_obj) | Q(subscription__end_date__isnull=True),
             active=True,
@@ -1450,74 +1158,14 @@ def print_labels_for_product_date(request):
                 )
             return response
 
-        old_route = 0
-
-        for sp in subscription_products:
-
-            if sp.address is None:
-                continue
-
-            # Separator between routes
-            if sp.route and old_route != sp.route:
-                label = next(iterator)
-                label.separador()
-                old_route = sp.route
-
-            # Here we'll show an icon if the contact has one of the payment types marked on settings.
-            has_invoice = (
-                sp.subscription.payment_type
-                and sp.subscription.payment_type in settings.LOGISTICS_LABEL_INVOICE_PAYMENT_TYPES
-                and not sp.subscription.billing_address
-                and sp.subscription.contact.invoice_set.filter(print_date__gte=date.today() - timedelta(30)).exists()
-            )
-
-            for copy in range(sp.copies):
-
-                label = next(iterator)
-
-                if sp.has_envelope:
-                    label.envelope = True
-
-                if sp.subscription.start_date == next_business_day():
-                    label.new = True
-
-                if sp.special_instructions:
-                    label.special_instructions = True
-
-                if sp.label_message and sp.label_message.strip():
-                    label.message_for_contact = sp.label_message
-                else:
-                    if sp.subscription.type == "P":
-                        if sp.seller:
-                            ref = sp.seller.name
-                        else:
-                            ref = "un amigo"  # TODO: i18n
-                        label.message_for_contact = "Recomendado por {}".format(ref)  # TODO: i18n
-                    # When we have a 2x1 plan we should put it here
-                    # elif getattr(sp.subscription.product, 'id', None) == 6:
-                    #     eti.comunicar_cliente = "2x1"
-
-                if sp.label_contact:
-                    label.name = sp.label_contact.get_full_name().upper()
-                else:
-                    label.name = sp.subscription.contact.get_full_name().upper()
-                label.address = (sp.address.address_1 or "") + "\n" + (sp.address.address_2 or "")
-                if sp.route:
-                    label.route = sp.route.number
-                    label.route_order = sp.order
-                else:
-                    label.route = None
-                    label.route_order = None
-
-                label.has_invoice = (
-                    has_invoice
-                    and sp.subscription.get_first_product_by_priority()
-                    and sp.subscription.get_first_product_by_priority() == product
-                )
-                label.draw()
-        sheet.flush()
-        canvas.save()
-        return response
+        # It's always a roll for now. TODO: Change
+        page = "Roll"
+        specs = label_specs(product_date_subscription_products(product, date_obj), invoice_product=product)
+        # the routes that didn't change since the last time aren't drawn again
+        return pdf_response(
+            lambda output: LabelCache().labels(product_date_run(product, date_obj, page), specs, output, page),
+            "labels-{}-{}.pdf".format(product.name, date_str),
+        )
     else:
         products = Product.objects.filter(offerable=True, type="S")
         return render(
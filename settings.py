@@ -205,8 +205,18 @@ ISSUE_RESOLUTION_SOLVED_SUBCATEGORIES = []
 
 # logistics
 LOGISTICS_LABEL_INVOICE_PAYMENT_TYPES = []
+# Where the print_labels command leaves the labels PDF of the day, relative to "MEDIA"
+LOGISTICS_LABELS_PATH = "labels"
 ISSUE_SUBCATEGORY_NOT_DELIVERED = "not-delivered"
 
+# Mailtrain synchronization of the Dynamic Contact Filters (see core.mailtrain_sync)
+# Threads sending the subscribe/delete calls of a filter
+MAILTRAIN_SYNC_WORKERS = 8
+# Maximum Mailtrain API requests per second shared by all the filters synced at the same time, None for no limit
+MAILTRAIN_API_RATE = None
+# Where the diff reports of the sync_all_filters command are written, relative to "MEDIA"
+MAILTRAIN_SYNC_REPORTS_PATH = "mailtrain_sync"
+
 # Override to True if route for billing is required
 # Useful when you explicitly require to send the invoices via logistics
 REQUIRE_ROUTE_FOR_BILLING = False
@@ -20,6 +20,13 @@ class ISSUE_CATEGORIES(models.TextChoices):
     COMMUNITY = 'O', _('Community')
 
 
+class CONTACT_IMPORT_STATUS(models.TextChoices):
+    PENDING = 'P', _('Pending')
+    STARTED = 'S', _('Started')
+    COMPLETED = 'C', _('Completed')
+    FAILED = 'F', _('Failed')
+
+
 SCHEDULED_TASK_CATEGORIES = (
     ('AC', _('Address change')),
     ('PD', _('Start of pause')),
@@ -0,0 +1,59 @@
+# coding=utf-8
+"""
+Keyset (cursor) navigation of the seller console.
+
+Instead of counting the console list and seeking by offset, the console moves through it by the key of the contact it
+showed last: (date_assigned, contact) for the new contacts, which is the index of the campaign queue, and (datetime, id)
+for the activities. Finding the next contact is a single indexed query that reads only a few rows, and it doesn't skip
+or repeat contacts when other sellers change the list meanwhile.
+
+A cursor is the key of an instance as a URL-safe string, like "20261012_1234" (or "_1234" for a contact without
+date_assigned, which go last).
+"""
+from datetime import datetime
+
+from django.db.models import Q
+
+
+KEYSET_FIELDS = {
+    "new": ("queue_entry__date_assigned", "queue_entry__contact_id"),
+    "act": ("datetime", "id"),
+}
+KEY_FORMATS = {"new": "%Y%m%d", "act": "%Y%m%d%H%M%S%f"}
+
+
+def instance_key(category, instance):
+    if category == "new":
+        return instance.date_assigned, instance.contact_id
+    return instance.datetime, instance.id
+
+
+def encode_cursor(category, instance):
+    first, second = instance_key(category, instance)
+    return "{}_{}".format(first.strftime(KEY_FORMATS[category]) if first else "", second)
+
+
+def decode_cursor(category, cursor):
+    """
+    Returns the key of the cursor, raises ValueError if it's not a valid cursor.
+    """
+    first, second = cursor.rsplit("_", 1)
+    first = datetime.strptime(first, KEY_FORMATS[category]) if first else None
+    if first and category == "new":
+        first = first.date()
+    return first, int(second)
+
+
+def after_cursor(queryset, category, cursor):
+    """
+    Filters the console instances ordered by their key to the ones after the cursor. Instances without the first field
+    of the key go last.
+    """
+    (first_field, second_field), (first, second) = KEYSET_FIELDS[category], decode_cursor(category, cursor)
+    if first is None:
+        return queryset.filter(**{first_field + "__isnull": True, second_field + "__gt": second})
+    return queryset.filter(
+        Q(**{first_field + "__gt": first})
+        | Q(**{first_field: first, second_field + "__gt": second})
+        | Q(**{first_field + "__isnull": True})
+    )
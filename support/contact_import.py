@@ -0,0 +1,452 @@
+# coding=utf-8
+"""
+Bulk import of contacts from a CSV file (see ImportContactsView and the process_contact_imports command).
+
+ContactImporter processes the rows of the file in chunks, each one in a single transaction:
+
+- The id document types, states, countries and tags are read once for the whole file.
+- The contacts that match the rows of a chunk, by email or else by phone or mobile, are read with two queries, and
+  what categorises them (being in an active campaign, having an active subscription) with two more.
+- The rows are matched in memory, in the order of the file, against those contacts and the ones created or updated by
+  the previous rows, like the row-by-row import did.
+- The new contacts (with their history records), their addresses and the tags are written with bulk_create, and the
+  phones added to existing contacts with bulk_update. The emails added to existing contacts are still saved one by
+  one, since they're validated against the CMS.
+- The contact signals aren't sent for the bulk writes: the dynamic contact filters are refreshed once per chunk, and
+  the new and updated contacts are synced with the CMS once all the chunks are committed.
+
+A chunk that fails is imported again one row per transaction, so only the failing rows are left out.
+
+run_import() runs a ContactImport, saving its progress after each chunk.
+"""
+import copy
+import re
+import traceback
+from collections import defaultdict
+
+import pandas as pd
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import CharField, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+from taggit.models import Tag, TaggedItem
+
+from core import dcf_members
+from core.models import (
+    Address,
+    Contact,
+    ContactCampaignStatus,
+    Country,
+    IdDocumentType,
+    State,
+    Subscription,
+    regex_alphanumeric,
+    regex_alphanumeric_msg,
+    update_web_user,
+    update_web_user_newsletters,
+)
+from core.utils import mail_managers_on_errors
+from support.choices import CONTACT_IMPORT_STATUS
+
+
+COLUMNS = [
+    "name",
+    "last_name",
+    "email",
+    "phone",
+    "mobile",
+    "notes",
+    "address_1",
+    "address_2",
+    "city",
+    "state",
+    "country",
+    "id_document_type",
+    "id_document",
+]
+CONTACT_FIELDS = ["name", "last_name", "email", "phone", "mobile", "notes", "id_document_type_id", "id_document"]
+CHUNK_SIZE = 1000
+alphanumeric = re.compile(regex_alphanumeric)
+
+
+def read_csv(csv_file, use_headers=True):
+    """
+    Returns the rows of the file as a DataFrame of strings with the COLUMNS. Raises ValueError if any is missing.
+    """
+    if use_headers:
+        df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_csv(csv_file, header=None, dtype=str, keep_default_na=False)
+        df.columns = COLUMNS
+    missing = [column for column in COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(_("Missing columns: {}").format(", ".join(missing)))
+    return df[COLUMNS]
+
+
+def empty_results():
+    return {
+        "new_contacts": 0,
+        "in_active_campaign": 0,
+        "active_contacts": 0,
+        "existing_inactive_contacts": 0,
+        "added_emails": 0,
+        "added_phones": 0,
+        "added_mobiles": 0,
+        "errors": [],
+        "warnings": [],
+    }
+
+
+def merge_results(results, other):
+    for key, value in other.items():
+        results[key] += value
+
+
+class ContactImporter:
+    """
+    Imports the rows of a CSV file (see the module docstring). tags has the lists of tags to add to the new contacts
+    ("tags"), to the existing ones without active subscriptions ("tags_existing"), with active subscriptions
+    ("tags_active") and in active campaigns ("tags_in_campaign"). results can be the results of a previous run, to
+    resume it.
+    """
+
+    def __init__(self, tags, results=None, chunk_size=CHUNK_SIZE):
+        self.tags = {
+            tag_type: [tag.strip() for tag in tag_list if isinstance(tag, str) and tag.strip()]
+            for tag_type, tag_list in tags.items()
+        }
+        self.results = results or empty_results()
+        self.chunk_size = chunk_size
+        self.phone_field = Contact._meta.get_field("phone")
+        # the lowest id wins, like .first() did
+        self.id_document_types = {
+            name.lower(): pk for pk, name in IdDocumentType.objects.order_by("-id").values_list("id", "name")
+        }
+        self.states = dict(State.objects.order_by("-id").values_list("name", "id"))
+        self.countries = dict(Country.objects.order_by("-id").values_list("name", "id"))
+        self.tag_ids = {}
+        # the contacts (saved or not) by email and by phone, of the rows imported and the matches read
+        self.by_email, self.by_phone = {}, defaultdict(dict)
+        self.loaded_emails, self.loaded_phones = set(), set()
+        # (contact, created) to sync with the CMS at the end
+        self.to_sync = []
+
+    def run(self, df, row_offset=2, start=0, progress=None):
+        """
+        Imports the rows of df from start on. row_offset is added to the index of a row to get its line in the file.
+        progress, if given, is called with the number of rows processed and the results after each chunk.
+        """
+        records = df.to_dict("records")
+        for chunk_start in range(start, len(records), self.chunk_size):
+            rows = [
+                (index + row_offset, row)
+                for index, row in enumerate(records[chunk_start:chunk_start + self.chunk_size], chunk_start)
+            ]
+            self.import_rows(rows)
+            if progress:
+                progress(min(chunk_start + self.chunk_size, len(records)), self.results)
+        self.sync_with_cms()
+        return self.results
+
+    def import_rows(self, rows):
+        """
+        Imports a list of (row number, row) in one transaction, or one row per transaction when it fails.
+        """
+        try:
+            results, by_email, by_phone, to_sync, edited, tag_ids = self.import_chunk(rows)
+        except Exception as e:
+            if len(rows) == 1:
+                self.results["errors"].append("CSV Row {}: {}".format(rows[0][0], e))
+            else:
+                for row in rows:
+                    self.import_rows([row])
+            return
+        merge_results(self.results, results)
+        for contact, edited_contact in edited.values():
+            contact.__dict__.update(edited_contact.__dict__)
+        self.by_email.update(by_email)
+        for phone, contacts in by_phone.items():
+            self.by_phone[phone].update(contacts)
+        self.to_sync.extend(to_sync)
+        self.tag_ids.update(tag_ids)
+
+    def parse_row(self, row, row_number, results):
+        name = row["name"].strip()
+        if not name:
+            raise ValueError(_("The name is required"))
+        if not alphanumeric.match(name) and getattr(settings, "ENABLE_ALPHANUMERIC_VALIDATION_FOR_NAME", True):
+            raise ValueError(regex_alphanumeric_msg)
+        id_document_type = row["id_document_type"]
+        id_document_type_id = self.id_document_types.get(id_document_type.lower()) if id_document_type else None
+        if id_document_type and not id_document_type_id:
+            results["warnings"].append(
+                _("Invalid ID document type '{}' (Row {}). Contact created without document type.").format(
+                    id_document_type, row_number
+                )
+            )
+        return {
+            "name": name,
+            "last_name": row["last_name"],
+            "email": row["email"].strip().lower() or None,
+            "phone": row["phone"],
+            "mobile": row["mobile"],
+            "notes": row["notes"].strip() or None,
+            "address_1": row["address_1"] or None,
+            "address_2": row["address_2"] or None,
+            "city": row["city"] or None,
+            "state_id": self.states.get(row["state"].strip()),
+            "country_id": self.countries.get(row["country"]),
+            "id_document_type_id": id_document_type_id,
+            "id_document": row["id_document"] or None,
+            # the phone as it's stored, to match it
+            "phone_key": self.phone_field.get_prep_value(row["phone"]) if row["phone"] else None,
+        }
+
+    def load_matches(self, rows):
+        """
+        Reads the contacts with the emails and phones of the rows that weren't read yet.
+        """
+        emails = {data["email"] for row_number, data in rows if data["email"]} - self.loaded_emails
+        if emails:
+            for contact in Contact.objects.filter(email__in=emails):
+                self.by_email.setdefault(contact.email, contact)
+            self.loaded_emails |= emails
+        phones = {data["phone_key"] for row_number, data in rows if data["phone_key"]} - self.loaded_phones
+        if phones:
+            matches = Contact.objects.filter(Q(phone__in=phones) | Q(mobile__in=phones)).annotate(
+                stored_phone=Cast("phone", CharField()), stored_mobile=Cast("mobile", CharField())
+            )
+            for contact in matches:
+                for phone in (contact.stored_phone, contact.stored_mobile):
+                    if phone in phones:
+                        self.by_phone[phone].setdefault(contact.id, contact)
+            self.loaded_phones |= phones
+
+    def import_chunk(self, rows):
+        """
+        Imports the rows in one transaction. Returns the results, and the contacts and tag ids to add to the maps once
+        committed. The existing contacts are changed in copies, so they're left as they were if the transaction fails.
+        """
+        results = empty_results()
+        by_email, by_phone = {}, defaultdict(dict)
+        parsed = []
+        for row_number, row in rows:
+            try:
+                parsed.append((row_number, self.parse_row(row, row_number, results)))
+            except ValueError as e:
+                results["errors"].append("CSV Row {}: {}".format(row_number, e))
+        self.load_matches(parsed)
+
+        # the new contacts aren't saved yet, they're matched by the next rows as they are
+        new_contacts, new_addresses, email_updates, phone_updates, tagged = [], [], {}, {}, []
+        matches_by_row, edited = [], {}
+
+        def current(contact):
+            return edited[contact.pk][1] if contact.pk in edited else contact
+
+        def original(contact):
+            return edited[contact.pk][0] if contact.pk in edited else contact
+
+        for row_number, data in parsed:
+            email, phone = data["email"], data["phone_key"]
+            matched_by_phone = False
+            if email and (email in by_email or email in self.by_email):
+                matches = [current(by_email.get(email) or self.by_email[email])]
+            elif phone:
+                matches = [
+                    current(contact)
+                    for contact in {**self.by_phone.get(phone, {}), **by_phone.get(phone, {})}.values()
+                ]
+                matched_by_phone = True
+            else:
+                matches = []
+
+            if not matches:
+                contact = Contact(**{field: data[field] for field in CONTACT_FIELDS})
+                contact.no_email = contact.email is None
+                new_contacts.append(contact)
+                if data["address_1"]:
+                    new_addresses.append(
+                        Address(
+                            contact=contact,
+                            address_1=data["address_1"],
+                            address_2=data["address_2"],
+                            city=data["city"],
+                            address_type="physical",  # Default
+                            state_id=data["state_id"],
+                            country_id=data["country_id"],
+                        )
+                    )
+                tagged.append((contact, self.tags.get("tags", [])))
+                results["new_contacts"] += 1
+                if email:
+                    by_email[email] = contact
+                if phone:
+                    by_phone[phone][id(contact)] = contact
+                continue
+
+            matches_by_row.append(matches)
+            if len(matches) > 1:
+                continue
+            contact = matches[0]
+            if contact.pk and contact.pk not in edited:
+                edited[contact.pk] = (contact, copy.copy(contact))
+                contact = edited[contact.pk][1]
+            if matched_by_phone and not contact.email:
+                # IMPORTANT: Never overwrite existing emails to prevent data loss
+                if email:
+                    contact.email = email
+                    contact.no_email = False
+                    if contact.pk:
+                        email_updates[contact.pk] = contact
+                    by_email[email] = original(contact)
+                    results["added_emails"] += 1
+            elif data["phone"] and phone not in self.stored_phones(contact):
+                # If the contact already has a phone, the phone goes to the mobile field
+                if contact.phone:
+                    contact.mobile = data["phone"]
+                else:
+                    contact.phone = data["phone"]
+                if contact.pk:
+                    phone_updates[contact.pk] = contact
+                by_phone[phone][contact.pk or id(contact)] = original(contact)
+                results["added_phones"] += 1
+
+        with transaction.atomic(), dcf_members.deferred_refresh():
+            for contact in email_updates.values():
+                contact.save()
+            bulk_update_with_history(
+                [contact for pk, contact in phone_updates.items() if pk not in email_updates],
+                Contact,
+                ["phone", "mobile"],
+                batch_size=self.chunk_size,
+            )
+            bulk_create_with_history(new_contacts, Contact, batch_size=self.chunk_size)
+            for address in new_addresses:
+                address.contact_id = address.contact.pk
+            Address.objects.bulk_create(new_addresses, batch_size=self.chunk_size)
+            tagged += self.categorize(matches_by_row, results)
+            tag_ids = self.add_tags(tagged)
+            dcf_members.contacts_changed([contact.pk for contact in new_contacts] + list(phone_updates))
+
+        # the keys of the new contacts in by_phone are replaced by their ids
+        by_phone = {
+            phone: {contact.pk: contact for contact in contacts.values()} for phone, contacts in by_phone.items()
+        }
+        to_sync = [(contact, True) for contact in new_contacts] + [
+            (contact, False) for pk, contact in phone_updates.items() if pk not in email_updates
+        ]
+        return results, by_email, by_phone, to_sync, edited, tag_ids
+
+    def stored_phones(self, contact):
+        return {
+            self.phone_field.get_prep_value(number) if number else None
+            for number in (contact.phone, contact.mobile)
+        }
+
+    def categorize(self, matches_by_row, results):
+        """
+        Counts the matched contacts of each row by category and returns the tags to add to them.
+        """
+        contact_ids = {contact.pk for matches in matches_by_row for contact in matches if contact.pk}
+        in_active_campaign = set(
+            ContactCampaignStatus.objects.filter(contact_id__in=contact_ids, campaign__active=True).values_list(
+                "contact_id", flat=True
+            )
+        )
+        with_active_subscription = set(
+            Subscription.objects.filter(contact_id__in=contact_ids, active=True).values_list("contact_id", flat=True)
+        )
+        tagged = []
+        for matches in matches_by_row:
+            for contact in matches:
+                if contact.pk in in_active_campaign:
+                    results["in_active_campaign"] += 1
+                    tagged.append((contact, self.tags.get("tags_in_campaign", [])))
+                elif contact.pk in with_active_subscription:
+                    results["active_contacts"] += 1
+                    tagged.append((contact, self.tags.get("tags_active", [])))
+                else:
+                    results["existing_inactive_contacts"] += 1
+                    tagged.append((contact, self.tags.get("tags_existing", [])))
+        return tagged
+
+    def add_tags(self, tagged):
+        """
+        Adds the tags of a list of (contact, tag names), with one insert. Returns the ids of the tags by name, which
+        are added to self.tag_ids once the chunk is committed, since the tags it creates are gone if it fails.
+        """
+        content_type = ContentType.objects.get_for_model(Contact)
+        tag_ids, items = dict(self.tag_ids), []
+        for contact, names in tagged:
+            for name in names:
+                if name not in tag_ids:
+                    tag = Tag.objects.filter(name=name).first() or Tag.objects.create(name=name)
+                    tag_ids[name] = tag.id
+                items.append(TaggedItem(content_type=content_type, object_id=contact.pk, tag_id=tag_ids[name]))
+        TaggedItem.objects.bulk_create(items, ignore_conflicts=True)
+        return tag_ids
+
+    def sync_with_cms(self):
+        """
+        Syncs the new and updated contacts with the CMS, in one pass after every chunk was committed.
+        """
+        if not settings.WEB_UPDATE_USER_ENABLED:
+            return
+        failed = []
+        for contact, created in self.to_sync:
+            try:
+                if created:
+                    update_web_user(contact, method="POST" if settings.WEB_CREATE_USER_ENABLED else "PUT")
+                else:
+                    update_web_user(contact)
+                update_web_user_newsletters(contact)
+            except ValidationError as ex:
+                failed.append("{}: {}".format(contact.pk, ex))
+        self.to_sync = []
+        if failed:
+            self.results["errors"].append(_("CMS sync failed for contacts {}").format(", ".join(failed)))
+            mail_managers_on_errors("CMS sync of imported contacts", "\n".join(failed), "")
+
+
+def run_import(contact_import, chunk_size=CHUNK_SIZE):
+    """
+    Runs a ContactImport, from the rows it already processed on, saving its progress after each chunk.
+    """
+    contact_import.status = CONTACT_IMPORT_STATUS.STARTED
+    contact_import.started = contact_import.started or timezone.now()
+    contact_import.save(update_fields=["status", "started"])
+
+    def save_progress(processed_rows, results):
+        contact_import.processed_rows, contact_import.results = processed_rows, results
+        contact_import.save(update_fields=["processed_rows", "results"])
+
+    try:
+        with contact_import.file.open("rb") as csv_file:
+            df = read_csv(csv_file, contact_import.use_headers)
+        if contact_import.total_rows != len(df):
+            contact_import.total_rows = len(df)
+            contact_import.save(update_fields=["total_rows"])
+        importer = ContactImporter(contact_import.tags, contact_import.results or None, chunk_size)
+        importer.run(
+            df,
+            row_offset=2 if contact_import.use_headers else 1,
+            start=contact_import.processed_rows,
+            progress=save_progress,
+        )
+    except Exception as e:
+        contact_import.status = CONTACT_IMPORT_STATUS.FAILED
+        contact_import.results.setdefault("errors", []).append(str(e))
+        mail_managers_on_errors("Contact import {}".format(contact_import.id), str(e), traceback.format_exc())
+    else:
+        contact_import.status = CONTACT_IMPORT_STATUS.COMPLETED
+        contact_import.results = importer.results
+    contact_import.finished = timezone.now()
+    contact_import.save(update_fields=["status", "finished", "results"])
+    return contact_import
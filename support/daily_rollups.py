@@ -0,0 +1,251 @@
+# coding=utf-8
+"""
+Daily roll-up tables for the statistics views.
+
+Each Rollup aggregates a transactional table (the source) by day into a compact table of daily facts: a row per day
+and combination of its dimensions (campaign, seller, product, route, reason...) with the aggregated measures. Reading
+a range sums the rows of the days already aggregated and aggregates the source for the rest (today and the days that
+changed since they were aggregated), so the result is the same as reading the source, in two queries whatever the
+length of the range.
+
+Which days are aggregated is recorded in DailyRollup. Signals (see support.signals) drop the DailyRollup of the days
+whose source rows changed. The rollup_daily_metrics command aggregates the pending days every night, and can backfill
+a range or aggregate again a single day.
+
+The statistics views read from these tables when the STATISTICS_FROM_ROLLUPS setting is True or with ?rollup=1 in
+the URL (and not with ?rollup=0).
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Least, TruncDate
+
+from core.models import Subscription
+from core.utils import logistics_is_installed
+from support.models import DailyRollup, Issue, SalesDailyMetrics, SalesRecord, UnsubscriptionDailyMetrics
+
+if logistics_is_installed():
+    from logistics.models import IssueDailyMetrics
+
+
+# Counted as one more product in the sales distribution by products count
+SPECIAL_PRODUCT_SLUG = "la-diaria-5-dias"
+MAX_PRODUCTS_COUNT = 4
+
+
+def use_rollups(request):
+    """
+    Whether the statistics of the request are read from the daily roll-up tables.
+    """
+    rollup = request.GET.get("rollup")
+    if rollup in ("0", "1"):
+        return rollup == "1"
+    return getattr(settings, "STATISTICS_FROM_ROLLUPS", False)
+
+
+class Rollup:
+    """
+    A daily roll-up of the source queryset into model, which has a date field, the dimensions ({field: source field or
+    expression}) and the measures ({field: aggregate of the source}). date_lookup filters the source by day, and
+    date_expression returns the day of a source row.
+    """
+
+    def __init__(self, name, model, source, date_lookup, dimensions, measures, date_expression=None):
+        self.name = name
+        self.model = model
+        self.source = source
+        self.date_lookup = date_lookup
+        self.date_expression = date_expression or F(date_lookup)
+        self.dimensions = dimensions
+        self.measures = measures
+
+    def __str__(self):
+        return self.name
+
+    def facts(self, queryset):
+        """
+        Aggregates the source queryset by day and dimensions, returns the rows of the roll-up as dicts.
+        """
+        aliases = {
+            "rollup_" + field: F(source) if isinstance(source, str) else source
+            for field, source in self.dimensions.items()
+        }
+        rows = (
+            queryset.annotate(rollup_date=self.date_expression, **aliases)
+            .values("rollup_date", *aliases)
+            .annotate(**self.measures)
+            .order_by()
+        )
+        for row in rows:
+            fact = {"date": row["rollup_date"]}
+            fact.update({field: row["rollup_" + field] for field in self.dimensions})
+            fact.update({field: row[field] or 0 for field in self.measures})
+            yield fact
+
+    def rolled_up_days(self, date_from=None, date_to=None):
+        days = DailyRollup.objects.filter(name=self.name)
+        if date_from:
+            days = days.filter(date__gte=date_from)
+        if date_to:
+            days = days.filter(date__lte=date_to)
+        return days.values("date")
+
+    def rollup_day(self, day):
+        """
+        Aggregates the source rows of the day, replacing the rows stored for it. Returns the number of rows.
+        """
+        with transaction.atomic():
+            self.model.objects.filter(date=day).delete()
+            facts = list(self.facts(self.source.filter(**{self.date_lookup: day})))
+            self.model.objects.bulk_create(self.model(**fact) for fact in facts)
+            DailyRollup.objects.update_or_create(name=self.name, date=day)
+        return len(facts)
+
+    def pending_days(self, until=None):
+        """
+        Returns the days before until (today by default) with source rows or stored rows that aren't aggregated, or
+        changed since.
+        """
+        until = until or date.today()
+        days = self.rolled_up_days()
+        source_days = (
+            self.source.filter(**{self.date_lookup + "__lt": until})
+            .exclude(**{self.date_lookup + "__in": days})
+            .annotate(rollup_date=self.date_expression)
+            .order_by()
+            .values_list("rollup_date", flat=True)
+            .distinct()
+        )
+        stored_days = (
+            self.model.objects.filter(date__lt=until)
+            .exclude(date__in=days)
+            .order_by()
+            .values_list("date", flat=True)
+            .distinct()
+        )
+        return sorted(set(source_days) | set(stored_days))
+
+    def days_changed(self, *days):
+        """
+        The days stop being read from the stored rows until they're aggregated again. Today and later days are never
+        aggregated.
+        """
+        days = [day for day in days if day and day < date.today()]
+        if days:
+            DailyRollup.objects.filter(name=self.name, date__in=days).delete()
+
+    def rows_changed(self, queryset):
+        """
+        The days of the source rows of the queryset stop being read from the stored rows, in a single query. Called
+        before saving the rows, it drops the days they had before the changes.
+        """
+        DailyRollup.objects.filter(
+            name=self.name,
+            date__lt=date.today(),
+            date__in=queryset.annotate(rollup_date=self.date_expression).values("rollup_date"),
+        ).delete()
+
+    def source_filters(self, filters):
+        source_filters = {}
+        for key, value in filters.items():
+            field, separator, lookup = key.partition("__")
+            source = self.dimensions[field]
+            if not isinstance(source, str):
+                raise ValueError("The roll-up can't be filtered by {}".format(field))
+            source_filters[source + separator + lookup] = value
+        return source_filters
+
+    def read(self, group_by=(), date_from=None, date_to=None, **filters):
+        """
+        Returns the measures of the days in the range (all of them by default) for the filters on the dimensions, by
+        the values of the group_by fields (dimensions or "date") like seller_metrics.count_metrics does.
+        """
+        days = self.rolled_up_days(date_from, date_to)
+        stored = self.model.objects.filter(date__in=days, **filters)
+        live = self.source.exclude(**{self.date_lookup + "__in": days}).filter(**self.source_filters(filters))
+        if date_from:
+            live = live.filter(**{self.date_lookup + "__gte": date_from})
+        if date_to:
+            live = live.filter(**{self.date_lookup + "__lte": date_to})
+
+        totals = defaultdict(lambda: dict.fromkeys(self.measures, 0))
+        stored_rows = stored.values(*group_by).annotate(**{field: Sum(field) for field in self.measures}).order_by()
+        for rows in (stored_rows, self.facts(live)):
+            for row in rows:
+                key = tuple(row[field] for field in group_by)
+                for field in self.measures:
+                    totals[key[0] if len(key) == 1 else key][field] += row[field] or 0
+        if not group_by:
+            return totals[()]
+        return totals
+
+
+def products_count_expression():
+    """
+    The products of a sales record, plus one for the special product, up to MAX_PRODUCTS_COUNT.
+    """
+    products = SalesRecord.products.through.objects.filter(salesrecord_id=OuterRef("pk"))
+    count = Subquery(
+        products.order_by().values("salesrecord_id").annotate(count=Count("*")).values("count"),
+        output_field=IntegerField(),
+    )
+    special = Case(
+        When(Exists(products.filter(product__slug=SPECIAL_PRODUCT_SLUG)), then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return Least(Coalesce(count, 0) + special, Value(MAX_PRODUCTS_COUNT))
+
+
+SALES = Rollup(
+    "sales",
+    SalesDailyMetrics,
+    SalesRecord.objects.all(),
+    "date_time__date",
+    date_expression=TruncDate("date_time"),
+    dimensions={
+        "seller_id": "seller_id",
+        "campaign_id": "campaign_id",
+        "sale_type": "sale_type",
+        "payment_type": "subscription__payment_type",
+        "frequency": "subscription__frequency",
+        "validated": "subscription__validated",
+        "products_count": products_count_expression(),
+    },
+    measures={"sales": Count("id"), "commission": Sum("total_commission_value")},
+)
+
+UNSUBSCRIPTIONS = Rollup(
+    "unsubscriptions",
+    UnsubscriptionDailyMetrics,
+    # a row per unsubscribed subscription product, like the statistics
+    Subscription.objects.filter(end_date__isnull=False, unsubscription_products__type="S"),
+    "end_date",
+    dimensions={"product_id": "unsubscription_products", "reason": "unsubscription_reason"},
+    measures={"unsubscriptions": Count("id")},
+)
+
+if logistics_is_installed():
+    ISSUES = Rollup(
+        "issues",
+        IssueDailyMetrics,
+        Issue.objects.all(),
+        "date",
+        dimensions={"category": "category", "route_id": "subscription_product__route_id"},
+        measures={"issues": Count("id")},
+    )
+
+
+def get_rollups():
+    """
+    Returns the roll-ups by name.
+    """
+    from support.seller_metrics import SELLER_METRICS
+
+    rollups = [SELLER_METRICS, SALES, UNSUBSCRIPTIONS]
+    if logistics_is_installed():
+        rollups.append(ISSUES)
+    return {rollup.name: rollup for rollup in rollups}
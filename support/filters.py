@@ -315,23 +315,34 @@ class UnsubscribedSubscriptionsByEndDateFilter(django_filters.FilterSet):
         field_name='end_date', lookup_expr='lte', widget=forms.TextInput(attrs={'autocomplete': 'off'})
     )
 
-    def filter_by_date(self, queryset, name, value):
+    @staticmethod
+    def date_range(value):
+        """
+        Returns the first and last end dates of a choice of the date filter, (None, None) without one.
+        """
+        today = date.today()
         if value == 'today':
-            return queryset.filter(end_date=date.today())
+            return today, today
         elif value == 'yesterday':
-            return queryset.filter(end_date=date.today() - timedelta(1))
+            return today - timedelta(1), today - timedelta(1)
         elif value == 'last_7_days':
-            return queryset.filter(end_date__gte=date.today() - timedelta(7), end_date__lte=date.today())
+            return today - timedelta(7), today
         elif value == 'last_30_days':
-            return queryset.filter(end_date__gte=date.today() - timedelta(30), end_date__lte=date.today())
+            return today - timedelta(30), today
         elif value == 'this_month':
-            return queryset.filter(end_date__month=date.today().month, end_date__year=date.today().year)
+            next_month = (today.replace(day=28) + timedelta(4)).replace(day=1)
+            return today.replace(day=1), next_month - timedelta(1)
         elif value == 'last_month':
-            month = date.today().month - 1 if date.today().month != 1 else 12
-            year = date.today().year if date.today().month != 1 else date.today().year - 1
-            return queryset.filter(end_date__month=month, end_date__year=year)
+            last_day = today.replace(day=1) - timedelta(1)
+            return last_day.replace(day=1), last_day
         else:
-            return queryset
+            return None, None
+
+    def filter_by_date(self, queryset, name, value):
+        date_from, date_to = self.date_range(value)
+        if date_from:
+            queryset = queryset.filter(end_date__gte=date_from, end_date__lte=date_to)
+        return queryset
 
     class Meta:
         model = Subscription
@@ -0,0 +1,108 @@
+# coding=utf-8
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Campaign, Contact, ContactCampaignStatus
+from support.console_cursor import encode_cursor
+from support.models import Seller
+from support.views.seller_console import SellerConsoleView
+
+
+class Command(BaseCommand):
+    help = """Compares the offset and the cursor navigation of the seller console ("new" contacts) at several positions
+    of a campaign. By default the campaign (--rows contacts assigned to one seller) is created for the benchmark inside
+    a transaction that is rolled back at the end, so the database is left untouched."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, default=200000, help="Contacts of the campaign created (default 200000)"
+        )
+        parser.add_argument("--positions", type=int, default=10, help="Positions of the list measured (default 10)")
+        parser.add_argument("--campaign", type=int, help="Use this campaign instead of creating one")
+        parser.add_argument("--seller", type=int, help="Seller of the campaign given with --campaign")
+
+    def handle(self, *args, **options):
+        if bool(options["campaign"]) != bool(options["seller"]):
+            raise CommandError("--campaign and --seller go together")
+        with transaction.atomic():
+            if options["campaign"]:
+                campaign = Campaign.objects.get(pk=options["campaign"])
+                seller = Seller.objects.select_related("user").get(pk=options["seller"])
+                if not seller.user:
+                    raise CommandError("The seller has no user")
+            else:
+                campaign, seller = self.create_campaign(options["rows"])
+            self.benchmark(campaign, seller, options["positions"])
+            transaction.set_rollback(True)
+
+    def create_campaign(self, rows):
+        start = time.time()
+        user = User.objects.create_user(username="benchmark-seller-console")
+        seller = Seller.objects.create(name="Benchmark", user=user)
+        campaign = Campaign.objects.create(name="Benchmark", active=True, priority=3)
+        contacts = Contact.objects.bulk_create(
+            (Contact(name="Benchmark {}".format(i)) for i in range(rows)), batch_size=5000
+        )
+        ContactCampaignStatus.objects.bulk_create(
+            (
+                ContactCampaignStatus(
+                    contact=contact,
+                    campaign=campaign,
+                    seller=seller,
+                    status=1,
+                    date_assigned=date.today() - timedelta(i % 60),
+                )
+                for i, contact in enumerate(contacts)
+            ),
+            batch_size=5000,
+        )
+        campaign.refresh_queue()
+        self.stdout.write("Created a campaign of {} contacts in {:.1f}s".format(rows, time.time() - start))
+        return campaign, seller
+
+    def view(self, campaign, seller, **params):
+        request = RequestFactory().get("/", params)
+        request.user = seller.user
+        view = SellerConsoleView()
+        view.setup(request, category="new", campaign_id=campaign.id)
+        return view
+
+    def measure(self, function):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        return elapsed * 1000, len(queries)
+
+    def benchmark(self, campaign, seller, positions):
+        statuses = campaign.get_not_contacted(seller.id)
+        rows = statuses.count()
+        if rows < 2:
+            raise CommandError("The seller has no contacts to call in the campaign")
+        offsets = sorted({1 + (rows - 1) * i // max(positions - 1, 1) for i in range(positions)})
+        row = "{:>10} {:>14} {:>9} {:>14} {:>9}"
+        self.stdout.write(row.format("position", "offset ms", "queries", "cursor ms", "queries"))
+        totals = [0.0, 0.0]
+        for offset in offsets:
+            # the cursor of a position is the key of the contact before it
+            cursor = encode_cursor("new", statuses[offset - 2]) if offset > 1 else ""
+
+            offset_view = self.view(campaign, seller, offset=offset)
+            offset_ms, offset_queries = self.measure(lambda: offset_view.get_offset_navigation(campaign, seller))
+            cursor_view = self.view(campaign, seller, cursor=cursor)
+            cursor_ms, cursor_queries = self.measure(lambda: cursor_view.get_console_window(campaign, seller))
+
+            totals[0] += offset_ms
+            totals[1] += cursor_ms
+            self.stdout.write(
+                row.format(offset, "%.1f" % offset_ms, offset_queries, "%.1f" % cursor_ms, cursor_queries)
+            )
+        self.stdout.write(
+            "Average: offset {:.1f} ms, cursor {:.1f} ms".format(totals[0] / len(offsets), totals[1] / len(offsets))
+        )
@@ -0,0 +1,51 @@
+# coding=utf-8
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from support.choices import CONTACT_IMPORT_STATUS
+from support.contact_import import CHUNK_SIZE, run_import
+from support.models import ContactImport
+
+
+class Command(BaseCommand):
+    help = """
+    Imports the contacts of the pending ContactImport objects, created by the import contacts view for large files.
+    Meant to run every minute from cron. The ids of imports that were interrupted or failed can be given to resume
+    them from the last chunk imported.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("import_ids", nargs="*", type=int)
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows imported in each transaction")
+
+    def claim(self, import_id=None):
+        """
+        Marks a pending import (or the one given) as started and returns it, so other runs skip it.
+        """
+        with transaction.atomic():
+            imports = ContactImport.objects.select_for_update(skip_locked=True).order_by("id")
+            if import_id:
+                contact_import = imports.exclude(status=CONTACT_IMPORT_STATUS.COMPLETED).filter(pk=import_id).first()
+            else:
+                contact_import = imports.filter(status=CONTACT_IMPORT_STATUS.PENDING).first()
+            if contact_import:
+                contact_import.status = CONTACT_IMPORT_STATUS.STARTED
+                contact_import.started = contact_import.started or timezone.now()
+                contact_import.save(update_fields=["status", "started"])
+            return contact_import
+
+    def handle(self, *args, **options):
+        import_ids = options["import_ids"] or [None]
+        while import_ids:
+            contact_import = self.claim(import_ids[0])
+            if options["import_ids"] or not contact_import:
+                import_ids.pop(0)
+            if not contact_import:
+                continue
+            run_import(contact_import, options["chunk_size"])
+            self.stdout.write(
+                "{}: {}, {} rows".format(
+                    contact_import, contact_import.get_status_display(), contact_import.processed_rows
+                )
+            )
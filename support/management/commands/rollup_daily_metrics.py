@@ -0,0 +1,51 @@
+# coding=utf-8
+from datetime import date, timedelta
+
+from django.core.management import BaseCommand, CommandError
+
+from support.daily_rollups import get_rollups
+
+
+class Command(BaseCommand):
+    help = """Aggregates the daily roll-up tables read by the statistics views (seller metrics, sales, unsubscriptions
+    and issues). By default only the days before today that aren't aggregated, or changed since, are aggregated, plus
+    the last --recent days, to include the changes that don't send signals: run it every night. Use --date to aggregate
+    again a single day, or --from (and --to) to backfill a range. --rollup limits it to some of the roll-ups."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rollup", action="append", choices=sorted(get_rollups()), help="Only this roll-up")
+        parser.add_argument("--date", type=date.fromisoformat, help="Aggregate this day (YYYY-MM-DD)")
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="Aggregate from this day")
+        parser.add_argument(
+            "--to", dest="date_to", type=date.fromisoformat, help="Aggregate up to this day, by default yesterday"
+        )
+        parser.add_argument(
+            "--recent", type=int, default=7, help="Aggregate again the last days along with the pending ones"
+        )
+
+    def handle(self, *args, **options):
+        yesterday = date.today() - timedelta(1)
+        if options["date"]:
+            days = [options["date"]]
+        elif options["date_from"]:
+            date_to = options["date_to"] or yesterday
+            if date_to < options["date_from"]:
+                raise CommandError("--to must be after --from")
+            days = [options["date_from"] + timedelta(i) for i in range((date_to - options["date_from"]).days + 1)]
+        else:
+            days = None
+        recent = [yesterday - timedelta(i) for i in range(options["recent"])]
+
+        for name, rollup in get_rollups().items():
+            if options["rollup"] and name not in options["rollup"]:
+                continue
+            aggregated = 0
+            for day in days or sorted(set(rollup.pending_days()) | set(recent)):
+                if day > yesterday:
+                    self.stderr.write("{} skipped, today and later days are always read live".format(day))
+                    continue
+                rows = rollup.rollup_day(day)
+                aggregated += 1
+                if options["verbosity"] > 1:
+                    self.stdout.write("{} {}: {} rows".format(name, day, rows))
+            self.stdout.write("{}: {} days aggregated".format(name, aggregated))
@@ -1,26 +1,51 @@
 # coding=utf-8
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.core.management import BaseCommand
 
+from core.mailtrain_sync import MailtrainClient, sync_filters
 from core.models import DynamicContactFilter
 
 
 class Command(BaseCommand):
-    help = """Syncs all Dynamic Contact Filters with mailtrain. It needs to have the 'autosync' attribute on."""
+    help = """Syncs all Dynamic Contact Filters with mailtrain. It needs to have the 'autosync' attribute on.
+    Several filters are synced at the same time, sharing a global limit of Mailtrain API requests per second."""
 
-    # This is left blank if it's necessary to add some arguments
-    # def add_arguments(self, parser):
-    #    # parser.add_argument('payment_type', type=str)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Filters synced at the same time (default: 4)"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.MAILTRAIN_SYNC_WORKERS,
+            help="Threads sending the calls of every filter (default: settings.MAILTRAIN_SYNC_WORKERS)",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.MAILTRAIN_API_RATE,
+            help="Maximum API requests per second for the whole run (default: settings.MAILTRAIN_API_RATE)",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only report the differences")
+        parser.add_argument(
+            "--report", action="store_true", help="Write the diff of every filter to a CSV file"
+        )
 
     def handle(self, *args, **options):
-        dc_filters = DynamicContactFilter.objects.filter(autosync=True)
+        dc_filters = DynamicContactFilter.objects.filter(autosync=True).exclude(mailtrain_id="")
         print(_("Started synchronization process"))
-        for dcf in dc_filters:
-            print(_("Started synchronizing filter {}".format(dcf.id)))
-            try:
-                dcf.sync_with_mailtrain_list()
-            except Exception as e:
-                print(_("There was an error synchronizing filter {}: {}".format(dcf.id, e)))
-            else:
-                print(_("Finished synchronizing filter {}".format(dcf.id)))
+        reports = sync_filters(
+            dc_filters,
+            MailtrainClient(rate=options["rate"]),
+            concurrency=options["concurrency"],
+            workers=options["workers"],
+            dry_run=options["dry_run"],
+        )
+        for report in reports:
+            print(report)
+            for email, action, error in report.errors[:10]:
+                print(_("There was an error synchronizing filter {}: {}".format(report.dcf.id, (action, email, error))))
+            if options["report"]:
+                print(_("Diff report written to {}".format(report.write_csv())))
         print(_("Finished synchronization process"))
@@ -18,5 +18,5 @@ class Command(BaseCommand):
             print(_("Cannot select filter"))
 
         print(_("Started synchronization process"))
-        dcf.sync_with_mailtrain_list()
+        print(dcf.sync_with_mailtrain_list())
         print(_("Finished synchronization process"))
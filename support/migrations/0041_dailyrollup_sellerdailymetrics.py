@@ -0,0 +1,75 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0121_contactcampaignstatus_ccs_last_action_date"),
+        ("support", "0040_absencereason_attendancerecord_shift_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyRollup",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=50)),
+                ("date", models.DateField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "daily roll-up",
+                "verbose_name_plural": "daily roll-ups",
+                "unique_together": {("name", "date")},
+            },
+        ),
+        migrations.CreateModel(
+            name="SellerDailyMetrics",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField()),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("not_contacted_yet", models.PositiveIntegerField(default=0)),
+                ("called", models.PositiveIntegerField(default=0)),
+                ("tried_to_contact", models.PositiveIntegerField(default=0)),
+                ("contacted", models.PositiveIntegerField(default=0)),
+                ("ended_without_contact", models.PositiveIntegerField(default=0)),
+                ("success", models.PositiveIntegerField(default=0)),
+                ("success_with_direct_sale", models.PositiveIntegerField(default=0)),
+                ("scheduled", models.PositiveIntegerField(default=0)),
+                ("call_later", models.PositiveIntegerField(default=0)),
+                ("unreachable", models.PositiveIntegerField(default=0)),
+                ("error_in_promotion", models.PositiveIntegerField(default=0)),
+                ("started_promotion", models.PositiveIntegerField(default=0)),
+                ("rejected", models.PositiveIntegerField(default=0)),
+                ("rejected_without_reason", models.PositiveIntegerField(default=0)),
+                ("with_resolution_contacted", models.PositiveIntegerField(default=0)),
+                ("with_resolution_not_contacted", models.PositiveIntegerField(default=0)),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="seller_daily_metrics",
+                        to="core.campaign",
+                    ),
+                ),
+                (
+                    "seller",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_metrics",
+                        to="support.seller",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "seller daily metrics",
+                "verbose_name_plural": "seller daily metrics",
+                "indexes": [models.Index(fields=["date", "seller"], name="seller_daily_metrics_date")],
+            },
+        ),
+    ]
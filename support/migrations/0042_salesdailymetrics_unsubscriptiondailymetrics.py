@@ -0,0 +1,73 @@
+# Generated by Django 4.2 on 2026-10-17 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0121_contactcampaignstatus_ccs_last_action_date"),
+        ("support", "0041_dailyrollup_sellerdailymetrics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesDailyMetrics",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField()),
+                ("sale_type", models.CharField(max_length=1)),
+                ("payment_type", models.CharField(max_length=2, null=True)),
+                ("frequency", models.PositiveSmallIntegerField()),
+                ("validated", models.BooleanField()),
+                ("products_count", models.PositiveSmallIntegerField()),
+                ("sales", models.PositiveIntegerField(default=0)),
+                ("commission", models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_daily_metrics",
+                        to="core.campaign",
+                    ),
+                ),
+                (
+                    "seller",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_daily_metrics",
+                        to="support.seller",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "sales daily metrics",
+                "verbose_name_plural": "sales daily metrics",
+                "indexes": [models.Index(fields=["date", "seller"], name="sales_daily_metrics_date")],
+            },
+        ),
+        migrations.CreateModel(
+            name="UnsubscriptionDailyMetrics",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField(db_index=True)),
+                ("reason", models.PositiveSmallIntegerField(null=True)),
+                ("unsubscriptions", models.PositiveIntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="unsubscription_daily_metrics",
+                        to="core.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "unsubscription daily metrics",
+                "verbose_name_plural": "unsubscription daily metrics",
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-17 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("support", "0042_salesdailymetrics_unsubscriptiondailymetrics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContactImport",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created", models.DateTimeField(auto_now_add=True, verbose_name="Created")),
+                ("started", models.DateTimeField(blank=True, null=True, verbose_name="Started")),
+                ("finished", models.DateTimeField(blank=True, null=True, verbose_name="Finished")),
+                ("file", models.FileField(upload_to="contact_imports/", verbose_name="File")),
+                ("use_headers", models.BooleanField(default=True, verbose_name="CSV file has headers")),
+                ("tags", models.JSONField(default=dict, verbose_name="Tags")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("P", "Pending"), ("S", "Started"), ("C", "Completed"), ("F", "Failed")],
+                        default="P",
+                        max_length=1,
+                        verbose_name="Status",
+                    ),
+                ),
+                ("total_rows", models.PositiveIntegerField(default=0, verbose_name="Rows")),
+                ("processed_rows", models.PositiveIntegerField(default=0, verbose_name="Processed rows")),
+                ("results", models.JSONField(default=dict, verbose_name="Results")),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "contact import",
+                "verbose_name_plural": "contact imports",
+                "ordering": ["-id"],
+            },
+        ),
+    ]
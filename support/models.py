@@ -15,6 +15,7 @@ from core.models import Campaign
 from simple_history.models import HistoricalRecords
 
 from support.choices import (
+    CONTACT_IMPORT_STATUS,
     get_issue_categories,
     ISSUE_ANSWERS,
     ISSUE_SUBCATEGORIES,
@@ -762,3 +763,137 @@ class SellerAttendance(models.Model):
         unique_together = [("record", "seller")]
         verbose_name = _("seller attendance")
         verbose_name_plural = _("seller attendances")
+
+
+class DailyRollup(models.Model):
+    """
+    Days aggregated in a daily roll-up table, by the name of the roll-up. The rows of a day are only read while its
+    DailyRollup exists, the days without one are read from the transactional tables until they're aggregated (again).
+    """
+
+    name = models.CharField(max_length=50)
+    date = models.DateField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{} {}".format(self.name, self.date)
+
+    class Meta:
+        unique_together = [("name", "date")]
+        verbose_name = _("daily roll-up")
+        verbose_name_plural = _("daily roll-ups")
+
+
+class SellerDailyMetrics(models.Model):
+    """
+    Counts of the ContactCampaignStatus objects by the day of their last action, campaign and seller (see
+    support.seller_metrics for the definition of each count).
+    """
+
+    date = models.DateField()
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="seller_daily_metrics")
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, null=True, related_name="daily_metrics")
+    total = models.PositiveIntegerField(default=0)
+    not_contacted_yet = models.PositiveIntegerField(default=0)
+    called = models.PositiveIntegerField(default=0)
+    tried_to_contact = models.PositiveIntegerField(default=0)
+    contacted = models.PositiveIntegerField(default=0)
+    ended_without_contact = models.PositiveIntegerField(default=0)
+    success = models.PositiveIntegerField(default=0)
+    success_with_direct_sale = models.PositiveIntegerField(default=0)
+    scheduled = models.PositiveIntegerField(default=0)
+    call_later = models.PositiveIntegerField(default=0)
+    unreachable = models.PositiveIntegerField(default=0)
+    error_in_promotion = models.PositiveIntegerField(default=0)
+    started_promotion = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    rejected_without_reason = models.PositiveIntegerField(default=0)
+    with_resolution_contacted = models.PositiveIntegerField(default=0)
+    with_resolution_not_contacted = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["date", "seller"], name="seller_daily_metrics_date")]
+        verbose_name = _("seller daily metrics")
+        verbose_name_plural = _("seller daily metrics")
+
+
+class SalesDailyMetrics(models.Model):
+    """
+    Sales records and their commission by day, seller, campaign, sale type, payment type, frequency and validation of
+    the subscription, and number of products sold (see support.daily_rollups).
+    """
+
+    date = models.DateField()
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, null=True, related_name="sales_daily_metrics")
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, null=True, related_name="sales_daily_metrics")
+    sale_type = models.CharField(max_length=1)
+    payment_type = models.CharField(max_length=2, null=True)
+    frequency = models.PositiveSmallIntegerField()
+    validated = models.BooleanField()
+    products_count = models.PositiveSmallIntegerField()
+    sales = models.PositiveIntegerField(default=0)
+    commission = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["date", "seller"], name="sales_daily_metrics_date")]
+        verbose_name = _("sales daily metrics")
+        verbose_name_plural = _("sales daily metrics")
+
+
+class UnsubscriptionDailyMetrics(models.Model):
+    """
+    Unsubscribed products by day of end of the subscription, product and unsubscription reason (see
+    support.daily_rollups).
+    """
+
+    date = models.DateField(db_index=True)
+    product = models.ForeignKey("core.Product", on_delete=models.CASCADE, related_name="unsubscription_daily_metrics")
+    reason = models.PositiveSmallIntegerField(null=True)
+    unsubscriptions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("unsubscription daily metrics")
+        verbose_name_plural = _("unsubscription daily metrics")
+
+
+class ContactImport(models.Model):
+    """
+    A CSV file of contacts imported in the background by the process_contact_imports command (see
+    support.contact_import), with its progress and results.
+    """
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_("Created"))
+    started = models.DateTimeField(null=True, blank=True, verbose_name=_("Started"))
+    finished = models.DateTimeField(null=True, blank=True, verbose_name=_("Finished"))
+    file = models.FileField(upload_to="contact_imports/", verbose_name=_("File"))
+    use_headers = models.BooleanField(default=True, verbose_name=_("CSV file has headers"))
+    tags = models.JSONField(default=dict, verbose_name=_("Tags"))
+    status = models.CharField(
+        max_length=1, choices=CONTACT_IMPORT_STATUS.choices, default=CONTACT_IMPORT_STATUS.PENDING,
+        verbose_name=_("Status"),
+    )
+    total_rows = models.PositiveIntegerField(default=0, verbose_name=_("Rows"))
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name=_("Processed rows"))
+    results = models.JSONField(default=dict, verbose_name=_("Results"))
+
+    def __str__(self):
+        return "{} {}".format(_("Contact import"), self.id)
+
+    def progress(self):
+        """
+        Returns the percentage of rows processed.
+        """
+        if self.status == CONTACT_IMPORT_STATUS.COMPLETED:
+            return "100.00"
+        if self.total_rows > 0:
+            return "{0:.2f}".format(float(self.processed_rows) * 100 / float(self.total_rows))
+        return 0
+
+    def is_running(self):
+        return self.status in (CONTACT_IMPORT_STATUS.PENDING, CONTACT_IMPORT_STATUS.STARTED)
+
+    class Meta:
+        verbose_name = _("contact import")
+        verbose_name_plural = _("contact imports")
+        ordering = ["-id"]
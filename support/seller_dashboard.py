@@ -0,0 +1,168 @@
+# coding=utf-8
+"""
+Counters of the seller console dashboard (seller_console_list_campaigns).
+
+All the counters of a seller are computed with a few grouped queries, instead of a handful of counts per campaign and
+per special route, and cached for SELLER_CONSOLE_DASHBOARD_CACHE_TIMEOUT seconds (60 by default). The signals in
+support.signals drop the cached counters of a seller when their activities or campaign statuses change, so the seller
+sees the result of their own calls right away. Other changes (like bulk updates, or issues) show up when the cache
+expires.
+
+The cached data only has plain values, the campaigns are dicts with their id, name and end_date.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.choices import ACTIVITY_STATUS
+from core.models import Activity, Campaign, ContactCampaignStatus, SubscriptionProduct
+from core.utils import logistics_is_installed
+from support.models import Issue
+
+
+def cache_key(seller_id):
+    return "seller_dashboard:{}".format(seller_id)
+
+
+def get_dashboard(seller):
+    """
+    Returns the counters of the dashboard of the seller, from the cache when they're there.
+    """
+    dashboard = cache.get(cache_key(seller.id))
+    if dashboard is None:
+        dashboard = compute_dashboard(seller)
+        cache.set(
+            cache_key(seller.id), dashboard, getattr(settings, "SELLER_CONSOLE_DASHBOARD_CACHE_TIMEOUT", 60)
+        )
+    return dashboard
+
+
+def invalidate(seller_id):
+    """
+    Drops the cached counters of the seller when the current transaction commits.
+    """
+    if seller_id:
+        transaction.on_commit(lambda: cache.delete(cache_key(seller_id)))
+
+
+def compute_dashboard(seller):
+    dashboard = activity_counters(seller)
+    activity_campaigns = dashboard["campaigns_with_activities_to_do"]
+    dashboard["campaigns_with_not_contacted"], successful = campaign_counters(
+        seller, [campaign["id"] for campaign in activity_campaigns]
+    )
+    for campaign in activity_campaigns:
+        campaign["successful"] = successful.get(campaign["id"], 0)
+    dashboard["issues_never_paid_count"] = issues_never_paid_count(seller)
+    if logistics_is_installed():
+        dashboard["special_routes"] = special_routes(seller)
+    return dashboard
+
+
+def activity_counters(seller):
+    """
+    The campaigns with pending calls of the seller up to now and their count, and the count of pending and expired
+    calls, in one query.
+    """
+    rows = (
+        Activity.objects.filter(
+            seller=seller,
+            activity_type="C",
+            status__in=(ACTIVITY_STATUS.PENDING, ACTIVITY_STATUS.EXPIRED),
+            datetime__lte=timezone.now(),
+        )
+        .values("campaign_id", "campaign__name", "campaign__end_date")
+        .annotate(total=Count("id"), pending=Count("id", filter=Q(status=ACTIVITY_STATUS.PENDING)))
+        .order_by("-campaign__active", "campaign__priority", "campaign__name")
+    )
+    campaigns, total = [], 0
+    for row in rows:
+        total += row["total"]
+        if row["campaign_id"] and row["pending"]:
+            campaigns.append(
+                {
+                    "id": row["campaign_id"],
+                    "name": row["campaign__name"],
+                    "end_date": row["campaign__end_date"],
+                    "pending": row["pending"],
+                }
+            )
+    return {"campaigns_with_activities_to_do": campaigns, "total_pending_activities": total}
+
+
+def campaign_counters(seller, activity_campaign_ids):
+    """
+    The active campaigns where the seller has contacts not contacted or to call again, with the size of their queue,
+    and the successful sales of those campaigns and of the ones with activities as {campaign_id: count}, in one query.
+    """
+    # the queues are built on first use, see Campaign.get_queue
+    for campaign in Campaign.objects.filter(
+        active=True, queue_refreshed__isnull=True, contactcampaignstatus__seller=seller
+    ).distinct():
+        campaign.refresh_queue()
+
+    rows = (
+        ContactCampaignStatus.objects.filter(
+            Q(campaign__active=True) | Q(campaign_id__in=activity_campaign_ids), seller=seller
+        )
+        .values("campaign_id", "campaign__name", "campaign__end_date", "campaign__active")
+        .annotate(
+            to_call=Count("id", filter=Q(status__in=[1, 3])),
+            count=Count("queue_entry"),
+            successful=Count("id", filter=Q(campaign_resolution__in=["S1", "S2"])),
+        )
+        .order_by("-campaign__active", "campaign__priority", "campaign__name")
+    )
+    campaigns, successful = [], {}
+    for row in rows:
+        successful[row["campaign_id"]] = row["successful"]
+        if row["campaign__active"] and row["to_call"]:
+            campaigns.append(
+                {
+                    "id": row["campaign_id"],
+                    "name": row["campaign__name"],
+                    "end_date": row["campaign__end_date"],
+                    "count": row["count"],
+                    "successful": row["successful"],
+                }
+            )
+    return campaigns, successful
+
+
+def issues_never_paid_count(seller):
+    if not getattr(settings, "ISSUE_SUBCATEGORY_NEVER_PAID", None) or not getattr(
+        settings, "ISSUE_STATUS_FINISHED_LIST", None
+    ):
+        return 0
+    return (
+        Issue.objects.filter(sub_category__slug=settings.ISSUE_SUBCATEGORY_NEVER_PAID, assigned_to=seller.user_id)
+        .exclude(status__slug__in=settings.ISSUE_STATUS_FINISHED_LIST)
+        .count()
+    )
+
+
+def special_routes(seller):
+    """
+    The special routes with products sold by the seller in subscriptions started in the last 45 days (today included),
+    as {route_id: (route name, count)} in the order of SPECIAL_ROUTES_FOR_SELLERS_LIST, in one query.
+    """
+    route_ids = getattr(settings, "SPECIAL_ROUTES_FOR_SELLERS_LIST", [])
+    if not route_ids:
+        return {}
+    counters = {
+        row["route_id"]: (row["route__name"], row["count"])
+        for row in SubscriptionProduct.objects.filter(
+            seller=seller,
+            route_id__in=route_ids,
+            subscription__active=True,
+            subscription__start_date__gte=datetime.now() - timedelta(days=45),
+        )
+        .values("route_id", "route__name")
+        .annotate(count=Count("id"))
+        .order_by()
+    }
+    return {route_id: counters[route_id] for route_id in route_ids if route_id in counters}
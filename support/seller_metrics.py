@@ -0,0 +1,117 @@
+# coding=utf-8
+"""
+Counts of ContactCampaignStatus objects used by the seller and campaign statistics.
+
+Every count of METRICS is computed in a single query, optionally grouped by some fields (like the seller), instead of
+one count() per metric and seller.
+
+The counts by seller for a range of days of last action come from a daily roll-up table, SellerDailyMetrics, for the
+days already aggregated, and from ContactCampaignStatus for the rest (today, and the days changed since they were
+aggregated), see support.daily_rollups. A day stops being read from the table (see DailyRollup) as soon as a status of
+that day is saved or deleted, because saving a status moves it to today. The rollup_daily_metrics command aggregates
+the pending days every night.
+
+Updates that don't send signals (queryset update() and bulk writes) don't mark their days as changed: call
+SELLER_METRICS.rows_changed() with the queryset before the update (like the views that release the contacts of a
+seller do), or run rollup_daily_metrics with --date or --from for them.
+"""
+from django.db.models import Count, Q
+
+from core.choices import get_contacted_statuses
+from core.models import ContactCampaignStatus
+from support.daily_rollups import Rollup
+from support.models import SellerDailyMetrics
+
+
+ROLLUP_NAME = "seller_metrics"
+REJECTED_RESOLUTIONS = ("AS", "DN", "LO", "NI")
+
+METRICS = {
+    "total": None,
+    "not_contacted_yet": Q(status=1),
+    "called": Q(status__gte=2),
+    "tried_to_contact": Q(status=3),
+    "contacted": Q(status__in=get_contacted_statuses()),
+    "ended_without_contact": Q(status=5),
+    "success": Q(campaign_resolution__in=("S1", "S2")),
+    "success_with_direct_sale": Q(campaign_resolution="S2"),
+    "scheduled": Q(campaign_resolution="SC"),
+    "call_later": Q(campaign_resolution="CL"),
+    "unreachable": Q(campaign_resolution="UN"),
+    "error_in_promotion": Q(campaign_resolution="EP"),
+    "started_promotion": Q(campaign_resolution="SP"),
+    "rejected": Q(campaign_resolution__in=REJECTED_RESOLUTIONS),
+    "rejected_without_reason": Q(campaign_resolution__in=REJECTED_RESOLUTIONS, resolution_reason__isnull=True),
+    "with_resolution_contacted": Q(campaign_resolution__isnull=False, status__in=get_contacted_statuses()),
+    "with_resolution_not_contacted": Q(campaign_resolution__isnull=False, status__in=[3, 5]),
+}
+
+
+def empty_metrics():
+    return dict.fromkeys(METRICS, 0)
+
+
+def pct(count, total):
+    return (count * 100) / (total or 1)
+
+
+def count_metrics(queryset, *group_by):
+    """
+    Counts every metric of the ContactCampaignStatus queryset in one query. Without group_by returns a dict with the
+    counts, otherwise a dict of them by the value of the field (or the tuple of values of the fields) of each group.
+    """
+    annotations = {name: Count("id", filter=condition) for name, condition in METRICS.items()}
+    if not group_by:
+        return queryset.aggregate(**annotations)
+    return group_rows(queryset.values(*group_by).annotate(**annotations).order_by(), group_by)
+
+
+def group_rows(rows, group_by):
+    groups = {}
+    for row in rows:
+        key = tuple(row[field] for field in group_by)
+        groups[key[0] if len(key) == 1 else key] = {name: row[name] or 0 for name in METRICS}
+    return groups
+
+
+SELLER_METRICS = Rollup(
+    ROLLUP_NAME,
+    SellerDailyMetrics,
+    ContactCampaignStatus.objects.all(),
+    "last_action_date",
+    dimensions={"campaign_id": "campaign_id", "seller_id": "seller_id"},
+    measures={name: Count("id", filter=condition) for name, condition in METRICS.items()},
+)
+
+
+def metrics_by_seller(date_from, date_to, campaign=None):
+    """
+    Returns the counts of the statuses whose last action was in the range, by seller id (None for the statuses without
+    seller), in two queries whatever the length of the range.
+    """
+    filters = {"campaign_id": campaign.id} if campaign else {}
+    return SELLER_METRICS.read(["seller_id"], date_from, date_to, **filters)
+
+
+def rollup_day(day):
+    """
+    Aggregates the statuses whose last action was on the day into SellerDailyMetrics.
+    """
+    return SELLER_METRICS.rollup_day(day)
+
+
+def pending_days(until=None):
+    return SELLER_METRICS.pending_days(until)
+
+
+def status_changing(instance):
+    """
+    Called before a ContactCampaignStatus is saved: the day of its previous last action stops being read from the
+    aggregated rows, since the status moves to today.
+    """
+    if instance.pk:
+        SELLER_METRICS.rows_changed(ContactCampaignStatus.objects.filter(pk=instance.pk))
+
+
+def status_deleted(instance):
+    SELLER_METRICS.days_changed(instance.last_action_date)
@@ -0,0 +1,101 @@
+# coding=utf-8
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Activity, ContactCampaignStatus, Subscription
+from core.utils import logistics_is_installed
+from support.models import Issue, SalesRecord
+
+from . import daily_rollups, seller_dashboard, seller_metrics
+
+
+# The cached dashboard counters of a seller are dropped when their activities or campaign statuses change (see
+# support.seller_dashboard).
+
+
+@receiver([post_save, post_delete], sender=Activity)
+@receiver([post_save, post_delete], sender=ContactCampaignStatus)
+def seller_dashboard_changed(sender, instance, **kwargs):
+    seller_dashboard.invalidate(instance.seller_id)
+
+
+# A day of the seller metrics roll-up is read again from ContactCampaignStatus when one of its statuses is saved or
+# deleted (see support.seller_metrics).
+
+
+@receiver(pre_save, sender=ContactCampaignStatus)
+def seller_metrics_status_changing(sender, instance, **kwargs):
+    seller_metrics.status_changing(instance)
+
+
+@receiver(post_delete, sender=ContactCampaignStatus)
+def seller_metrics_status_deleted(sender, instance, **kwargs):
+    seller_metrics.status_deleted(instance)
+
+
+# The same for the days of the other daily roll-ups (see support.daily_rollups): the days before the changes on
+# pre_save, the days after them on post_save and post_delete.
+
+
+@receiver(pre_save, sender=SalesRecord)
+def sales_record_changing(sender, instance, **kwargs):
+    if instance.pk:
+        daily_rollups.SALES.rows_changed(SalesRecord.objects.filter(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=SalesRecord)
+def sales_record_changed(sender, instance, **kwargs):
+    daily_rollups.SALES.days_changed(instance.date_time and instance.date_time.date())
+
+
+@receiver(m2m_changed, sender=SalesRecord.products.through)
+def sales_record_products_changed(sender, instance, action, **kwargs):
+    if action.startswith("post_") and isinstance(instance, SalesRecord):
+        daily_rollups.SALES.days_changed(instance.date_time.date())
+
+
+# The fields of a subscription read by the sales roll-up (through its sales records) and the unsubscriptions roll-up.
+# Saving a subscription without changing them (like billing does) doesn't drop any day.
+ROLLUP_SUBSCRIPTION_FIELDS = (
+    "payment_type", "frequency", "validated", "start_date", "end_date", "unsubscription_reason"
+)
+
+
+@receiver(pre_save, sender=Subscription)
+def rollups_subscription_changing(sender, instance, update_fields=None, **kwargs):
+    fields = [field for field in ROLLUP_SUBSCRIPTION_FIELDS if update_fields is None or field in update_fields]
+    previous = None
+    if instance.pk and fields:
+        previous = Subscription.objects.filter(pk=instance.pk).values(*fields).first()
+    if previous is None:
+        # a new subscription has no sales records yet
+        instance.rollups_changed = bool(fields)
+        return
+    instance.rollups_changed = any(previous[field] != getattr(instance, field) for field in fields)
+    if instance.rollups_changed:
+        daily_rollups.SALES.rows_changed(SalesRecord.objects.filter(subscription_id=instance.pk))
+        daily_rollups.UNSUBSCRIPTIONS.days_changed(previous.get("end_date"))
+
+
+@receiver(post_save, sender=Subscription)
+def rollups_subscription_changed(sender, instance, **kwargs):
+    if getattr(instance, "rollups_changed", True):
+        daily_rollups.UNSUBSCRIPTIONS.days_changed(instance.end_date)
+
+
+@receiver(m2m_changed, sender=Subscription.unsubscription_products.through)
+def unsubscription_products_changed(sender, instance, action, **kwargs):
+    if action.startswith("post_") and isinstance(instance, Subscription):
+        daily_rollups.UNSUBSCRIPTIONS.days_changed(instance.end_date)
+
+
+if logistics_is_installed():
+
+    @receiver(pre_save, sender=Issue)
+    def rollups_issue_changing(sender, instance, **kwargs):
+        if instance.pk:
+            daily_rollups.ISSUES.rows_changed(Issue.objects.filter(pk=instance.pk))
+
+    @receiver([post_save, post_delete], sender=Issue)
+    def rollups_issue_changed(sender, instance, **kwargs):
+        daily_rollups.ISSUES.days_changed(instance.date)
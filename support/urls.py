@@ -93,6 +93,7 @@ urlpatterns = [
     re_path(r"^edit_address/(\d+)/$", edit_address),
     re_path(r"^edit_address/(\d+)/(\d+)/$", edit_address),
     path("import/", views.ImportContactsView.as_view(), name="import_contacts"),
+    path("import/<int:pk>/", views.ContactImportDetailView.as_view(), name="contact_import_detail"),
     path("send_promo/<int:contact_id>/", send_promo, name="send_promo"),
     path("update_promo/<int:subscription_id>/", update_promo, name="update_promo"),
     path(
@@ -294,6 +295,13 @@ urlpatterns = [
         name="check_for_existing_contacts",
     ),
     path("tag_analysis/", views.TagAnalysisView.as_view(), name="tag_analysis"),
+    path(
+        "duplicate_contacts/",
+        views.DuplicateContactCandidatesView.as_view(),
+        name="duplicate_contact_candidates",
+    ),
+    path("merge_contacts/", views.MergeCompareContactsView.as_view(), name="merge_compare_contacts"),
+    path("process_merge_contacts/", views.ProcessMergeContactsView.as_view(), name="process_merge_contacts"),
     path(
         "last_read_articles/<int:contact_id>/",
         views.last_read_articles,
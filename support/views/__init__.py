@@ -12,9 +12,13 @@ from .contacts import (  # noqa
     ContactListView,
     ContactUpdateView,
     ImportContactsView,
+    ContactImportDetailView,
     contact_invoices_htmx,
     CheckForExistingContactsView,
     TagAnalysisView,
+    DuplicateContactCandidatesView,
+    MergeCompareContactsView,
+    ProcessMergeContactsView,
 )
 from .scheduled_tasks import (  # noqa
     new_scheduled_task_address_change,
@@ -2,6 +2,7 @@ import calendar
 import csv
 import io
 import json
+from collections import defaultdict
 from datetime import date, datetime, timedelta
 
 import pandas as pd
@@ -45,6 +46,8 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from taggit.models import Tag
 
 from core import choices as core_choices
+from core.campaign_queue import deferred_refresh, refresh_contacts
+from core.do_not_call import sync_numbers
 from core.filters import ContactFilter
 from core.forms import AddressForm
 from core.mixins import BreadcrumbsMixin
@@ -54,7 +57,6 @@ from core.models import (
     Campaign,
     Contact,
     ContactCampaignStatus,
-    DoNotCallNumber,
     DynamicContactFilter,
     Product,
     Subscription,
@@ -103,6 +105,9 @@ from support.models import (
     ATTENDANCE_STATUS_ABSENT,
     ATTENDANCE_STATUS_PRESENT,
 )
+from support import seller_metrics
+from support.daily_rollups import MAX_PRODUCTS_COUNT, SALES, SPECIAL_PRODUCT_SLUG, use_rollups
+from support.seller_metrics import pct
 
 now = datetime.now()
 
@@ -191,20 +196,21 @@ class AssignCampaignsView(LoginRequiredMixin, BreadcrumbsMixin, TemplateView):
 
             # Process contacts
             contacts = Contact.objects.filter(tags__name__in=tag_list)
-            for contact in contacts.iterator():
-                try:
-                    if request.POST.get("ignore_in_active_campaign", False):
-                        if contact.contactcampaignstatus_set.filter(campaign__active=True).exists():
-                            in_campaign += 1
-                            continue
-                    if request.POST.get("ignore_debtors", False):
-                        if contact.is_debtor():
-                            debtors += 1
-                            continue
-                    contact.add_to_campaign(campaign)
-                    count += 1
-                except Exception:
-                    errors += 1
+            with deferred_refresh():
+                for contact in contacts.iterator():
+                    try:
+                        if request.POST.get("ignore_in_active_campaign", False):
+                            if contact.contactcampaignstatus_set.filter(campaign__active=True).exists():
+                                in_campaign += 1
+                                continue
+                        if request.POST.get("ignore_debtors", False):
+                            if contact.is_debtor():
+                                debtors += 1
+                                continue
+                        contact.add_to_campaign(campaign)
+                        count += 1
+                    except Exception:
+                        errors += 1
 
             # Set messages
             messages.success(request, f"{count} contactos fueron agregados a la campaña con éxito.")
@@ -480,18 +486,19 @@ class AssignSellerView(LoginRequiredMixin, BreadcrumbsMixin, TemplateView):
             contacts_to_assign = list(self.ccs_qs[:assigned_total])
 
             # Assign contacts using round-robin distribution
-            for i, contact_status in enumerate(contacts_to_assign):
-                if i < len(assignment_queue):
-                    seller_id = assignment_queue[i]
-                    contact_status.seller = Seller.objects.get(pk=seller_id)
-                    contact_status.date_assigned = date.today()
-                    if contact_status.status in (6, 7):
-                        contact_status.status = 1
-                    try:
-                        contact_status.save()
-                    except Exception as e:
-                        messages.error(request, e)
-                        return HttpResponseRedirect(reverse("assign_sellers"))
+            with deferred_refresh():
+                for i, contact_status in enumerate(contacts_to_assign):
+                    if i < len(assignment_queue):
+                        seller_id = assignment_queue[i]
+                        contact_status.seller = Seller.objects.get(pk=seller_id)
+                        contact_status.date_assigned = date.today()
+                        if contact_status.status in (6, 7):
+                            contact_status.status = 1
+                        try:
+                            contact_status.save()
+                        except Exception as e:
+                            messages.error(request, e)
+                            return HttpResponseRedirect(reverse("assign_sellers"))
 
         messages.success(request, f"{assigned_total} contactos fueron repartidos con éxito.")
 
@@ -519,7 +526,13 @@ def release_seller_contacts(request, seller_id=None):
 
     if seller_id:
         seller = get_object_or_404(Seller, pk=seller_id)
-        seller.contactcampaignstatus_set.filter(status__lt=4).update(seller=None)
+        released = seller.contactcampaignstatus_set.filter(status__lt=4)
+        contact_ids = list(released.values_list("contact_id", flat=True))
+        # update() doesn't send the signals that drop the rolled-up days of the seller metrics and refresh the
+        # campaign queues
+        seller_metrics.SELLER_METRICS.rows_changed(released)
+        released.update(seller=None)
+        refresh_contacts(contact_ids)
         messages.success(request, f"Los contactos de {seller} fueron liberados")
         return HttpResponseRedirect(reverse("release_seller_contacts"))
     else:
@@ -545,7 +558,13 @@ def release_seller_contacts_by_campaign(request, seller_id, campaign_id=None):
     active_campaigns = seller_obj.get_active_campaigns()
     if campaign_id:
         campaign_obj = get_object_or_404(Campaign, pk=campaign_id)
-        seller_obj.contactcampaignstatus_set.filter(status__lt=4, campaign=campaign_obj).update(seller=None)
+        released = seller_obj.contactcampaignstatus_set.filter(status__lt=4, campaign=campaign_obj)
+        contact_ids = list(released.values_list("contact_id", flat=True))
+        # update() doesn't send the signals that drop the rolled-up days of the seller metrics and refresh the
+        # campaign queues
+        seller_metrics.SELLER_METRICS.rows_changed(released)
+        released.update(seller=None)
+        refresh_contacts(contact_ids)
         messages.success(request, f"Los contactos de {seller_obj} fueron liberados de la campaña {campaign_obj.name}")
         return HttpResponseRedirect(reverse("release_seller_contacts"))
     else:
@@ -1905,9 +1924,22 @@ def sync_with_mailtrain(request, dcf_id):
         )
         return HttpResponseRedirect(reverse("dynamic_contact_filter_edit", args=[dcf.id]))
     try:
-        dcf.sync_with_mailtrain_list()
+        report = dcf.sync_with_mailtrain_list()
     except Exception as e:
         messages.error(request, _(f"Error: {e}"))
+    else:
+        if report.ok:
+            messages.success(
+                request,
+                _("Synchronized: {} emails added and {} removed").format(len(report.added), len(report.removed)),
+            )
+        else:
+            messages.warning(
+                request,
+                _("Synchronized with {} errors: {} emails added and {} removed. First error: {}").format(
+                    len(report.errors), len(report.added), len(report.removed), report.errors[0][2]
+                ),
+            )
     return HttpResponseRedirect(reverse("dynamic_contact_filter_edit", args=[dcf.id]))
 
 
@@ -2174,19 +2206,23 @@ def debtor_contacts(request):
 @staff_member_required
 def campaign_statistics_list(request):
     campaigns_filter = CampaignFilter(request.GET, queryset=Campaign.objects.all())
+    campaign_ids = campaigns_filter.qs.values("id")
+    if use_rollups(request):
+        metrics = seller_metrics.SELLER_METRICS.read(["campaign_id"], campaign_id__in=campaign_ids)
+    else:
+        metrics = seller_metrics.count_metrics(
+            ContactCampaignStatus.objects.filter(campaign__in=campaign_ids), "campaign_id"
+        )
     for campaign in campaigns_filter.qs:
-        contacts = campaign.contactcampaignstatus_set.count() or 1
-        campaign.called_count = campaign.contactcampaignstatus_set.filter(status__gte=2).count()
-        campaign.called_pct = (campaign.called_count * 100) / contacts
-        campaign.contacted_count = campaign.contactcampaignstatus_set.filter(
-            status__in=core_choices.get_contacted_statuses()
-        ).count()
-        campaign.contacted_pct = (campaign.contacted_count * 100) / (campaign.called_count or 1)
-        campaign.success_count = campaign.contactcampaignstatus_set.filter(
-            campaign_resolution__in=("S1", "S2")
-        ).count()
-        campaign.success_over_total_pct = (campaign.success_count * 100) / (contacts or 1)
-        campaign.success_over_contacted_pct = (campaign.success_count * 100) / (campaign.contacted_count or 1)
+        counts = metrics.get(campaign.id) or seller_metrics.empty_metrics()
+        contacts = counts["total"] or 1
+        campaign.called_count = counts["called"]
+        campaign.called_pct = pct(campaign.called_count, contacts)
+        campaign.contacted_count = counts["contacted"]
+        campaign.contacted_pct = pct(campaign.contacted_count, campaign.called_count)
+        campaign.success_count = counts["success"]
+        campaign.success_over_total_pct = pct(campaign.success_count, contacts)
+        campaign.success_over_contacted_pct = pct(campaign.success_count, campaign.contacted_count)
     return render(
         request,
         "campaign_statistics_list.html",
@@ -2357,89 +2393,86 @@ class CampaignStatisticsDetailView(BreadcrumbsMixin, UserPassesTestMixin, Filter
 
         # Get filtered queryset
         filtered_qs = context['filter'].qs
-        filtered_count = filtered_qs.count()
+
+        # Every count of the campaign by seller, and of the filtered queryset, in one query each
+        campaign_metrics = seller_metrics.count_metrics(self.campaign.contactcampaignstatus_set.all(), "seller_id")
+        metrics = seller_metrics.count_metrics(filtered_qs)
+        filtered_count = metrics['total']
 
         # Basic counts
-        context['total_count'] = self.campaign.contactcampaignstatus_set.count()
-        context['assigned_count'] = self.campaign.contactcampaignstatus_set.filter(seller__isnull=False).count()
-        context['not_assigned_count'] = self.campaign.contactcampaignstatus_set.filter(seller__isnull=True).count()
+        context['total_count'] = sum(counts['total'] for counts in campaign_metrics.values())
+        context['not_assigned_count'] = campaign_metrics.get(None, {}).get('total', 0)
+        context['assigned_count'] = context['total_count'] - context['not_assigned_count']
         context['filtered_count'] = filtered_count
 
         # Status counts from filtered queryset
-        context['not_contacted_yet_count'] = filtered_qs.filter(status=1).count()
-        context['tried_to_contact_count'] = filtered_qs.filter(status=3).count()
-        context['contacted_count'] = filtered_qs.filter(status__in=core_choices.get_contacted_statuses()).count()
-        context['could_not_contact_count'] = filtered_qs.filter(status=5).count()
-        called_count = filtered_qs.filter(status__gte=2).count()
+        context['not_contacted_yet_count'] = metrics['not_contacted_yet']
+        context['tried_to_contact_count'] = metrics['tried_to_contact']
+        context['contacted_count'] = metrics['contacted']
+        context['could_not_contact_count'] = metrics['ended_without_contact']
+        called_count = metrics['called']
 
         # Percentages
-        context['not_contacted_yet_pct'] = float((context['not_contacted_yet_count'] * 100) / (filtered_count or 1))
-        context['tried_to_contact_pct'] = float((context['tried_to_contact_count'] * 100) / (filtered_count or 1))
-        context['contacted_pct'] = (context['contacted_count'] * 100) / (called_count or 1)
-        context['could_not_contact_pct'] = (context['could_not_contact_count'] * 100) / (filtered_count or 1)
+        context['not_contacted_yet_pct'] = float(pct(context['not_contacted_yet_count'], filtered_count))
+        context['tried_to_contact_pct'] = float(pct(context['tried_to_contact_count'], filtered_count))
+        context['contacted_pct'] = pct(context['contacted_count'], called_count)
+        context['could_not_contact_pct'] = pct(context['could_not_contact_count'], filtered_count)
 
         # Resolution statistics
-        ccs_with_resolution = filtered_qs.filter(campaign_resolution__isnull=False)
-        ccs_with_resolution_contacted_count = ccs_with_resolution.filter(
-            status__in=core_choices.get_contacted_statuses()
-        ).count()
-        ccs_with_resolution_not_contacted_count = ccs_with_resolution.filter(status__in=[3, 5]).count()
-
-        context['success_with_direct_sale_count'] = ccs_with_resolution.filter(campaign_resolution="S2").count()
-        context['scheduled_count'] = ccs_with_resolution.filter(campaign_resolution="SC").count()
-        context['call_later_count'] = ccs_with_resolution.filter(campaign_resolution="CL").count()
-        context['unreachable_count'] = ccs_with_resolution.filter(campaign_resolution="UN").count()
-        context['error_in_promotion_count'] = ccs_with_resolution.filter(campaign_resolution="EP").count()
-        context['started_promotion_count'] = ccs_with_resolution.filter(campaign_resolution="SP").count()
+        ccs_with_resolution_contacted_count = metrics['with_resolution_contacted']
+        ccs_with_resolution_not_contacted_count = metrics['with_resolution_not_contacted']
+
+        context['success_with_direct_sale_count'] = metrics['success_with_direct_sale']
+        context['scheduled_count'] = metrics['scheduled']
+        context['call_later_count'] = metrics['call_later']
+        context['unreachable_count'] = metrics['unreachable']
+        context['error_in_promotion_count'] = metrics['error_in_promotion']
+        context['started_promotion_count'] = metrics['started_promotion']
 
         # Resolution percentages
-        context['success_with_direct_sale_pct'] = (context['success_with_direct_sale_count'] * 100) / (
-            ccs_with_resolution_contacted_count or 1
+        context['success_with_direct_sale_pct'] = pct(
+            context['success_with_direct_sale_count'], ccs_with_resolution_contacted_count
         )
-        context['scheduled_pct'] = (context['scheduled_count'] * 100) / (ccs_with_resolution_contacted_count or 1)
-        context['call_later_pct'] = (context['call_later_count'] * 100) / (ccs_with_resolution_contacted_count or 1)
-        context['started_promotion_pct'] = (context['started_promotion_count'] * 100) / (
-            ccs_with_resolution_contacted_count or 1
+        context['scheduled_pct'] = pct(context['scheduled_count'], ccs_with_resolution_contacted_count)
+        context['call_later_pct'] = pct(context['call_later_count'], ccs_with_resolution_contacted_count)
+        context['started_promotion_pct'] = pct(
+            context['started_promotion_count'], ccs_with_resolution_contacted_count
         )
-        context['unreachable_pct'] = (context['unreachable_count'] * 100) / (
-            ccs_with_resolution_not_contacted_count or 1
-        )
-        context['error_in_promotion_pct'] = (context['error_in_promotion_count'] * 100) / (
-            ccs_with_resolution_not_contacted_count or 1
+        context['unreachable_pct'] = pct(context['unreachable_count'], ccs_with_resolution_not_contacted_count)
+        context['error_in_promotion_pct'] = pct(
+            context['error_in_promotion_count'], ccs_with_resolution_not_contacted_count
         )
 
         # Rejects section
-        total_rejects = ccs_with_resolution.filter(campaign_resolution__in=("AS", "DN", "LO", "NI"))
-        context['total_rejects_count'] = total_rejects.count()
-        context['total_rejects_pct'] = (context['total_rejects_count'] * 100) / (
-            ccs_with_resolution_contacted_count or 1
-        )
-
-        rejects_with_reason = total_rejects.filter(resolution_reason__isnull=False)
-        rejects_with_reason_count = rejects_with_reason.count()
-        context['rejects_without_reason_count'] = total_rejects.filter(resolution_reason__isnull=True).count()
+        context['total_rejects_count'] = metrics['rejected']
+        context['total_rejects_pct'] = pct(context['total_rejects_count'], ccs_with_resolution_contacted_count)
+        context['rejects_without_reason_count'] = metrics['rejected_without_reason']
+        rejects_with_reason_count = metrics['rejected'] - metrics['rejected_without_reason']
 
+        reasons = dict(core_choices.CAMPAIGN_RESOLUTION_REASONS_CHOICES)
         rejects_by_reason = {}
-        for ccs in rejects_with_reason.iterator():
-            reason = ccs.get_resolution_reason_display()
-            item = rejects_by_reason.get(reason, 0)
-            item += 1
-            rejects_by_reason[reason] = item
-        for index, item in list(rejects_by_reason.items()):
-            pct = (item * 100) / (rejects_with_reason_count or 1)
-            rejects_by_reason[index] = (item, pct)
+        for row in (
+            filtered_qs.filter(
+                campaign_resolution__in=seller_metrics.REJECTED_RESOLUTIONS, resolution_reason__isnull=False
+            )
+            .values('resolution_reason')
+            .annotate(count=Count('id'))
+            .order_by('resolution_reason')
+        ):
+            reason = reasons.get(row['resolution_reason'], row['resolution_reason'])
+            rejects_by_reason[reason] = (row['count'], pct(row['count'], rejects_with_reason_count))
         context['rejects_by_reason'] = rejects_by_reason
 
         # Success rate
         success_rate_count = context['success_with_direct_sale_count']
         context['success_rate_count'] = success_rate_count
-        context['success_rate_pct'] = (success_rate_count * 100) / (context['contacted_count'] or 1)
+        context['success_rate_pct'] = pct(success_rate_count, context['contacted_count'])
 
         # Seller-specific data
         if context['filter'].data.get("seller", None):
             seller = Seller.objects.get(pk=context['filter'].data["seller"])
             context['seller'] = seller
-            context['seller_assigned_count'] = self.campaign.contactcampaignstatus_set.filter(seller=seller).count()
+            context['seller_assigned_count'] = campaign_metrics.get(seller.id, {}).get('total', 0)
         else:
             context['seller'] = None
             context['seller_assigned_count'] = None
@@ -2686,29 +2719,24 @@ class AllCampaignsStatusExportView(BreadcrumbsMixin, UserPassesTestMixin, Filter
 def campaign_statistics_per_seller(request, campaign_id):
     campaign = get_object_or_404(Campaign, pk=campaign_id)
     sellers = Seller.objects.filter(internal=True).order_by("name")
-    assigned_count = campaign.contactcampaignstatus_set.filter(seller__isnull=False).count()
-    not_assigned_count = campaign.contactcampaignstatus_set.filter(seller__isnull=True).count()
+    metrics = seller_metrics.count_metrics(campaign.contactcampaignstatus_set.all(), "seller_id")
+    assigned_count = sum(counts["total"] for seller_id, counts in metrics.items() if seller_id is not None)
+    not_assigned_count = metrics.get(None, {}).get("total", 0)
     for seller in sellers:
-        seller.assigned_count = seller.contactcampaignstatus_set.filter(campaign=campaign).count()
-        assigned = seller.assigned_count or 1
-        seller.not_contacted_yet_count = seller.contactcampaignstatus_set.filter(campaign=campaign, status=1).count()
-        seller.not_contacted_yet_pct = (seller.not_contacted_yet_count * 100) / assigned
-        seller.called_count = seller.contactcampaignstatus_set.filter(campaign=campaign, status__gte=2).count()
-        seller.called_pct = (seller.called_count * 100) / assigned
-        seller.contacted_count = seller.contactcampaignstatus_set.filter(
-            campaign=campaign, status__in=core_choices.get_contacted_statuses()
-        ).count()
-        seller.contacted_pct = (seller.contacted_count * 100) / (seller.called_count or 1)
-        seller.success_count = seller.contactcampaignstatus_set.filter(
-            campaign=campaign, campaign_resolution__in=("S1", "S2")
-        ).count()
-        seller.success_pct = (seller.success_count * 100) / (seller.contacted_count or 1)
-        seller.rejected_count = seller.contactcampaignstatus_set.filter(
-            campaign=campaign, campaign_resolution__in=("AS", "DN", "LO", "NI")
-        ).count()
-        seller.rejected_pct = (seller.rejected_count * 100) / assigned
-        seller.unreachable_count = seller.contactcampaignstatus_set.filter(campaign=campaign, status=5).count()
-        seller.unreachable_pct = (seller.unreachable_count * 100) / assigned
+        counts = metrics.get(seller.id) or seller_metrics.empty_metrics()
+        seller.assigned_count = counts["total"]
+        seller.not_contacted_yet_count = counts["not_contacted_yet"]
+        seller.not_contacted_yet_pct = pct(seller.not_contacted_yet_count, seller.assigned_count)
+        seller.called_count = counts["called"]
+        seller.called_pct = pct(seller.called_count, seller.assigned_count)
+        seller.contacted_count = counts["contacted"]
+        seller.contacted_pct = pct(seller.contacted_count, seller.called_count)
+        seller.success_count = counts["success"]
+        seller.success_pct = pct(seller.success_count, seller.contacted_count)
+        seller.rejected_count = counts["rejected"]
+        seller.rejected_pct = pct(seller.rejected_count, seller.assigned_count)
+        seller.unreachable_count = counts["ended_without_contact"]
+        seller.unreachable_pct = pct(seller.unreachable_count, seller.assigned_count)
     return render(
         request,
         "campaign_statistics_per_seller.html",
@@ -2731,45 +2759,42 @@ def seller_performance_by_time(request):
         1,
     ) - timedelta(1)
     if request.GET:
-        ccs_queryset = ContactCampaignStatus.objects.all()
         form = ContactCampaignStatusByDateForm(request.GET)
         if form.is_valid():
             date_from = form.cleaned_data["date_gte"]
             date_to = form.cleaned_data["date_lte"]
     else:
         form = ContactCampaignStatusByDateForm(initial={"date_gte": date_from, "date_lte": date_to})
-    ccs_queryset = ContactCampaignStatus.objects.filter(
-        last_action_date__gte=date_from,
-        last_action_date__lte=date_to,
-    )
-    assigned_count = ccs_queryset.filter(seller__isnull=False).count() or 1
-    called_count = ccs_queryset.filter(seller__isnull=False, status__gte=2).count()
-    called_pct = (called_count * 100) / assigned_count
-    contacted_count = ccs_queryset.filter(
-        seller__isnull=False, status__in=core_choices.get_contacted_statuses()
-    ).count()
-    contacted_pct = (contacted_count * 100) / assigned_count
-    success_count = ccs_queryset.filter(seller__isnull=False, campaign_resolution__in=("S1", "S2")).count()
-    success_pct = (success_count * 100) / assigned_count
+    # the days already aggregated are read from SellerDailyMetrics, see support.seller_metrics
+    metrics = seller_metrics.metrics_by_seller(date_from, date_to)
+    assigned = seller_metrics.empty_metrics()
+    for seller_id, counts in metrics.items():
+        if seller_id is not None:
+            for name, count in counts.items():
+                assigned[name] += count
+    assigned_count = assigned["total"] or 1
+    called_count = assigned["called"]
+    called_pct = pct(called_count, assigned_count)
+    contacted_count = assigned["contacted"]
+    contacted_pct = pct(contacted_count, assigned_count)
+    success_count = assigned["success"]
+    success_pct = pct(success_count, assigned_count)
 
     for seller in sellers:
-        seller.assigned_count = ccs_queryset.filter(seller=seller).count()
-        seller.not_contacted_yet_count = ccs_queryset.filter(seller=seller, status=1).count()
-        seller.not_contacted_yet_pct = (seller.not_contacted_yet_count * 100) / (seller.assigned_count or 1)
-        seller.called_count = ccs_queryset.filter(seller=seller, status__gte=2).count()
-        seller.called_pct = (seller.called_count * 100) / (seller.assigned_count or 1)
-        seller.contacted_count = ccs_queryset.filter(
-            seller=seller, status__in=core_choices.get_contacted_statuses()
-        ).count()
-        seller.contacted_pct = (seller.contacted_count * 100) / (seller.assigned_count or 1)
-        seller.success_count = ccs_queryset.filter(seller=seller, campaign_resolution__in=("S1", "S2")).count()
-        seller.success_pct = (seller.success_count * 100) / (seller.assigned_count or 1)
-        seller.rejected_count = ccs_queryset.filter(
-            seller=seller, campaign_resolution__in=("AS", "DN", "LO", "NI")
-        ).count()
-        seller.rejected_pct = (seller.rejected_count * 100) / (seller.assigned_count or 1)
-        seller.unreachable_count = ccs_queryset.filter(seller=seller, status=5).count()
-        seller.unreachable_pct = (seller.unreachable_count * 100) / (seller.assigned_count or 1)
+        counts = metrics.get(seller.id) or seller_metrics.empty_metrics()
+        seller.assigned_count = counts["total"]
+        seller.not_contacted_yet_count = counts["not_contacted_yet"]
+        seller.not_contacted_yet_pct = pct(seller.not_contacted_yet_count, seller.assigned_count)
+        seller.called_count = counts["called"]
+        seller.called_pct = pct(seller.called_count, seller.assigned_count)
+        seller.contacted_count = counts["contacted"]
+        seller.contacted_pct = pct(seller.contacted_count, seller.assigned_count)
+        seller.success_count = counts["success"]
+        seller.success_pct = pct(seller.success_count, seller.assigned_count)
+        seller.rejected_count = counts["rejected"]
+        seller.rejected_pct = pct(seller.rejected_count, seller.assigned_count)
+        seller.unreachable_count = counts["ended_without_contact"]
+        seller.unreachable_pct = pct(seller.unreachable_count, seller.assigned_count)
     return render(
         request,
         "seller_performance_by_time.html",
@@ -2894,16 +2919,17 @@ def history_extended(request, contact_id):
 def upload_do_not_call_numbers(request):
     if request.FILES:
         decoded_file = request.FILES.get("do_not_call_numbers").read().decode("utf-8").splitlines()
-        numbers = csv.reader(decoded_file)
-        if numbers:
-            # Remove both headers
-            next(numbers)
-            next(numbers)
-
-            DoNotCallNumber.delete_all_numbers()
-            DoNotCallNumber.upload_new_numbers(numbers)
-
-            messages.success(request, _("Numbers have been uploaded successfully."))
+        # Skip both headers
+        numbers = [row[0] for row in csv.reader(decoded_file[2:]) if row]
+        if not numbers:
+            # an empty file would empty the registry
+            messages.error(request, _("The file has no numbers."))
+        else:
+            added, removed = sync_numbers(numbers)
+            messages.success(
+                request,
+                _("Numbers have been uploaded successfully: {} added, {} removed.").format(added, removed),
+            )
             return HttpResponseRedirect("/")
 
     return render(
@@ -3019,14 +3045,14 @@ class SalesRecordFilterSellersView(BreadcrumbsMixin, FilterView):
         if df.empty:
             return {}
         special_product_sales_ids = list(
-            queryset.filter(products__slug='la-diaria-5-dias').values_list('id', flat=True)
+            queryset.filter(products__slug=SPECIAL_PRODUCT_SLUG).values_list('id', flat=True)
         )
         # Mark rows that contain the special product
         df['has_special_product'] = df['id'].isin(special_product_sales_ids)
         # Adjust counts
         df['adjusted_count'] = df['total_products'] + df['has_special_product']
         # Ensure counts do not exceed 4
-        df['adjusted_count'] = df['adjusted_count'].clip(upper=4)
+        df['adjusted_count'] = df['adjusted_count'].clip(upper=MAX_PRODUCTS_COUNT)
         # Create the distribution
         distribution = df['adjusted_count'].value_counts().sort_index().to_dict()
         return distribution
@@ -3064,21 +3090,94 @@ class SalesRecordFilterSellersView(BreadcrumbsMixin, FilterView):
     def get_commissions(self, queryset):
         return queryset.aggregate(total_commission=Sum('total_commission_value'))["total_commission"]
 
+    def get_statistics(self, queryset) -> dict:
+        return {
+            "total_commission": self.get_commissions(queryset),
+            "sales_distribution_product_count": self.get_sales_distribution_by_product(queryset),
+            "sales_distribution_payment_type": self.get_sales_distribution_by_payment_type(
+                queryset.filter(sale_type=SalesRecord.SALE_TYPE.FULL)
+            ),
+            "sales_distribution_by_subscription_frequency": self.get_sales_distribution_by_subscription_frequency(
+                queryset
+            ),
+        }
+
+    def get_rollup_filters(self):
+        """
+        Translates the filters to the dimensions of the sales roll-up (see support.daily_rollups). Returns None when
+        some filter isn't one of them, then the statistics are computed from the sales records.
+        """
+        if not self.filterset.is_valid():
+            return None
+        data = self.filterset.form.cleaned_data
+        if any(data.get(name) for name in ("date_time", "start_date__gte", "start_date__lte", "products")):
+            return None
+        filters = {"date_from": data.get("date_time__gte"), "date_to": data.get("date_time__lte")}
+        if self.seller:
+            filters["seller_id"] = self.seller.id
+        if data.get("seller"):
+            filters["seller_id__in"] = [seller.id for seller in data["seller"]]
+        if data.get("payment_method"):
+            filters["payment_type__in"] = data["payment_method"]
+        if data.get("sale_type"):
+            filters["sale_type"] = data["sale_type"]
+        if data.get("validated") is not None:
+            filters["validated"] = data["validated"]
+        return filters
+
+    def get_rollup_statistics(self, date_from=None, date_to=None, **filters) -> dict:
+        """
+        The same statistics as get_statistics, from the sales roll-up.
+        """
+        rows = SALES.read(["sale_type", "payment_type", "frequency", "products_count"], date_from, date_to, **filters)
+        if not rows:
+            return {"total_commission": None}
+        products_count, payment_type, frequency = defaultdict(int), defaultdict(int), defaultdict(int)
+        for (sale_type, payment_type_key, frequency_key, products), measures in rows.items():
+            products_count[products] += measures["sales"]
+            frequency[frequency_key] += measures["sales"]
+            if sale_type == SalesRecord.SALE_TYPE.FULL:
+                payment_type[payment_type_key] += measures["sales"]
+
+        if hasattr(settings, 'SELLER_COMMISSION_PAYMENT_METHODS'):
+            payment_type = {
+                key: count for key, count in payment_type.items() if key in settings.SELLER_COMMISSION_PAYMENT_METHODS
+            }
+        if hasattr(settings, 'SUBSCRIPTION_PAYMENT_METHODS'):
+            payment_type = self.count_by_label(payment_type, dict(settings.SUBSCRIPTION_PAYMENT_METHODS))
+        else:
+            payment_type = dict(sorted(payment_type.items(), key=lambda item: item[1], reverse=True))
+        return {
+            "total_commission": sum(measures["commission"] for measures in rows.values()),
+            "sales_distribution_product_count": dict(sorted(products_count.items())),
+            "sales_distribution_payment_type": payment_type,
+            "sales_distribution_by_subscription_frequency": self.count_by_label(
+                frequency, dict(core_choices.FREQUENCY_CHOICES)
+            ),
+        }
+
+    @staticmethod
+    def count_by_label(counts, labels):
+        by_label = defaultdict(int)
+        for key, count in counts.items():
+            if key in labels and count:
+                by_label[labels[key]] += count
+        return dict(sorted(by_label.items()))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         queryset = self.get_queryset()
         context["seller"] = self.seller
-        context["total_commission"] = self.get_commissions(queryset)
+        rollup_filters = self.get_rollup_filters() if use_rollups(self.request) else None
+        if rollup_filters is None:
+            statistics = self.get_statistics(queryset)
+        else:
+            statistics = self.get_rollup_statistics(**rollup_filters)
+        context["total_commission"] = statistics.pop("total_commission")
         if not queryset.exists():
             messages.error(self.request, _("You have no sales records."))
             return context
-        context["sales_distribution_product_count"] = self.get_sales_distribution_by_product(queryset)
-        context["sales_distribution_payment_type"] = self.get_sales_distribution_by_payment_type(
-            queryset.filter(sale_type=SalesRecord.SALE_TYPE.FULL)
-        )
-        context["sales_distribution_by_subscription_frequency"] = (
-            self.get_sales_distribution_by_subscription_frequency(queryset)
-        )
+        context.update(statistics)
         return context
 
 
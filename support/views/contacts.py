@@ -1,22 +1,22 @@
 import csv
 import json
-import pandas as pd
 from datetime import date
 
 from django.conf import settings
-from django.db import transaction
 from django.db.models import Q, Prefetch, Case, When, Value, BooleanField, Count, Exists, OuterRef
 from django.contrib.auth.models import Group
-from django.views.generic import UpdateView, CreateView, DetailView, ListView, FormView
+from django.views.generic import UpdateView, CreateView, DetailView, ListView, FormView, TemplateView, View
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, HttpResponseNotFound, StreamingHttpResponse
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.http import require_POST
 from django.utils.functional import cached_property
 import io
 
@@ -24,19 +24,19 @@ from core.models import (
     Contact,
     Product,
     MailtrainList,
-    State,
-    Country,
-    Address,
     Subscription,
     ContactCampaignStatus,
-    IdDocumentType,
+    DuplicateContactCandidate,
 )
+from core.contact_duplicates import find_candidates
 from core.filters import ContactFilter
 from core.forms import ContactAdminForm, ContactUpdateForm
 from core.mixins import BreadcrumbsMixin
 from core.utils import get_mailtrain_lists, detect_csv_delimiter
 
+from support.contact_import import ContactImporter, read_csv
 from support.forms import ContactCampaignStatusEditForm, ImportContactsForm, CheckForExistingContactsForm
+from support.models import ContactImport
 
 from invoicing.models import Invoice, CreditNote
 from taggit.models import Tag
@@ -588,45 +588,35 @@ class ImportContactsView(BreadcrumbsMixin, FormView):
 
         return response
 
-    def get_address_column_names(self):
-        return ['address_1', 'address_2', 'city', 'state', 'country']
-
-    def resolve_id_document_type(self, id_doc_type_str, row_number=None):
-        """
-        Resolve ID document type string to IdDocumentType object.
-        Returns None if not found and logs a warning.
-
-        Args:
-            id_doc_type_str: String identifier for document type (e.g., 'CI', 'CC', 'RUT')
-            row_number: Optional row number for warning messages
-
-        Returns:
-            IdDocumentType object or None
-        """
-        if not id_doc_type_str:
-            return None
-
-        # Try to find by name (case-insensitive)
-        doc_type = IdDocumentType.objects.filter(name__iexact=id_doc_type_str).first()
-
-        if not doc_type:
-            # Log warning for invalid document type
-            row_info = f" (Row {row_number})" if row_number else ""
-            messages.warning(
-                self.request,
-                _(f"Invalid ID document type '{id_doc_type_str}'{row_info}. Contact created without document type."),
-            )
-            return None
-
-        return doc_type
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["contact_imports"] = ContactImport.objects.select_related("created_by")[:10]
+        return context
 
     def form_valid(self, form):
         csvfile = form.cleaned_data['file']
         use_headers = form.cleaned_data.get('use_headers', True)
         tags = self.parse_tags(form.cleaned_data)
 
-        results = self.process_csv(csvfile, tags, use_headers)
+        try:
+            df = read_csv(csvfile, use_headers)
+        except Exception as e:
+            messages.error(self.request, str(e))
+            return super().form_valid(form)
+
+        if len(df) > getattr(settings, "CONTACT_IMPORT_BACKGROUND_ROWS", 1000):
+            # Large files are imported by the process_contact_imports command
+            csvfile.seek(0)
+            contact_import = ContactImport.objects.create(
+                created_by=self.request.user, file=csvfile, use_headers=use_headers, tags=tags, total_rows=len(df)
+            )
+            messages.info(
+                self.request,
+                _("The file has {} rows and will be imported in the background").format(len(df)),
+            )
+            return HttpResponseRedirect(reverse("contact_import_detail", args=[contact_import.id]))
 
+        results = ContactImporter(tags).run(df, row_offset=2 if use_headers else 1)
         self.display_messages(results)
 
         return super().form_valid(form)
@@ -635,204 +625,41 @@ class ImportContactsView(BreadcrumbsMixin, FormView):
         tag_types = ['tags', 'tags_existing', 'tags_active', 'tags_in_campaign']
         return {tag_type: [tag.strip() for tag in cleaned_data.get(tag_type, '').split(',')] for tag_type in tag_types}
 
-    def process_csv(self, csv_file, tags, use_headers=True):
-        results = {
-            'new_contacts': [],
-            'in_active_campaign': [],
-            'active_contacts': [],
-            'existing_inactive_contacts': [],
-            'errors': [],
-            'added_emails': 0,
-            'added_phones': 0,
-            'added_mobiles': 0,
-        }
-
-        try:
-            if use_headers:
-                df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
-            else:
-                # Read without headers and assign column names manually
-                df = pd.read_csv(csv_file, header=None, dtype=str, keep_default_na=False)
-                df.columns = [
-                    'name',
-                    'last_name',
-                    'email',
-                    'phone',
-                    'mobile',
-                    'notes',
-                    'address_1',
-                    'address_2',
-                    'city',
-                    'state',
-                    'country',
-                    'id_document_type',
-                    'id_document',
-                ]
-        except Exception as e:
-            results['errors'].append(str(e))
-            return results
-
-        for index, row in df.iterrows():
-            try:
-                # Calculate row number for error messages
-                row_number = index + 2 if use_headers else index + 1
-                # Always use use_headers=True for parse_row since we assign column names
-                contact_data = self.parse_row(row, use_headers=True, row_number=row_number)
-                self.process_contact(contact_data, tags, results)
-            except Exception as e:
-                results['errors'].append(
-                    f"CSV Row {index + 2 if use_headers else index + 1}: {e}"
-                )  # +2 for headers (pandas index + header row), +1 for no headers
-
-        return results
-
-    def parse_row(self, row, use_headers=True, row_number=None):
-        """
-        Parse a row from the CSV file into contact data dictionary.
-        Since we read CSV with dtype=str, all values are strings and empty strings are preserved.
-
-        Args:
-            row: DataFrame row to parse
-            use_headers: Whether the CSV had headers (kept for compatibility)
-            row_number: Row number for warning messages
-        """
-        # Resolve ID document type, returns None if invalid
-        id_doc_type_obj = self.resolve_id_document_type(row['id_document_type'], row_number)
-
-        return {
-            'name': row['name'] if row['name'] else None,
-            'last_name': row['last_name'] if row['last_name'] else "",
-            'email': row['email'].lower() if row['email'] else None,
-            'phone': row['phone'] if row['phone'] else "",
-            'mobile': row['mobile'] if row['mobile'] else "",
-            'notes': row['notes'].strip() if row['notes'] else None,
-            'address_1': row['address_1'] if row['address_1'] else None,
-            'address_2': row['address_2'] if row['address_2'] else None,
-            'city': row['city'] if row['city'] else None,
-            'state': row['state'].strip() if row['state'] else None,
-            'country': row['country'] if row['country'] else None,
-            'id_document_type': id_doc_type_obj,
-            'id_document': row['id_document'] if row['id_document'] else None,
-        }
-
-    @transaction.atomic
-    def process_contact(self, contact_data, tags, results):
-        email = contact_data.get('email')
-        phone = contact_data.get('phone')
-
-        # Try to match by email first
-        matches = self.find_matching_contacts_by_email(email) if email else Contact.objects.none()
-
-        # If no email match, try to match by phone
-        if not matches.exists() and phone:
-            matches = self.find_matching_contacts_by_phone(phone)
-            if matches.exists():
-                # Matched by phone - update email if contact doesn't have one
-                self.update_existing_contacts(matches, contact_data, tags, results, matched_by_phone=True)
-                return
-
-        if matches.exists():
-            self.update_existing_contacts(matches, contact_data, tags, results)
-        else:
-            self.create_new_contact(contact_data, tags, results)
-
-    def find_matching_contacts_by_email(self, email):
-        return Contact.objects.filter(email=email)
-
-    def find_matching_contacts_by_phone(self, phone):
-        return Contact.objects.filter(phone=phone) | Contact.objects.filter(mobile=phone)
-
-    def update_existing_contacts(self, matches, contact_data, tags, results, matched_by_phone=False):
-        for contact in matches:
-            self.categorize_contact(contact, tags, results)
-            if matches.count() == 1:
-                # Update email if matched by phone and contact doesn't have an email
-                # IMPORTANT: Never overwrite existing emails to prevent data loss
-                if matched_by_phone and not contact.email:
-                    email_from_csv = contact_data.get('email')
-                    if email_from_csv:
-                        contact.email = email_from_csv
-                        contact.save()
-                        results['added_emails'] += 1
-                else:
-                    self.update_contact_phone(contact, contact_data, results)
-
-    def categorize_contact(self, contact, tags, results):
-        if contact.contactcampaignstatus_set.filter(campaign__active=True).exists():
-            results['in_active_campaign'].append(contact.id)
-            self.add_tags(contact, tags['tags_in_campaign'])
-        elif contact.has_active_subscription():
-            results['active_contacts'].append(contact.id)
-            self.add_tags(contact, tags['tags_active'])
-        else:
-            results['existing_inactive_contacts'].append(contact.id)
-            self.add_tags(contact, tags['tags_existing'])
-
-    def update_contact_phone(self, contact, contact_data, results):
-        phone_from_csv = contact_data.get('phone', '')
-        if not phone_from_csv:
-            return  # No phone to update
-
-        try:
-            # If phone already exists and is not empty, update the mobile field, else update the phone field
-            if contact.phone:
-                setattr(contact, 'mobile', phone_from_csv)
-            else:
-                setattr(contact, 'phone', phone_from_csv)
-            contact.save()
-            results['added_phones'] += 1
-        except Exception as e:
-            results['errors'].append(f"Could not add phone {phone_from_csv} to contact {contact.id}: {e}")
-
-    def create_new_contact(self, contact_data, tags, results):
-        new_contact = Contact.objects.create(
-            **{k: v for k, v in contact_data.items() if k not in self.get_address_column_names()}
-        )
-
-        state_data = contact_data.get('state', None)
-        contact_data['state'] = State.objects.filter(name=state_data).first()
-
-        country_data = contact_data.get('country', None)
-        contact_data['country'] = Country.objects.filter(name=country_data).first()
-
-        if contact_data['address_1']:
-            Address.objects.create(
-                contact=new_contact,
-                address_1=contact_data['address_1'],
-                address_2=contact_data['address_2'],
-                city=contact_data['city'],
-                address_type="physical",  # Default
-                state=contact_data['state'],
-                country=contact_data['country'],
-            )
-
-        results['new_contacts'].append(new_contact)
-        self.add_tags(new_contact, tags['tags'])
-
-    def add_tags(self, contact, tag_list):
-        tag_list = [tag for tag in tag_list if isinstance(tag, str) and tag.strip()]
-        if not tag_list:
-            return
-        contact.tags.add(*tag_list)
-
     def display_messages(self, results):
-        messages.success(self.request, f"{len(results['new_contacts'])} contacts imported successfully")
-        messages.warning(self.request, f"{len(results['in_active_campaign'])} contacts were found in active campaigns")
+        messages.success(self.request, f"{results['new_contacts']} contacts imported successfully")
+        messages.warning(self.request, f"{results['in_active_campaign']} contacts were found in active campaigns")
         messages.warning(
-            self.request, f"{len(results['active_contacts'])} contacts were found with active subscriptions"
+            self.request, f"{results['active_contacts']} contacts were found with active subscriptions"
         )
         messages.warning(
             self.request,
-            _(f"{len(results['existing_inactive_contacts'])} contacts were found without active subscriptions"),
+            _(f"{results['existing_inactive_contacts']} contacts were found without active subscriptions"),
         )
         messages.success(self.request, f"{results['added_emails']} emails were added to existing contacts")
         messages.success(self.request, f"{results['added_phones']} phone numbers were added to existing contacts")
         messages.success(self.request, f"{results['added_mobiles']} mobile numbers were added to existing contacts")
 
+        for warning in results['warnings']:
+            messages.warning(self.request, warning)
         for error in results['errors']:
             messages.error(self.request, error)
 
 
+@method_decorator(staff_member_required, name="dispatch")
+class ContactImportDetailView(BreadcrumbsMixin, DetailView):
+    model = ContactImport
+    template_name = "contact_import_detail.html"
+    context_object_name = "contact_import"
+
+    def breadcrumbs(self):
+        return [
+            {"url": reverse("home"), "label": _("Home")},
+            {"url": reverse("campaign_management"), "label": _("Campaign Management")},
+            {"label": _("Import Contacts"), "url": reverse("import_contacts")},
+            {"label": str(self.object), "url": reverse("contact_import_detail", args=[self.object.id])},
+        ]
+
+
 @csrf_protect
 def contact_invoices_htmx(request, contact_id):
     # Make sure the request comes from my HTMX library
@@ -1179,6 +1006,182 @@ class TagAnalysisView(BreadcrumbsMixin, ListView):
         return context
 
 
+@method_decorator(login_required, name="dispatch")
+@method_decorator(permission_required("core.can_merge_contacts", raise_exception=True), name="dispatch")
+class DuplicateContactCandidatesView(BreadcrumbsMixin, ListView):
+    """
+    Ranked list of the pairs of contacts that are probably duplicated, found by the detect_duplicate_contacts command.
+    Each pair links to MergeCompareContactsView.
+    """
+
+    model = DuplicateContactCandidate
+    template_name = "duplicate_contact_candidates.html"
+    context_object_name = "candidates"
+    paginate_by = 50
+    page_kwarg = "p"
+
+    def breadcrumbs(self):
+        return [
+            {"url": reverse("home"), "label": _("Home")},
+            {"label": _("Contact list"), "url": reverse("contact_list")},
+            {"label": _("Duplicate contacts"), "url": ""},
+        ]
+
+    def get_queryset(self):
+        queryset = (
+            DuplicateContactCandidate.objects.filter(dismissed=False)
+            .select_related("contact", "other")
+            .order_by("-score", "contact_id")
+        )
+        reason = self.request.GET.get("reason")
+        if reason:
+            queryset = queryset.filter(reasons__contains=reason)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["reason_filter"] = self.request.GET.get("reason", "")
+        context["reasons"] = ["email", "phone", "id_document", "name"]
+        return context
+
+
+@method_decorator(login_required, name="dispatch")
+@method_decorator(permission_required("core.can_merge_contacts", raise_exception=True), name="dispatch")
+class MergeCompareContactsView(BreadcrumbsMixin, TemplateView):
+    """
+    Compares two contacts side by side before merging them. The user picks the contact to keep and the values of its
+    fields, or dismisses the pair when they aren't the same person.
+    """
+
+    template_name = "merge_compare_contacts.html"
+    compared_fields = ["name", "last_name", "email", "id_document", "phone", "mobile", "work_phone"]
+
+    def breadcrumbs(self):
+        return [
+            {"url": reverse("home"), "label": _("Home")},
+            {"label": _("Duplicate contacts"), "url": reverse("duplicate_contact_candidates")},
+            {"label": _("Merge contacts"), "url": ""},
+        ]
+
+    def get(self, request, *args, **kwargs):
+        if any(
+            contact_id and not contact_id.isdecimal()
+            for contact_id in (request.GET.get("contact_1"), request.GET.get("contact_2"))
+        ):
+            messages.error(request, _("Contact IDs must be numbers"))
+            return HttpResponseRedirect(reverse("merge_compare_contacts"))
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        contact_1_id = self.request.GET.get("contact_1")
+        contact_2_id = self.request.GET.get("contact_2")
+        if not (contact_1_id and contact_2_id):
+            return context
+        if contact_1_id == contact_2_id:
+            messages.error(self.request, _("Contact IDs must be different"))
+            return context
+
+        contacts = Contact.objects.in_bulk([contact_1_id, contact_2_id])
+        for contact_id in (contact_1_id, contact_2_id):
+            if int(contact_id) not in contacts:
+                messages.error(self.request, _("Contact {id} does not exist").format(id=contact_id))
+                return context
+        contact1, contact2 = contacts[int(contact_1_id)], contacts[int(contact_2_id)]
+
+        low, high = sorted([contact1.id, contact2.id])
+        candidate = DuplicateContactCandidate.objects.filter(contact_id=low, other_id=high).first()
+        if candidate is None:
+            # the score of a pair that wasn't detected, if they share any key
+            scored = find_candidates(Contact.objects.filter(pk__in=[low, high]), min_score=0)
+            if len(scored):
+                candidate = DuplicateContactCandidate(
+                    contact_id=low, other_id=high, score=scored["score"].iloc[0], reasons=scored["reasons"].iloc[0]
+                )
+
+        context.update(
+            {
+                "contact1": contact1,
+                "contact2": contact2,
+                "candidate": candidate,
+                "rows": [
+                    {
+                        "field": field,
+                        "label": Contact._meta.get_field(field).verbose_name,
+                        "value1": getattr(contact1, field) or "",
+                        "value2": getattr(contact2, field) or "",
+                    }
+                    for field in self.compared_fields
+                ],
+                "counts": [
+                    (_("Subscriptions"), contact1.subscriptions.count(), contact2.subscriptions.count()),
+                    (_("Issues"), contact1.issue_set.count(), contact2.issue_set.count()),
+                    (_("Activities"), contact1.activity_set.count(), contact2.activity_set.count()),
+                    (_("Invoices"), contact1.invoice_set.count(), contact2.invoice_set.count()),
+                ],
+            }
+        )
+        return context
+
+
+class ProcessMergeContactsView(View):
+    """
+    Merges the contact that wasn't selected into the selected one (see Contact.merge_other_contact_into_this), with
+    the chosen values. With action=dismiss, the pair is marked as not duplicated instead.
+    """
+
+    @method_decorator(require_POST)
+    @method_decorator(login_required)
+    @method_decorator(permission_required("core.can_merge_contacts", raise_exception=True))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        contact_ids = [request.POST.get("contact1_id"), request.POST.get("contact2_id")]
+        contacts = Contact.objects.in_bulk(
+            [contact_id for contact_id in contact_ids if contact_id and contact_id.isdecimal()]
+        )
+        if len(contacts) != 2:
+            messages.error(request, _("One of the contacts does not exist"))
+            return HttpResponseRedirect(reverse("duplicate_contact_candidates"))
+
+        if request.POST.get("action") == "dismiss":
+            low, high = sorted(contacts)
+            if not DuplicateContactCandidate.objects.filter(contact_id=low, other_id=high).update(dismissed=True):
+                DuplicateContactCandidate.objects.create(
+                    contact_id=low, other_id=high, score=0, reasons="", dismissed=True
+                )
+            messages.success(request, _("Contacts {} and {} marked as not duplicated").format(low, high))
+            return HttpResponseRedirect(reverse("duplicate_contact_candidates"))
+
+        selected_contact_id = request.POST.get("selected_contact_id")
+        if selected_contact_id not in contact_ids:
+            messages.error(request, _("Select the contact to keep"))
+            return HttpResponseRedirect(
+                "{}?contact_1={}&contact_2={}".format(reverse("merge_compare_contacts"), *contact_ids)
+            )
+        contact_ids.remove(selected_contact_id)
+        target, source = contacts[int(selected_contact_id)], contacts[int(contact_ids[0])]
+
+        errors = target.merge_other_contact_into_this(
+            source,
+            **{field: request.POST.get("new_" + field) for field in MergeCompareContactsView.compared_fields},
+        )
+        if errors:
+            for error in errors:
+                messages.error(request, error)
+            return HttpResponseRedirect(
+                "{}?contact_1={}&contact_2={}".format(reverse("merge_compare_contacts"), target.id, source.id)
+            )
+        messages.success(
+            request,
+            _("Contact {source_id} merged into contact {id}. It was tagged for deletion.").format(
+                id=target.id, source_id=source.id
+            ),
+        )
+        return HttpResponseRedirect(reverse("contact_detail", args=[target.id]))
+
+
 def user_can_edit_campaign_status(user):
     return user.is_active and (
         user.is_superuser or user.groups.filter(name__in=["Managers", "Admin"]).exists()
@@ -2,10 +2,10 @@ from django.views.generic import TemplateView
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
 from django.conf import settings
 from django.contrib import messages
-from django.utils import timezone
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.db.models import Prefetch
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
@@ -13,9 +13,12 @@ from django.utils.html import format_html
 from datetime import date, timedelta, datetime
 
 from support.models import Seller, Issue, SellerConsoleAction
+from core.do_not_call import prefetch_do_not_call
 from core.models import Address, SubscriptionProduct, Activity, ContactCampaignStatus, Campaign, Subscription, Contact
 from core.utils import logistics_is_installed
 from core.choices import ACTIVITY_STATUS, CAMPAIGN_RESOLUTION_REASONS_CHOICES, CAMPAIGN_STATUS
+from support.console_cursor import after_cursor, encode_cursor
+from support.seller_dashboard import get_dashboard
 
 if logistics_is_installed():
     from logistics.models import Route
@@ -169,63 +172,14 @@ def seller_console_list_campaigns(request, seller_id=None):
         messages.error(request, _("This seller is set in more than one user. Please contact your manager."))
         return HttpResponseRedirect(reverse("home"))
 
-    if logistics_is_installed():
-        special_routes = {}
-        for route_id in getattr(settings, "SPECIAL_ROUTES_FOR_SELLERS_LIST", []):
-            route = Route.objects.get(pk=route_id)
-            # Only include subscriptions started in the last 45 days (today included).
-            # i.e. start_date must be >= (today - 45 days), so anything older is excluded.
-            counter = SubscriptionProduct.objects.filter(
-                seller=seller,
-                route_id=route_id,
-                subscription__active=True,
-                subscription__start_date__gte=datetime.now() - timedelta(days=45),
-            ).count()
-            if counter:
-                special_routes[route_id] = (route.name, counter)
-
-    # We'll make these lists so we can append the sub count to each campaign
-    campaigns_with_not_contacted_list, campaigns_with_activities_list = [], []
-
-    # Get count of never paid issues for this seller
-    issues_never_paid_count = 0
-    if getattr(settings, "ISSUE_SUBCATEGORY_NEVER_PAID", None) and getattr(
-        settings, "ISSUE_STATUS_FINISHED_LIST", None
-    ):
-        issues_never_paid_count = Issue.objects.filter(
-            sub_category__slug=getattr(settings, "ISSUE_SUBCATEGORY_NEVER_PAID", ""),
-            assigned_to=user,
-        ).exclude(status__slug__in=getattr(settings, "ISSUE_STATUS_FINISHED_LIST", [])).count()
-
-    not_contacted_campaigns = seller.get_campaigns_by_status([1, 3])
-    campaigns_with_activities = seller.get_campaigns_with_activities()
-    for campaign in not_contacted_campaigns:
-        campaign.count = campaign.get_not_contacted_count(seller.id)
-        campaign.successful = campaign.get_successful_count(seller.id)
-        campaigns_with_not_contacted_list.append(campaign)
-    for campaign in campaigns_with_activities:
-        campaign.pending = campaign.activity_set.filter(
-            seller=seller,
-            status="P",
-            activity_type="C",
-            datetime__lte=timezone.now(),
-        ).count()
-        campaign.successful = campaign.get_successful_count(seller.id)
-        if campaign.pending:
-            campaigns_with_activities_list.append(campaign)
-    upcoming_activity = seller.upcoming_activity()
-    total_pending_activities = seller.total_pending_activities_count()
-
-    context = {
-        "campaigns_with_not_contacted": campaigns_with_not_contacted_list,
-        "campaigns_with_activities_to_do": campaigns_with_activities_list,
-        "seller": seller,
-        "total_pending_activities": total_pending_activities,
-        "upcoming_activity": upcoming_activity,
-        "issues_never_paid_count": issues_never_paid_count,
-    }
-    if logistics_is_installed():
-        context["special_routes"] = special_routes
+    # the counters are cached for a short time, see support.seller_dashboard
+    context = get_dashboard(seller).copy()
+    context.update(
+        {
+            "seller": seller,
+            "upcoming_activity": seller.upcoming_activity(),
+        }
+    )
     return render(
         request,
         "seller_console_list_campaigns.html",
@@ -241,6 +195,17 @@ class SellerConsoleView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
 
     def get(self, request, *args, **kwargs):
         """Handle GET requests and check for end of list"""
+        if self.cursor_navigation():
+            try:
+                self.console_window = self.get_console_window(self.get_campaign(), self.get_seller())
+            except ValueError:
+                messages.warning(request, _("Invalid position. Using first item."))
+                return HttpResponseRedirect(f"{request.path}?cursor=")
+            if not self.console_window:
+                messages.success(request, _("You've reached the end of this list"))
+                return HttpResponseRedirect(reverse("seller_console_list_campaigns"))
+            return super().get(request, *args, **kwargs)
+
         redirect_url = self.check_end_of_list()
         if redirect_url:
             messages.success(request, _("You've reached the end of this list"))
@@ -271,6 +236,67 @@ class SellerConsoleView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
             return str(reverse("seller_console_list_campaigns"))  # Convert to string
         return None
 
+    def cursor_navigation(self):
+        """
+        Whether the console moves through the list by cursor (see support.console_cursor) instead of by offset. It's
+        enabled for everyone with the SELLER_CONSOLE_CURSOR_NAVIGATION setting, or by a cursor in the URL.
+        """
+        return (
+            getattr(settings, "SELLER_CONSOLE_CURSOR_NAVIGATION", False)
+            or "cursor" in self.request.GET
+            or self.get_cursor() is not None
+        )
+
+    def get_cursor(self):
+        """
+        Returns the cursor of the page, or None to start from the beginning. The views of the sales started from the
+        console send it back as the offset.
+        """
+        cursor = self.request.GET.get("cursor") or self.request.GET.get("offset") or ""
+        return cursor if "_" in cursor else None
+
+    def get_console_window(self, campaign, seller):
+        """
+        Returns the console instance to show (the requested activity, or the first one after the cursor) followed by
+        the next ones, with the data of their contacts, in a fixed number of queries and without counting the list.
+        """
+        category = self.kwargs['category']
+        instances = self.get_console_instances(campaign, seller)
+        activity_id = self.request.GET.get('a')
+        if activity_id:
+            instances = instances.filter(pk=int(activity_id))
+        elif self.get_cursor():
+            instances = after_cursor(instances, category, self.get_cursor())
+        size = getattr(settings, "SELLER_CONSOLE_PREFETCH_CONTACTS", 5) + 1
+        window = list(self.with_contact_data(instances)[:size])
+        # the phones of all the contacts of the window are checked against the do not call registry in one query
+        prefetch_do_not_call([instance.contact for instance in window])
+        return window
+
+    def with_contact_data(self, console_instances):
+        """
+        Prefetches the subscriptions, open issues and activities of the contacts of the console instances, so the
+        console doesn't query them for the contact shown.
+        """
+        terminal_statuses = getattr(settings, 'ISSUE_STATUS_FINISHED_LIST', [])
+        return console_instances.select_related('contact').prefetch_related(
+            Prefetch(
+                'contact__subscriptions',
+                queryset=Subscription.objects.order_by("-active", "id"),
+                to_attr='console_subscriptions',
+            ),
+            Prefetch(
+                'contact__issue_set',
+                queryset=Issue.objects.exclude(status__slug__in=terminal_statuses).order_by("-date_created"),
+                to_attr='console_open_issues',
+            ),
+            Prefetch(
+                'contact__activity_set',
+                queryset=Activity.objects.order_by("-datetime", "id"),
+                to_attr='console_activities',
+            ),
+        )
+
     def get_seller(self):
         """Get seller for current user"""
         return get_object_or_404(Seller, user=self.request.user)
@@ -510,6 +536,18 @@ class SellerConsoleView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
 
         messages.success(self.request, success_msg_html, extra_tags='safe')
 
+        if data.get("next_cursor") is not None:
+            # Cursor navigation: the contact stays in the list for "Call later" and "Not found" results, so we move
+            # past it. Otherwise it left the list and the next one comes after the same cursor.
+            if seller_console_action.action_type in (
+                SellerConsoleAction.ACTION_TYPES.CALL_LATER,
+                SellerConsoleAction.ACTION_TYPES.NOT_FOUND,
+            ):
+                offset = data.get("next_cursor")
+            return HttpResponseRedirect(
+                "{}?cursor={}".format(reverse("seller_console", args=[category, campaign.id]), offset or "")
+            )
+
         # Convert offset to int and increment it for "Call later" and "Not found" results
         try:
             if seller_console_action.action_type in (
@@ -546,32 +584,15 @@ class SellerConsoleView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
         seller = self.get_seller()
 
         category = self.kwargs['category']
-        offset = self.request.GET.get('offset')
-        activity_id = self.request.GET.get('a')
-
-        offset = int(offset) if offset else 1
         call_datetime = datetime.strftime(date.today() + timedelta(1), "%Y-%m-%d")
 
-        console_instances_qs = self.get_console_instances(campaign, seller)
-        count = console_instances_qs.count()
-
-        # Materialize and annotate each instance with a unified 'console_action' attribute so the
-        # template doesn't need to probe for model-specific fields. Accessing a non-existent
-        # attribute via |default crashes in production (DEBUG=False) with VariableDoesNotExist.
-        # In "new" mode instances are ContactCampaignStatus (has last_console_action).
-        # In "act" mode instances are Activity (has seller_console_action).
-        console_instances = list(console_instances_qs)
-        for inst in console_instances:
-            inst.console_action = getattr(inst, 'last_console_action', None) or getattr(
-                inst, 'seller_console_action', None
-            )
-
-        # Get console instance based on activity_id or offset
-        console_instance = self.get_console_instance(
-            console_instances=console_instances, activity_id=activity_id, count=count, offset=offset
-        )
+        if self.cursor_navigation():
+            navigation = self.get_cursor_navigation(category)
+        else:
+            navigation = self.get_offset_navigation(campaign, seller)
 
         # If no valid console instance is found, redirect to campaigns list
+        console_instance = navigation['console_instance']
         if not console_instance:
             messages.warning(self.request, _("No valid contacts found in this campaign"))
             return {'redirect': reverse("seller_console_list_campaigns")}
@@ -594,29 +615,45 @@ class SellerConsoleView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
             if last_action_activity:
                 last_action_datetime = last_action_activity.datetime
 
-        terminal_statuses = getattr(settings, 'ISSUE_STATUS_FINISHED_LIST', [])
-        open_issues = Issue.objects.filter(contact=contact).exclude(status__slug__in=terminal_statuses).order_by(
-            "-date_created"
-        )
+        if hasattr(contact, 'console_activities'):
+            # prefetched by with_contact_data
+            open_issues = contact.console_open_issues
+            all_subscriptions = contact.console_subscriptions
+            all_activities = [
+                activity
+                for activity in contact.console_activities
+                if not (category == "act" and activity.pk == console_instance.pk)
+            ]
+            times_contacted = sum(
+                1
+                for activity in contact.console_activities
+                if activity.activity_type == "C" and activity.status == "C" and activity.campaign_id == campaign.id
+            )
+            open_issues_count = len(open_issues)
+        else:
+            terminal_statuses = getattr(settings, 'ISSUE_STATUS_FINISHED_LIST', [])
+            open_issues = (
+                Issue.objects.filter(contact=contact)
+                .exclude(status__slug__in=terminal_statuses)
+                .order_by("-date_created")
+            )
+            all_subscriptions = Subscription.objects.filter(contact=contact).order_by("-active", "id")
+            all_activities = self.get_activities(contact, console_instance, category)
+            times_contacted = contact.activity_set.filter(activity_type="C", status="C", campaign=campaign).count()
+            open_issues_count = open_issues.count()
 
+        context.update(navigation)
         context.update(
             {
                 'campaign': campaign,
-                'times_contacted': contact.activity_set.filter(
-                    activity_type="C", status="C", campaign=campaign
-                ).count(),
+                'times_contacted': times_contacted,
                 'category': category,
-                'position': offset + 1,
-                'offset': offset,
                 'seller': seller,
                 'contact': contact,
-                'count': count,
                 'addresses': Address.objects.filter(contact=contact).order_by("address_1"),
                 'call_date': call_datetime,
-                'all_activities': self.get_activities(contact, console_instance, category),
-                'all_subscriptions': Subscription.objects.filter(contact=contact).order_by("-active", "id"),
-                'console_instance': console_instance,
-                'console_instances': console_instances,
+                'all_activities': all_activities,
+                'all_subscriptions': all_subscriptions,
                 'url': self.request.path,
                 'pending_activities_count': seller.total_pending_activities_count(),
                 'upcoming_activity': seller.upcoming_activity(),
@@ -626,11 +663,79 @@ class SellerConsoleView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
                 'phone_duplicates': phone_duplicates_info['contacts'],
                 'last_action_datetime': last_action_datetime,
                 'open_issues': open_issues,
-                'open_issues_count': open_issues.count(),
+                'open_issues_count': open_issues_count,
             }
         )
         return context
 
+    def annotate_console_actions(self, console_instances):
+        # Annotate each instance with a unified 'console_action' attribute so the template doesn't need to probe for
+        # model-specific fields. Accessing a non-existent attribute via |default crashes in production (DEBUG=False)
+        # with VariableDoesNotExist.
+        # In "new" mode instances are ContactCampaignStatus (has last_console_action).
+        # In "act" mode instances are Activity (has seller_console_action).
+        for inst in console_instances:
+            inst.console_action = getattr(inst, 'last_console_action', None) or getattr(
+                inst, 'seller_console_action', None
+            )
+
+    def get_offset_navigation(self, campaign, seller):
+        """
+        Returns the console instance at the offset of the page, evaluating and counting the whole list.
+        """
+        offset = self.request.GET.get('offset')
+        activity_id = self.request.GET.get('a')
+        offset = int(offset) if offset else 1
+
+        console_instances_qs = self.get_console_instances(campaign, seller)
+        count = console_instances_qs.count()
+        console_instances = list(console_instances_qs)
+        self.annotate_console_actions(console_instances)
+        for position, inst in enumerate(console_instances, 1):
+            inst.nav_query = "offset={}".format(position)
+
+        # Get console instance based on activity_id or offset
+        console_instance = self.get_console_instance(
+            console_instances=console_instances, activity_id=activity_id, count=count, offset=offset
+        )
+        return {
+            'console_instance': console_instance,
+            'console_instances': console_instances,
+            'cursor_navigation': False,
+            'position': offset + 1,
+            'offset': offset,
+            'count': count,
+            'skip_query': "offset={}".format(offset + 1),
+        }
+
+    def get_cursor_navigation(self, category):
+        """
+        Returns the first console instance after the cursor of the page and the next ones, read by get().
+        """
+        window = self.console_window
+        self.annotate_console_actions(window)
+        cursor = self.get_cursor() or ""
+        for inst in window:
+            inst.nav_query = "cursor={}".format(cursor)
+            cursor = encode_cursor(category, inst)
+
+        console_instance = window[0]
+        activity_id = self.request.GET.get('a')
+        if activity_id:
+            console_instance = self.get_console_instance(
+                console_instances=window, activity_id=activity_id, count=len(window), offset=1
+            )
+        next_cursor = encode_cursor(category, window[0])
+        return {
+            'console_instance': console_instance,
+            'console_instances': window,
+            'cursor_navigation': True,
+            # the views of the sales started from the console send the offset back
+            'offset': self.get_cursor() or "",
+            'next_cursor': next_cursor,
+            'skip_query': "cursor={}".format(next_cursor),
+        }
+
     def get_phone_duplicates_info(self, contact):
         """
         Get information about other contacts with the same phone number.
@@ -54,6 +54,7 @@ from support.forms import (
     RetentionDiscountForm,
     FreeSubscriptionForm,
 )
+from support.daily_rollups import UNSUBSCRIPTIONS, use_rollups
 from support.location import SugerenciaGeorefForm
 from support.models import SalesRecord
 from util.dates import add_business_days
@@ -390,10 +391,83 @@ class SubscriptionUpdateView(SubscriptionMixin, FormView):
         return context
 
 
+def unsubscription_statistics_from_rollups(filters):
+    """
+    The statistics of unsubscription_statistics from the unsubscriptions roll-up (see support.daily_rollups), for the
+    cleaned data of UnsubscribedSubscriptionsByEndDateFilter.
+    """
+    date_from, date_to = UnsubscribedSubscriptionsByEndDateFilter.date_range(filters.get("date"))
+    if filters.get("date_gte"):
+        date_from = max(date_from, filters["date_gte"]) if date_from else filters["date_gte"]
+    if filters.get("date_lte"):
+        date_to = min(date_to, filters["date_lte"]) if date_to else filters["date_lte"]
+    today, group_by = date.today(), ["product_id", "reason"]
+    executed, programmed = {}, {}
+    if not date_from or date_from <= today:
+        executed = UNSUBSCRIPTIONS.read(group_by, date_from, min(date_to, today) if date_to else today)
+    if not date_to or date_to > today:
+        # like end_date__gt=today, within the range
+        programmed = UNSUBSCRIPTIONS.read(group_by, max(date_from or today, today + timedelta(1)), date_to)
+
+    products = Product.objects.filter(id__in={product_id for product_id, reason in {**executed, **programmed}})
+    products = sorted(products, key=lambda product: (product.billing_priority, product.name))
+    overdue = settings.UNSUBSCRIPTION_OVERDUE_REASON
+    choices = dict(settings.UNSUBSCRIPTION_REASON_CHOICES)
+
+    def by_product(*groups, requested=True):
+        totals = collections.Counter()
+        for group in groups:
+            for (product_id, reason), measures in group.items():
+                if (reason != overdue) == requested:
+                    totals[product_id] += measures["unsubscriptions"]
+        return [
+            {"unsubscription_products__name": product.name, "total": totals[product.id]}
+            for product in products
+            if totals[product.id]
+        ]
+
+    def by_reason(product_id=None):
+        totals = collections.Counter()
+        for group in (executed, programmed):
+            for (group_product_id, reason), measures in group.items():
+                if reason is not None and product_id in (None, group_product_id):
+                    totals[reason] += measures["unsubscriptions"]
+        return [
+            {"unsubscription_reason": choices.get(reason, None), "total": total} for reason, total in totals.items()
+        ]
+
+    individual_products_dict = collections.OrderedDict()
+    for product_obj in Product.objects.filter(type="S", offerable=True).order_by("billing_priority"):
+        individual_products_dict[product_obj.name] = by_reason(product_obj.id)
+    total_unsubscriptions_requested = by_product(executed, programmed)
+    total_unsubscriptions_not_requested = by_product(executed, programmed, requested=False)
+    return {
+        "executed_unsubscriptions_requested": by_product(executed),
+        "executed_unsubscriptions_not_requested": by_product(executed, requested=False),
+        "programmed_unsubscriptions_requested": by_product(programmed),
+        "programmed_unsubscriptions_not_requested": by_product(programmed, requested=False),
+        "total_unsubscriptions_requested": total_unsubscriptions_requested,
+        "total_unsubscriptions_not_requested": total_unsubscriptions_not_requested,
+        "individual_products_dict": individual_products_dict,
+        "total_unsubscriptions_by_reason": by_reason(),
+        "total_requested_unsubscriptions_count": sum(item["total"] for item in total_unsubscriptions_requested),
+        "total_not_requested_unsubscriptions_count": sum(
+            item["total"] for item in total_unsubscriptions_not_requested
+        ),
+        "total_unsubscriptions_count": sum(
+            measures["unsubscriptions"] for group in (executed, programmed) for measures in group.values()
+        ),
+    }
+
+
 @staff_member_required
 def unsubscription_statistics(request):
     unsubscriptions_queryset = Subscription.objects.filter(end_date__isnull=False, unsubscription_products__type="S")
     unsubscriptions_filter = UnsubscribedSubscriptionsByEndDateFilter(request.GET, queryset=unsubscriptions_queryset)
+    if use_rollups(request) and unsubscriptions_filter.is_valid():
+        context = unsubscription_statistics_from_rollups(unsubscriptions_filter.form.cleaned_data)
+        context.update({"filter": unsubscriptions_filter, "queryset": unsubscriptions_filter.qs})
+        return render(request, "unsubscription_statistics.html", context)
 
     executed_unsubscriptions_requested = (
         unsubscriptions_filter.qs.filter(end_date__lte=date.today())
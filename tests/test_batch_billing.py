@@ -0,0 +1,124 @@
+# coding=utf-8
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
+
+from django.test import TestCase
+
+from core.models import Product, Subscription
+from logistics.models import Route
+from invoicing.models import Billing, Invoice
+from invoicing.batch_billing import plan_chunks, run_batch_billing
+from invoicing.utils import bill_subscription
+
+from tests.factory import (
+    create_contact, create_subscription, create_product, create_address, create_route, create_dynamiccontactfilter
+)
+
+
+class TestBatchBilling(TestCase):
+
+    def setUp(self):
+        create_route(number=1, name="Route 1")
+        create_product(name='Newspaper', price=500, type="S", billing_priority=1)
+        product, route = Product.objects.get(slug="newspaper"), Route.objects.get(number=1)
+        self.subscriptions = []
+        for i in range(5):
+            contact = create_contact('cliente%d' % i, "2900080%d" % i)
+            subscription = create_subscription(contact)
+            subscription.next_billing = date.today()
+            subscription.save()
+            address = create_address('Treinta y Tres 14%d' % i, contact, address_type='physical')
+            subscription.add_product(product=product, address=address, route=route)
+            self.subscriptions.append(subscription)
+
+    def test1_batch_billing_bills_every_chunk(self):
+        billing = Billing.objects.create(billing_date=date.today(), dpp=10)
+        chunks = plan_chunks(billing, chunk_size=2)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(billing.subscriber_amount, 5)
+
+        reports = list(run_batch_billing(billing))
+        self.assertEqual(sum(report["billed"] for report in reports), 5)
+        self.assertEqual(sum(report["failed"] for report in reports), 0)
+        self.assertEqual(billing.invoice_set.count(), 5)
+        billing.refresh_from_db()
+        self.assertEqual(billing.status, "C")
+        self.assertEqual(billing.processed_contacts, 5)
+
+    def test2_resumed_billing_does_not_bill_twice(self):
+        billing = Billing.objects.create(billing_date=date.today(), dpp=10)
+        plan_chunks(billing, chunk_size=2)
+        list(run_batch_billing(billing))
+
+        # simulate a crash before the last chunk was committed and resume the run
+        billing.chunks.filter(number=3).update(status="P")
+        reports = list(run_batch_billing(billing))
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(reports[0]["billed"], 0)
+        self.assertEqual(reports[0]["skipped"], 1)
+        self.assertEqual(Invoice.objects.filter(subscription__in=self.subscriptions).count(), 5)
+        billing.refresh_from_db()
+        self.assertEqual(billing.processed_contacts, 5)
+
+        # the last subscription failed to bill, and is billed when the billing is resumed
+        billing.chunks.filter(number=3).update(status="E", billed=0, skipped=0, failed=1)
+        Subscription.objects.filter(pk=self.subscriptions[-1].pk).update(next_billing=date.today())
+        reports = list(run_batch_billing(billing))
+        self.assertEqual((reports[0]["billed"], reports[0]["failed"]), (1, 0))
+        billing.refresh_from_db()
+        self.assertEqual(billing.processed_contacts, 5)
+
+    def test3_bulk_billing_matches_row_by_row_billing(self):
+        # the first subscription is billed on its own, the rest in bulk
+        expected = bill_subscription(self.subscriptions[0], date.today())
+        billing = Billing.objects.create(billing_date=date.today(), dpp=10)
+        plan_chunks(billing, chunk_size=10)
+        reports = list(run_batch_billing(billing, bulk=True))
+        self.assertEqual(reports[0]["billed"], 4)
+
+        for subscription in self.subscriptions[1:]:
+            invoice = Invoice.objects.get(subscription=subscription)
+            self.assertEqual(invoice.amount, expected.amount)
+            self.assertEqual(invoice.invoiceitem_set.count(), expected.invoiceitem_set.count())
+            self.assertEqual(invoice.history.count(), 1)
+            subscription.refresh_from_db()
+            self.assertEqual(subscription.next_billing, date.today() + relativedelta(months=subscription.frequency))
+            self.assertEqual(subscription.history.latest().next_billing, subscription.next_billing)
+
+    def test4_zero_amount_subscriptions_move_forward(self):
+        # a balance larger than the price leaves nothing to bill, like bill_subscription the next billing date and
+        # the balance are advanced anyway, so the subscription isn't picked up again by every run
+        for bulk in (True, False):
+            subscription = self.subscriptions[0 if bulk else 1]
+            subscription.next_billing, subscription.balance = date.today(), 1000
+            subscription.save()
+            billing = Billing.objects.create(billing_date=date.today(), dpp=10)
+            plan_chunks(billing, chunk_size=10)
+            reports = list(run_batch_billing(billing, bulk=bulk))
+            self.assertEqual(reports[0]["skipped"], 1)
+            self.assertFalse(billing.invoice_set.filter(subscription=subscription).exists())
+            subscription.refresh_from_db()
+            self.assertEqual(subscription.next_billing, date.today() + relativedelta(months=subscription.frequency))
+            self.assertEqual(subscription.balance, 500)
+
+    def test5_bulk_billing_refreshes_debtor_filters(self):
+        # an invoice created already expired makes its contact a debtor, like when it's saved by bill_subscription
+        dcf = create_dynamiccontactfilter("Debtors", 1)
+        dcf.debtor_contacts = 2
+        dcf.save()
+        dcf.products.add(Product.objects.get(slug="newspaper"))
+        contact = self.subscriptions[0].contact
+        contact.email = "debtor@example.com"
+        contact.save()
+        self.assertFalse(dcf.members.exists())
+
+        billing_date = date.today() - timedelta(30)
+        for subscription in self.subscriptions:
+            subscription.next_billing = billing_date
+            subscription.save()
+        billing = Billing.objects.create(billing_date=billing_date, dpp=10)
+        plan_chunks(billing, chunk_size=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            reports = list(run_batch_billing(billing, bulk=True))
+        self.assertEqual(reports[0]["billed"], 5)
+        self.assertEqual(list(dcf.members.values_list("contact_id", flat=True)), [contact.id])
@@ -0,0 +1,80 @@
+# coding=utf-8
+from datetime import date
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Contact, Product, Subscription, SubscriptionProduct
+from core.pricing import pricing_engine
+from core.utils import calc_price_from_products
+from invoicing.billing_context import BillingContext
+from invoicing.utils import bill_subscription
+from logistics.models import Route
+
+from tests.factory import create_address, create_contact, create_product, create_route
+
+
+class TestBillingContext(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_route(number=1, name="Route 1")
+        create_product(name='Newspaper', price=500, type="S", billing_priority=1)
+        create_product(name='Weekly', price=200, type="S", billing_priority=2)
+        product, weekly = Product.objects.get(slug="newspaper"), Product.objects.get(slug="weekly")
+        route = Route.objects.get(number=1)
+        address = create_address('Treinta y Tres 1479', create_contact('cliente', "29000808"))
+
+        contacts = Contact.objects.bulk_create([Contact(name="cliente%d" % i, no_mail=True) for i in range(1000)])
+        subscriptions = Subscription.objects.bulk_create(
+            [
+                Subscription(contact=contact, type="N", payment_type="C", next_billing=date.today())
+                for contact in contacts
+            ]
+        )
+        subscription_products = []
+        for i, subscription in enumerate(subscriptions):
+            subscription_products.append(
+                SubscriptionProduct(subscription=subscription, product=product, address=address, route=route)
+            )
+            if i % 2:
+                subscription_products.append(
+                    SubscriptionProduct(subscription=subscription, product=weekly, address=address, route=route)
+                )
+        SubscriptionProduct.objects.bulk_create(subscription_products)
+        cls.subscription_ids = [subscription.id for subscription in subscriptions]
+
+    def read_billing_data(self, subscription_ids):
+        """
+        Reads everything bill_subscription needs for the given subscriptions, returns the number of queries made.
+        """
+        # start with no catalog loaded, so both runs load it
+        pricing_engine.invalidate()
+        with CaptureQueriesContext(connection) as queries:
+            context = BillingContext(subscription_ids)
+            for subscription in context:
+                subscription.get_billing_data_by_priority()
+                subscription.get_product_count()
+                subscription.get_billing_document()
+                summary = subscription.product_summary(with_pauses=True, context=context)
+                calc_price_from_products(
+                    summary, subscription.frequency, create_items=True, subscription=subscription,
+                    catalog=context.products,
+                )
+        self.assertEqual(len(context), len(subscription_ids))
+        return len(queries)
+
+    def test1_query_count_is_constant(self):
+        self.assertEqual(
+            self.read_billing_data(self.subscription_ids[:10]), self.read_billing_data(self.subscription_ids)
+        )
+
+    def test2_billing_with_context_matches_billing_without_it(self):
+        with_context, without_context = self.subscription_ids[1], self.subscription_ids[3]
+        context = BillingContext([with_context])
+        invoice = bill_subscription(context.subscriptions[0], date.today(), context=context)
+        expected = bill_subscription(Subscription.objects.get(pk=without_context), date.today())
+        self.assertEqual(invoice.amount, expected.amount)
+        self.assertEqual(invoice.billing_address, expected.billing_address)
+        self.assertEqual(invoice.invoiceitem_set.count(), expected.invoiceitem_set.count())
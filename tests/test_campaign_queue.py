@@ -0,0 +1,78 @@
+# coding=utf-8
+from datetime import date, datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from core.campaign_queue import deferred_refresh
+from core.models import Activity, Campaign, ContactCampaignStatus
+from support.models import Seller
+from tests.factories.core_factories import ContactFactory
+
+
+class TestCampaignQueue(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username="vendedor", password="testpass")
+        self.seller = Seller.objects.create(name="Vendedor", user=user, internal=True)
+        self.campaign = Campaign.objects.create(name="Mid", active=True, priority=3)
+        self.urgent = Campaign.objects.create(name="Urgent", active=True, priority=1)
+        self.contacts = [ContactFactory() for i in range(3)]
+        for day, contact in zip([3, 1, 2], self.contacts):
+            ContactCampaignStatus.objects.create(
+                contact=contact, campaign=self.campaign, status=1, seller=self.seller, date_assigned=date(2026, 10, day)
+            )
+
+    def queue(self):
+        return list(self.campaign.get_not_contacted(self.seller.id).values_list("contact_id", flat=True))
+
+    def assertQueueMatchesDefinition(self):
+        for campaign in Campaign.objects.all():
+            self.assertEqual(
+                set(campaign.queue_entries.values_list("contact_campaign_status_id", flat=True)),
+                set(campaign.get_queue_statuses().values_list("id", flat=True)),
+            )
+
+    def test1_queue_order_and_count(self):
+        first, second, third = self.contacts
+        self.assertEqual(self.queue(), [second.id, third.id, first.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.campaign.get_not_contacted_count(self.seller.id), 3)
+        self.assertQueueMatchesDefinition()
+
+    def test2_queue_follows_statuses_activities_and_campaigns(self):
+        first, second, third = self.contacts
+        # a status in a campaign with a higher priority takes the contact out of the queue
+        ContactCampaignStatus.objects.create(contact=first, campaign=self.urgent, status=1, seller=self.seller)
+        self.assertEqual(self.queue(), [second.id, third.id])
+        # and so does a pending activity
+        activity = Activity.objects.create(
+            contact=second, campaign=self.campaign, seller=self.seller, activity_type="C", status="P",
+            datetime=datetime.now(),
+        )
+        self.assertEqual(self.queue(), [third.id])
+        self.assertQueueMatchesDefinition()
+
+        activity.status = "C"
+        activity.save()
+        self.assertEqual(self.queue(), [second.id, third.id])
+        # the queues are rebuilt when a campaign is deactivated
+        self.urgent.active = False
+        self.urgent.save()
+        self.assertEqual(self.queue(), [second.id, third.id, first.id])
+        self.urgent.delete()
+        self.assertQueueMatchesDefinition()
+
+        ccs = ContactCampaignStatus.objects.get(contact=third, campaign=self.campaign)
+        ccs.status = 4
+        ccs.save()
+        self.assertEqual(self.queue(), [second.id, first.id])
+
+    def test3_deferred_refresh(self):
+        with deferred_refresh():
+            for ccs in ContactCampaignStatus.objects.all():
+                ccs.seller = None
+                ccs.save()
+            self.assertEqual(len(self.queue()), 3)
+        self.assertEqual(self.queue(), [])
+        self.assertQueueMatchesDefinition()
@@ -0,0 +1,65 @@
+# coding=utf-8
+from django.contrib.auth.models import Permission, User
+from django.test import TestCase
+from django.urls import reverse
+
+from core.contact_duplicates import find_candidates, store_candidates
+from core.contact_merge import merge_contacts
+from core.models import DuplicateContactCandidate
+from tests.factory import create_contact
+
+
+class TestContactDuplicates(TestCase):
+
+    def setUp(self):
+        self.juan = create_contact("Juan Pérez", "099123456", "juan.perez@gmail.com")
+        self.other_juan = create_contact("PEREZ, Juan", "", "juanperez+news@gmail.com")
+        self.other_juan.mobile = "+598 99 123 456"
+        self.other_juan.save()
+        self.ana = create_contact("Ana Gómez", "24001234")
+        self.other_ana = create_contact("ana gomez", "")
+        self.unrelated = create_contact("Pedro", "24009999")
+
+    def test1_candidates_are_blocked_and_ranked(self):
+        candidates = find_candidates(min_score=0)
+        self.assertEqual(
+            list(candidates[["contact_id", "other_id"]].itertuples(index=False, name=None)),
+            [(self.juan.id, self.other_juan.id), (self.ana.id, self.other_ana.id)],
+        )
+        self.assertEqual(list(candidates["score"]), [1.0, 0.5])
+        self.assertEqual(list(candidates["reasons"]), ["email,phone,name", "name"])
+
+        # the same name alone isn't enough
+        self.assertEqual(len(find_candidates()), 1)
+
+        # the keys shared by too many contacts aren't used
+        create_contact("Ana Gomez", "")
+        self.assertEqual(len(find_candidates(min_score=0, max_block=2)), 1)
+
+    def test2_store_candidates(self):
+        self.assertEqual(store_candidates(find_candidates(min_score=0)), 2)
+        DuplicateContactCandidate.objects.filter(contact=self.ana).update(dismissed=True)
+        self.assertEqual(store_candidates(find_candidates(min_score=0)), 1)
+        self.assertTrue(DuplicateContactCandidate.objects.get(contact=self.ana).dismissed)
+
+        # merging the contacts solves their candidates, and the merged contact isn't a candidate anymore
+        merge_contacts([(self.juan, self.other_juan)])
+        self.assertFalse(DuplicateContactCandidate.objects.filter(contact=self.juan).exists())
+        self.assertEqual(len(find_candidates(min_score=0)), 1)
+
+    def test3_merge_compare_contacts_with_invalid_ids(self):
+        user = User.objects.create_user("merger", password="pass", is_staff=True)
+        user.user_permissions.add(Permission.objects.get(codename="can_merge_contacts"))
+        self.client.login(username="merger", password="pass")
+        url = reverse("merge_compare_contacts")
+
+        response = self.client.get(url, {"contact_1": "abc", "contact_2": self.juan.id})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        response = self.client.get(url, {"contact_1": self.juan.id, "contact_2": self.other_juan.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["contact2"], self.other_juan)
+
+        response = self.client.post(
+            reverse("process_merge_contacts"), {"contact1_id": "abc", "contact2_id": self.juan.id, "action": "dismiss"}
+        )
+        self.assertRedirects(response, reverse("duplicate_contact_candidates"), fetch_redirect_response=False)
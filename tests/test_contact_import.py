@@ -0,0 +1,95 @@
+# coding=utf-8
+from unittest.mock import patch
+
+import pandas as pd
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from core.models import Address, Contact
+from support.choices import CONTACT_IMPORT_STATUS
+from support.contact_import import COLUMNS, ContactImporter, run_import
+from support.models import ContactImport
+from tests.factory import create_contact
+
+TAGS = {"tags": ["nuevo"], "tags_existing": ["existente"], "tags_active": [], "tags_in_campaign": []}
+
+
+def make_rows(*rows):
+    return pd.DataFrame([{column: row.get(column, "") for column in COLUMNS} for row in rows], columns=COLUMNS)
+
+
+class TestContactImport(TestCase):
+
+    def test1_rows_are_matched_within_the_file(self):
+        existing = create_contact("Existente", "099111111", "existente@example.com")
+        df = make_rows(
+            {"name": "Nuevo", "email": "nuevo@example.com", "address_1": "18 de Julio 1234"},
+            # matches the contact created by the first row
+            {"name": "Nuevo", "email": "nuevo@example.com", "phone": "099222222"},
+            {"name": "Existente", "email": "existente@example.com", "phone": "099333333"},
+            # matches the existing contact by the phone added by the previous row
+            {"name": "Existente", "phone": "099333333"},
+        )
+        results = ContactImporter(TAGS, chunk_size=2).run(df)
+
+        self.assertEqual(results["new_contacts"], 1)
+        self.assertEqual(results["existing_inactive_contacts"], 3)
+        self.assertEqual(results["added_phones"], 2)
+        self.assertEqual(Contact.objects.count(), 2)
+        new_contact = Contact.objects.get(email="nuevo@example.com")
+        self.assertEqual(new_contact.phone.as_national.replace(" ", ""), "099222222")
+        self.assertTrue(Address.objects.filter(contact=new_contact).exists())
+        self.assertEqual(set(new_contact.tags.names()), {"nuevo", "existente"})
+        existing.refresh_from_db()
+        self.assertEqual(existing.mobile.as_national.replace(" ", ""), "099333333")
+        self.assertEqual(set(existing.tags.names()), {"existente"})
+
+    def test2_failing_rows_are_left_out(self):
+        df = make_rows(
+            {"name": "Uno", "email": "uno@example.com"},
+            {"name": "", "email": "sin.nombre@example.com"},
+            {"name": "Tres", "email": "tres@example.com", "id_document_type": "XX"},
+        )
+        results = ContactImporter(TAGS, chunk_size=10).run(df)
+
+        self.assertEqual(results["new_contacts"], 2)
+        self.assertEqual(len(results["errors"]), 1)
+        self.assertTrue(results["errors"][0].startswith("CSV Row 3:"))
+        self.assertEqual(len(results["warnings"]), 1)
+        self.assertFalse(Contact.objects.filter(email="sin.nombre@example.com").exists())
+
+    def test3_an_interrupted_import_is_resumed(self):
+        df = make_rows(*[{"name": "Contacto", "email": "contacto{}@example.com".format(i)} for i in range(5)])
+        contact_import = ContactImport.objects.create(
+            file=ContentFile(df.to_csv(index=False).encode("utf-8"), name="contactos.csv"),
+            tags=TAGS,
+            status=CONTACT_IMPORT_STATUS.STARTED,
+        )
+        # the first chunk was imported before the interruption
+        ContactImporter(TAGS, chunk_size=2).run(df.iloc[:2])
+        contact_import.processed_rows = 2
+        contact_import.results = {
+            "new_contacts": 2, "in_active_campaign": 0, "active_contacts": 0, "existing_inactive_contacts": 0,
+            "added_emails": 0, "added_phones": 0, "added_mobiles": 0, "errors": [], "warnings": [],
+        }
+        contact_import.save()
+
+        run_import(contact_import, chunk_size=2)
+
+        contact_import.refresh_from_db()
+        self.assertEqual(contact_import.status, CONTACT_IMPORT_STATUS.COMPLETED)
+        self.assertEqual(contact_import.total_rows, 5)
+        self.assertEqual(contact_import.processed_rows, 5)
+        self.assertEqual(contact_import.results["new_contacts"], 5)
+        self.assertEqual(contact_import.progress(), "100.00")
+        self.assertEqual(Contact.objects.filter(email__startswith="contacto").count(), 5)
+
+    def test4_tags_of_a_failed_chunk_are_created_again(self):
+        df = make_rows({"name": "Uno", "email": "uno@example.com"}, {"name": "Dos", "email": "dos@example.com"})
+        # the chunk fails after creating the tag, and its rows are imported again one by one
+        with patch("support.contact_import.dcf_members.contacts_changed", side_effect=[Exception("Error"), None, None]):
+            results = ContactImporter(TAGS, chunk_size=10).run(df)
+
+        self.assertEqual((results["new_contacts"], results["errors"]), (2, []))
+        for email in ("uno@example.com", "dos@example.com"):
+            self.assertEqual(set(Contact.objects.get(email=email).tags.names()), {"nuevo"})
@@ -0,0 +1,76 @@
+# coding=utf-8
+from datetime import date
+
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+from core.contact_merge import merge_contacts, merge_pairs
+from core.models import Contact, ContactCampaignStatus
+from tests.factory import create_campaign, create_contact, create_issue, create_subscription
+
+
+class TestContactMerge(TestCase):
+
+    def setUp(self):
+        self.target = create_contact("Destino", "099111111")
+        self.source = create_contact("Origen", "099222222", "origen@example.com")
+        self.campaign = create_campaign("Campaña")
+        self.other_campaign = create_campaign("Otra campaña")
+
+    def test1_every_relation_is_moved(self):
+        subscription = create_subscription(self.source)
+        create_issue(self.source, date.today())
+        target_status = ContactCampaignStatus.objects.create(contact=self.target, campaign=self.campaign)
+        ContactCampaignStatus.objects.create(contact=self.source, campaign=self.campaign)
+        moved_status = ContactCampaignStatus.objects.create(contact=self.source, campaign=self.other_campaign)
+        self.source.tags.add("vip")
+
+        merge_contacts([(self.target, self.source)])
+
+        self.target.refresh_from_db()
+        self.source.refresh_from_db()
+        self.assertEqual(self.target.email, "origen@example.com")
+        self.assertIsNone(self.source.email)
+        self.assertEqual(list(self.target.subscriptions.all()), [subscription])
+        self.assertEqual(self.target.issue_set.count(), 1)
+        # the target's status of the campaign is kept, the other one is moved
+        self.assertEqual(
+            set(self.target.contactcampaignstatus_set.values_list("pk", flat=True)), {target_status.pk, moved_status.pk}
+        )
+        self.assertFalse(ContactCampaignStatus.objects.filter(contact=self.source).exists())
+        self.assertEqual(set(self.target.tags.names()), {"vip"})
+        self.assertEqual(set(self.source.tags.names()), {"vip", "eliminar"})
+        self.assertIn("Combined from {}".format(self.source.id), self.target.notes)
+
+    def test2_merge_pairs(self):
+        other_source = create_contact("Otro origen", "099333333")
+        create_subscription(other_source)
+        merged, errors = merge_pairs(
+            [
+                (self.target.id, self.source.id),
+                (self.target.id, other_source.id),
+                (other_source.id, self.target.id),
+                (self.target.id, 0),
+            ],
+            chunk_size=10,
+        )
+        self.assertEqual(merged, 2)
+        self.assertEqual([error[:2] for error in errors], [(other_source.id, self.target.id), (self.target.id, 0)])
+        self.assertEqual(self.target.subscriptions.count(), 1)
+        self.assertEqual(Contact.objects.filter(tags__name="eliminar").count(), 2)
+
+    def test3_moved_email_is_validated(self):
+        create_subscription(self.source)
+        # the CMS has the email for another contact and it can't be deduped
+        with override_settings(WEB_UPDATE_USER_ENABLED=True), patch(
+            "core.models.validateEmailOnWeb", return_value={"msg": "El email ya está en uso", "retval": 0}
+        ) as validate:
+            with self.assertRaises(ValidationError):
+                merge_contacts([(self.target, self.source)])
+        validate.assert_called_once_with(self.target.id, "origen@example.com")
+        # nothing was merged
+        self.assertEqual(Contact.objects.get(pk=self.source.pk).email, "origen@example.com")
+        self.assertIsNone(Contact.objects.get(pk=self.target.pk).email)
+        self.assertEqual(self.target.subscriptions.count(), 0)
@@ -0,0 +1,76 @@
+# coding=utf-8
+from datetime import date
+
+from django.test import TestCase
+
+from logistics.models import Delivery
+from logistics.utils import create_deliveries
+
+from tests.factory import create_contact, create_product, create_route, create_subscription
+
+
+class TestCreateDeliveries(TestCase):
+
+    def setUp(self):
+        # 2026-10-12 is a monday
+        self.monday = date(2026, 10, 12)
+        self.route_1, self.route_2 = create_route(1, "Route 1"), create_route(2, "Route 2")
+        self.monday_paper = create_product(name="Monday paper", price=100)
+        self.monday_paper.weekday = 1
+        self.monday_paper.save()
+        self.friday_paper = create_product(name="Friday paper", price=100)
+        self.friday_paper.weekday = 5
+        self.friday_paper.save()
+
+    def subscribe(self, name, start_date, products, route, copies=1, active=True):
+        subscription = create_subscription(create_contact(name, "29000800"))
+        subscription.start_date = start_date
+        subscription.active = active
+        subscription.save()
+        for product in products:
+            subscription.add_product(product=product, copies=copies, route=route)
+        return subscription
+
+    def delivered(self):
+        return {
+            (delivery.date, delivery.route, delivery.product_id): delivery.copies
+            for delivery in Delivery.objects.all()
+        }
+
+    def test1_copies_per_date_route_and_product(self):
+        self.subscribe("A", date(2026, 1, 1), [self.monday_paper, self.friday_paper], self.route_1)
+        self.subscribe("B", date(2026, 1, 1), [self.monday_paper], self.route_1, copies=2)
+        self.subscribe("C", date(2026, 1, 1), [self.friday_paper], self.route_2)
+        self.subscribe("D", date(2026, 1, 1), [self.friday_paper], self.route_2, active=False)
+
+        create_deliveries(self.monday, date(2026, 10, 19))
+        self.assertEqual(
+            self.delivered(),
+            {
+                (self.monday, 1, self.monday_paper.id): 3,
+                (date(2026, 10, 16), 1, self.friday_paper.id): 1,
+                (date(2026, 10, 16), 2, self.friday_paper.id): 1,
+                (date(2026, 10, 19), 1, self.monday_paper.id): 3,
+            },
+        )
+
+    def test2_running_again_does_not_add_the_copies_twice(self):
+        self.subscribe("A", date(2026, 1, 1), [self.monday_paper], self.route_1, copies=2)
+        create_deliveries(self.monday)
+        create_deliveries(self.monday)
+        self.assertEqual(self.delivered(), {(self.monday, 1, self.monday_paper.id): 2})
+
+        self.subscribe("B", date(2026, 1, 1), [self.monday_paper], self.route_2)
+        create_deliveries(self.monday)
+        self.assertEqual(
+            self.delivered(), {(self.monday, 1, self.monday_paper.id): 2, (self.monday, 2, self.monday_paper.id): 1}
+        )
+
+    def test3_subscriptions_count_from_their_start_date(self):
+        self.subscribe("A", date(2026, 1, 1), [self.monday_paper], self.route_1)
+        self.subscribe("B", date(2026, 10, 14), [self.monday_paper], self.route_1)
+        create_deliveries(self.monday, date(2026, 10, 19))
+        self.assertEqual(
+            self.delivered(),
+            {(self.monday, 1, self.monday_paper.id): 1, (date(2026, 10, 19), 1, self.monday_paper.id): 2},
+        )
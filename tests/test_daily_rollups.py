@@ -0,0 +1,122 @@
+# coding=utf-8
+from datetime import date, datetime, timedelta
+
+from django.test import TestCase, override_settings
+
+from support.daily_rollups import SALES, UNSUBSCRIPTIONS
+from support.models import DailyRollup, SalesRecord
+from support.views.subscriptions import unsubscription_statistics_from_rollups
+from tests.factory import create_contact, create_product, create_subscription
+
+
+class TestDailyRollups(TestCase):
+
+    def setUp(self):
+        self.today = date.today()
+        self.product = create_product("Producto", 500, offerable=True)
+        self.other_product = create_product("Otro producto", 300, offerable=True)
+        self.sales = []
+        for days, payment_type, products in (
+            (3, "C", [self.product]),
+            (3, "S", [self.product, self.other_product]),
+            (2, "C", []),
+            (0, "C", [self.other_product]),
+        ):
+            subscription = create_subscription(create_contact("Contacto", "099123456"), payment_type=payment_type)
+            sale = SalesRecord.objects.create(subscription=subscription, sale_type=SalesRecord.SALE_TYPE.FULL)
+            sale.products.set(products)
+            # date_time is auto_now_add
+            SalesRecord.objects.filter(pk=sale.pk).update(
+                date_time=datetime.combine(self.today - timedelta(days), datetime.min.time())
+            )
+            self.sales.append(sale)
+
+    def test1_sales_rollup_matches_the_sales_records(self):
+        group_by = ["payment_type", "products_count"]
+        live = SALES.read(group_by)
+        self.assertEqual(live[("C", 1)]["sales"], 2)
+        self.assertEqual(live[("S", 2)]["sales"], 1)
+        self.assertEqual(live[("C", 0)]["sales"], 1)
+
+        pending = SALES.pending_days()
+        self.assertEqual(pending, [self.today - timedelta(3), self.today - timedelta(2)])
+        for day in pending:
+            SALES.rollup_day(day)
+        self.assertEqual(SALES.pending_days(), [])
+        with self.assertNumQueries(2):
+            self.assertEqual(SALES.read(group_by), live)
+        self.assertEqual(SALES.read(date_from=self.today - timedelta(2))["sales"], 2)
+        self.assertEqual(SALES.read(payment_type__in=["S"])["sales"], 1)
+
+        # the sales are aggregated by fields of their subscription
+        subscription = self.sales[1].subscription
+        subscription.payment_type = "C"
+        subscription.save()
+        self.assertEqual(SALES.pending_days(), [self.today - timedelta(3)])
+        self.assertEqual(SALES.read(group_by)[("C", 2)]["sales"], 1)
+
+    def test2_unsubscriptions_rollup(self):
+        end_date = self.today - timedelta(5)
+        subscription = self.sales[0].subscription
+        subscription.end_date = end_date
+        subscription.unsubscription_reason = 1
+        subscription.save()
+        subscription.unsubscription_products.add(self.product, self.other_product)
+
+        self.assertEqual(UNSUBSCRIPTIONS.pending_days(), [end_date])
+        UNSUBSCRIPTIONS.rollup_day(end_date)
+        rows = UNSUBSCRIPTIONS.read(["product_id", "reason"])
+        self.assertEqual(rows[(self.product.id, 1)]["unsubscriptions"], 1)
+        self.assertEqual(UNSUBSCRIPTIONS.read()["unsubscriptions"], 2)
+
+        # moving the end date drops both days, the previous one on pre_save
+        subscription.end_date = end_date - timedelta(1)
+        subscription.save()
+        self.assertFalse(DailyRollup.objects.filter(name=UNSUBSCRIPTIONS.name).exists())
+        self.assertEqual(UNSUBSCRIPTIONS.read(date_from=end_date)["unsubscriptions"], 0)
+        self.assertEqual(UNSUBSCRIPTIONS.pending_days(), [end_date - timedelta(1), end_date])
+
+    def test3_saves_that_dont_change_the_rolled_up_fields(self):
+        subscription = self.sales[0].subscription
+        subscription.end_date, subscription.unsubscription_reason = self.today - timedelta(5), 1
+        subscription.save()
+        subscription.unsubscription_products.add(self.product)
+        for rollup in (SALES, UNSUBSCRIPTIONS):
+            for day in rollup.pending_days():
+                rollup.rollup_day(day)
+
+        # billing only changes the next billing date and the balance
+        subscription.next_billing, subscription.balance = self.today, 100
+        subscription.save()
+        self.assertEqual(SALES.pending_days(), [])
+        self.assertEqual(UNSUBSCRIPTIONS.pending_days(), [])
+
+    # defined by every deployment in its local settings
+    @override_settings(UNSUBSCRIPTION_OVERDUE_REASON=99)
+    def test4_programmed_unsubscriptions_are_the_ones_after_today_in_the_range(self):
+        for days, subscription in zip((0, 1, 10), (sale.subscription for sale in self.sales)):
+            subscription.end_date, subscription.unsubscription_reason = self.today + timedelta(days), 1
+            subscription.save()
+            subscription.unsubscription_products.add(self.product)
+
+        def counts(**filters):
+            statistics = unsubscription_statistics_from_rollups(filters)
+            executed = sum(item["total"] for item in statistics["executed_unsubscriptions_requested"])
+            programmed = sum(item["total"] for item in statistics["programmed_unsubscriptions_requested"])
+            return executed, programmed
+
+        # today is executed only
+        self.assertEqual(counts(), (1, 2))
+        self.assertEqual(counts(date_lte=self.today + timedelta(5)), (1, 1))
+        self.assertEqual(counts(date_gte=self.today + timedelta(5)), (0, 1))
+
+    def test5_moving_a_sale_drops_both_days(self):
+        for day in SALES.pending_days():
+            SALES.rollup_day(day)
+
+        sale = SalesRecord.objects.get(pk=self.sales[0].pk)
+        sale.date_time = datetime.combine(self.today - timedelta(2), datetime.min.time())
+        sale.save()
+        self.assertEqual(SALES.pending_days(), [self.today - timedelta(3), self.today - timedelta(2)])
+        self.assertEqual(SALES.read(date_to=self.today - timedelta(3))["sales"], 1)
+        self.assertEqual(SALES.read(date_from=self.today - timedelta(2), date_to=self.today - timedelta(2))["sales"], 2)
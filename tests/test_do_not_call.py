@@ -0,0 +1,58 @@
+# coding=utf-8
+from django.test import TestCase, override_settings
+
+from core.do_not_call import flag_contacts, normalize_number, prefetch_do_not_call, sync_numbers
+from core.models import DoNotCallNumber
+from tests.factory import create_contact
+
+
+class TestDoNotCall(TestCase):
+
+    def setUp(self):
+        sync_numbers(["099111111", "24001234"])
+
+    def test1_numbers_are_normalised(self):
+        self.assertEqual(normalize_number("099 111 111"), "99111111")
+        self.assertEqual(normalize_number("+59899111111"), "99111111")
+        self.assertEqual(DoNotCallNumber.objects.get(number="24001234").national_number, "24001234")
+        self.assertIsNone(normalize_number(""))
+
+    def test2_contact_phones_are_matched_exactly(self):
+        contact = create_contact("No llamar", "099111111")
+        contact.work_phone = "2400 1234"
+        # a number that contains a shorter one isn't a match
+        other = create_contact("Llamar", "099911111")
+        with self.assertNumQueries(1):
+            self.assertTrue(contact.do_not_call_phone())
+            self.assertTrue(contact.do_not_call_work_phone())
+            self.assertFalse(contact.do_not_call_mobile())
+        self.assertFalse(other.do_not_call_phone())
+
+    def test3_prefetch_and_flag_contacts(self):
+        contacts = [create_contact("Contacto {}".format(i), "09922222{}".format(i)) for i in range(3)]
+        flagged = create_contact("No llamar", "099111111")
+        with self.assertNumQueries(1):
+            prefetch_do_not_call(contacts + [flagged])
+            self.assertEqual([contact.do_not_call_phone() for contact in contacts], [False] * 3)
+            self.assertTrue(flagged.do_not_call_phone())
+        self.assertEqual(flag_contacts(chunk_size=2), {flagged.id: ["phone"]})
+
+    def test4_upload_is_a_diff(self):
+        added, removed = sync_numbers(["099111111", "099333333"])
+        self.assertEqual((added, removed), (1, 1))
+        self.assertEqual(
+            list(DoNotCallNumber.objects.values_list("number", flat=True)), ["099111111", "099333333"]
+        )
+
+    @override_settings(
+        DO_NOT_CALL_IN_MEMORY_FILTER=True,
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    )
+    def test5_in_memory_filter(self):
+        contact = create_contact("No llamar", "099111111")
+        self.assertTrue(contact.do_not_call_phone())
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_numbers(["099333333"])
+        # the filter is loaded again once the registry changes
+        contact = create_contact("Otro", "099333333")
+        self.assertTrue(contact.do_not_call_phone())
@@ -1,4 +1,7 @@
 # coding=utf-8
+from datetime import date
+from unittest.mock import patch
+
 from django.test import TestCase
 
 from tests.factory import (
@@ -6,7 +9,8 @@ from tests.factory import (
 )
 
 from util import rand_chars
-from core.models import Contact, Product, DynamicContactFilter
+from core.dcf_members import deferred_refresh
+from core.models import Contact, Product, DynamicContactFilter, DynamicContactFilterMember
 from core.choices import DYNAMIC_CONTACT_FILTER_MODES
 
 
@@ -83,7 +87,8 @@ class TestCoreDynamicContactFilter(TestCase):
 
         # Then we will see if the contact doesn't want to allow promotions anymore, if it appears on the dcf.
         c3.allow_promotions = False
-        c3.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            c3.save()
 
         # Contact 3 shouldn't be here anymore
         self.assertEqual(dcf.get_email_count(), 0)
@@ -126,7 +131,8 @@ class TestCoreDynamicContactFilter(TestCase):
 
         # Finally we'll remove the allow promotions from one of these contacts, result should be 2
         c1.allow_promotions = False
-        c1.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            c1.save()
         self.assertEqual(dcf.get_email_count(), 2)
 
         # This dcf should have one product only
@@ -177,3 +183,77 @@ class TestCoreDynamicContactFilter(TestCase):
 
         # Now we only have 2 people subscribed to this newsletter, let's see if we can find them here
         self.assertEqual(dcf.get_email_count(), 2)
+
+    def test6_members_are_refreshed_incrementally(self):
+        dcf = create_dynamiccontactfilter('Test description', 1)
+        product3 = Product.objects.get(name='magazine')
+        dcf.products.add(product3)
+        c4 = Contact.objects.get(name='contact 4')
+        self.assertEqual(list(dcf.members.values_list('contact_id', 'email')), [(c4.id, c4.email)])
+
+        # A new subscription product adds the contact, changing the email updates it
+        c2 = Contact.objects.get(name='contact 2')
+        with self.captureOnCommitCallbacks(execute=True):
+            c2.subscriptions.first().add_product(product3)
+            c2.email = f'new{rand_chars()}@email.com'
+            c2.save()
+            # the contacts are refreshed when the transaction is committed
+            self.assertEqual(list(dcf.get_emails()), [c4.email])
+        self.assertEqual(set(dcf.get_emails()), {c4.email, c2.email})
+
+        # Deactivating the subscription removes the contact
+        subscription = c4.subscriptions.first()
+        subscription.active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.save()
+        self.assertEqual(dcf.get_emails(), [c2.email])
+        self.assertEqual(list(dcf.get_contacts()), [c2])
+
+    def test7_deferred_refresh_and_rebuild(self):
+        dcf = create_dynamiccontactfilter('Test description', 1)
+        dcf.allow_promotions = True
+        dcf.save()
+        product1 = Product.objects.get(name='newspaper')
+        dcf.products.add(product1)
+        self.assertEqual(dcf.get_email_count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, deferred_refresh():
+            for contact in Contact.objects.filter(name__in=['contact 1', 'contact 3']):
+                contact.allow_promotions = False
+                contact.save()
+            # nothing is reported until the block ends
+            self.assertEqual(callbacks, [])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(dcf.get_email_count(), 1)
+
+        # A full rebuild gives the same members as the subscriptions query
+        DynamicContactFilterMember.objects.filter(dcf=dcf).delete()
+        dcf.refresh_members()
+        self.assertEqual(
+            sorted(dcf.get_emails()), sorted(s.contact.email for s in dcf.get_subscriptions())
+        )
+
+    def test8_only_the_filters_that_read_the_changed_fields_are_refreshed(self):
+        dcf = create_dynamiccontactfilter('Test description', 1)
+        dcf.products.add(Product.objects.get(name='newspaper'))
+        c1 = Contact.objects.get(name='contact 1')
+        subscription = c1.subscriptions.first()
+
+        with patch.object(DynamicContactFilter, 'refresh_members') as refresh_members:
+            with self.captureOnCommitCallbacks(execute=True):
+                # the filters don't read the billing fields of the subscriptions
+                subscription.next_billing = date.today()
+                subscription.balance = 100
+                subscription.save()
+                # nor the polls option of the contacts when they don't filter by it
+                c1.allow_polls = not c1.allow_polls
+                c1.save()
+            refresh_members.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                subscription.active = False
+                subscription.save()
+                c1.email = f'new{rand_chars()}@email.com'
+                c1.save()
+            # once, for every change
+            refresh_members.assert_called_once_with({c1.id})
@@ -0,0 +1,84 @@
+# coding=utf-8
+from datetime import date
+
+from django.test import TestCase
+
+from logistics.edition_snapshot import route_manifests, snapshot_edition, snapshot_editions
+from logistics.models import Delivery, EditionRoute
+from logistics.utils import create_deliveries
+
+from tests.factory import create_contact, create_product, create_route, create_subscription
+
+
+class TestEditionSnapshot(TestCase):
+
+    def setUp(self):
+        # 2026-10-12 is a monday
+        self.monday = date(2026, 10, 12)
+        self.route_1, self.route_2 = create_route(1, "Route 1"), create_route(2, "Route 2")
+        self.monday_paper = create_product(name="Monday paper", price=100)
+        self.monday_paper.weekday = 1
+        self.monday_paper.save()
+
+    def subscribe(self, name, start_date, route, copies=1, subscription_type="N", instructions=None):
+        subscription = create_subscription(create_contact(name, "29000800"), subscription_type)
+        subscription.start_date = start_date
+        subscription.active = True
+        subscription.save()
+        return subscription.add_product(
+            product=self.monday_paper, copies=copies, route=route, instructions=instructions
+        )
+
+    def test1_manifest_of_every_route(self):
+        self.subscribe("A", date(2026, 1, 1), self.route_1, copies=2, instructions="Portería")
+        self.subscribe("B", date(2026, 10, 10), self.route_1, subscription_type="P")
+        self.subscribe("C", date(2026, 1, 1), self.route_2)
+        # starts after the edition
+        self.subscribe("D", date(2026, 10, 13), self.route_2)
+
+        edition = snapshot_editions(self.monday)[0]
+        self.assertEqual((edition.total, edition.promotions, edition.standard), (4, 1, 3))
+        self.assertIsNotNone(edition.snapshot_at)
+        route_1 = EditionRoute.objects.get(edition=edition, route=self.route_1)
+        self.assertEqual(
+            (route_1.copies, route_1.subscription_products, route_1.contacts, route_1.new, route_1.promotions),
+            (3, 2, 2, 1, 1),
+        )
+        self.assertEqual(route_1.special_instructions, 1)
+        self.assertEqual(route_manifests(self.monday)[2]["copies"], 1)
+        self.assertIsNone(route_manifests(date(2026, 10, 19)))
+        self.assertEqual(
+            set(Delivery.objects.values_list("route", "product_id", "copies")),
+            {(1, self.monday_paper.id, 3), (2, self.monday_paper.id, 1)},
+        )
+
+    def test2_snapshot_is_kept(self):
+        subscription_product = self.subscribe("A", date(2026, 1, 1), self.route_1)
+        snapshot_edition(self.monday_paper, self.monday)
+        subscription_product.copies = 5
+        subscription_product.save()
+
+        snapshot_edition(self.monday_paper, self.monday)
+        self.assertEqual(route_manifests(self.monday, self.monday_paper)[1]["copies"], 1)
+        # the deliveries of a day with a snapshot are the copies that were sent
+        create_deliveries(self.monday)
+        self.assertEqual(Delivery.objects.get(date=self.monday, route=1).copies, 1)
+
+        snapshot_edition(self.monday_paper, self.monday, force=True)
+        self.assertEqual(route_manifests(self.monday, self.monday_paper)[1]["copies"], 5)
+        self.assertEqual(Delivery.objects.get(date=self.monday, route=1).copies, 5)
+
+    def test3_manifests_need_every_edition_of_the_day(self):
+        self.subscribe("A", date(2026, 1, 1), self.route_1)
+        monday_supplement = create_product(name="Monday supplement", price=50)
+        monday_supplement.weekday = 1
+        monday_supplement.save()
+
+        snapshot_edition(self.monday_paper, self.monday)
+        # the supplement has no snapshot yet, its copies would be missing from the totals of the day
+        self.assertIsNone(route_manifests(self.monday))
+        self.assertEqual(route_manifests(self.monday, self.monday_paper)[1]["copies"], 1)
+        self.assertIsNone(route_manifests(self.monday, monday_supplement))
+
+        snapshot_edition(monday_supplement, self.monday)
+        self.assertEqual(route_manifests(self.monday)[1]["copies"], 1)
@@ -1,10 +1,18 @@
 # coding=utf-8
 import warnings
+from unittest.mock import patch
 
 from django.conf import settings
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from pyisemail.diagnosis import DNSDiagnosis, ValidDiagnosis
 
-from util.email_typosquash import clean_email
+from core.models import EmailReplacement
+from util import email_typosquash
+from util.email_typosquash import clean_email, clean_emails
+
+
+def stub_resolver(domain):
+    return ValidDiagnosis() if domain in ("hotmail.com", "hotmil.com", "gmail.com") else DNSDiagnosis("NO_RECORD")
 
 
 class TestEmailReplacements(TestCase):
@@ -40,3 +48,40 @@ class TestEmailReplacements(TestCase):
             clean_email("address@hotmil.com"),
             {'valid': True, 'email': 'address@hotmil.com', 'replacement': 'address@hotmail.com'},
         )
+
+
+@override_settings(CORE_VALIDATE_EMAIL_CHECK_MX=True, CORE_WHITELISTED_DOMAINS=["example.com"])
+class TestCleanEmails(TestCase):
+
+    fixtures = ['email_replacements']
+
+    def setUp(self):
+        email_typosquash._mx_cache.clear()
+
+    def test1_each_domain_is_resolved_once(self):
+        emails = ["user{}@{}".format(i, domain) for i in range(100) for domain in ("hotmail.com", "gmaill.com")]
+        with patch("util.email_typosquash.resolve_mx", side_effect=stub_resolver) as resolver:
+            with self.assertNumQueries(1):
+                results = clean_emails(emails + ["address@hotamil.com", "address@example.com", "not an email"])
+            self.assertEqual(
+                sorted(call.args[0] for call in resolver.call_args_list), ["gmaill.com", "hotamil.com", "hotmail.com"]
+            )
+            # the MX results are cached
+            clean_emails(["other@gmaill.com"])
+            self.assertEqual(resolver.call_count, 3)
+        self.assertEqual(results[0], {"valid": True, "email": "user0@hotmail.com"})
+        self.assertEqual(
+            results[1], {"valid": False, "email": "user0@gmaill.com", "suggestion": "user0@gmail.com"}
+        )
+        self.assertEqual(results[-3]["replacement"], "address@hotmail.com")
+        self.assertEqual(results[-2], {"valid": True, "email": "address@example.com"})
+        self.assertFalse(results[-1]["valid"])
+
+    def test2_replacements_are_reloaded_when_they_change(self):
+        with patch("util.email_typosquash.resolve_mx", side_effect=stub_resolver):
+            self.assertIn("suggestion", clean_email("address@gmaill.com"))
+            EmailReplacement.objects.create(domain="gmaill.com", replacement="gmail.com", status="rejected")
+            with self.assertNumQueries(1):
+                self.assertNotIn("suggestion", clean_email("address@gmaill.com"))
+            with self.assertNumQueries(0):
+                clean_email("address@gmaill.com")
@@ -0,0 +1,90 @@
+# coding=utf-8
+from datetime import date
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from logistics.issue_statistics import DAY, MONTH, WEEK, issue_statistics, periods, route_statistics
+from support.models import Issue
+from tests.factory import create_contact, create_product, create_route, create_subscription
+
+
+class TestPeriods(SimpleTestCase):
+
+    def test1_periods(self):
+        # 2026-10-14 is a wednesday
+        self.assertEqual(
+            periods(WEEK, date(2026, 10, 14), date(2026, 10, 19)),
+            [(date(2026, 10, 12), date(2026, 10, 18)), (date(2026, 10, 19), date(2026, 10, 25))],
+        )
+        self.assertEqual(
+            periods(MONTH, date(2026, 11, 20), date(2027, 1, 5)),
+            [
+                (date(2026, 11, 1), date(2026, 11, 30)),
+                (date(2026, 12, 1), date(2026, 12, 31)),
+                (date(2027, 1, 1), date(2027, 1, 31)),
+            ],
+        )
+        self.assertEqual(len(periods(DAY, date(2026, 10, 14), date(2026, 10, 20))), 7)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestIssueStatistics(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.route_1, self.route_2 = create_route(1, "Route 1"), create_route(2, "Route 2")
+        monday_paper = create_product(name="Monday paper", price=100)
+        monday_paper.weekday = 1
+        monday_paper.save()
+        self.subscription_products = []
+        for name, route in (("A", self.route_1), ("B", self.route_1), ("C", self.route_2)):
+            subscription = create_subscription(create_contact(name, "29000800"))
+            subscription.active = True
+            subscription.save()
+            self.subscription_products.append(subscription.add_product(product=monday_paper, route=route))
+
+    def add_issue(self, day, subscription_product, category="L"):
+        Issue.objects.create(
+            contact=subscription_product.subscription.contact,
+            subscription_product=subscription_product,
+            date=day,
+            category=category,
+        )
+
+    def test1_issues_by_period(self):
+        # monday and wednesday of the same week, and a monday of the next month
+        self.add_issue(date(2026, 10, 12), self.subscription_products[0])
+        self.add_issue(date(2026, 10, 12), self.subscription_products[2])
+        self.add_issue(date(2026, 10, 14), self.subscription_products[1])
+        self.add_issue(date(2026, 11, 2), self.subscription_products[1])
+        self.add_issue(date(2026, 10, 12), self.subscription_products[1], category="S")
+
+        days = issue_statistics(DAY, date(2026, 10, 12), date(2026, 10, 14))
+        self.assertEqual([day["issues"] for day in days], [2, 0, 1])
+        # over the 3 active monday subscription products, none on wednesdays
+        self.assertAlmostEqual(days[0]["pct"], 200 / 3)
+        self.assertIsNone(days[1]["pct"])
+        self.assertIsNone(days[2]["pct"])
+
+        weeks = issue_statistics(WEEK, date(2026, 10, 14), date(2026, 11, 2))
+        self.assertEqual([week["issues"] for week in weeks], [3, 0, 0, 1])
+        self.assertAlmostEqual(weeks[0]["pct"], 300 / (3 * 6))
+
+        months = issue_statistics(MONTH, date(2026, 10, 20), date(2026, 11, 2))
+        self.assertEqual(
+            [(month["start"], month["issues"]) for month in months], [(date(2026, 10, 1), 3), (date(2026, 11, 1), 1)]
+        )
+
+    def test2_route_statistics(self):
+        self.add_issue(date(2026, 10, 12), self.subscription_products[0])
+        self.add_issue(date(2026, 10, 13), self.subscription_products[1])
+        self.add_issue(date(2026, 10, 20), self.subscription_products[2])
+
+        statistics = route_statistics([self.route_1, self.route_2], date(2026, 10, 12), date(2026, 10, 18))
+        self.assertEqual(
+            [(row["route_number"], row["issues_count"], row["subscriptions_count"]) for row in statistics],
+            [(1, 2, 2), (2, 0, 1)],
+        )
+        # 2 issues over 2 subscriptions times 5 weekdays
+        self.assertAlmostEqual(statistics[0]["pct"], 20)
@@ -0,0 +1,122 @@
+# coding=utf-8
+import io
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from PyPDF2 import PdfReader
+
+from django.test import TestCase, override_settings
+
+from logistics.label_cache import OLD_VERSION_SECONDS, LabelCache, weekday_run
+from logistics.label_printing import label_specs, label_subscription_products
+
+from tests.factory import (
+    create_address,
+    create_contact,
+    create_empty_invoice,
+    create_product,
+    create_route,
+    create_subscription,
+)
+
+
+class TestLabelPrinting(TestCase):
+
+    def setUp(self):
+        # 2026-10-12 is a monday
+        self.monday = date(2026, 10, 12)
+        self.route = create_route(1, "Route 1")
+        self.monday_paper = create_product(name="Monday paper", price=100, billing_priority=2)
+        self.monday_paper.weekday = 1
+        self.monday_paper.save()
+        self.friday_paper = create_product(name="Friday paper", price=100, billing_priority=1)
+        self.friday_paper.weekday = 5
+        self.friday_paper.save()
+
+    def subscribe(self, name, products, route=None):
+        contact = create_contact(name, "29000800")
+        subscription = create_subscription(contact)
+        subscription.start_date = date(2026, 1, 1)
+        subscription.active = True
+        subscription.save()
+        address = create_address("Street 1234", contact)
+        for order, product in enumerate(products):
+            subscription.add_product(product=product, address=address, route=route or self.route, order=order)
+        return subscription
+
+    def test1_labels_are_read_with_one_query(self):
+        for i in range(5):
+            self.subscribe("Contact %d" % i, [self.monday_paper])
+        self.subscribe("Only friday", [self.friday_paper])
+        with self.assertNumQueries(1):
+            labels = [
+                (sp.subscription.contact.get_full_name(), sp.route_id, sp.address.address_1, sp.product.name)
+                for sp in label_subscription_products(1, self.monday)
+            ]
+        self.assertEqual(len(labels), 5)
+        self.assertEqual(label_subscription_products(1, self.monday, [2]).count(), 0)
+
+    def test2_invoice_annotations(self):
+        invoiced = self.subscribe("Invoiced", [self.monday_paper, self.friday_paper])
+        invoice = create_empty_invoice(invoiced.contact, "C")
+        invoice.print_date = date.today() - timedelta(2)
+        invoice.save()
+        self.subscribe("Not invoiced", [self.monday_paper])
+
+        labels = {
+            sp.subscription_id: (sp.recently_invoiced, sp.first_product_weekday)
+            for sp in label_subscription_products(1, self.monday)
+        }
+        # the friday paper comes first by billing priority
+        self.assertEqual(labels[invoiced.id], (True, 5))
+        self.assertEqual(len(labels), 2)
+        self.assertIn((False, 1), labels.values())
+
+    def test3_only_the_routes_that_changed_are_drawn_again(self):
+        other_route = create_route(2, "Route 2")
+        self.subscribe("First", [self.monday_paper])
+        changed = self.subscribe("Second", [self.monday_paper], route=other_route)
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LabelCache(directory)
+
+            def render():
+                output = io.BytesIO()
+                specs = label_specs(label_subscription_products(1, self.monday), invoice_weekday=1)
+                paths, drawn = cache.labels(weekday_run(1, "Roll"), specs, output)
+                output.seek(0)
+                return len(PdfReader(output).pages), drawn
+
+            # a separator and a label for each route
+            self.assertEqual(render(), (4, 2))
+            self.assertEqual(render(), (4, 0))
+            changed.subscriptionproduct_set.update(label_message="Happy birthday")
+            self.assertEqual(render(), (4, 1))
+
+            # the old version of the route is kept while a request rendered from the old specs may be using it
+            run_directory = os.path.join(directory, weekday_run(1, "Roll"))
+            self.assertEqual(len(os.listdir(run_directory)), 3)
+            for filename in os.listdir(run_directory):
+                old = time.time() - OLD_VERSION_SECONDS - 1
+                os.utime(os.path.join(run_directory, filename), (old, old))
+            self.assertEqual(render(), (4, 0))
+            self.assertEqual(len(os.listdir(run_directory)), 2)
+
+    @override_settings(LOGISTICS_LABEL_INVOICE_PAYMENT_TYPES=["C"])
+    def test4_invoice_icon_of_the_labels_of_a_day(self):
+        # print_labels_for_day passes the weekday as a number, it used to compare it as a string and never showed it
+        monday_first = self.subscribe("Monday first", [self.monday_paper])
+        friday_first = self.subscribe("Friday first", [self.monday_paper, self.friday_paper])
+        self.subscribe("Not invoiced", [self.monday_paper])
+        for subscription in (monday_first, friday_first):
+            invoice = create_empty_invoice(subscription.contact, "C")
+            invoice.print_date = date.today() - timedelta(2)
+            invoice.save()
+
+        icons = {
+            spec.name: spec.has_invoice
+            for spec in label_specs(label_subscription_products(1, self.monday), invoice_weekday=1)
+        }
+        self.assertEqual(icons, {"MONDAY FIRST": True, "FRIDAY FIRST": False, "NOT INVOICED": False})
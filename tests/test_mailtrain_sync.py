@@ -0,0 +1,164 @@
+# coding=utf-8
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.test import TestCase, override_settings
+
+from core.mailtrain_sync import MailtrainClient, sync_filters
+from core.models import Product
+
+from tests.factory import (
+    create_address,
+    create_contact,
+    create_dynamiccontactfilter,
+    create_product,
+    create_subscription,
+)
+
+
+class FakeMailtrain(ThreadingHTTPServer):
+    """
+    Local server with the subscriptions, subscribe and delete endpoints of the Mailtrain API. The first `failures`
+    requests are answered with a 503.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeMailtrainHandler)
+        self.lists, self.requests, self.failures = {}, [], 0
+        self.lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        return "http://127.0.0.1:{}/api/".format(self.server_address[1])
+
+
+class FakeMailtrainHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, data=None):
+        body = json.dumps(data or {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        _, _, endpoint, list_id = url.path.split("/")
+        server = self.server
+        with server.lock:
+            server.requests.append((method, endpoint))
+            if server.failures:
+                server.failures -= 1
+                return self.reply(503)
+            if query.get("access_token") != ["secret"]:
+                return self.reply(403)
+            emails = server.lists.setdefault(list_id, [])
+            if method == "GET":
+                start, limit = int(query["start"][0]), int(query["limit"][0])
+                page = [{"email": email} for email in emails[start:start + limit]]
+                return self.reply(200, {"data": {"total": len(emails), "subscriptions": page}})
+            length = int(self.headers["Content-Length"])
+            email = parse_qs(self.rfile.read(length).decode())["EMAIL"][0]
+            if endpoint == "subscribe":
+                emails.append(email)
+            elif email in emails:
+                emails.remove(email)
+            return self.reply(200, {"data": {}})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+class TestMailtrainSync(TestCase):
+
+    def setUp(self):
+        self.server = FakeMailtrain()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings_override = override_settings(MAILTRAIN_API_URL=self.server.api_url, MAILTRAIN_API_KEY="secret")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        product = create_product("newspaper", 500)
+        for i in range(6):
+            contact = create_contact("contact %d" % i, "123456", "contact%d@email.com" % i)
+            create_subscription(contact).add_product(product, create_address("Fake Street 123", contact))
+
+    def create_filter(self, mailtrain_id):
+        dcf = create_dynamiccontactfilter("Newspaper readers")
+        dcf.products.add(Product.objects.get(name="newspaper"))
+        dcf.mailtrain_id = mailtrain_id
+        dcf.save()
+        return dcf
+
+    def test1_only_the_differences_are_sent(self):
+        dcf = self.create_filter("list1")
+        self.server.lists["list1"] = ["contact0@email.com", "CONTACT1@email.com", "gone@email.com"]
+        client = MailtrainClient(backoff=0)
+        client.page_size = 2
+
+        report = dcf.sync_with_mailtrain_list(client)
+        self.assertTrue(report.ok)
+        self.assertEqual((report.in_filter, report.in_list), (6, 3))
+        self.assertEqual(report.removed, ["gone@email.com"])
+        self.assertEqual(len(report.added), 4)
+        self.assertEqual(
+            sorted(email.lower() for email in self.server.lists["list1"]),
+            ["contact%d@email.com" % i for i in range(6)],
+        )
+        # 2 pages of the list, 1 delete and 4 subscribes
+        self.assertEqual(len(self.server.requests), 7)
+        dcf.refresh_from_db()
+        self.assertIsNotNone(dcf.last_time_synced)
+
+        # nothing to send the second time
+        self.server.requests.clear()
+        report = dcf.sync_with_mailtrain_list(client)
+        self.assertEqual((report.added, report.removed), ([], []))
+        self.assertEqual(self.server.requests, [("GET", "subscriptions")] * 3)
+
+    def test2_failed_requests_are_retried(self):
+        dcf = self.create_filter("list2")
+        self.server.failures = 2
+        report = dcf.sync_with_mailtrain_list(MailtrainClient(backoff=0))
+        self.assertTrue(report.ok)
+        self.assertEqual(len(self.server.lists["list2"]), 6)
+
+        # when the list can't be read nothing is sent and the filter isn't marked as synced
+        dcf = self.create_filter("list3")
+        self.server.failures = 10
+        self.server.requests.clear()
+        report = dcf.sync_with_mailtrain_list(MailtrainClient(retries=1, backoff=0))
+        self.assertFalse(report.ok)
+        self.assertEqual(self.server.requests, [("GET", "subscriptions")] * 2)
+        dcf.refresh_from_db()
+        self.assertIsNone(dcf.last_time_synced)
+
+    def test3_filters_are_synced_concurrently(self):
+        filters = [self.create_filter("list%d" % i) for i in range(4, 8)]
+        self.server.lists["list7"] = ["other@email.com"]
+        reports = sync_filters(filters, MailtrainClient(rate=1000, backoff=0), concurrency=4, workers=2)
+        self.assertEqual([report.dcf for report in reports], filters)
+        self.assertTrue(all(report.ok for report in reports))
+        self.assertEqual(reports[3].removed, ["other@email.com"])
+        for i in range(4, 8):
+            self.assertEqual(len(self.server.lists["list%d" % i]), 6)
+
+        # a dry run only reports the differences
+        self.server.lists["list4"].pop()
+        report = sync_filters(filters[:1], MailtrainClient(), dry_run=True)[0]
+        self.assertEqual(len(report.added), 1)
+        self.assertEqual(len(self.server.lists["list4"]), 5)
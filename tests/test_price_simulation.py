@@ -0,0 +1,81 @@
+# coding=utf-8
+from django.test import TestCase, override_settings
+
+from core.price_simulation import PriceSimulation
+from core.pricing import pricing_engine
+from core.utils import calc_price_from_products
+
+from tests.factory import create_contact, create_product, create_subscription
+
+
+class TestPriceSimulation(TestCase):
+
+    def setUp(self):
+        newspaper = create_product(name="Newspaper", price=500)
+        weekly = create_product(name="Weekly", price=200, billing_priority=2)
+        weekly.has_implicit_discount = True
+        weekly.save()
+        discount = create_product(name="Newspaper discount", price=50, type="D")
+        discount.target_product = newspaper
+        discount.save()
+        percentage = create_product(name="10%", price=10, type="P")
+        book = create_product(name="Book", price=99, type="O")
+        self.newspaper = newspaper
+
+        combinations = [
+            ([newspaper], 1),
+            ([newspaper, weekly], 1),
+            ([newspaper, discount], 3),
+            ([newspaper, weekly, percentage], 6),
+            ([weekly, discount, book], 12),
+            ([newspaper, percentage, book], 1),
+        ]
+        self.subscriptions = []
+        for i, (products, frequency) in enumerate(combinations * 2):
+            subscription = create_subscription(create_contact("cliente%d" % i, "2900080%d" % i))
+            subscription.frequency = frequency
+            subscription.save()
+            for product in products:
+                subscription.add_product(product=product, copies=1 + i % 2)
+            self.subscriptions.append(subscription)
+
+    def tearDown(self):
+        pricing_engine.invalidate()
+
+    def scalar_totals(self):
+        return {
+            subscription.id: calc_price_from_products(
+                subscription.product_summary(with_pauses=True), subscription.frequency
+            )
+            for subscription in self.subscriptions
+        }
+
+    def simulated_totals(self, simulation, price_table=None, frequency_discounts=None):
+        old, new = simulation.compare(price_table, frequency_discounts)
+        return dict(zip(simulation.subscription_ids.tolist(), old.tolist())), dict(
+            zip(simulation.subscription_ids.tolist(), new.tolist())
+        )
+
+    @override_settings(DISCOUNT_3_MONTHS=5, DISCOUNT_12_MONTHS=10)
+    def test1_current_totals_match_calc_price_from_products(self):
+        simulation = PriceSimulation()
+        old, new = self.simulated_totals(simulation)
+        self.assertEqual(simulation.frequencies.size, 6)
+        self.assertEqual(old, self.scalar_totals())
+        self.assertEqual(new, old)
+
+    @override_settings(DISCOUNT_3_MONTHS=5, DISCOUNT_12_MONTHS=10)
+    def test2_proposed_totals_match_calc_price_from_products(self):
+        simulation = PriceSimulation()
+        old, new = self.simulated_totals(simulation, {self.newspaper.id: 640}, {12: 20})
+        with self.settings(DISCOUNT_12_MONTHS=20):
+            self.newspaper.price = 640
+            self.newspaper.save()
+            self.assertEqual(new, self.scalar_totals())
+
+        report = simulation.run({self.newspaper.id: 640}, {12: 20}, top=3)
+        self.assertEqual(report["subscriptions"], 12)
+        self.assertEqual(report["old_total"], sum(old.values()))
+        self.assertEqual(report["new_total"], sum(new.values()))
+        self.assertEqual(len(report["top_movers"]), 3)
+        self.assertEqual(sum(bucket["count"] for bucket in report["histogram"]), 12)
@@ -0,0 +1,100 @@
+# coding=utf-8
+from django.test import TestCase, override_settings
+
+from archive.tests.old_calc_price_from_products import calc_price_from_products as old_calc_price_from_products
+from core.models import Product
+from core.pricing import pricing_engine
+from core.utils import calc_price_from_products
+
+from tests.factory import create_product
+
+
+class TestPricingEngine(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.newspaper = create_product(name="Newspaper", price=500)
+        cls.weekly = create_product(name="Weekly", price=200, billing_priority=2)
+        cls.weekly.has_implicit_discount = True
+        cls.weekly.save()
+        cls.digital = create_product(name="Digital", price=333)
+        cls.digital.billing_mode = Product.BillingModeChoices.FIXED
+        cls.digital.save()
+        cls.discount = create_product(name="Newspaper discount", price=50, type="D")
+        cls.discount.target_product = cls.newspaper
+        cls.discount.save()
+        cls.weekly_percentage = create_product(name="Weekly 15%", price=15, type="P")
+        cls.weekly_percentage.target_product = cls.weekly
+        cls.weekly_percentage.save()
+        cls.percentage = create_product(name="10%", price=10, type="P")
+        cls.plain_discount = create_product(name="Plain discount", price=30, type="D")
+        cls.book = create_product(name="Book", price=99.5, type="O")
+
+    def tearDown(self):
+        # the rollback of the test transaction doesn't send signals, don't leave its products in the snapshot
+        pricing_engine.invalidate()
+
+    def combinations(self):
+        n, w, d = self.newspaper.id, self.weekly.id, self.digital.id
+        return [
+            {n: 1},
+            {n: 2, w: 1},
+            {d: 1, w: 3},
+            {n: 1, self.discount.id: 1},
+            {self.discount.id: 2, n: 1, w: 1, self.weekly_percentage.id: 1},
+            {w: 1, self.discount.id: 1},
+            {n: 1, w: 1, self.percentage.id: 1, self.plain_discount.id: 1},
+            {n: 1, self.book.id: 2},
+            {d: 2, self.percentage.id: 1, self.book.id: 1},
+            {n: "3", str(w): "1"},
+        ]
+
+    def assertSamePrices(self):
+        for products_with_copies in self.combinations():
+            for frequency in (1, 3, 6, 12):
+                self.assertEqual(
+                    calc_price_from_products(products_with_copies, frequency),
+                    old_calc_price_from_products(products_with_copies, frequency),
+                )
+                total, items = calc_price_from_products(products_with_copies, frequency, create_items=True)
+                old_total, old_items = old_calc_price_from_products(products_with_copies, frequency, create_items=True)
+                self.assertEqual(total, old_total)
+                self.assertEqual(
+                    [
+                        (
+                            str(i.description), i.amount, i.price, i.copies, i.type, i.type_dr, i.product_id,
+                            i.subscription_id,
+                        )
+                        for i in items
+                    ],
+                    [
+                        (
+                            str(i.description), i.amount, i.price, i.copies, i.type, i.type_dr, i.product_id,
+                            i.subscription_id,
+                        )
+                        for i in old_items
+                    ],
+                )
+
+    def test1_same_prices_as_before(self):
+        self.assertSamePrices()
+
+    @override_settings(DISCOUNT_3_MONTHS=4.76, DISCOUNT_6_MONTHS=7.3, DISCOUNT_12_MONTHS=11.91)
+    def test2_same_prices_as_before_with_frequency_discounts(self):
+        self.assertSamePrices()
+
+    def test3_prices_are_memoised(self):
+        pricing_engine.invalidate()
+        calc_price_from_products({self.newspaper.id: 1}, 1)
+        calc_price_from_products({self.newspaper.id: 1}, 1)
+        calc_price_from_products({self.newspaper.id: 2}, 1)
+        cache_info = pricing_engine.cache_info()
+        self.assertEqual(cache_info["hits"], 1)
+        self.assertEqual(cache_info["misses"], 2)
+
+    def test4_saving_a_product_invalidates_the_prices(self):
+        self.assertEqual(calc_price_from_products({self.newspaper.id: 1}, 1), 500)
+        self.newspaper.price = 550
+        self.newspaper.save()
+        self.assertEqual(calc_price_from_products({self.newspaper.id: 1}, 1), 550)
+        self.assertEqual(pricing_engine.cache_info()["hits"], 0)
@@ -0,0 +1,108 @@
+# coding=utf-8
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from logistics.route_assignment import (
+    AMBIGUOUS,
+    NO_LOCATION,
+    OUTSIDE,
+    SUGGESTED,
+    RouteIndex,
+    apply_suggestions,
+    suggest_routes,
+    unrouted_subscription_products,
+)
+from tests.factories.core_factories import AddressFactory, ContactFactory, ProductFactory, SubscriptionFactory
+from tests.factories.logistics_factories import RouteFactory
+
+
+def square(min_x, min_y, max_x, max_y):
+    return [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y), (min_x, min_y)]
+
+
+def shift(x, y):
+    """
+    Moves a point of the synthetic polygons to the longitude and latitude of Montevideo.
+    """
+    return x / 100 - 56.3, y / 100 - 34.95
+
+
+# Synthetic routes: 1 with a hole, 2 next to it, 3 inside 1 and 4 a triangle far from the others
+POLYGONS = [
+    (1, [square(0, 0, 10, 10), square(4, 4, 6, 6)]),
+    (2, [square(10, 0, 20, 10)]),
+    (3, [square(1, 1, 3, 3)]),
+    (4, [[(100, 100), (110, 100), (105, 110), (100, 100)]]),
+]
+
+
+class TestRouteIndex(SimpleTestCase):
+
+    def test1_locate(self):
+        index = RouteIndex(POLYGONS)
+        routes, matches = index.locate(
+            [0.5, 5, 2, 15, 105, 101, 50, np.nan], [0.5, 5, 2, 5, 102, 109, 50, 1]
+        )
+        # inside 1, in the hole of 1, inside 3 (and 1), inside 2, inside 4, outside the triangle of 4, outside, no
+        # coordinates
+        self.assertEqual(routes.tolist(), [1, 0, 3, 2, 4, 0, 0, 0])
+        self.assertEqual(matches.tolist(), [1, 0, 2, 1, 1, 0, 0, 0])
+
+    def test2_same_result_as_testing_every_polygon(self):
+        index = RouteIndex(POLYGONS, grid_cells=16)
+        single_cell = RouteIndex(POLYGONS, grid_cells=1)
+        rng = np.random.default_rng(0)
+        xs, ys = rng.uniform(-5, 115, 5000), rng.uniform(-5, 115, 5000)
+        routes, matches = index.locate(xs, ys)
+        expected_routes, expected_matches = single_cell.locate(xs, ys)
+        self.assertEqual(routes.tolist(), expected_routes.tolist())
+        self.assertEqual(matches.tolist(), expected_matches.tolist())
+        self.assertTrue((routes == 2).any() and (routes == 4).any())
+
+    def test3_empty_index(self):
+        routes, matches = RouteIndex([]).locate([1.0], [1.0])
+        self.assertEqual(routes.tolist(), [0])
+        self.assertEqual(matches.tolist(), [0])
+
+
+class TestRouteSuggestions(TestCase):
+
+    def setUp(self):
+        self.product = ProductFactory(type="S", offerable=True, digital=False)
+        for number, rings in POLYGONS[:3]:
+            RouteFactory(number=number)
+        # the routes of the index don't need a polygon in the database
+        self.index = RouteIndex(
+            [(number, [[shift(x, y) for x, y in ring] for ring in rings]) for number, rings in POLYGONS]
+        )
+
+    def add_product(self, x=None, y=None):
+        subscription = SubscriptionFactory(contact=ContactFactory(), active=True)
+        address = AddressFactory(contact=subscription.contact)
+        if x is not None:
+            address.longitude, address.latitude = shift(x, y)
+            address.save()
+        return subscription.add_product(product=self.product, address=address)
+
+    def test1_suggest_and_apply(self):
+        inside = self.add_product(15, 5)
+        nested = self.add_product(2, 2)
+        outside = self.add_product(50, 50)
+        no_location = self.add_product()
+
+        suggestions = suggest_routes(unrouted_subscription_products(), self.index).set_index("id")
+        self.assertEqual(suggestions.loc[inside.id, "status"], SUGGESTED)
+        self.assertEqual(suggestions.loc[inside.id, "route"], 2)
+        self.assertEqual(suggestions.loc[nested.id, "status"], AMBIGUOUS)
+        self.assertEqual(suggestions.loc[nested.id, "route"], 3)
+        self.assertEqual(suggestions.loc[outside.id, "status"], OUTSIDE)
+        self.assertEqual(suggestions.loc[no_location.id, "status"], NO_LOCATION)
+
+        self.assertEqual(apply_suggestions(suggestions.reset_index()), 1)
+        inside.refresh_from_db()
+        nested.refresh_from_db()
+        self.assertEqual(inside.route_id, 2)
+        self.assertIsNone(nested.route_id)
+        self.assertEqual(apply_suggestions(suggestions.reset_index(), include_ambiguous=True), 1)
+        nested.refresh_from_db()
+        self.assertEqual(nested.route_id, 3)
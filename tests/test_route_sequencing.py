@@ -0,0 +1,97 @@
+# coding=utf-8
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, TestCase
+
+from logistics.route_sequencing import (
+    distance_matrix,
+    nearest_neighbour,
+    propose_orders,
+    proposed_updates,
+    sequence_route,
+    tour_length,
+    two_opt,
+)
+from tests.factories.core_factories import AddressFactory, ContactFactory, ProductFactory, SubscriptionFactory
+from tests.factories.logistics_factories import RouteFactory
+
+
+def street(stops, start=0):
+    """
+    Returns the latitudes and longitudes of stops along a street, 0.001 degrees (about 90 m) apart.
+    """
+    return np.full(stops, -34.9), -56.2 + 0.001 * np.arange(start, start + stops)
+
+
+class TestSequencing(SimpleTestCase):
+
+    def test1_two_opt(self):
+        rng = np.random.default_rng(0)
+        latitudes, longitudes = -34.9 + rng.uniform(0, 0.03, 300), -56.2 + rng.uniform(0, 0.04, 300)
+        distances = distance_matrix(latitudes, longitudes)
+        self.assertAlmostEqual(distances[0, 1], distances[1, 0])
+        tour = nearest_neighbour(distances, start=5)
+        improved = two_opt(distances, tour)
+        self.assertEqual(sorted(improved.tolist()), list(range(300)))
+        self.assertEqual(improved[0], 5)
+        self.assertLess(tour_length(distances, improved), tour_length(distances, tour))
+
+    def test2_sequence_route(self):
+        latitudes, longitudes = street(6)
+        # the stops along the street in a shuffled order, two products at the last stop and one without location
+        frame = pd.DataFrame(
+            {
+                "id": [1, 2, 3, 4, 5, 6, 7, 8],
+                "route": 1,
+                "order": pd.array([10, 20, 30, 40, 50, 60, 70, None], dtype="Int64"),
+                "latitude": np.append(latitudes[[0, 3, 1, 5, 2, 4, 5]], np.nan),
+                "longitude": np.append(longitudes[[0, 3, 1, 5, 2, 4, 5]], np.nan),
+                "address": "",
+            }
+        )
+        proposed, stops, current_length, proposed_length, end = sequence_route(frame)
+        self.assertEqual(stops, 6)
+        self.assertEqual(proposed.sort_index().tolist(), [10, 40, 20, 60, 30, 50, 60, 70])
+        self.assertLess(proposed_length, current_length)
+        self.assertEqual(end, (latitudes[5], longitudes[5]))
+
+
+class TestProposeOrders(TestCase):
+
+    def setUp(self):
+        self.product = ProductFactory(type="S", offerable=True, digital=False)
+        self.parent = RouteFactory(number=1)
+        self.child = RouteFactory(number=2, parent_route=self.parent)
+
+    def add_product(self, route, latitude, longitude, order):
+        subscription = SubscriptionFactory(contact=ContactFactory(), active=True)
+        address = AddressFactory(contact=subscription.contact, latitude=latitude, longitude=longitude)
+        return subscription.add_product(product=self.product, address=address, route=route, order=order)
+
+    def test1_parent_and_child_routes(self):
+        latitudes, longitudes = street(3)
+        parent_products = [
+            self.add_product(self.parent, latitudes[i], longitudes[i], order)
+            for i, order in ((0, 10), (2, 20), (1, 30))
+        ]
+        # the child route continues the street, its stop closest to the end of the parent route goes first
+        latitudes, longitudes = street(2, start=3)
+        child_products = [
+            self.add_product(self.child, latitudes[i], longitudes[i], order) for i, order in ((1, 10), (0, 20))
+        ]
+
+        proposal, summaries = propose_orders(self.parent)
+        self.assertEqual([summary["route"] for summary in summaries], [1, 2])
+        self.assertEqual(
+            proposal["id"].tolist(), [parent_products[i].id for i in (0, 2, 1)] + [child_products[i].id for i in (1, 0)]
+        )
+        self.assertEqual(proposal["proposed"].tolist(), [10, 20, 30, 10, 20])
+        self.assertEqual(
+            proposed_updates(proposal),
+            {
+                parent_products[2].id: {"order": 20},
+                parent_products[1].id: {"order": 30},
+                child_products[1].id: {"order": 10},
+                child_products[0].id: {"order": 20},
+            },
+        )
@@ -0,0 +1,70 @@
+# coding=utf-8
+from django.http import QueryDict
+from django.test import TestCase
+
+from core.models import SubscriptionProduct
+from logistics.models import RouteChange
+from logistics.route_updates import apply_updates, form_updates, orders_in_tens, validate_updates
+from tests.factories.core_factories import AddressFactory, ContactFactory, ProductFactory, SubscriptionFactory
+from tests.factories.logistics_factories import RouteFactory
+
+
+class TestRouteUpdates(TestCase):
+
+    def setUp(self):
+        self.product = ProductFactory(type="S", offerable=True, digital=False)
+        self.route, self.other_route = RouteFactory(number=1), RouteFactory(number=2)
+
+    def add_product(self, route=None, order=None):
+        subscription = SubscriptionFactory(contact=ContactFactory(), active=True)
+        address = AddressFactory(contact=subscription.contact)
+        return subscription.add_product(product=self.product, address=address, route=route, order=order)
+
+    def test1_form_updates(self):
+        post = QueryDict(
+            "sp-1=2&message-1=hola&instructions-1=&sp-2=&sp-order-3=10&message-3=x&csrfmiddlewaretoken=abc"
+        )
+        self.assertEqual(
+            form_updates(post, "sp-", "route"), {1: {"route": "2", "label_message": "hola", "special_instructions": ""}}
+        )
+        self.assertEqual(
+            form_updates(post, "sp-order-", "order"),
+            {3: {"order": "10", "label_message": "x", "special_instructions": None}},
+        )
+
+    def test2_validate_and_apply(self):
+        moved = self.add_product(self.route, order=5)
+        assigned = self.add_product()
+        unchanged = self.add_product(self.other_route)
+        bad_route = self.add_product()
+        bad_order = self.add_product(self.route)
+
+        changed, errors = validate_updates(
+            {
+                moved.id: {"route": "2", "order": None, "label_message": "Portería"},
+                assigned.id: {"route": "1", "order": None},
+                unchanged.id: {"route": "2", "order": None},
+                bad_route.id: {"route": "99", "order": None},
+                bad_order.id: {"order": "first"},
+                0: {"route": "1"},
+            }
+        )
+        self.assertEqual({sp.id for sp in changed}, {moved.id, assigned.id})
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(apply_updates(changed), 2)
+
+        moved.refresh_from_db()
+        assigned.refresh_from_db()
+        self.assertEqual((moved.route_id, moved.order, moved.label_message), (2, None, "Portería"))
+        self.assertEqual(assigned.route_id, 1)
+        # only the subscription product that left a route is logged
+        self.assertEqual(
+            list(RouteChange.objects.values_list("contact_id", "old_route_id")), [(moved.subscription.contact_id, 1)]
+        )
+
+    def test3_orders_in_tens(self):
+        for order in (3, 7, 8):
+            self.add_product(self.route, order=order)
+        subscription_products = SubscriptionProduct.objects.filter(route=self.route).select_related("subscription")
+        apply_updates(orders_in_tens(subscription_products.order_by("product_id", "order", "id")), ["order"])
+        self.assertEqual(list(subscription_products.order_by("order").values_list("order", flat=True)), [10, 20, 30])
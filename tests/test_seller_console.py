@@ -1,10 +1,13 @@
 # coding=utf-8
+from datetime import date
+
 from django.contrib.auth.models import User
 from django.test import Client, TestCase
 from django.urls import reverse
 
 from core.models import Activity, Campaign, ContactCampaignStatus
 from core.choices import CAMPAIGN_STATUS
+from support.console_cursor import encode_cursor
 from support.models import Seller, SellerConsoleAction
 from tests.factories.core_factories import ContactFactory
 
@@ -144,3 +147,74 @@ class TestSellerConsoleScheduledActivity(TestCase):
         )
         self.assertEqual(pending.count(), 1)
         self.assertEqual(pending.first().seller_console_action, self.schedule)
+
+
+class TestSellerConsoleCursorNavigation(TestCase):
+    """
+    Verifica la navegación por cursor de la consola: los contactos se recorren por (date_assigned, contacto), los que
+    no tienen date_assigned van al final, y después de resolver un contacto se sigue desde el mismo cursor.
+    """
+
+    def setUp(self):
+        self.client = Client()
+
+        self.user = User.objects.create_superuser(username="vendedor", password="testpass")
+        self.seller = Seller.objects.create(name="Vendedor", user=self.user, internal=True)
+        self.client.login(username="vendedor", password="testpass")
+
+        self.campaign = Campaign.objects.create(name="Campaña test", active=True, priority=3)
+        self.contacts = [ContactFactory() for i in range(3)]
+        self.statuses = [
+            ContactCampaignStatus.objects.create(
+                contact=contact, campaign=self.campaign, status=1, seller=self.seller, date_assigned=date_assigned
+            )
+            for contact, date_assigned in zip(self.contacts, [date(2026, 10, 2), None, date(2026, 10, 1)])
+        ]
+        self.url = reverse("seller_console", args=["new", self.campaign.id])
+
+    def test_contacts_are_visited_by_keyset(self):
+        """Se recorren en orden de date_assigned, con los que no tienen fecha al final, hasta el fin de la lista."""
+        visited, cursor = [], ""
+        for i in range(3):
+            response = self.client.get(self.url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context["cursor_navigation"])
+            visited.append(response.context["contact"])
+            cursor = response.context["next_cursor"]
+        first, second, third = self.contacts
+        self.assertEqual(visited, [third, first, second])
+        self.assertEqual(cursor, "_{}".format(second.id))
+
+        response = self.client.get(self.url, {"cursor": cursor})
+        self.assertRedirects(response, reverse("seller_console_list_campaigns"), fetch_redirect_response=False)
+
+    def test_invalid_cursor_starts_from_the_beginning(self):
+        response = self.client.get(self.url, {"cursor": "x_y"})
+        self.assertRedirects(response, self.url + "?cursor=", fetch_redirect_response=False)
+
+    def test_resolved_contact_continues_from_the_same_cursor(self):
+        """El contacto resuelto sale de la lista, así que el siguiente se busca desde el cursor de la página."""
+        SellerConsoleAction.objects.create(
+            slug="not-interested",
+            name="No interesado",
+            action_type=SellerConsoleAction.ACTION_TYPES.DECLINED,
+            campaign_status=CAMPAIGN_STATUS.ENDED_WITH_CONTACT,
+            campaign_resolution="NI",
+            is_active=True,
+        )
+        cursor = encode_cursor("new", self.statuses[2])
+        response = self.client.post(
+            self.url,
+            data={
+                "result": "not-interested",
+                "category": "new",
+                "instance_id": self.statuses[0].id,
+                "seller_id": self.seller.id,
+                "offset": cursor,
+                "next_cursor": encode_cursor("new", self.statuses[0]),
+                "notes": "",
+            },
+        )
+        self.assertRedirects(response, "{}?cursor={}".format(self.url, cursor), fetch_redirect_response=False)
+        response = self.client.get(self.url, {"cursor": cursor})
+        self.assertEqual(response.context["contact"], self.contacts[1])
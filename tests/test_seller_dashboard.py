@@ -0,0 +1,73 @@
+# coding=utf-8
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from core.models import Activity, Campaign, ContactCampaignStatus
+from support.models import Seller
+from support.seller_dashboard import compute_dashboard, get_dashboard
+from tests.factories.core_factories import ContactFactory
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ISSUE_SUBCATEGORY_NEVER_PAID=None,
+    SPECIAL_ROUTES_FOR_SELLERS_LIST=[],
+)
+class TestSellerDashboard(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username="vendedor", password="testpass")
+        self.seller = Seller.objects.create(name="Vendedor", user=user, internal=True)
+        self.other_seller = Seller.objects.create(name="Otro")
+        self.campaign = Campaign.objects.create(name="Mid", active=True, priority=3)
+        self.old_campaign = Campaign.objects.create(name="Old", active=False, priority=3)
+        contacts = [ContactFactory() for i in range(5)]
+        for contact, status, resolution in zip(contacts, [1, 1, 3, 2, 4], [None, None, None, "S1", "S2"]):
+            ContactCampaignStatus.objects.create(
+                contact=contact, campaign=self.campaign, status=status, seller=self.seller,
+                campaign_resolution=resolution,
+            )
+        ContactCampaignStatus.objects.create(
+            contact=contacts[0], campaign=self.campaign, status=1, seller=self.other_seller
+        )
+        ContactCampaignStatus.objects.create(
+            contact=contacts[1], campaign=self.old_campaign, status=4, seller=self.seller, campaign_resolution="S1"
+        )
+        # pending calls: two due in the old campaign, one in the future, and an expired one
+        for contact, days, status in zip(contacts, [-1, -2, 1, -1], ["P", "P", "P", "E"]):
+            Activity.objects.create(
+                contact=contact, campaign=self.old_campaign, seller=self.seller, activity_type="C", status=status,
+                datetime=datetime.now() + timedelta(days),
+            )
+        self.campaign.refresh_queue()
+
+    def test1_counters_match_the_campaigns(self):
+        with self.assertNumQueries(3):
+            dashboard = compute_dashboard(self.seller)
+        (campaign,) = dashboard["campaigns_with_not_contacted"]
+        self.assertEqual(campaign["id"], self.campaign.id)
+        self.assertEqual(campaign["count"], self.campaign.get_not_contacted_count(self.seller.id))
+        self.assertEqual(campaign["successful"], self.campaign.get_successful_count(self.seller.id))
+        (campaign,) = dashboard["campaigns_with_activities_to_do"]
+        self.assertEqual((campaign["id"], campaign["pending"], campaign["successful"]), (self.old_campaign.id, 2, 1))
+        self.assertEqual(dashboard["total_pending_activities"], self.seller.total_pending_activities_count())
+        self.assertEqual(dashboard["issues_never_paid_count"], 0)
+
+    def test2_cache_is_dropped_when_the_seller_activities_change(self):
+        get_dashboard(self.seller)
+        with self.assertNumQueries(0):
+            get_dashboard(self.seller)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.create(
+                contact=ContactFactory(), campaign=self.campaign, seller=self.other_seller, activity_type="C",
+                status="P", datetime=datetime.now(),
+            )
+        with self.assertNumQueries(0):
+            get_dashboard(self.seller)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.filter(status="E").get().delete()
+        self.assertEqual(get_dashboard(self.seller)["total_pending_activities"], 2)
@@ -0,0 +1,88 @@
+# coding=utf-8
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from core.models import Campaign, ContactCampaignStatus
+from support.models import DailyRollup, Seller, SellerDailyMetrics
+from support.seller_metrics import count_metrics, metrics_by_seller, pending_days, rollup_day
+from tests.factories.core_factories import ContactFactory
+
+
+class TestSellerMetrics(TestCase):
+
+    def setUp(self):
+        self.seller = Seller.objects.create(name="Vendedor", internal=True)
+        self.other_seller = Seller.objects.create(name="Otro", internal=True)
+        self.campaign = Campaign.objects.create(name="Campaña", active=True, priority=3)
+        self.today = date.today()
+        rows = [
+            # seller, status, resolution, days ago
+            (self.seller, 1, None, 3),
+            (self.seller, 2, "S2", 3),
+            (self.seller, 4, "NI", 2),
+            (self.seller, 5, "UN", 1),
+            (self.other_seller, 3, None, 2),
+            (self.other_seller, 4, "S1", 1),
+            (None, 1, None, 2),
+        ]
+        for seller, status, resolution, days in rows:
+            ccs = ContactCampaignStatus.objects.create(
+                contact=ContactFactory(), campaign=self.campaign, seller=seller, status=status,
+                campaign_resolution=resolution,
+            )
+            # last_action_date is auto_now, update() doesn't change it
+            ContactCampaignStatus.objects.filter(pk=ccs.pk).update(last_action_date=self.today - timedelta(days))
+
+    def live_metrics(self, date_from, date_to):
+        return count_metrics(
+            ContactCampaignStatus.objects.filter(last_action_date__range=(date_from, date_to)), "seller_id"
+        )
+
+    def test1_metrics_in_one_query(self):
+        with self.assertNumQueries(1):
+            metrics = count_metrics(self.campaign.contactcampaignstatus_set.all(), "seller_id")
+        counts = metrics[self.seller.id]
+        self.assertEqual((counts["total"], counts["called"], counts["contacted"]), (4, 3, 2))
+        self.assertEqual((counts["success"], counts["rejected"], counts["ended_without_contact"]), (1, 1, 1))
+        self.assertEqual(counts["rejected_without_reason"], 1)
+        self.assertEqual(metrics[None]["not_contacted_yet"], 1)
+        self.assertEqual(count_metrics(ContactCampaignStatus.objects.all())["total"], 7)
+
+    def test2_rolled_up_days_match_the_statuses(self):
+        date_from = self.today - timedelta(3)
+        self.assertEqual(pending_days(), [date_from, self.today - timedelta(2), self.today - timedelta(1)])
+        for day in pending_days():
+            rollup_day(day)
+        self.assertEqual(pending_days(), [])
+        self.assertEqual(SellerDailyMetrics.objects.count(), 6)
+        with self.assertNumQueries(2):
+            metrics = metrics_by_seller(date_from, self.today)
+        self.assertEqual(metrics, self.live_metrics(date_from, self.today))
+
+        # saving a status moves it to today, and its day is read again from the statuses until aggregated again
+        ccs = ContactCampaignStatus.objects.get(seller=self.seller, status=1)
+        ccs.status = 2
+        ccs.save()
+        self.assertFalse(DailyRollup.objects.filter(date=date_from).exists())
+        self.assertEqual(pending_days(), [date_from])
+        self.assertEqual(metrics_by_seller(date_from, self.today), self.live_metrics(date_from, self.today))
+        self.assertEqual(metrics_by_seller(date_from, date_from)[self.seller.id]["total"], 1)
+
+        rollup_day(date_from)
+        self.assertEqual(metrics_by_seller(date_from, self.today), self.live_metrics(date_from, self.today))
+
+    def test3_released_contacts_leave_their_seller(self):
+        User.objects.create_superuser(username="manager", password="testpass")
+        self.client.login(username="manager", password="testpass")
+        date_from = self.today - timedelta(3)
+        for day in pending_days():
+            rollup_day(day)
+
+        # the view releases them with update(), which doesn't send the signals
+        self.client.get(reverse("release_seller_contacts_by_campaign", args=[self.seller.id, self.campaign.id]))
+        self.assertEqual(ContactCampaignStatus.objects.filter(seller=None).count(), 3)
+        self.assertEqual(pending_days(), [date_from])
+        self.assertEqual(metrics_by_seller(date_from, self.today), self.live_metrics(date_from, self.today))
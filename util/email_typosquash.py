@@ -1,6 +1,23 @@
+"""
+Email validation with typo replacements.
+
+clean_email() validates an email and looks for a replacement of its domain (the approved EmailReplacement objects) or a
+suggestion (pymailcheck). clean_emails() does the same for many emails at once, like the ones of an import:
+
+- The approved and rejected replacements are kept in memory. They're loaded again when an EmailReplacement is saved or
+  deleted in this process (see core.signals), and other processes load them again when they're older than
+  CORE_EMAIL_REPLACEMENTS_TTL seconds (300).
+- The MX check of each domain is kept in memory for CORE_EMAIL_MX_CACHE_TTL seconds (3600), and clean_emails() checks
+  the domains not cached yet concurrently, in CORE_EMAIL_MX_WORKERS threads (16). The timeouts aren't kept.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pydoc import locate
+from threading import RLock
 
 from pyisemail import is_email
+from pyisemail.diagnosis import BaseDiagnosis
+from pyisemail.validators import DNSValidator
 from pymailcheck import split_email, suggest
 
 from django.conf import settings
@@ -10,6 +27,89 @@ from django.utils.translation import gettext as _
 from core.models import EmailReplacement
 
 
+DNSWARN, THRESHOLD, VALID = (BaseDiagnosis.CATEGORIES[category] for category in ("DNSWARN", "THRESHOLD", "VALID"))
+
+
+class Replacements:
+    """
+    The approved replacements ({domain: replacement}) and the rejected ones ({(domain, replacement)}), in memory.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self._loaded = None
+
+    def get(self):
+        with self._lock:
+            ttl = getattr(settings, "CORE_EMAIL_REPLACEMENTS_TTL", 300)
+            if self._loaded and ttl and time.monotonic() - self._loaded[2] > ttl:
+                self.invalidate()
+            if self._loaded is None:
+                approved, rejected = {}, set()
+                for domain, replacement, status in EmailReplacement.objects.filter(
+                    status__in=("approved", "rejected")
+                ).values_list("domain", "replacement", "status"):
+                    if status == "approved":
+                        approved[domain] = replacement
+                    else:
+                        rejected.add((domain, replacement))
+                self._loaded = (approved, rejected, time.monotonic())
+            return self._loaded[:2]
+
+    def invalidate(self, **kwargs):
+        """
+        Drops the replacements, they're loaded again on the next call. Accepts (and ignores) any keyword argument so it
+        can be connected to signals.
+        """
+        with self._lock:
+            self._loaded = None
+
+
+replacements = Replacements()
+_mx_cache = {}
+
+
+def resolve_mx(domain):
+    """
+    Returns the pyisemail diagnosis of the DNS records of the domain.
+    """
+    return DNSValidator().is_valid(domain, True)
+
+
+def mx_codes(domains):
+    """
+    Returns {domain: diagnosis code} of the MX check of the domains, from the cache or resolving the missing ones
+    concurrently.
+    """
+    now, codes, missing = time.monotonic(), {}, []
+    for domain in set(domains):
+        cached = _mx_cache.get(domain.lower())
+        if cached and cached[1] > now:
+            codes[domain] = cached[0]
+        else:
+            missing.append(domain)
+    if missing:
+        workers = min(getattr(settings, "CORE_EMAIL_MX_WORKERS", 16), len(missing))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                diagnoses = list(executor.map(resolve_mx, missing))
+        else:
+            diagnoses = [resolve_mx(domain) for domain in missing]
+        expires = time.monotonic() + getattr(settings, "CORE_EMAIL_MX_CACHE_TTL", 3600)
+        for domain, diagnosis in zip(missing, diagnoses):
+            codes[domain] = diagnosis.code
+            if diagnosis.diagnosis_type != "DNS_TIMEDOUT":
+                _mx_cache[domain.lower()] = (diagnosis.code, expires)
+    return codes
+
+
+def get_whitelisted_domains():
+    whitelisted_domains = getattr(settings, "CORE_WHITELISTED_DOMAINS", [])
+    if type(whitelisted_domains) is str:
+        whitelisted_domains = locate(whitelisted_domains)()
+    return whitelisted_domains
+
+
 def replacement_request_add(domain, replacement, target_obj=None):
     notify = False
     try:
@@ -40,25 +140,51 @@ def clean_email(email):
       replaced: email replaced if match any replacement
       suggestion: suggested email to be used
     """
-    splitted = split_email(email)
-    domain, whitelisted_domains = splitted["domain"], getattr(settings, "CORE_WHITELISTED_DOMAINS", [])
-    if type(whitelisted_domains) is str:
-        whitelisted_domains = locate(whitelisted_domains)()
-    whitelisted = domain in whitelisted_domains
+    return clean_emails([email])[0]
 
-    valid = whitelisted or is_email(email, check_dns=getattr(settings, "CORE_VALIDATE_EMAIL_CHECK_MX", True))
-    result = {"valid": valid, "email": email}
 
-    if not whitelisted:
-        replacements = EmailReplacement.approved()
-        replacement = replacements.get(domain) if replacements else None
-        replaced = "%s@%s" % (splitted["address"], replacement) if replacement else None
+def clean_emails(emails):
+    """
+    Returns the result of clean_email for each one of the emails, in the same order. The replacements are read once
+    and the MX records of each domain are checked once, concurrently for all the domains.
+    """
+    emails = list(emails)
+    whitelisted_domains = get_whitelisted_domains()
+    check_dns = getattr(settings, "CORE_VALIDATE_EMAIL_CHECK_MX", True)
+    approved, rejected = replacements.get()
+
+    # the syntax is checked first, the domains are checked only for the emails with a valid syntax
+    parsed = []
+    for email in emails:
+        splitted = split_email(email)
+        domain = splitted["domain"] if splitted else None
+        whitelisted = domain in whitelisted_domains
+        code = None if whitelisted else is_email(email, diagnose=True).code
+        parsed.append((email, splitted, whitelisted, code))
+    codes = {}
+    if check_dns:
+        codes = mx_codes(
+            splitted["domain"] for email, splitted, whitelisted, code in parsed if code is not None and code < DNSWARN
+        )
 
-        if replaced:
-            result["replacement"] = replaced
-        elif not valid:
-            suggestion = suggest(email)
-            if suggestion and not EmailReplacement.is_rejected(domain, suggestion["domain"]):
-                result["suggestion"] = suggestion["full"]
+    results = []
+    for email, splitted, whitelisted, code in parsed:
+        if whitelisted:
+            valid = True
+        elif check_dns and code < DNSWARN:
+            valid = max(code, codes[splitted["domain"]]) < VALID
+        else:
+            valid = code < THRESHOLD
+        result = {"valid": valid, "email": email}
 
-    return result
+        if not whitelisted and splitted:
+            domain = splitted["domain"]
+            replacement = approved.get(domain)
+            if replacement:
+                result["replacement"] = "%s@%s" % (splitted["address"], replacement)
+            elif not valid:
+                suggestion = suggest(email)
+                if suggestion and (domain, suggestion["domain"]) not in rejected:
+                    result["suggestion"] = suggestion["full"]
+        results.append(result)
+    return results